@@ -0,0 +1,188 @@
+"""
+Durable local store of fetched Reddit posts and comments.
+
+Items are keyed by fullname and indexed on (author, kind, created_utc), so the newest
+`post_limit` / `comment_limit` items of an account are one index range scan each. For
+every account we also remember when it was last fetched in full and how large a window
+that fetch covered; a later request for the same or a smaller window within the
+configured max age is served from the store instead of Reddit.
+
+The database runs in WAL mode with a busy timeout and takes write locks up front
+(BEGIN IMMEDIATE), so several uvicorn worker processes can share one file: readers never
+block, and writers queue instead of failing.
+"""
+
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+# Window size recorded when Reddit returned fewer items than asked for: we have them all
+EXHAUSTED = 1 << 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    fullname TEXT PRIMARY KEY,
+    author TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    created_utc REAL NOT NULL,
+    title TEXT,
+    body TEXT,
+    link_id TEXT,
+    link_title TEXT,
+    fetched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_author_kind_created ON items (author, kind, created_utc);
+CREATE INDEX IF NOT EXISTS items_fetched_at ON items (fetched_at);
+CREATE TABLE IF NOT EXISTS authors (
+    author TEXT PRIMARY KEY,
+    synced_at REAL NOT NULL,
+    post_window INTEGER NOT NULL,
+    comment_window INTEGER NOT NULL
+);
+"""
+
+UPSERT = """
+INSERT INTO items (fullname, author, kind, created_utc, title, body, link_id, link_title, fetched_at)
+VALUES (:fullname, :author, :kind, :created_utc, :title, :body, :link_id, :link_title, :fetched_at)
+ON CONFLICT (fullname) DO UPDATE SET
+    title = excluded.title,
+    body = excluded.body,
+    link_title = COALESCE(excluded.link_title, items.link_title),
+    fetched_at = excluded.fetched_at
+"""
+
+
+class ActivityStore:
+    def __init__(self, path: str, busy_timeout: float = 5.0, batch_size: int = 1000):
+        self.path = path
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        # Transactions are managed explicitly (see _write)
+        self.connection = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None,
+                                          check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    @contextmanager
+    def _write(self):
+        """BEGIN IMMEDIATE ... COMMIT under the store's lock; rolls back on error."""
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def upsert_items(self, author: str, items: List[Dict[str, Any]]):
+        """
+        Inserts or refreshes items (dicts with fullname, kind, created_utc, title, body,
+        link_id, link_title) in batches of batch_size rows per transaction.
+        """
+        author = author.lower()
+        now = time.time()
+        rows = [{"title": None, "body": None, "link_id": None, "link_title": None, **item,
+                 "author": author, "fetched_at": now} for item in items]
+        for start in range(0, len(rows), self.batch_size):
+            with self._write() as connection:
+                connection.executemany(UPSERT, rows[start:start + self.batch_size])
+
+    def record_sync(self, author: str, post_window: int, comment_window: int):
+        """Records that the newest post_window posts and comment_window comments were just fetched."""
+        with self._write() as connection:
+            connection.execute("INSERT OR REPLACE INTO authors VALUES (?, ?, ?, ?)",
+                               (author.lower(), time.time(), post_window, comment_window))
+
+    def read_window(self, author: str, post_limit: int, comment_limit: int, max_age: float,
+                    since: Optional[float] = None) -> Optional[Tuple[List[dict], List[dict]]]:
+        """
+        Returns (posts, comments), newest first, if the store holds a full fetch of at least
+        this window that is younger than max_age seconds; otherwise None. With `since`, only
+        items newer than that created_utc are returned.
+        """
+        author = author.lower()
+        with self.lock:
+            sync = self.connection.execute("SELECT * FROM authors WHERE author = ?", (author,)).fetchone()
+            if (sync is None or time.time() - sync["synced_at"] > max_age
+                    or post_limit > sync["post_window"] or comment_limit > sync["comment_window"]):
+                return None
+            return (self._range(author, "post", post_limit, since),
+                    self._range(author, "comment", comment_limit, since))
+
+    def _range(self, author: str, kind: str, limit: int, since: Optional[float]) -> List[dict]:
+        rows = self.connection.execute(
+            "SELECT * FROM items WHERE author = ? AND kind = ? AND created_utc > ? "
+            "ORDER BY created_utc DESC LIMIT ?",
+            (author, kind, since if since is not None else float("-inf"), limit),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def prune(self, retention_seconds: float, max_items_per_author: int) -> int:
+        """
+        Retention job: drops items not seen by any fetch for retention_seconds and all but
+        the newest max_items_per_author posts and comments of each account. Returns the
+        number of items removed.
+
+        Deletes at most batch_size items per transaction, so fetches writing to the store
+        wait for one batch rather than for the whole pass.
+        """
+        cutoff = time.time() - retention_seconds
+        removed = self._delete_in_batches(
+            "DELETE FROM items WHERE rowid IN (SELECT rowid FROM items WHERE fetched_at < :cutoff LIMIT :batch_size)",
+            {"cutoff": cutoff})
+        with self._write() as connection:
+            connection.execute("DELETE FROM authors WHERE synced_at < ?", (cutoff,))
+
+        # Accounts over the cap, from the (author, kind, created_utc) index, outside any write lock
+        with self.lock:
+            over_cap = self.connection.execute(
+                "SELECT author, kind FROM items GROUP BY author, kind HAVING COUNT(*) > ?", (max_items_per_author,)
+            ).fetchall()
+        for author, kind in over_cap:
+            removed += self._delete_in_batches(
+                """
+                DELETE FROM items WHERE fullname IN (
+                    SELECT fullname FROM items WHERE author = :author AND kind = :kind
+                    ORDER BY created_utc DESC LIMIT :batch_size OFFSET :keep)
+                """,
+                {"author": author, "kind": kind, "keep": max_items_per_author})
+        with self._write() as connection:
+            # Those windows are no longer complete
+            connection.execute(
+                """
+                UPDATE authors SET post_window = MIN(post_window, ?), comment_window = MIN(comment_window, ?)
+                WHERE post_window > ? OR comment_window > ?
+                """,
+                (max_items_per_author,) * 4,
+            )
+        return removed
+
+    def _delete_in_batches(self, statement: str, parameters: Dict[str, Any]) -> int:
+        """Repeats a DELETE of at most :batch_size rows, one transaction each, until it removes fewer."""
+        removed = 0
+        while True:
+            with self._write() as connection:
+                count = connection.execute(statement, {**parameters, "batch_size": self.batch_size}).rowcount
+            removed += count
+            if count < self.batch_size:
+                return removed
+
+    def compact(self):
+        """Compaction job: folds the WAL back into the database file and truncates it."""
+        with self.lock:
+            self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def clear(self):
+        with self._write() as connection:
+            connection.execute("DELETE FROM items")
+            connection.execute("DELETE FROM authors")
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
@@ -0,0 +1,187 @@
+"""
+Admission control for /analyze.
+
+Every request is priced before any work starts (Reddit pages, items, prompt tokens)
+and only admitted while the total cost of in-flight requests stays under a global
+ceiling. Requests that do not fit wait in a bounded queue; once the queue is full
+or the wait times out they are shed with 429/503 and a Retry-After header.
+"""
+
+import asyncio
+import math
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Dict
+
+from fastapi import HTTPException
+
+# Rough token estimates used to price a request before fetching anything
+PROMPT_OVERHEAD_TOKENS = 300
+TOKENS_PER_POST = 150
+TOKENS_PER_COMMENT = 60
+COMPLETION_TOKENS = 1000
+# One Reddit listing page is weighted like this many tokens of LLM work
+COST_PER_PAGE = 500
+REDDIT_PAGE_SIZE = 100
+
+
+# Listing sizes the Reddit fetch reads, with their defaults
+LIMIT_PARAMETERS = {"post_limit": 10, "comment_limit": 100}
+
+
+def get_int_parameter(parameters: Dict[str, Any], name: str, default: int) -> int:
+    """Reads a non-negative integer parameter, raising 422 if it is malformed."""
+    value = parameters.get(name, default)
+    if isinstance(value, float) and not value.is_integer():
+        raise HTTPException(status_code=422, detail=f"Parameter '{name}' must be an integer")
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=422, detail=f"Parameter '{name}' must be an integer")
+    if value < 0:
+        raise HTTPException(status_code=422, detail=f"Parameter '{name}' must not be negative")
+    return value
+
+
+def normalize_limits(parameters: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Returns parameters with the listing sizes validated and stored as ints, so "5" or 5.0
+    reach the Reddit fetch (and the result cache key) the same way 5 does.
+    """
+    parameters = dict(parameters)
+    for name, default in LIMIT_PARAMETERS.items():
+        if name in parameters:
+            parameters[name] = get_int_parameter(parameters, name, default)
+    return parameters
+
+
+def estimate_request_cost(parameters: Dict[str, Any], completion_tokens: int = COMPLETION_TOKENS) -> Dict[str, int]:
+    """
+    Estimates the upstream work an /analyze request will cause, for a completion of at
+    most completion_tokens. Returns pages (Reddit requests), items, prompt_tokens and a
+    combined cost.
+    """
+    post_limit = get_int_parameter(parameters, "post_limit", LIMIT_PARAMETERS["post_limit"])
+    comment_limit = get_int_parameter(parameters, "comment_limit", LIMIT_PARAMETERS["comment_limit"])
+
+    comment_pages = math.ceil(comment_limit / REDDIT_PAGE_SIZE)
+    # One request to load the redditor plus one per listing page
+    pages = 1 + math.ceil(post_limit / REDDIT_PAGE_SIZE) + comment_pages
+    if parameters.get("include_context"):
+        pages += comment_pages
+
+    items = post_limit + comment_limit
+    prompt_tokens = PROMPT_OVERHEAD_TOKENS + post_limit * TOKENS_PER_POST + comment_limit * TOKENS_PER_COMMENT
+    cost = prompt_tokens + completion_tokens + pages * COST_PER_PAGE
+
+    return {"pages": pages, "items": items, "prompt_tokens": prompt_tokens, "cost": cost}
+
+
+class AdmissionController:
+    """
+    Tracks the cost of in-flight requests against max_inflight_cost.
+
+    A request is admitted immediately if it fits (or if nothing else is running, so a
+    single large request can never deadlock). Otherwise it waits in a queue of at most
+    max_queue entries for up to queue_timeout seconds. Small requests that fit are not
+    held back by large queued ones; large ones are shed instead.
+    """
+
+    def __init__(self, max_request_cost: int, max_inflight_cost: int, max_queue: int,
+                 queue_timeout: float, retry_after: int):
+        self.max_request_cost = max_request_cost
+        self.max_inflight_cost = max_inflight_cost
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.inflight_cost = 0
+        self.inflight_requests = 0
+        self.waiters = deque()
+        self.stats = {
+            "admitted": 0,
+            "queued": 0,
+            "rejected_too_large": 0,
+            "shed_queue_full": 0,
+            "shed_timeout": 0,
+        }
+
+    def _fits(self, cost: int) -> bool:
+        return self.inflight_requests == 0 or self.inflight_cost + cost <= self.max_inflight_cost
+
+    def _admit(self, cost: int):
+        self.inflight_cost += cost
+        self.inflight_requests += 1
+        self.stats["admitted"] += 1
+
+    def _reject(self, status_code: int, detail: str):
+        raise HTTPException(status_code=status_code, detail=detail,
+                            headers={"Retry-After": str(self.retry_after)})
+
+    def check_size(self, cost: int):
+        """Raises 422 for a request that could never be admitted, however idle the server is."""
+        if cost > self.max_request_cost:
+            self.stats["rejected_too_large"] += 1
+            raise HTTPException(
+                status_code=422,
+                detail=f"Request is too expensive (estimated cost {cost}, limit {self.max_request_cost}). "
+                       "Lower post_limit or comment_limit.",
+            )
+
+    async def acquire(self, cost: int):
+        self.check_size(cost)
+
+        if self._fits(cost):
+            self._admit(cost)
+            return
+
+        if len(self.waiters) >= self.max_queue:
+            self.stats["shed_queue_full"] += 1
+            self._reject(429, "Server is at capacity, please retry later")
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (cost, waiter)
+        self.waiters.append(entry)
+        self.stats["queued"] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done():
+                # Admitted just as the timeout fired; keep the slot
+                return
+            self.waiters.remove(entry)
+            self.stats["shed_timeout"] += 1
+            self._reject(503, "Server is overloaded, please retry later")
+        except BaseException:
+            # Cancelled while queued: give back the slot if we were admitted meanwhile
+            if waiter.done():
+                self.release(cost)
+            elif entry in self.waiters:
+                self.waiters.remove(entry)
+            raise
+
+    def release(self, cost: int):
+        self.inflight_cost -= cost
+        self.inflight_requests -= 1
+        # Wake queued requests, oldest first, as long as they fit
+        for entry in list(self.waiters):
+            waiter_cost, waiter = entry
+            if self._fits(waiter_cost):
+                self.waiters.remove(entry)
+                self._admit(waiter_cost)
+                waiter.set_result(None)
+
+    @asynccontextmanager
+    async def admit(self, cost: int):
+        await self.acquire(cost)
+        try:
+            yield
+        finally:
+            self.release(cost)
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            **{f"admission_{name}": value for name, value in self.stats.items()},
+            "admission_inflight_cost": self.inflight_cost,
+            "admission_inflight_requests": self.inflight_requests,
+            "admission_queue_depth": len(self.waiters),
+        }
@@ -0,0 +1,355 @@
+"""
+Two-tier cache shared by all uvicorn workers.
+
+Each TieredCache keeps a small in-process L1 in front of an optional shared tier:
+- SQLiteBackend: a local SQLite file (WAL) that every worker on the host opens.
+- RedisBackend: any server speaking the Redis protocol (GET/SET PX NX/DEL/SCAN),
+  reached with a minimal client so no extra dependency is needed.
+
+Values are serialized once, as JSON, and the L1 keeps the decoded copy of exactly what
+went to the shared tier, so a value looks the same whichever tier it came from (tuples
+come back as lists). L1 entries live at most l1_ttl seconds when there is a shared tier,
+bounding how long a worker can miss another worker's update.
+
+get_or_compute() protects against stampedes: concurrent misses for one key in a process
+share one computation, and across processes a lock key in the shared tier lets one
+worker compute while the others poll for its result.
+"""
+
+import asyncio
+import json
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+from urllib.parse import urlparse
+
+# Bump when the encoding changes so workers running old code ignore new entries
+SERIALIZATION_VERSION = b"1:"
+
+# Returned by get() for a miss, since None is a valid cached value
+MISSING = object()
+
+
+def encode(value: Any) -> bytes:
+    return SERIALIZATION_VERSION + json.dumps(value, separators=(",", ":")).encode()
+
+
+def decode(data: Optional[bytes]) -> Any:
+    if data is None or not data.startswith(SERIALIZATION_VERSION):
+        return MISSING
+    return json.loads(data[len(SERIALIZATION_VERSION):])
+
+
+class SQLiteBackend:
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)")
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value FROM cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)",
+                                    (key, value, time.time() + ttl if ttl is not None else None))
+
+    def add(self, key: str, value: bytes, ttl: float) -> bool:
+        """Sets the key only if it is absent (or expired); returns whether it was set."""
+        now = time.time()
+        with self.lock:
+            cursor = self.connection.execute(
+                """
+                INSERT INTO cache VALUES (?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at
+                WHERE cache.expires_at IS NOT NULL AND cache.expires_at <= ?
+                """,
+                (key, value, now + ttl, now),
+            )
+        return cursor.rowcount == 1
+
+    def delete(self, key: str):
+        with self.lock:
+            self.connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self, prefix: str):
+        with self.lock:
+            self.connection.execute("DELETE FROM cache WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+    def purge_expired(self, batch_size: int = 1000) -> int:
+        """
+        Deletes expired entries, which get() ignores but nothing else removes; returns how
+        many. Works in batches so other workers' writes wait for at most one of them.
+        """
+        purged = 0
+        while True:
+            with self.lock:
+                cursor = self.connection.execute(
+                    "DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache WHERE expires_at <= ? LIMIT ?)",
+                    (time.time(), batch_size),
+                )
+            purged += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                return purged
+
+
+class RedisBackend:
+    """Minimal Redis protocol (RESP) client; one connection per thread."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379, db: int = 0, timeout: float = 2.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = (sock, sock.makefile("rb"))
+            self.local.connection = connection
+            if self.db:
+                self._call("SELECT", str(self.db))
+        return connection
+
+    def _call(self, *args):
+        sock, reader = self._connection()
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            arg = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        try:
+            sock.sendall(b"".join(parts))
+            return self._read(reader)
+        except OSError:
+            # Close and drop the broken connection; the next call reconnects
+            self.local.connection = None
+            reader.close()
+            sock.close()
+            raise
+
+    def _read(self, reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload
+        if kind == b"-":
+            raise RuntimeError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            count = int(payload)
+            return None if count < 0 else [self._read(reader) for _ in range(count)]
+        raise RuntimeError(f"Unexpected Redis reply: {line!r}")
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._call("GET", key)
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        if ttl is None:
+            self._call("SET", key, value)
+        else:
+            self._call("SET", key, value, "PX", max(1, int(ttl * 1000)))
+
+    def add(self, key: str, value: bytes, ttl: float) -> bool:
+        return self._call("SET", key, value, "PX", max(1, int(ttl * 1000)), "NX") is not None
+
+    def delete(self, key: str):
+        self._call("DEL", key)
+
+    def purge_expired(self) -> int:
+        """Redis removes expired keys itself."""
+        return 0
+
+    def clear(self, prefix: str):
+        cursor = b"0"
+        while True:
+            cursor, keys = self._call("SCAN", cursor, "MATCH", prefix + "*", "COUNT", 1000)
+            if keys:
+                self._call("DEL", *keys)
+            if cursor == b"0":
+                return
+
+
+def create_backend(url: str):
+    """Builds a shared tier from CACHE_URL: "", "sqlite:///path/to/cache.db" or "redis://host:port/db"."""
+    if not url:
+        return None
+    parsed = urlparse(url)
+    if parsed.scheme == "sqlite":
+        return SQLiteBackend(parsed.path)
+    if parsed.scheme == "redis":
+        db = int(parsed.path.lstrip("/") or 0)
+        return RedisBackend(parsed.hostname or "127.0.0.1", parsed.port or 6379, db)
+    raise ValueError(f"Unsupported CACHE_URL scheme: {parsed.scheme!r}")
+
+
+class TieredCache:
+    def __init__(self, namespace: str, backend=None, l1_max_entries: int = 10000, l1_ttl: float = 5.0,
+                 lock_ttl: float = 120.0, poll_interval: float = 0.05):
+        self.namespace = namespace
+        self.backend = backend
+        self.l1_max_entries = l1_max_entries
+        self.l1_ttl = l1_ttl
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        # key -> (expires_at or None, value); oldest first
+        self.l1: "OrderedDict[str, tuple]" = OrderedDict()
+        # key -> future of the computation running in this process
+        self.inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {"l1_hits": 0, "shared_hits": 0, "misses": 0, "computations": 0, "coalesced": 0,
+                      "shared_errors": 0}
+
+    def _shared_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _l1_get(self, key: str) -> Any:
+        entry = self.l1.get(key)
+        if entry is None:
+            return MISSING
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.l1[key]
+            return MISSING
+        return value
+
+    def _l1_set(self, key: str, value: Any, ttl: Optional[float]):
+        if self.backend is not None:
+            ttl = self.l1_ttl if ttl is None else min(ttl, self.l1_ttl)
+        self.l1.pop(key, None)
+        if len(self.l1) >= self.l1_max_entries:
+            self.l1.popitem(last=False)
+        self.l1[key] = (time.monotonic() + ttl if ttl is not None else None, value)
+
+    async def _shared(self, method: str, *args):
+        """Runs a (blocking) shared-tier call in a worker thread; errors count as misses."""
+        try:
+            return await asyncio.to_thread(getattr(self.backend, method), *args)
+        except (OSError, RuntimeError, sqlite3.Error):
+            self.stats["shared_errors"] += 1
+            return None
+
+    async def get(self, key: str) -> Any:
+        value = self._l1_get(key)
+        if value is not MISSING:
+            self.stats["l1_hits"] += 1
+            return value
+        if self.backend is not None:
+            value = decode(await self._shared("get", self._shared_key(key)))
+            if value is not MISSING:
+                self.stats["shared_hits"] += 1
+                self._l1_set(key, value, None)
+                return value
+        self.stats["misses"] += 1
+        return MISSING
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        data = encode(value)
+        # Keep the same shape the shared tier would hand back
+        self._l1_set(key, decode(data), ttl)
+        if self.backend is not None:
+            await self._shared("set", self._shared_key(key), data, ttl)
+
+    async def delete(self, key: str):
+        self.l1.pop(key, None)
+        if self.backend is not None:
+            await self._shared("delete", self._shared_key(key))
+
+    async def get_or_compute(self, key: str, ttl: float, compute: Callable[[], Awaitable[Any]],
+                             cacheable: Callable[[Any], bool] = lambda value: True) -> Any:
+        """
+        Returns the cached value, or computes, stores and returns it. Only one computation
+        per key runs at a time in this process and, with a shared tier, across workers.
+        Values for which cacheable() is false are returned but not stored.
+        """
+        while True:
+            value = await self.get(key)
+            if value is not MISSING:
+                return value
+
+            future = self.inflight.get(key)
+            if future is None:
+                break
+            self.stats["coalesced"] += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The computing request went away; try again ourselves
+
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting; don't warn about an unretrieved exception
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self.inflight[key] = future
+        try:
+            value = await self._compute_once(key, ttl, compute, cacheable)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self.inflight.pop(key, None)
+        future.set_result(value)
+        return value
+
+    async def _compute_once(self, key, ttl, compute, cacheable):
+        lock_key = self._shared_key(key) + ":lock"
+        waited_until = time.monotonic() + self.lock_ttl
+        while self.backend is not None and time.monotonic() < waited_until:
+            if await self._shared("add", lock_key, b"1", self.lock_ttl) is not False:
+                # Acquired (or the shared tier is unreachable, in which case compute anyway)
+                break
+            # Another worker is computing; wait for its result
+            await asyncio.sleep(self.poll_interval)
+            value = decode(await self._shared("get", self._shared_key(key)))
+            if value is not MISSING:
+                self.stats["shared_hits"] += 1
+                self._l1_set(key, value, ttl)
+                return value
+        try:
+            self.stats["computations"] += 1
+            value = await compute()
+            if cacheable(value):
+                await self.set(key, value, ttl)
+            return value
+        finally:
+            if self.backend is not None:
+                await self._shared("delete", lock_key)
+
+    def clear(self):
+        self.l1.clear()
+        if self.backend is not None:
+            self.backend.clear(self.namespace + ":")
+
+    def __len__(self) -> int:
+        return len(self.l1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "l1_size": len(self.l1)}
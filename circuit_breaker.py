@@ -0,0 +1,117 @@
+"""
+Circuit breakers for upstream services (Reddit, OpenAI).
+
+A breaker watches the outcome and duration of the last `window_size` calls. Once at
+least `min_calls` have been seen and either the error rate or the share of slow calls
+crosses its threshold, the breaker opens and calls fail fast with CircuitOpenError.
+After `open_duration` seconds it lets `half_open_max_calls` probe calls through: a
+successful probe closes it again, a failed one re-opens it.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Dict
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose breaker is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"{name} is temporarily unavailable (circuit open)")
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_rate_threshold: float = 0.5, slow_call_duration: float = 10.0,
+                 slow_call_rate_threshold: float = 0.8, window_size: int = 20, min_calls: int = 5,
+                 open_duration: float = 30.0, half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.open_duration = open_duration
+        self.half_open_max_calls = half_open_max_calls
+
+        # Calls to the OpenAI breaker happen on worker threads
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        # (failed, slow) for each recent call
+        self.outcomes = deque(maxlen=window_size)
+        self.stats = {"calls": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "opened": 0}
+
+    def before_call(self):
+        """Raises CircuitOpenError if the call must not go through."""
+        with self.lock:
+            if self.state == OPEN:
+                remaining = self.opened_at + self.open_duration - time.monotonic()
+                if remaining > 0:
+                    self.stats["rejected"] += 1
+                    raise CircuitOpenError(self.name, remaining)
+                self.state = HALF_OPEN
+                self.half_open_calls = 0
+
+            if self.state == HALF_OPEN:
+                if self.half_open_calls >= self.half_open_max_calls:
+                    self.stats["rejected"] += 1
+                    raise CircuitOpenError(self.name, self.open_duration)
+                self.half_open_calls += 1
+
+    def record_success(self, duration: float):
+        self._record(failed=False, duration=duration)
+
+    def record_failure(self, duration: float = 0.0):
+        self._record(failed=True, duration=duration)
+
+    def record_ignored(self):
+        """The call ended without telling us anything about upstream health (e.g. cancelled)."""
+        with self.lock:
+            if self.state == HALF_OPEN and self.half_open_calls > 0:
+                self.half_open_calls -= 1
+
+    def _record(self, failed: bool, duration: float):
+        slow = duration >= self.slow_call_duration
+        with self.lock:
+            self.stats["calls"] += 1
+            self.stats["failures"] += failed
+            self.stats["slow_calls"] += slow
+
+            if self.state == HALF_OPEN:
+                if failed or slow:
+                    self._open()
+                else:
+                    self.state = CLOSED
+                    self.outcomes.clear()
+                return
+
+            self.outcomes.append((failed, slow))
+            if self.state == CLOSED and len(self.outcomes) >= self.min_calls:
+                failure_rate = sum(f for f, _ in self.outcomes) / len(self.outcomes)
+                slow_rate = sum(s for _, s in self.outcomes) / len(self.outcomes)
+                if failure_rate >= self.failure_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+                    self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.outcomes.clear()
+        self.stats["opened"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            window = len(self.outcomes)
+            return {
+                "state": self.state,
+                "window_calls": window,
+                "window_failure_rate": round(sum(f for f, _ in self.outcomes) / window, 3) if window else 0.0,
+                **self.stats,
+            }
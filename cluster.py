@@ -0,0 +1,90 @@
+"""
+Cluster mode: route /analyze requests to the node that owns the target username.
+
+Every node is configured with the same list of node URLs and places them on a
+consistent-hash ring (each node at `vnodes` points). The owner of a username is the
+first node clockwise from the username's hash, so all requests for one Reddit user land
+on one node and find its caches warm, and adding or removing a node only moves the
+usernames next to it on the ring. Calls to each peer go through a circuit breaker; when
+the owner cannot be reached the receiving node handles the request itself.
+"""
+
+import bisect
+import hashlib
+import time
+from typing import Any, Callable, Dict, List
+
+import requests
+
+from circuit_breaker import CircuitBreaker
+
+# Set on forwarded requests so the owner handles them instead of forwarding again
+FORWARDED_HEADER = "X-Cluster-Forwarded-By"
+
+
+def ring_hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    def __init__(self, nodes: List[str], vnodes: int = 100):
+        self.nodes = list(nodes)
+        points = sorted((ring_hash(f"{node}#{index}"), node) for node in self.nodes for index in range(vnodes))
+        self.hashes = [point for point, _ in points]
+        self.owners = [node for _, node in points]
+
+    def owner(self, key: str) -> str:
+        index = bisect.bisect(self.hashes, ring_hash(key)) % len(self.hashes)
+        return self.owners[index]
+
+
+class ClusterRouter:
+    def __init__(self, self_url: str, nodes: List[str], vnodes: int, connect_timeout: float,
+                 breaker_factory: Callable[[str], CircuitBreaker]):
+        if self_url not in nodes:
+            raise ValueError(f"CLUSTER_SELF ({self_url!r}) must be one of CLUSTER_NODES")
+        self.self_url = self_url
+        self.ring = HashRing(nodes, vnodes)
+        self.connect_timeout = connect_timeout
+        self.breakers = {node: breaker_factory(node) for node in nodes if node != self_url}
+        # Keeps connections to peers open between requests
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=len(nodes), pool_maxsize=32)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def owner(self, username: str) -> str:
+        return self.ring.owner(username.lower())
+
+    def forward(self, owner: str, body: Dict[str, Any], timeout: float) -> requests.Response:
+        """
+        POSTs an /analyze body to its owner. Raises CircuitOpenError or requests.ConnectionError
+        if the owner is unreachable (the caller should fall back to handling it locally) and
+        requests.Timeout if the owner accepted the request but did not answer in time.
+        """
+        breaker = self.breakers[owner]
+        breaker.before_call()
+        started = time.monotonic()
+        try:
+            response = self.session.post(
+                f"{owner}/analyze",
+                json=body,
+                headers={FORWARDED_HEADER: self.self_url, "X-Request-Timeout": str(max(timeout, 0.001))},
+                timeout=(self.connect_timeout, max(timeout, 0.001)),
+            )
+        except requests.ConnectionError:
+            breaker.record_failure(time.monotonic() - started)
+            raise
+        except requests.Timeout:
+            # The owner is up but slow; that says more about this request than about the peer
+            breaker.record_ignored()
+            raise
+        breaker.record_success(time.monotonic() - started)
+        return response
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "self": self.self_url,
+            "nodes": self.ring.nodes,
+            "peers": {node: breaker.snapshot()["state"] for node, breaker in self.breakers.items()},
+        }
@@ -0,0 +1,131 @@
+"""
+Response compression negotiated from Accept-Encoding.
+
+CompressionMiddleware compresses complete JSON and text responses of at least
+`minimum_size` bytes with brotli (when the optional `brotli` package is installed) or
+gzip, whichever the client prefers. Streaming responses, already-encoded responses and
+other content types pass through untouched.
+"""
+
+import gzip
+from typing import List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # optional dependency: without it only gzip is offered
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+def supported_encodings() -> List[str]:
+    # In order of preference when the client weighs them equally
+    return (["br"] if brotli is not None else []) + ["gzip"]
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Picks the supported encoding with the highest q-value in an Accept-Encoding header."""
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            weights[name] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in supported_encodings():
+        quality = weights.get(encoding, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str, gzip_level: int = 6, brotli_quality: int = 4) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=brotli_quality)
+    return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.minimum_size < 0:
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+        encoding = choose_encoding(accept_encoding)
+
+        start = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                # Held back until we know the body
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = _Headers(start["headers"])
+            headers.add_vary()
+            if (message.get("more_body") or encoding is None or len(body) < self.minimum_size
+                    or "content-encoding" in headers or not headers.compressible()):
+                passthrough = True
+                await send({**start, "headers": headers.items})
+                await send(message)
+                return
+
+            body = compress(body, encoding, self.gzip_level, self.brotli_quality)
+            headers.set("content-encoding", encoding)
+            headers.set("content-length", str(len(body)))
+            await send({**start, "headers": headers.items})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class _Headers:
+    """Just enough mutable access to raw ASGI headers for the middleware."""
+
+    def __init__(self, items: List[Tuple[bytes, bytes]]):
+        self.items = list(items)
+
+    def __contains__(self, name: str) -> bool:
+        return any(key.lower() == name.encode() for key, _ in self.items)
+
+    def get(self, name: str) -> str:
+        for key, value in self.items:
+            if key.lower() == name.encode():
+                return value.decode("latin-1")
+        return ""
+
+    def set(self, name: str, value: str):
+        self.items = [(key, old) for key, old in self.items if key.lower() != name.encode()]
+        self.items.append((name.encode(), value.encode("latin-1")))
+
+    def add_vary(self):
+        vary = self.get("vary")
+        if "accept-encoding" not in vary.lower():
+            self.set("vary", f"{vary}, Accept-Encoding" if vary else "Accept-Encoding")
+
+    def compressible(self) -> bool:
+        return self.get("content-type").startswith(COMPRESSIBLE_TYPES)
@@ -0,0 +1,133 @@
+"""
+Adaptive degradation of /analyze under load.
+
+Under peak load a slightly shallower analysis returned quickly beats a timeout.
+DegradationController turns load signals into a level between 0 (serve requests as
+asked) and 1 (as shallow as the caller allows), taking the strongest of:
+
+- queue depth: requests waiting for a pipeline slot or for admission, against
+  queue_depth,
+- upstream latency: smoothed Reddit time per listing page and completion time, each
+  against its target (twice the target is full degradation),
+- rate-limit headroom: the share of Reddit's rate-limit window left, once it drops
+  below rate_headroom.
+
+plan() applies the level to a request: post_limit and comment_limit move towards the
+caller's minimums (min_post_limit / min_comment_limit, by default min_fraction of the
+requested limits), and from model_level on the completion uses degraded_model (by
+default fallback_model). A request with "degrade": false is never changed.
+"""
+
+import math
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+from admission import LIMIT_PARAMETERS, get_int_parameter
+
+
+def clamp(value: float) -> float:
+    return min(1.0, max(0.0, value))
+
+
+class DegradationController:
+    def __init__(self, queue_depth: int = 20, reddit_page_target: float = 1.0, llm_target: float = 20.0,
+                 rate_headroom: float = 0.2, min_fraction: float = 0.25, model_level: float = 0.5,
+                 fallback_model: str = "gpt-4o-mini", smoothing: float = 0.2):
+        self.queue_depth = queue_depth
+        self.reddit_page_target = reddit_page_target
+        self.llm_target = llm_target
+        self.rate_headroom = rate_headroom
+        self.min_fraction = min_fraction
+        self.model_level = model_level
+        self.fallback_model = fallback_model
+        self.smoothing = smoothing
+        # Exponentially smoothed observations; None until the first one
+        self.reddit_page_latency: Optional[float] = None
+        self.llm_latency: Optional[float] = None
+        self.rate_remaining: Optional[float] = None
+        # Completions are observed from worker threads
+        self.lock = threading.Lock()
+        self.stats = {"degraded": 0, "limits_reduced": 0, "model_switched": 0}
+
+    def _smooth(self, current: Optional[float], value: float) -> float:
+        return value if current is None else current + self.smoothing * (value - current)
+
+    def observe_reddit(self, seconds: float, pages: int):
+        with self.lock:
+            self.reddit_page_latency = self._smooth(self.reddit_page_latency, seconds / max(1, pages))
+
+    def observe_rate_limit(self, remaining: Optional[float], used: Optional[int]):
+        """Takes asyncpraw's rate limit state (Reddit's X-Ratelimit-Remaining / -Used)."""
+        if remaining is None or used is None or remaining + used <= 0:
+            return
+        with self.lock:
+            self.rate_remaining = remaining / (remaining + used)
+
+    def observe_llm(self, seconds: float):
+        with self.lock:
+            self.llm_latency = self._smooth(self.llm_latency, seconds)
+
+    def signals(self, queued: int) -> Dict[str, float]:
+        def over_target(value: Optional[float], target: float) -> float:
+            return 0.0 if value is None or target <= 0 else clamp(value / target - 1)
+
+        with self.lock:
+            return {
+                "queue": clamp(queued / self.queue_depth) if self.queue_depth > 0 else 0.0,
+                "reddit_latency": over_target(self.reddit_page_latency, self.reddit_page_target),
+                "llm_latency": over_target(self.llm_latency, self.llm_target),
+                "rate_limit": (clamp(1 - self.rate_remaining / self.rate_headroom)
+                               if self.rate_remaining is not None and self.rate_headroom > 0 else 0.0),
+            }
+
+    def level(self, queued: int) -> float:
+        return max(self.signals(queued).values())
+
+    def plan(self, parameters: Dict[str, Any], level: float,
+             default_model: str) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        """
+        Returns the parameters to run the request with and the degradation applied to
+        them ({"level": ..., "post_limit": {"requested": ..., "applied": ...}, ...}), or
+        the parameters unchanged and None.
+        """
+        # Only requests that accept a degraded result are degraded
+        if level <= 0 or not parameters.get("degrade", False):
+            return parameters, None
+
+        effective = dict(parameters)
+        applied: Dict[str, Any] = {}
+        for name, default in LIMIT_PARAMETERS.items():
+            requested = get_int_parameter(parameters, name, default)
+            floor = get_int_parameter(parameters, f"min_{name}", math.ceil(requested * self.min_fraction))
+            value = math.ceil(requested - level * (requested - min(floor, requested)))
+            if value < requested:
+                effective[name] = value
+                applied[name] = {"requested": requested, "applied": value}
+
+        model = parameters.get("model", default_model)
+        degraded_model = parameters.get("degraded_model", self.fallback_model)
+        if degraded_model is not None and not isinstance(degraded_model, str):
+            raise HTTPException(status_code=422, detail="Parameter 'degraded_model' must be a string")
+        if level >= self.model_level and degraded_model and degraded_model != model:
+            effective["model"] = degraded_model
+            applied["model"] = {"requested": model, "applied": degraded_model}
+
+        if not applied:
+            return parameters, None
+        self.stats["degraded"] += 1
+        self.stats["limits_reduced"] += "post_limit" in applied or "comment_limit" in applied
+        self.stats["model_switched"] += "model" in applied
+        return effective, {"level": round(level, 3), **applied}
+
+    def snapshot(self, queued: int) -> Dict[str, Any]:
+        signals = self.signals(queued)
+        return {
+            **self.stats,
+            "level": round(max(signals.values()), 3),
+            "signals": {name: round(value, 3) for name, value in signals.items()},
+            "reddit_page_latency": self.reddit_page_latency,
+            "llm_latency": self.llm_latency,
+            "rate_remaining": self.rate_remaining,
+        }
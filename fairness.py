@@ -0,0 +1,214 @@
+"""
+Per-caller fairness for /analyze, keyed on the request's user_id.
+
+- CallerQuotas: a token bucket per caller, charged with the request's estimated cost.
+- FairScheduler: a weighted fair queue over a fixed number of pipeline slots, with a
+  per-caller concurrency cap, so one busy caller cannot starve everyone else.
+- CallerMetrics: per-caller request counts, usage and latency percentiles.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+
+
+class CallerQuotas:
+    """Token buckets of `burst` cost units per caller, refilled at `rate` units per second."""
+
+    def __init__(self, rate: float, burst: float, max_callers: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_callers = max_callers
+        # caller -> (tokens, last_refill)
+        self.buckets: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def take(self, caller: str, cost: float):
+        """Charges `cost` to the caller's bucket or raises 429 with a Retry-After hint."""
+        if self.rate <= 0:
+            return
+
+        now = time.monotonic()
+        tokens, last_refill = self.buckets.pop(caller, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last_refill) * self.rate)
+        # A request larger than the whole bucket is allowed once the bucket is full
+        needed = min(cost, self.burst)
+
+        if tokens < needed:
+            self.buckets[caller] = (tokens, now)
+            retry_after = max(1, int((needed - tokens) / self.rate + 0.999))
+            raise HTTPException(status_code=429, detail=f"Quota exceeded for caller '{caller}'",
+                                headers={"Retry-After": str(retry_after)})
+
+        self.buckets[caller] = (tokens - needed, now)
+        if len(self.buckets) > self.max_callers:
+            self.buckets.popitem(last=False)
+
+
+class FairScheduler:
+    """
+    Weighted fair queue in front of the pipeline.
+
+    Each queued request gets a virtual finish tag of max(virtual_time, caller's last tag)
+    + cost / weight. When a slot frees up, the eligible waiter (caller below its
+    concurrency cap) with the smallest tag runs next. A caller sending many requests
+    therefore pushes its own tags forward and cannot crowd out occasional callers.
+    """
+
+    def __init__(self, max_concurrency: int, per_caller_concurrency: int, max_queue_per_caller: int,
+                 queue_timeout: float, retry_after: int, weights: Optional[Dict[str, float]] = None):
+        self.max_concurrency = max_concurrency
+        self.per_caller_concurrency = per_caller_concurrency
+        self.max_queue_per_caller = max_queue_per_caller
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.weights = weights or {}
+        self.active = 0
+        self.active_by_caller: Dict[str, int] = {}
+        self.queues: Dict[str, deque] = {}
+        self.last_tags: Dict[str, float] = {}
+        self.virtual_time = 0.0
+
+    def _next_tags(self, caller: str, cost: float):
+        """Returns (start_tag, finish_tag) for a new request from caller."""
+        start = max(self.virtual_time, self.last_tags.get(caller, 0.0))
+        finish = start + cost / self.weights.get(caller, 1.0)
+        self.last_tags[caller] = finish
+        return start, finish
+
+    def _eligible(self, caller: str) -> bool:
+        return self.active_by_caller.get(caller, 0) < self.per_caller_concurrency
+
+    def _start(self, caller: str):
+        self.active += 1
+        self.active_by_caller[caller] = self.active_by_caller.get(caller, 0) + 1
+
+    def _dispatch(self):
+        while self.active < self.max_concurrency:
+            candidates = [caller for caller, queue in self.queues.items() if queue and self._eligible(caller)]
+            if not candidates:
+                return
+            caller = min(candidates, key=lambda name: self.queues[name][0][0])
+            _, start, waiter = self.queues[caller].popleft()
+            if not self.queues[caller]:
+                del self.queues[caller]
+            # Virtual time follows the start tag of whatever enters service
+            self.virtual_time = max(self.virtual_time, start)
+            self._start(caller)
+            waiter.set_result(None)
+
+    def _forget_idle(self, caller: str):
+        if self.active == 0 and not self.queues:
+            # End of a busy period: nobody is behind anybody any more
+            self.active_by_caller.clear()
+            self.last_tags.clear()
+            return
+        if (not self.active_by_caller.get(caller) and caller not in self.queues
+                and self.last_tags.get(caller, 0.0) <= self.virtual_time):
+            self.active_by_caller.pop(caller, None)
+            self.last_tags.pop(caller, None)
+
+    async def acquire(self, caller: str, cost: float):
+        if self.active < self.max_concurrency and self._eligible(caller) and caller not in self.queues:
+            start, _ = self._next_tags(caller, cost)
+            self.virtual_time = max(self.virtual_time, start)
+            self._start(caller)
+            return
+
+        if len(self.queues.get(caller, ())) >= self.max_queue_per_caller:
+            raise HTTPException(status_code=429, detail=f"Too many queued requests for caller '{caller}'",
+                                headers={"Retry-After": str(self.retry_after)})
+
+        start, finish = self._next_tags(caller, cost)
+        queue = self.queues.setdefault(caller, deque())
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (finish, start, waiter)
+        queue.append(entry)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done():
+                return
+            self._remove(caller, entry)
+            raise HTTPException(status_code=503, detail="Server is busy, please retry later",
+                                headers={"Retry-After": str(self.retry_after)})
+        except BaseException:
+            if waiter.done():
+                self.release(caller)
+            else:
+                self._remove(caller, entry)
+            raise
+
+    def _remove(self, caller: str, entry):
+        queue = self.queues.get(caller)
+        if queue and entry in queue:
+            queue.remove(entry)
+            if not queue:
+                del self.queues[caller]
+        self._forget_idle(caller)
+
+    def release(self, caller: str):
+        self.active -= 1
+        self.active_by_caller[caller] -= 1
+        self._dispatch()
+        self._forget_idle(caller)
+
+    @asynccontextmanager
+    async def slot(self, caller: str, cost: float):
+        await self.acquire(caller, cost)
+        try:
+            yield
+        finally:
+            self.release(caller)
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            "scheduler_active": self.active,
+            "scheduler_queued": sum(len(queue) for queue in self.queues.values()),
+            "scheduler_waiting_callers": len(self.queues),
+        }
+
+
+class CallerMetrics:
+    """Per-caller counters and recent latencies, bounded to the most recently seen callers."""
+
+    def __init__(self, max_callers: int = 1000, latency_window: int = 200):
+        self.max_callers = max_callers
+        self.latency_window = latency_window
+        self.callers: "OrderedDict[str, dict]" = OrderedDict()
+
+    def _stats(self, caller: str) -> dict:
+        stats = self.callers.pop(caller, None)
+        if stats is None:
+            stats = {"requests": 0, "succeeded": 0, "failed": 0, "rejected": 0, "cost_used": 0,
+                     "latencies": deque(maxlen=self.latency_window)}
+        self.callers[caller] = stats
+        if len(self.callers) > self.max_callers:
+            self.callers.popitem(last=False)
+        return stats
+
+    def record_rejected(self, caller: str):
+        stats = self._stats(caller)
+        stats["requests"] += 1
+        stats["rejected"] += 1
+
+    def record(self, caller: str, latency: float, cost: int, succeeded: bool):
+        stats = self._stats(caller)
+        stats["requests"] += 1
+        stats["succeeded" if succeeded else "failed"] += 1
+        stats["cost_used"] += cost
+        stats["latencies"].append(latency)
+
+    def snapshot(self) -> Dict[str, dict]:
+        result = {}
+        for caller, stats in self.callers.items():
+            latencies = sorted(stats["latencies"])
+            summary = {key: value for key, value in stats.items() if key != "latencies"}
+            if latencies:
+                summary["latency_p50_ms"] = round(latencies[len(latencies) // 2] * 1000, 1)
+                summary["latency_p99_ms"] = round(latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] * 1000, 1)
+            result[caller] = summary
+        return result
@@ -0,0 +1,130 @@
+"""
+Request hedging for slow upstream calls (used for the OpenAI completion).
+
+The primary attempt starts immediately. If it has not started answering within a delay
+taken from a percentile of recently observed time-to-first-byte latencies, a second
+attempt is sent (possibly with different arguments, e.g. a fallback model) and the
+first successful answer wins. Hedges are capped to a fraction of primary requests so
+the extra spend stays bounded.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Executor, wait
+from typing import Any, Callable, Dict
+
+
+class HedgePolicy:
+    def __init__(self, percentile: float = 0.95, min_delay: float = 0.5, max_delay: float = 10.0,
+                 min_samples: int = 20, max_extra_ratio: float = 0.1, window: int = 500):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.max_extra_ratio = max_extra_ratio
+        self.latencies = deque(maxlen=window)
+        self.lock = threading.Lock()
+        self.stats = {"primaries": 0, "hedges": 0, "hedge_wins": 0, "hedges_denied": 0}
+
+    def record_latency(self, seconds: float):
+        with self.lock:
+            self.latencies.append(seconds)
+
+    def delay(self) -> float:
+        """How long to wait for the primary to start answering before hedging."""
+        with self.lock:
+            if len(self.latencies) < self.min_samples:
+                return self.max_delay
+            ordered = sorted(self.latencies)
+        value = ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))]
+        return min(self.max_delay, max(self.min_delay, value))
+
+    def reserve_hedge(self) -> bool:
+        """Counts a hedge if it keeps hedges within max_extra_ratio of primary requests."""
+        with self.lock:
+            if self.stats["hedges"] + 1 > self.max_extra_ratio * self.stats["primaries"]:
+                self.stats["hedges_denied"] += 1
+                return False
+            self.stats["hedges"] += 1
+            return True
+
+    def record_primary(self):
+        with self.lock:
+            self.stats["primaries"] += 1
+
+    def record_hedge_win(self):
+        with self.lock:
+            self.stats["hedge_wins"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            stats = dict(self.stats)
+        extra_ratio = round(stats["hedges"] / stats["primaries"], 4) if stats["primaries"] else 0.0
+        return {**stats, "extra_ratio": extra_ratio, "current_delay": round(self.delay(), 3)}
+
+
+class AnsweredEvent(threading.Event):
+    """An Event that calls `on_answer` the first time it is set."""
+
+    def __init__(self, on_answer: Callable[[], None]):
+        super().__init__()
+        self.on_answer = on_answer
+        self.answered_lock = threading.Lock()
+
+    def set(self):
+        with self.answered_lock:
+            first = not self.is_set()
+            super().set()
+        if first:
+            self.on_answer()
+
+
+def run_hedged(executor: Executor, policy: HedgePolicy, timeout: float,
+               primary: Callable[[threading.Event, float], Any], hedge: Callable[[threading.Event, float], Any],
+               is_success: Callable[[Any], bool], discard: Callable[[Any], None]):
+    """
+    Runs `primary` and, if it is slow to start answering, `hedge`; returns the first
+    successful result (or the last outcome if neither succeeds). Each attempt receives
+    an Event it must set once the upstream starts answering (or fails), and the time it
+    has left of `timeout`: the hedge only gets what remains after the delay, and is not
+    sent at all once nothing does. The losing attempt is abandoned and its result passed
+    to `discard` when it finishes. The primary's latency is recorded whichever wins.
+    """
+    policy.record_primary()
+
+    started = time.monotonic()
+    primary_answered = AnsweredEvent(lambda: policy.record_latency(time.monotonic() - started))
+    primary_future = executor.submit(primary, primary_answered, timeout)
+    delay = policy.delay()
+    if primary_answered.wait(min(delay, timeout)) or delay >= timeout:
+        return primary_future.result()
+
+    remaining = timeout - (time.monotonic() - started)
+    if remaining <= 0 or not policy.reserve_hedge():
+        return primary_future.result()
+
+    hedge_future = executor.submit(hedge, threading.Event(), remaining)
+    pending = {primary_future, hedge_future}
+    last_result, last_error = None, None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                last_result, last_error = None, e
+                continue
+
+            if is_success(result):
+                if future is hedge_future:
+                    policy.record_hedge_win()
+                # Abandon the loser; clean up whatever it eventually returns
+                for loser in pending:
+                    loser.add_done_callback(lambda f: f.exception() is None and discard(f.result()))
+                return result
+            last_result, last_error = result, None
+
+    if last_error is not None:
+        raise last_error
+    return last_result
@@ -0,0 +1,70 @@
+"""
+Which Reddit accounts are worth refreshing ahead of time, and how many refreshes we
+can afford.
+
+- AccessTracker: an exponentially decaying access count per username, so the top of
+  the ranking follows what users look at now rather than what they looked at once.
+- CallBudget: at most `limit` upstream calls in any sliding `window` seconds.
+
+Both take a `clock` so simulations can run on virtual time.
+"""
+
+import heapq
+import math
+import time
+from collections import deque
+from typing import Callable, Dict, List, Tuple
+
+
+class AccessTracker:
+    def __init__(self, half_life: float = 3600.0, max_entries: int = 10000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.decay = math.log(2) / half_life
+        self.max_entries = max_entries
+        self.clock = clock
+        # username -> (score, as of)
+        self.scores: Dict[str, Tuple[float, float]] = {}
+
+    def _score(self, entry: Tuple[float, float], now: float) -> float:
+        score, as_of = entry
+        return score * math.exp(-self.decay * (now - as_of))
+
+    def record(self, username: str):
+        now = self.clock()
+        key = username.lower()
+        entry = self.scores.get(key)
+        self.scores[key] = ((self._score(entry, now) if entry else 0.0) + 1.0, now)
+        if len(self.scores) > self.max_entries * 1.1:
+            # Amortized: drop the coldest tenth in one go
+            keep = heapq.nlargest(self.max_entries, self.scores.items(), key=lambda item: self._score(item[1], now))
+            self.scores = dict(keep)
+
+    def top(self, n: int) -> List[str]:
+        """The n most accessed usernames, hottest first."""
+        now = self.clock()
+        hottest = heapq.nlargest(n, self.scores.items(), key=lambda item: self._score(item[1], now))
+        return [username for username, _ in hottest]
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+
+class CallBudget:
+    def __init__(self, limit: int, window: float = 3600.0, clock: Callable[[], float] = time.monotonic):
+        self.limit = limit
+        self.window = window
+        self.clock = clock
+        self.calls = deque()
+
+    def available(self) -> int:
+        cutoff = self.clock() - self.window
+        while self.calls and self.calls[0] <= cutoff:
+            self.calls.popleft()
+        return max(0, self.limit - len(self.calls))
+
+    def spend(self, calls: int = 1):
+        now = self.clock()
+        self.calls.extend([now] * calls)
+
+    def snapshot(self) -> Dict[str, int]:
+        return {"limit": self.limit, "available": self.available()}
@@ -0,0 +1,289 @@
+"""
+Chat completion backends for summarize_with_llm.
+
+A backend takes an encoded OpenAI chat completion request body and answers the way the
+OpenAI API does, whatever actually produces the text:
+
+- HTTPBackend: any OpenAI-compatible /chat/completions endpoint, by base URL (OpenAI
+  itself, a recorder or replay server from upstream_replay.py, a self-hosted model
+  server).
+- LocalBackend: a deterministic summary computed in-process from the prompt, for tests,
+  load runs and running without network access. Optionally sleeps per generated token.
+
+Every backend offers complete() (blocking; returns a response with status_code, json(),
+text and close(), like requests.Response), stream() (yields OpenAI chat.completion.chunk
+dicts, the last one carrying usage) and their async counterparts acomplete() and
+astream(). Calls, failures, tokens and time are counted per backend with record().
+"""
+
+import abc
+import asyncio
+import json
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional, Union
+
+from outbound import HTTPClient
+
+# Words too common to say anything about a user's interests
+STOPWORDS = frozenset("""about after again also because been before being could does doing down
+every from have having here into just like more most much only other over really same some
+such than that their them then there these they this those through very what when where which
+while will with would your post title body comment""".split())
+SECTION_FIELDS = ("main_interests", "overall_tone", "activity_pattern")
+
+
+class LLMBackendError(Exception):
+    """A streamed completion was answered with an error status."""
+
+    def __init__(self, status_code: int, text: str):
+        self.status_code = status_code
+        self.text = text
+        super().__init__(f"{status_code} - {text}")
+
+
+class CompletionResponse:
+    """A completion answered in-process, with the parts of requests.Response the app reads."""
+
+    def __init__(self, status_code: int, payload: Dict[str, Any]):
+        self.status_code = status_code
+        self.payload = payload
+
+    def json(self) -> Dict[str, Any]:
+        return self.payload
+
+    @property
+    def text(self) -> str:
+        return json.dumps(self.payload)
+
+    def close(self):
+        pass
+
+
+class LLMBackend(abc.ABC):
+    kind = "base"
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lock = threading.Lock()
+        self.stats = {"calls": 0, "failures": 0, "prompt_tokens": 0, "completion_tokens": 0, "seconds": 0.0}
+
+    @abc.abstractmethod
+    def complete(self, body: bytes, timeout: float, answered: Optional[threading.Event] = None):
+        """Sends the request; `answered` is set as soon as the answer starts (or the call fails)."""
+
+    @abc.abstractmethod
+    def stream(self, body: bytes, timeout: float) -> Iterator[Dict[str, Any]]:
+        """Sends the request (which must have "stream": true) and yields the chunks as they arrive."""
+
+    async def acomplete(self, body: bytes, timeout: float):
+        return await asyncio.to_thread(self.complete, body, timeout)
+
+    async def astream(self, body: bytes, timeout: float) -> AsyncIterator[Dict[str, Any]]:
+        chunks = self.stream(body, timeout)
+        done = object()
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, done)
+            if chunk is done:
+                return
+            yield chunk
+
+    def record(self, seconds: float, succeeded: bool, usage: Optional[Dict[str, int]] = None):
+        with self.lock:
+            self.stats["calls"] += 1
+            self.stats["failures"] += not succeeded
+            self.stats["seconds"] += seconds
+            if usage:
+                self.stats["prompt_tokens"] += usage.get("prompt_tokens", 0)
+                self.stats["completion_tokens"] += usage.get("completion_tokens", 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            stats = dict(self.stats)
+        stats["mean_seconds"] = stats["seconds"] / stats["calls"] if stats["calls"] else None
+        return {"kind": self.kind, **stats}
+
+
+class HTTPBackend(LLMBackend):
+    kind = "http"
+
+    def __init__(self, name: str, base_url: Union[str, Callable[[], str]], api_key: Optional[str] = None,
+                 client: Optional[HTTPClient] = None):
+        """
+        base_url may be a callable, read on every request, for a URL that can change at runtime.
+        Requests go through `client`, which keeps connections to the server open.
+        """
+        super().__init__(name)
+        self._base_url = base_url
+        self.api_key = api_key
+        self.client = client or HTTPClient(f"llm {name}")
+
+    @property
+    def base_url(self) -> str:
+        base_url = self._base_url() if callable(self._base_url) else self._base_url
+        return base_url.rstrip("/")
+
+    def _post(self, body: bytes, timeout: float):
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return self.client.post(f"{self.base_url}/chat/completions", headers, body, timeout)
+
+    def complete(self, body: bytes, timeout: float, answered: Optional[threading.Event] = None):
+        try:
+            response = self._post(body, timeout)
+        finally:
+            if answered is not None:
+                answered.set()
+        # Reads and caches the body, releasing the connection back to the pool
+        self.client.read(response)
+        return response
+
+    def stream(self, body: bytes, timeout: float) -> Iterator[Dict[str, Any]]:
+        response = self._post(body, timeout)
+        try:
+            if response.status_code != 200:
+                self.client.read(response)
+                raise LLMBackendError(response.status_code, response.text)
+            # Server-sent events: "data: {chunk}" lines, ending with "data: [DONE]"
+            for line in response.iter_lines():
+                if isinstance(line, bytes):
+                    line = line.decode()
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    return
+                yield json.loads(data)
+        finally:
+            response.close()
+
+    def warm_up(self, timeout: float) -> bool:
+        """Connects ahead of the first completion; any answer from the server (even a 401) will do."""
+        return self.client.warm_up(f"{self.base_url}/models", timeout)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**super().snapshot(), "connections": self.client.snapshot()}
+
+
+class LocalBackend(LLMBackend):
+    """
+    Summarizes in-process: top words as interests, punctuation as tone, item counts and
+    lengths as the activity pattern. The same prompt always gives the same answer.
+    Answers honour max_tokens (finish_reason "length") and a json_object response_format;
+    seconds_per_token of generation time is simulated per completion token.
+    """
+
+    kind = "local"
+
+    def __init__(self, name: str = "local", seconds_per_token: float = 0.0):
+        super().__init__(name)
+        self.seconds_per_token = seconds_per_token
+
+    def answer(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        messages = request.get("messages") or []
+        prompt = "".join(f"{message.get('role')}:{message.get('content')}" for message in messages)
+        activity = messages[-1].get("content", "") if messages else ""
+        sections = summarize_activity(activity)
+        if (request.get("response_format") or {}).get("type") == "json_object":
+            content = json.dumps(sections)
+        else:
+            content = "\n\n".join(f"**{heading}:** {sections[name]}" for name, heading in
+                                  zip(SECTION_FIELDS, ("Main Interests", "Overall Tone", "Activity Pattern")))
+
+        # Like a model, stop mid-answer at max_tokens (4 characters per token)
+        max_tokens = request.get("max_tokens")
+        finish_reason = "stop"
+        if isinstance(max_tokens, int) and len(content) > max_tokens * 4:
+            content = content[:max_tokens * 4]
+            finish_reason = "length"
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        return {
+            "id": "chatcmpl-local",
+            "object": "chat.completion",
+            "model": request.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": finish_reason}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def _parse(self, body: bytes) -> Optional[Dict[str, Any]]:
+        try:
+            request = json.loads(body)
+        except ValueError:
+            return None
+        return request if isinstance(request, dict) else None
+
+    def _bad_request(self) -> CompletionResponse:
+        return CompletionResponse(400, {"error": {"message": "request body is not a JSON object",
+                                                  "type": "invalid_request_error"}})
+
+    def complete(self, body: bytes, timeout: float, answered: Optional[threading.Event] = None) -> CompletionResponse:
+        if answered is not None:
+            answered.set()
+        request = self._parse(body)
+        if request is None:
+            return self._bad_request()
+        payload = self.answer(request)
+        time.sleep(min(timeout, payload["usage"]["completion_tokens"] * self.seconds_per_token))
+        return CompletionResponse(200, payload)
+
+    async def acomplete(self, body: bytes, timeout: float) -> CompletionResponse:
+        request = self._parse(body)
+        if request is None:
+            return self._bad_request()
+        payload = self.answer(request)
+        await asyncio.sleep(min(timeout, payload["usage"]["completion_tokens"] * self.seconds_per_token))
+        return CompletionResponse(200, payload)
+
+    def stream(self, body: bytes, timeout: float) -> Iterator[Dict[str, Any]]:
+        request = self._parse(body)
+        if request is None:
+            raise LLMBackendError(400, "request body is not a JSON object")
+        payload = self.answer(request)
+        choice = payload["choices"][0]
+        pieces = re.findall(r"\S+\s*", choice["message"]["content"])
+        for piece in pieces:
+            time.sleep(max(1, len(piece) // 4) * self.seconds_per_token)
+            yield {"object": "chat.completion.chunk", "model": payload["model"],
+                   "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+        yield {"object": "chat.completion.chunk", "model": payload["model"],
+               "choices": [{"index": 0, "delta": {}, "finish_reason": choice["finish_reason"]}]}
+        yield {"object": "chat.completion.chunk", "model": payload["model"], "choices": [], "usage": payload["usage"]}
+
+
+def summarize_activity(activity: str) -> Dict[str, str]:
+    """The LocalBackend's summary of the activity text in a prompt, by section field."""
+    posts = activity.count("Post Title:")
+    comments = len(re.findall(r"^Comment\b", activity, re.MULTILINE))
+    words = [word.lower() for word in re.findall(r"[A-Za-z][A-Za-z']{3,}", activity)]
+    top = [word for word, _ in Counter(word for word in words if word not in STOPWORDS).most_common(5)]
+    questions = activity.count("?")
+    exclamations = activity.count("!")
+    items = max(1, posts + comments)
+    if questions > items / 2:
+        tone = "Inquisitive: many of their items ask questions."
+    elif exclamations > items / 2:
+        tone = "Enthusiastic: they write with a lot of emphasis."
+    else:
+        tone = "Matter-of-fact: mostly statements, few questions or exclamations."
+    return {
+        "main_interests": f"Frequent topics: {', '.join(top)}." if top else "No recurring topics.",
+        "overall_tone": tone,
+        "activity_pattern": f"{posts} posts and {comments} comments, about {len(words) // items} words per item.",
+    }
+
+
+def parse_backends(spec: str) -> Dict[str, str]:
+    """Reads LLM_BACKENDS ("name=base_url,name=base_url") into {name: base_url}."""
+    backends = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, separator, base_url = entry.partition("=")
+        if not separator or not name.strip() or not base_url.strip():
+            raise ValueError(f"LLM_BACKENDS entries must look like name=base_url, got {entry!r}")
+        backends[name.strip()] = base_url.strip()
+    return backends
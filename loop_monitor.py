@@ -0,0 +1,149 @@
+"""
+Event-loop lag monitoring.
+
+Anything synchronous that runs on the event loop (a slow SQLite query, a large JSON
+encode, a blocking HTTP call that was not moved to a thread) stalls every request in
+the process. LoopLagMonitor detects this in two ways:
+
+- A sampler task sleeps for `interval` and measures how late it wakes up. The drift is
+  the loop lag, recorded in a histogram.
+- A watchdog thread notices when the sampler has not run for longer than
+  `slow_callback_threshold`. It captures the loop thread's stack at that moment, which
+  points at the blocking code, and logs it.
+
+While the worst lag of the last `shed_window` seconds exceeds `shed_threshold`,
+`overloaded()` is true; /analyze uses it to turn away new work.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the lag histogram buckets, in milliseconds (plus an overflow bucket)
+LAG_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class LagHistogram:
+    def __init__(self, bounds=LAG_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value_ms: float):
+        index = 0
+        while index < len(self.bounds) and value_ms > self.bounds[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value_ms
+        self.max = max(self.max, value_ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Cumulative counts per upper bound, as in a Prometheus histogram."""
+        buckets = {}
+        running = 0
+        for bound, count in zip([*map(str, self.bounds), "+Inf"], self.counts):
+            running += count
+            buckets[bound] = running
+        return {"buckets_ms": buckets, "count": self.count, "sum_ms": round(self.total, 3),
+                "max_ms": round(self.max, 3)}
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.1, slow_callback_threshold: float = 0.1,
+                 shed_threshold: float = 0.0, shed_window: float = 5.0, max_reports: int = 20):
+        self.interval = interval
+        self.slow_callback_threshold = slow_callback_threshold
+        self.shed_threshold = shed_threshold
+        self.shed_window = shed_window
+        self.histogram = LagHistogram()
+        self.recent = deque()  # (monotonic time, lag seconds) within shed_window
+        self.slow_callbacks: deque = deque(maxlen=max_reports)
+        self.stats = {"samples": 0, "slow_callbacks": 0}
+        self.last_tick = time.monotonic()
+        self.loop_thread_id: Optional[int] = None
+        self.sampler: Optional[asyncio.Task] = None
+        self.watchdog: Optional[threading.Thread] = None
+        self.stopping = threading.Event()
+
+    def start(self):
+        """Starts the sampler on the running loop and the watchdog thread."""
+        self.loop_thread_id = threading.get_ident()
+        self.last_tick = time.monotonic()
+        self.stopping.clear()
+        self.sampler = asyncio.get_running_loop().create_task(self._sample())
+        if self.slow_callback_threshold > 0:
+            self.watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self.watchdog.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.sampler is not None:
+            self.sampler.cancel()
+            self.sampler = None
+        if self.watchdog is not None:
+            self.watchdog.join()
+            self.watchdog = None
+
+    async def _sample(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.record(max(0.0, now - expected), now)
+            self.last_tick = now
+
+    def record(self, lag: float, now: float):
+        self.stats["samples"] += 1
+        self.histogram.observe(lag * 1000)
+        self.recent.append((now, lag))
+        while self.recent and self.recent[0][0] < now - self.shed_window:
+            self.recent.popleft()
+        # The stall that just ended: fill in how long it lasted
+        if self.slow_callbacks and self.slow_callbacks[-1]["lag_ms"] is None:
+            self.slow_callbacks[-1]["lag_ms"] = round(lag * 1000, 1)
+
+    def _watch(self):
+        reported_tick = None
+        while not self.stopping.wait(self.slow_callback_threshold / 2):
+            tick = self.last_tick
+            stalled = time.monotonic() - tick - self.interval
+            if stalled > self.slow_callback_threshold and tick != reported_tick:
+                reported_tick = tick
+                self._report(stalled)
+
+    def _report(self, stalled: float):
+        frame = sys._current_frames().get(self.loop_thread_id)
+        stack = traceback.format_stack(frame) if frame is not None else []
+        self.stats["slow_callbacks"] += 1
+        self.slow_callbacks.append({"detected_at": time.time(), "blocked_for_ms": round(stalled * 1000, 1),
+                                    "lag_ms": None, "stack": stack})
+        logger.warning("Event loop blocked for %.0f ms (still running), at:\n%s", stalled * 1000, "".join(stack))
+
+    def current_lag(self) -> float:
+        """The worst lag seen in the last shed_window seconds, including a stall in progress."""
+        now = time.monotonic()
+        in_progress = max(0.0, now - self.last_tick - self.interval) if self.sampler else 0.0
+        return max([in_progress, *(lag for at, lag in self.recent if at >= now - self.shed_window)])
+
+    def overloaded(self) -> bool:
+        return self.shed_threshold > 0 and self.current_lag() > self.shed_threshold
+
+    def snapshot(self) -> Dict[str, Any]:
+        reports: List[Dict[str, Any]] = [{**report, "stack": report["stack"][-5:]} for report in self.slow_callbacks]
+        return {
+            **self.stats,
+            "lag": self.histogram.snapshot(),
+            "current_lag_ms": round(self.current_lag() * 1000, 1),
+            "overloaded": self.overloaded(),
+            "recent_slow_callbacks": reports,
+        }
@@ -1,14 +1,59 @@
 import os
+import asyncio
+import aiohttp
 import asyncpraw
+import asyncprawcore
+import hashlib
+import hmac
+import math
 import requests
 import json
+import re
+import sqlite3
+import time
+import tracemalloc
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Dict, Any, Optional
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse, Response
+from pydantic import BaseModel, ValidationError
+from typing import Dict, Any, List, Optional, Tuple
 import uvicorn
 
+from admission import AdmissionController, estimate_request_cost, normalize_limits
+from fairness import CallerMetrics, CallerQuotas, FairScheduler
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from hedging import HedgePolicy, run_hedged
+from llm_backends import HTTPBackend, LocalBackend, parse_backends
+from multiplex import AnalysisConnection, report_progress
+from outbound import DNSCache, HTTPClient, RedditConnections
+from summary_store import SummaryStore, drift
+from activity_store import EXHAUSTED, ActivityStore
+from cache import MISSING, TieredCache, create_backend
+from cluster import FORWARDED_HEADER, ClusterRouter
+from compression import CompressionMiddleware
+from hot_accounts import AccessTracker, CallBudget
+from loop_monitor import LoopLagMonitor
+from degradation import DegradationController
+from profiling import SamplingProfiler, trace_allocations
+from traffic_capture import TrafficCaptureMiddleware, TrafficRecorder
+
+try:
+    import orjson
+    DefaultResponse = ORJSONResponse
+    dump_json = orjson.dumps
+except ImportError:  # optional dependency: fall back to the standard json module
+    DefaultResponse = JSONResponse
+
+    def dump_json(value) -> bytes:
+        return json.dumps(value).encode()
+
 # --- 1. SETUP: LOAD CREDENTIALS FROM .ENV FILE ---
 # This securely loads your keys without hardcoding them in the script.
 load_dotenv()
@@ -17,17 +62,243 @@ REDDIT_CLIENT_ID = os.getenv("REDDIT_CLIENT_ID")
 REDDIT_CLIENT_SECRET = os.getenv("REDDIT_CLIENT_SECRET")
 REDDIT_USER_AGENT = os.getenv("REDDIT_USER_AGENT")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+# Reddit endpoints for access tokens and for API calls; point both (and OPENAI_BASE_URL)
+# at upstream_replay.py to record or replay upstream traffic
+REDDIT_URL = os.getenv("REDDIT_URL", "https://www.reddit.com").rstrip("/")
+REDDIT_OAUTH_URL = os.getenv("REDDIT_OAUTH_URL", "https://oauth.reddit.com").rstrip("/")
+
+# Chat completion backends (see llm_backends.py): "openai" (OPENAI_BASE_URL), "local"
+# (in-process and deterministic, no network; LLM_LOCAL_SECONDS_PER_TOKEN simulates
+# generation time) and the OpenAI-compatible servers listed in LLM_BACKENDS as
+# "name=base_url,..." (API key from LLM_<NAME>_API_KEY). LLM_BACKEND is the default;
+# requests can pick another with the "backend" parameter.
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+LLM_BACKENDS = os.getenv("LLM_BACKENDS", "")
+LLM_LOCAL_SECONDS_PER_TOKEN = float(os.getenv("LLM_LOCAL_SECONDS_PER_TOKEN", "0"))
 
 # Check if all credentials are provided
-if not all([REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT, OPENAI_API_KEY]):
-    raise ValueError("Missing credentials in the .env file. Please ensure REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT, and OPENAI_API_KEY are set.")
+if not all([REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT]) or (LLM_BACKEND == "openai" and not OPENAI_API_KEY):
+    raise ValueError("Missing credentials in the .env file. Please ensure REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT, and OPENAI_API_KEY (unless LLM_BACKEND is not \"openai\") are set.")
+
+# How long (in seconds) to remember Reddit accounts that are missing, suspended or empty.
+# Kept shorter than any positive caching so a newly active account shows up quickly.
+NEGATIVE_CACHE_TTL = int(os.getenv("NEGATIVE_CACHE_TTL", "300"))
+NEGATIVE_CACHE_MAX_ENTRIES = int(os.getenv("NEGATIVE_CACHE_MAX_ENTRIES", "10000"))
+
+# Parent submission titles looked up for include_context, shared across requests
+LINK_CONTEXT_CACHE_MAX_ENTRIES = int(os.getenv("LINK_CONTEXT_CACHE_MAX_ENTRIES", "50000"))
+# Reddit's /api/info accepts at most 100 fullnames per call
+REDDIT_INFO_BATCH_SIZE = 100
+
+# Admission control: request cost is roughly estimated prompt + completion tokens,
+# plus a fixed weight per Reddit page (see admission.py)
+ADMISSION_MAX_REQUEST_COST = int(os.getenv("ADMISSION_MAX_REQUEST_COST", "60000"))
+ADMISSION_MAX_INFLIGHT_COST = int(os.getenv("ADMISSION_MAX_INFLIGHT_COST", "300000"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "100"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "5"))
+
+# Per-caller fairness, keyed on the request's user_id (see fairness.py)
+SCHEDULER_MAX_CONCURRENCY = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "32"))
+SCHEDULER_PER_CALLER_CONCURRENCY = int(os.getenv("SCHEDULER_PER_CALLER_CONCURRENCY", "4"))
+SCHEDULER_MAX_QUEUE_PER_CALLER = int(os.getenv("SCHEDULER_MAX_QUEUE_PER_CALLER", "20"))
+# JSON object of user_id -> weight, e.g. {"dashboard": 4}; unlisted callers weigh 1
+SCHEDULER_CALLER_WEIGHTS = json.loads(os.getenv("SCHEDULER_CALLER_WEIGHTS", "{}"))
+# Token bucket per caller in cost units (a default request costs roughly 10,000)
+CALLER_QUOTA_RATE = float(os.getenv("CALLER_QUOTA_RATE", "20000"))
+CALLER_QUOTA_BURST = float(os.getenv("CALLER_QUOTA_BURST", "200000"))
+
+# End-to-end request deadline in seconds, overridable per request via the
+# X-Request-Timeout header or the timeout_seconds parameter (capped at the max)
+REQUEST_TIMEOUT_DEFAULT = float(os.getenv("REQUEST_TIMEOUT_DEFAULT", "120"))
+REQUEST_TIMEOUT_MAX = float(os.getenv("REQUEST_TIMEOUT_MAX", "300"))
+# Share of the remaining time that Reddit fetching may use; the rest is kept for the LLM
+FETCH_BUDGET_FRACTION = float(os.getenv("FETCH_BUDGET_FRACTION", "0.5"))
+# The activity text sent to the LLM is capped at ACTIVITY_TEXT_MAX_CHARS characters (about 4
+# per token): paging stops once the fetched items fill it, and older items are left out.
+# 0 disables the cap.
+ACTIVITY_TEXT_MAX_CHARS = int(os.getenv("ACTIVITY_TEXT_MAX_CHARS", "400000"))
+# How often to check whether the client has gone away
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.25"))
+
+# Circuit breakers around Reddit and OpenAI (see circuit_breaker.py)
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_SLOW_CALL_RATE = float(os.getenv("BREAKER_SLOW_CALL_RATE", "0.8"))
+BREAKER_WINDOW_SIZE = int(os.getenv("BREAKER_WINDOW_SIZE", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+REDDIT_SLOW_CALL_SECONDS = float(os.getenv("REDDIT_SLOW_CALL_SECONDS", "10"))
+OPENAI_SLOW_CALL_SECONDS = float(os.getenv("OPENAI_SLOW_CALL_SECONDS", "30"))
+
+# Hedged completions: if OpenAI has not started answering after the LLM_HEDGE_PERCENTILE
+# time-to-first-byte (clamped to the min/max delay), send a second request and keep the
+# first answer. Hedges are capped at LLM_HEDGE_MAX_RATIO of all completions.
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1.0"))
+LLM_HEDGE_MAX_DELAY = float(os.getenv("LLM_HEDGE_MAX_DELAY", "15"))
+LLM_HEDGE_MAX_RATIO = float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.1"))
+# Model for the hedge request; empty means the same model as the primary
+LLM_HEDGE_FALLBACK_MODEL = os.getenv("LLM_HEDGE_FALLBACK_MODEL", "")
+
+# Model used when a request does not name one
+DEFAULT_MODEL = "gpt-4o"
+
+# Adaptive degradation under load (see degradation.py), for requests that opt in with
+# "degrade": true; DEGRADE_ENABLED=false turns it off for all. The level is the strongest of:
+# queued requests against DEGRADE_QUEUE_DEPTH, smoothed Reddit seconds per listing page
+# against DEGRADE_REDDIT_PAGE_SECONDS and completion seconds against DEGRADE_LLM_SECONDS
+# (twice the target is full degradation), and Reddit rate-limit headroom once under
+# DEGRADE_RATE_HEADROOM. Limits shrink towards DEGRADE_MIN_FRACTION of the request's
+# (unless it sets min_post_limit / min_comment_limit); from DEGRADE_MODEL_LEVEL on the
+# completion uses DEGRADE_FALLBACK_MODEL (or the request's degraded_model).
+DEGRADE_ENABLED = os.getenv("DEGRADE_ENABLED", "true").lower() == "true"
+DEGRADE_QUEUE_DEPTH = int(os.getenv("DEGRADE_QUEUE_DEPTH", "20"))
+DEGRADE_REDDIT_PAGE_SECONDS = float(os.getenv("DEGRADE_REDDIT_PAGE_SECONDS", "1.0"))
+DEGRADE_LLM_SECONDS = float(os.getenv("DEGRADE_LLM_SECONDS", "20"))
+DEGRADE_RATE_HEADROOM = float(os.getenv("DEGRADE_RATE_HEADROOM", "0.2"))
+DEGRADE_MIN_FRACTION = float(os.getenv("DEGRADE_MIN_FRACTION", "0.25"))
+DEGRADE_MODEL_LEVEL = float(os.getenv("DEGRADE_MODEL_LEVEL", "0.5"))
+DEGRADE_FALLBACK_MODEL = os.getenv("DEGRADE_FALLBACK_MODEL", "gpt-4o-mini")
+
+# Last good summary per Reddit user, served (marked stale) while an upstream breaker is open,
+# for at most SUMMARY_CACHE_TTL seconds after it was computed
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "10000"))
+SUMMARY_CACHE_TTL = float(os.getenv("SUMMARY_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Shared cache tier for all workers: "" (in-process only), "sqlite:///path/cache.db" or
+# "redis://host:port/db". Each worker keeps entries in its own L1 for at most CACHE_L1_TTL seconds.
+CACHE_URL = os.getenv("CACHE_URL", "")
+CACHE_L1_TTL = float(os.getenv("CACHE_L1_TTL", "5"))
+# How often expired entries are deleted from a SQLite shared tier (Redis expires them itself)
+CACHE_PURGE_INTERVAL = float(os.getenv("CACHE_PURGE_INTERVAL", "3600"))
+# Identical /analyze requests within this many seconds share one result (0 disables)
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "60"))
+
+# Cluster mode: the base URLs of all nodes (comma-separated, the same list on every node)
+# and this node's own URL from that list. /analyze is forwarded to the node owning the
+# target username on a consistent-hash ring. Empty CLUSTER_NODES disables cluster mode.
+CLUSTER_NODES = [node.strip().rstrip("/") for node in os.getenv("CLUSTER_NODES", "").split(",") if node.strip()]
+CLUSTER_SELF = os.getenv("CLUSTER_SELF", "").rstrip("/")
+CLUSTER_VNODES = int(os.getenv("CLUSTER_VNODES", "100"))
+# Peers that do not accept a connection within this many seconds are treated as down
+CLUSTER_CONNECT_TIMEOUT = float(os.getenv("CLUSTER_CONNECT_TIMEOUT", "1"))
+
+# SQLite file holding each user's latest summary and its watermark, for "mode": "update"
+SUMMARY_STORE_PATH = os.getenv("SUMMARY_STORE_PATH", "summary_store.db")
+# Rebuild from the full history once incrementally added items exceed this share of the
+# items the last full rebuild was based on
+SUMMARY_UPDATE_MAX_DRIFT = float(os.getenv("SUMMARY_UPDATE_MAX_DRIFT", "0.5"))
+
+# SQLite (WAL) file of every fetched post and comment, shared by all workers (see activity_store.py)
+ACTIVITY_STORE_PATH = os.getenv("ACTIVITY_STORE_PATH", "activity_store.db")
+# Serve post_limit/comment_limit windows from the store if fetched within this many seconds (0 = never)
+ACTIVITY_STORE_MAX_AGE = float(os.getenv("ACTIVITY_STORE_MAX_AGE", "600"))
+# Retention job: drop items no fetch has seen for this long, and keep at most this many
+# posts and comments per account
+ACTIVITY_STORE_RETENTION = float(os.getenv("ACTIVITY_STORE_RETENTION", str(30 * 24 * 3600)))
+ACTIVITY_STORE_MAX_ITEMS_PER_AUTHOR = int(os.getenv("ACTIVITY_STORE_MAX_ITEMS_PER_AUTHOR", "2000"))
+ACTIVITY_STORE_MAINTENANCE_INTERVAL = float(os.getenv("ACTIVITY_STORE_MAINTENANCE_INTERVAL", "3600"))
+
+# GET /users/{username}/summary: clients and proxies may reuse a summary for SUMMARY_MAX_AGE
+# seconds, and keep serving it for SUMMARY_STALE_WHILE_REVALIDATE more while it is refreshed
+# in the background. Summaries older than both are refreshed before answering.
+SUMMARY_MAX_AGE = int(os.getenv("SUMMARY_MAX_AGE", "300"))
+SUMMARY_STALE_WHILE_REVALIDATE = int(os.getenv("SUMMARY_STALE_WHILE_REVALIDATE", "3600"))
+# Caller whose quota and fair share background refreshes use
+SUMMARY_REFRESH_CALLER = os.getenv("SUMMARY_REFRESH_CALLER", "summary-refresh")
+
+# Hot account refresher: every REFRESH_INTERVAL seconds, the REFRESH_TOP_N most requested
+# accounts whose stored summary is older than REFRESH_AHEAD_FRACTION * SUMMARY_MAX_AGE are
+# refreshed before they go stale. At most REFRESH_REDDIT_BUDGET fetches and REFRESH_LLM_BUDGET
+# completions per REFRESH_BUDGET_WINDOW seconds, and only while fewer than
+# REFRESH_MAX_BUSY_FRACTION of the pipeline slots are busy and nothing is queued. 0 disables it.
+REFRESH_TOP_N = int(os.getenv("REFRESH_TOP_N", "50"))
+REFRESH_INTERVAL = float(os.getenv("REFRESH_INTERVAL", "30"))
+REFRESH_AHEAD_FRACTION = float(os.getenv("REFRESH_AHEAD_FRACTION", "0.8"))
+REFRESH_REDDIT_BUDGET = int(os.getenv("REFRESH_REDDIT_BUDGET", "600"))
+REFRESH_LLM_BUDGET = int(os.getenv("REFRESH_LLM_BUDGET", "200"))
+REFRESH_BUDGET_WINDOW = float(os.getenv("REFRESH_BUDGET_WINDOW", "3600"))
+REFRESH_MAX_BUSY_FRACTION = float(os.getenv("REFRESH_MAX_BUSY_FRACTION", "0.5"))
+# Access counts behind "most requested" halve every this many seconds
+ACCESS_TRACKER_HALF_LIFE = float(os.getenv("ACCESS_TRACKER_HALF_LIFE", "3600"))
+
+# Opt-in capture of sanitized /analyze request shapes for replay (see traffic_capture.py).
+# Each worker writes its own file, with its pid before the extension (traffic.<pid>.jsonl),
+# rotated at TRAFFIC_CAPTURE_MAX_BYTES, keeping TRAFFIC_CAPTURE_BACKUPS old files.
+# Set TRAFFIC_CAPTURE_SALT to keep username hashes stable across workers and restarts.
+TRAFFIC_CAPTURE_PATH = os.getenv("TRAFFIC_CAPTURE_PATH", "")
+TRAFFIC_CAPTURE_MAX_BYTES = int(os.getenv("TRAFFIC_CAPTURE_MAX_BYTES", str(50 * 1024 * 1024)))
+TRAFFIC_CAPTURE_BACKUPS = int(os.getenv("TRAFFIC_CAPTURE_BACKUPS", "5"))
+TRAFFIC_CAPTURE_SALT = os.getenv("TRAFFIC_CAPTURE_SALT", "")
+
+# Event-loop lag: sampled every LOOP_LAG_INTERVAL seconds; stalls longer than
+# LOOP_SLOW_CALLBACK_THRESHOLD seconds are logged with the blocking stack (0 disables).
+# While the worst lag of the last LOOP_LAG_SHED_WINDOW seconds exceeds LOOP_LAG_SHED_THRESHOLD
+# seconds, new /analyze requests get 503 (0 disables shedding).
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+LOOP_SLOW_CALLBACK_THRESHOLD = float(os.getenv("LOOP_SLOW_CALLBACK_THRESHOLD", "0.1"))
+LOOP_LAG_SHED_THRESHOLD = float(os.getenv("LOOP_LAG_SHED_THRESHOLD", "0"))
+LOOP_LAG_SHED_WINDOW = float(os.getenv("LOOP_LAG_SHED_WINDOW", "5"))
+
+# /debug/profile and /debug/memory require `Authorization: Bearer $DEBUG_TOKEN`; unset, they are 404.
+# A profile or allocation trace runs for at most DEBUG_MAX_SECONDS.
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN", "")
+DEBUG_MAX_SECONDS = float(os.getenv("DEBUG_MAX_SECONDS", "120"))
+
+# Responses of at least this many bytes are gzip/brotli compressed if the client accepts it (-1 disables)
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+
+# /ws runs at most WS_MAX_CONCURRENCY analyses per connection and stops reading new ones
+# while WS_MAX_PENDING are unfinished; WS_SEND_QUEUE messages wait for a slow client.
+WS_MAX_CONCURRENCY = int(os.getenv("WS_MAX_CONCURRENCY", "8"))
+WS_MAX_PENDING = int(os.getenv("WS_MAX_PENDING", "64"))
+WS_SEND_QUEUE = int(os.getenv("WS_SEND_QUEUE", "256"))
+
+# Outbound connections (see outbound.py). While the server runs, host names resolve once per
+# DNS_CACHE_TTL seconds (0 disables the cache); LLM calls use HTTP/2 where the server offers
+# it and httpx[http2] is installed (OUTBOUND_HTTP2), over at most OUTBOUND_MAX_CONNECTIONS per
+# backend. Reddit connections stay open for REDDIT_KEEPALIVE_SECONDS between requests. With
+# OUTBOUND_WARMUP the Reddit and LLM connections are opened at startup, before the first
+# /analyze needs them.
+DNS_CACHE_TTL = float(os.getenv("DNS_CACHE_TTL", "60"))
+OUTBOUND_HTTP2 = os.getenv("OUTBOUND_HTTP2", "true").lower() == "true"
+OUTBOUND_MAX_CONNECTIONS = int(os.getenv("OUTBOUND_MAX_CONNECTIONS", "32"))
+REDDIT_KEEPALIVE_SECONDS = float(os.getenv("REDDIT_KEEPALIVE_SECONDS", "30"))
+OUTBOUND_WARMUP = os.getenv("OUTBOUND_WARMUP", "true").lower() == "true"
+OUTBOUND_WARMUP_TIMEOUT = float(os.getenv("OUTBOUND_WARMUP_TIMEOUT", "5"))
 
 # Authenticate with the OpenAI API
 # Note: For newer versions of openai package, we don't set the global api_key
 # Instead, we pass it directly to the client
 
 # --- FASTAPI APP SETUP ---
-app = FastAPI(title="Reddit Stalker API", description="API for analyzing Reddit user data")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Runs the background jobs (defined further down) and the DNS cache while the server is up."""
+    if DNS_CACHE_TTL > 0:
+        dns_cache.install()
+    jobs = [asyncio.create_task(activity_store_maintenance())]
+    if cache_backend is not None:
+        jobs.append(asyncio.create_task(cache_maintenance()))
+    if REFRESH_TOP_N > 0:
+        jobs.append(asyncio.create_task(hot_account_refresher()))
+    if OUTBOUND_WARMUP:
+        jobs.append(asyncio.create_task(warm_up_upstreams()))
+    loop_monitor.start()
+    yield
+    loop_monitor.stop()
+    for job in jobs:
+        job.cancel()
+    await reddit_connections.close()
+    if traffic_recorder is not None:
+        traffic_recorder.close()
+    dns_cache.uninstall()
+
+
+app = FastAPI(title="Reddit Stalker API", description="API for analyzing Reddit user data", lifespan=lifespan,
+              default_response_class=DefaultResponse)
 
 # Add CORS middleware to allow frontend communication
 app.add_middleware(
@@ -45,6 +316,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large JSON responses (see compression.py)
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+# Outermost, so captured timings include everything the client waited for
+traffic_recorder = None
+if TRAFFIC_CAPTURE_PATH:
+    traffic_recorder = TrafficRecorder(TRAFFIC_CAPTURE_PATH, max_bytes=TRAFFIC_CAPTURE_MAX_BYTES,
+                                       backup_count=TRAFFIC_CAPTURE_BACKUPS, salt=TRAFFIC_CAPTURE_SALT)
+    app.add_middleware(TrafficCaptureMiddleware, recorder=traffic_recorder)
+
 # Request model for the API
 class AnalyzeUserRequest(BaseModel):
     user_id: str
@@ -58,69 +339,721 @@ class AnalyzeUserResponse(BaseModel):
     analyzed_user: str
     summary: Optional[str] = None
     error: Optional[str] = None
+    # True when best_effort cut the Reddit fetch short and only part of the activity was summarized
+    partial: bool = False
+    # True when an upstream is unavailable and a previously computed summary was returned
+    stale: bool = False
+    # Token counts for the completion: prompt_tokens, cached_tokens, completion_tokens
+    usage: Optional[Dict[str, int]] = None
+    # How the summary was produced: "full", "incremental" or "unchanged" (no new activity)
+    summary_mode: Optional[str] = None
+    # True when an identical recent (or concurrent) request's result was returned
+    cached: bool = False
+    # With "output_format": "json": the parts of the summary by name (see SUMMARY_SECTIONS),
+    # only those listed in "sections" if given
+    sections: Optional[Dict[str, str]] = None
+    # Set when load made the server lower the limits or switch the model: the level (0-1)
+    # and, per changed parameter, {"requested": ..., "applied": ...}
+    degradation: Optional[Dict[str, Any]] = None
+
+
+# Response model for GET /users/{username}/summary
+class UserSummaryResponse(BaseModel):
+    username: str
+    summary: str
+    model: str
+    # The LLM backend that wrote it
+    backend: str
+    # When the summary last changed (ISO 8601, UTC)
+    updated_at: str
+
+
+# Simple in-process counters, exposed through GET /metrics
+metrics: Dict[str, int] = {
+    "negative_cache_hits": 0,
+    "negative_cache_misses": 0,
+    "negative_cache_stores": 0,
+    "link_context_cache_hits": 0,
+    "link_context_cache_misses": 0,
+    "link_context_info_requests": 0,
+    "deadline_exceeded": 0,
+    "partial_fetches": 0,
+    "client_disconnects": 0,
+    "stale_summaries_served": 0,
+    "llm_prompt_tokens": 0,
+    "llm_cached_prompt_tokens": 0,
+    "llm_completion_tokens": 0,
+    "summary_updates_incremental": 0,
+    "summary_updates_unchanged": 0,
+    "summary_updates_rebuilt": 0,
+    "activity_store_hits": 0,
+    "activity_store_misses": 0,
+    "activity_store_errors": 0,
+    "activity_store_pruned": 0,
+    "cache_expired_purged": 0,
+    "cache_purge_errors": 0,
+    "cluster_forwarded": 0,
+    "cluster_received": 0,
+    "cluster_fallbacks": 0,
+    "summary_not_modified": 0,
+    "summary_background_refreshes": 0,
+    "summary_background_refresh_failures": 0,
+    "hot_refreshes": 0,
+    "hot_refreshes_yielded": 0,
+    "hot_refreshes_over_budget": 0,
+    "shed_loop_lag": 0,
+    "analyze_finished": 0,
+    "activity_text_truncated": 0,
+    "llm_completions_truncated": 0,
+    "llm_invalid_structured_output": 0,
+    "ws_connections": 0,
+    "ws_analyses": 0,
+    "ws_rejected": 0,
+    "ws_progress_dropped": 0,
+    "ws_cancelled_on_close": 0,
+    "outbound_warmups": 0,
+    "outbound_warmup_failures": 0,
+}
+
+# Per-request memory accounting: the largest set of buffers (fetched items, rendered
+# activity text, prompt and request body) an /analyze pipeline held at once, in
+# characters/bytes. run_analysis sets a fresh dict per computation; worker threads
+# started with asyncio.to_thread see the same one.
+pipeline_buffers: ContextVar[Optional[Dict[str, int]]] = ContextVar("pipeline_buffers", default=None)
+# Peaks of recent computations, for /metrics
+pipeline_buffer_peaks = deque(maxlen=1000)
+
+
+def account_buffers(*sizes: int):
+    """Records buffers that are alive at the same time in the current request's pipeline."""
+    buffers = pipeline_buffers.get()
+    if buffers is not None:
+        buffers["peak"] = max(buffers["peak"], sum(sizes))
+
+
+admission = AdmissionController(
+    max_request_cost=ADMISSION_MAX_REQUEST_COST,
+    max_inflight_cost=ADMISSION_MAX_INFLIGHT_COST,
+    max_queue=ADMISSION_MAX_QUEUE,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+    retry_after=ADMISSION_RETRY_AFTER,
+)
+scheduler = FairScheduler(
+    max_concurrency=SCHEDULER_MAX_CONCURRENCY,
+    per_caller_concurrency=SCHEDULER_PER_CALLER_CONCURRENCY,
+    max_queue_per_caller=SCHEDULER_MAX_QUEUE_PER_CALLER,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+    retry_after=ADMISSION_RETRY_AFTER,
+    weights=SCHEDULER_CALLER_WEIGHTS,
+)
+reddit_breaker = CircuitBreaker(
+    "reddit",
+    failure_rate_threshold=BREAKER_FAILURE_RATE,
+    slow_call_duration=REDDIT_SLOW_CALL_SECONDS,
+    slow_call_rate_threshold=BREAKER_SLOW_CALL_RATE,
+    window_size=BREAKER_WINDOW_SIZE,
+    min_calls=BREAKER_MIN_CALLS,
+    open_duration=BREAKER_OPEN_SECONDS,
+)
+openai_breaker = CircuitBreaker(
+    "openai",
+    failure_rate_threshold=BREAKER_FAILURE_RATE,
+    slow_call_duration=OPENAI_SLOW_CALL_SECONDS,
+    slow_call_rate_threshold=BREAKER_SLOW_CALL_RATE,
+    window_size=BREAKER_WINDOW_SIZE,
+    min_calls=BREAKER_MIN_CALLS,
+    open_duration=BREAKER_OPEN_SECONDS,
+)
+
+
+# Installed in front of socket.getaddrinfo by lifespan(), and only while the app runs
+dns_cache = DNSCache(DNS_CACHE_TTL)
+reddit_connections = RedditConnections(keepalive_timeout=REDDIT_KEEPALIVE_SECONDS)
+
+
+def create_http_client(name: str) -> HTTPClient:
+    return HTTPClient(name, max_connections=OUTBOUND_MAX_CONNECTIONS, http2=OUTBOUND_HTTP2)
+
+
+def create_llm_backends() -> Dict[str, Any]:
+    backends = {
+        "openai": HTTPBackend("openai", lambda: OPENAI_BASE_URL, OPENAI_API_KEY, create_http_client("llm openai")),
+        "local": LocalBackend("local", seconds_per_token=LLM_LOCAL_SECONDS_PER_TOKEN),
+    }
+    for name, base_url in parse_backends(LLM_BACKENDS).items():
+        if name in backends:
+            raise ValueError(f"LLM_BACKENDS cannot redefine the built-in backend {name!r}")
+        backends[name] = HTTPBackend(name, base_url, os.getenv(f"LLM_{name.upper()}_API_KEY"),
+                                     create_http_client(f"llm {name}"))
+    return backends
+
+
+llm_backends = create_llm_backends()
+if LLM_BACKEND not in llm_backends:
+    raise ValueError(f"LLM_BACKEND must be one of: {', '.join(llm_backends)}")
+# One breaker per LLM_BACKENDS server; OpenAI has openai_breaker, the local backend none
+llm_breakers = {
+    name: CircuitBreaker(
+        f"llm {name}",
+        failure_rate_threshold=BREAKER_FAILURE_RATE,
+        slow_call_duration=OPENAI_SLOW_CALL_SECONDS,
+        slow_call_rate_threshold=BREAKER_SLOW_CALL_RATE,
+        window_size=BREAKER_WINDOW_SIZE,
+        min_calls=BREAKER_MIN_CALLS,
+        open_duration=BREAKER_OPEN_SECONDS,
+    )
+    for name in llm_backends if name not in ("openai", "local")
+}
+hedge_policy = HedgePolicy(
+    percentile=LLM_HEDGE_PERCENTILE,
+    min_delay=LLM_HEDGE_MIN_DELAY,
+    max_delay=LLM_HEDGE_MAX_DELAY,
+    max_extra_ratio=LLM_HEDGE_MAX_RATIO,
+)
+# Runs both attempts of a hedged completion
+hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+caller_quotas = CallerQuotas(rate=CALLER_QUOTA_RATE, burst=CALLER_QUOTA_BURST)
+caller_metrics = CallerMetrics()
+summary_store = SummaryStore(SUMMARY_STORE_PATH)
+activity_store = ActivityStore(ACTIVITY_STORE_PATH)
+access_tracker = AccessTracker(half_life=ACCESS_TRACKER_HALF_LIFE)
+refresh_reddit_budget = CallBudget(REFRESH_REDDIT_BUDGET, REFRESH_BUDGET_WINDOW)
+refresh_llm_budget = CallBudget(REFRESH_LLM_BUDGET, REFRESH_BUDGET_WINDOW)
+loop_monitor = LoopLagMonitor(interval=LOOP_LAG_INTERVAL, slow_callback_threshold=LOOP_SLOW_CALLBACK_THRESHOLD,
+                              shed_threshold=LOOP_LAG_SHED_THRESHOLD, shed_window=LOOP_LAG_SHED_WINDOW)
+degradation = DegradationController(
+    queue_depth=DEGRADE_QUEUE_DEPTH,
+    reddit_page_target=DEGRADE_REDDIT_PAGE_SECONDS,
+    llm_target=DEGRADE_LLM_SECONDS,
+    rate_headroom=DEGRADE_RATE_HEADROOM,
+    min_fraction=DEGRADE_MIN_FRACTION,
+    model_level=DEGRADE_MODEL_LEVEL,
+    fallback_model=DEGRADE_FALLBACK_MODEL,
+)
+cluster = None
+if CLUSTER_NODES:
+    cluster = ClusterRouter(
+        CLUSTER_SELF,
+        CLUSTER_NODES,
+        vnodes=CLUSTER_VNODES,
+        connect_timeout=CLUSTER_CONNECT_TIMEOUT,
+        breaker_factory=lambda node: CircuitBreaker(
+            f"peer {node}",
+            failure_rate_threshold=BREAKER_FAILURE_RATE,
+            window_size=BREAKER_WINDOW_SIZE,
+            min_calls=BREAKER_MIN_CALLS,
+            open_duration=BREAKER_OPEN_SECONDS,
+        ),
+    )
+
+
+# --- SHARED CACHES (see cache.py) ---
+cache_backend = create_backend(CACHE_URL)
+
+
+async def cache_maintenance():
+    """Background job: deletes expired shared-tier entries every CACHE_PURGE_INTERVAL."""
+    while True:
+        await asyncio.sleep(CACHE_PURGE_INTERVAL)
+        try:
+            metrics["cache_expired_purged"] += await asyncio.to_thread(cache_backend.purge_expired)
+        except (OSError, RuntimeError, sqlite3.Error):
+            metrics["cache_purge_errors"] += 1
+
+# --- NEGATIVE CACHE FOR UNAVAILABLE REDDIT ACCOUNTS ---
+# Maps lowercased username -> [status_code, detail]
+negative_cache = TieredCache("negative", cache_backend, l1_max_entries=NEGATIVE_CACHE_MAX_ENTRIES,
+                             l1_ttl=CACHE_L1_TTL)
+
+
+async def get_negative_cache_entry(username: str) -> Optional[Tuple[int, str]]:
+    """Returns (status_code, detail) if the username is known to be unavailable, otherwise None."""
+    entry = await negative_cache.get(username.lower())
+    if entry is MISSING:
+        return None
+    status_code, detail = entry
+    return status_code, detail
+
+
+async def store_negative_cache_entry(username: str, status_code: int, detail: str):
+    """Remembers that a username is missing, suspended or has no public activity."""
+    if NEGATIVE_CACHE_TTL <= 0:
+        return
+    await negative_cache.set(username.lower(), (status_code, detail), NEGATIVE_CACHE_TTL)
+    metrics["negative_cache_stores"] += 1
+
+
+def reddit_error_status(error: Exception) -> Optional[int]:
+    """Extracts the HTTP status from an asyncprawcore ResponseException (NotFound, Forbidden, ...)."""
+    response = getattr(error, "response", None)
+    return getattr(response, "status", None)
+
+
+def is_upstream_failure(status_code: Optional[int]) -> bool:
+    """Whether a status says the upstream is unhealthy (no response, 5xx or rate limited)."""
+    return status_code is None or status_code >= 500 or status_code == 429
+
+
+# Errors that mean Reddit could not be reached or did not answer in time
+REDDIT_TRANSPORT_ERRORS = (asyncprawcore.RequestException, aiohttp.ClientError, asyncio.TimeoutError, OSError)
+
+
+def reddit_health(error: Exception) -> Optional[bool]:
+    """
+    Whether an error from a Reddit call says Reddit is healthy (an answer such as 404), unhealthy
+    (transport error, 5xx or 429) or nothing at all (None: bad parameters or a bug of our own).
+    """
+    status = reddit_error_status(error)
+    if status is not None:
+        return not is_upstream_failure(status)
+    if isinstance(error, REDDIT_TRANSPORT_ERRORS):
+        return False
+    return None
+
+
+# --- LAST KNOWN GOOD SUMMARIES ---
+# Maps lowercased username -> summary
+summary_cache = TieredCache("summary", cache_backend, l1_max_entries=SUMMARY_CACHE_MAX_ENTRIES,
+                            l1_ttl=CACHE_L1_TTL)
+
+
+async def store_summary(username: str, summary: str):
+    await summary_cache.set(username.lower(), summary, ttl=SUMMARY_CACHE_TTL)
+
+
+async def get_stored_summary(username: str) -> Optional[str]:
+    summary = await summary_cache.get(username.lower())
+    return None if summary is MISSING else summary
+
+
+# --- RECENT RESULTS ---
+# Maps result_cache_key() -> {"summary", "summary_mode", "partial"}
+result_cache = TieredCache("result", cache_backend, l1_ttl=CACHE_L1_TTL,
+                           lock_ttl=REQUEST_TIMEOUT_MAX)
+
+# Parameters that change what an analysis returns. "sections" only selects from the
+# result, so requests for different sections share it. best_effort and degrade accept a
+# partial or degraded result, which callers that did not ask for one must not be handed.
+RESULT_PARAMETERS = ("post_limit", "comment_limit", "include_context", "model", "temperature",
+                     "custom_prompt", "mode", "summary_length", "output_format", "backend",
+                     "best_effort", "degrade")
+
+
+def result_cache_key(username: str, parameters: Dict[str, Any]) -> str:
+    relevant = {name: parameters[name] for name in RESULT_PARAMETERS if name in parameters}
+    canonical = json.dumps([username.lower(), relevant], sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+# --- PARENT SUBMISSION CONTEXT FOR COMMENTS ---
+# Maps submission fullname (t3_...) -> title
+link_context_cache: Dict[str, str] = {}
+
+
+async def hydrate_link_titles(reddit, link_ids) -> Dict[str, str]:
+    """
+    Returns {fullname: title} for the given submission fullnames.
+    Ids are deduplicated, served from link_context_cache where possible, and the rest
+    are fetched through /api/info in batches of REDDIT_INFO_BATCH_SIZE fullnames
+    instead of one lazy request per comment.
+    """
+    unique_ids = list(dict.fromkeys(link_ids))
+    missing = [link_id for link_id in unique_ids if link_id not in link_context_cache]
+    metrics["link_context_cache_hits"] += len(unique_ids) - len(missing)
+    metrics["link_context_cache_misses"] += len(missing)
+
+    for start in range(0, len(missing), REDDIT_INFO_BATCH_SIZE):
+        batch = missing[start:start + REDDIT_INFO_BATCH_SIZE]
+        metrics["link_context_info_requests"] += 1
+        async for submission in reddit.info(fullnames=batch):
+            if len(link_context_cache) >= LINK_CONTEXT_CACHE_MAX_ENTRIES:
+                link_context_cache.pop(next(iter(link_context_cache)))
+            link_context_cache[submission.fullname] = submission.title
+
+    return {link_id: link_context_cache[link_id] for link_id in unique_ids if link_id in link_context_cache}
+
+
+# --- LOCAL ACTIVITY STORE ---
+async def read_stored_activity(username: str, post_limit: int, comment_limit: int, include_context: bool):
+    """Returns (posts, comments) from the activity store if it can serve this window, else None."""
+    if ACTIVITY_STORE_MAX_AGE <= 0:
+        return None
+    try:
+        stored = await asyncio.to_thread(activity_store.read_window, username, post_limit, comment_limit,
+                                         ACTIVITY_STORE_MAX_AGE)
+    except sqlite3.Error:
+        metrics["activity_store_errors"] += 1
+        return None
+    # Parent titles are only stored once some request hydrated them
+    if stored is not None and include_context and any(comment["link_title"] is None for comment in stored[1]):
+        stored = None
+    metrics["activity_store_hits" if stored is not None else "activity_store_misses"] += 1
+    return stored
+
+
+async def write_stored_activity(username: str, posts, comments, windows: Optional[Tuple[int, int]]):
+    """Saves fetched items; `windows` (post_window, comment_window) marks a complete fetch."""
+    try:
+        await asyncio.to_thread(activity_store.upsert_items, username, posts + comments)
+        if windows is not None:
+            await asyncio.to_thread(activity_store.record_sync, username, *windows)
+    except sqlite3.Error:
+        # The store is an optimization; a failed write must not fail the request
+        metrics["activity_store_errors"] += 1
+
+
+async def activity_store_maintenance():
+    """Background job: retention, per-account caps and WAL compaction, every ACTIVITY_STORE_MAINTENANCE_INTERVAL."""
+    while True:
+        await asyncio.sleep(ACTIVITY_STORE_MAINTENANCE_INTERVAL)
+        try:
+            metrics["activity_store_pruned"] += await asyncio.to_thread(
+                activity_store.prune, ACTIVITY_STORE_RETENTION, ACTIVITY_STORE_MAX_ITEMS_PER_AUTHOR)
+            await asyncio.to_thread(activity_store.compact)
+        except sqlite3.Error:
+            metrics["activity_store_errors"] += 1
+
+
+# Rough per-item share of labels and separators in the activity text
+ITEM_OVERHEAD_CHARS = 32
+ITEM_SEPARATOR = "\n---\n"
+
+
+def item_chars(item: Dict[str, Any]) -> int:
+    """Approximate length of an item's rendered text, before parent titles are known."""
+    return len(item.get("title") or "") + len(item["body"] or "") + ITEM_OVERHEAD_CHARS
+
+
+def render_items(posts, comments, include_context: bool):
+    for post in posts:
+        # Add post title and selftext (if it exists)
+        yield f"Post Title: {post['title']}"
+        if post["body"]:
+            yield f"Post Body: {post['body']}"
+    for comment in comments:
+        if include_context and comment.get("link_title") is not None:
+            yield f"Comment (on post \"{comment['link_title']}\"): {comment['body']}"
+        else:
+            yield f"Comment: {comment['body']}"
+
+
+def format_activity(posts, comments, include_context: bool, max_chars: int = 0) -> str:
+    """
+    Renders stored or fetched items as the text sent to the LLM, newest first within posts
+    and comments. With max_chars, rendering stops at the first part that would not fit.
+    """
+    content = []
+    length = 0
+    for part in render_items(posts, comments, include_context):
+        length += len(part) + len(ITEM_SEPARATOR)
+        if max_chars and length > max_chars + len(ITEM_SEPARATOR):
+            metrics["activity_text_truncated"] += 1
+            if not content:
+                content.append(part[:max_chars])
+            break
+        content.append(part)
+    # Join all collected text into a single string, separated by newlines
+    return ITEM_SEPARATOR.join(content)
+
+
+def record_fetch_stats(stats: Dict[str, Any], posts, comments):
+    items = posts + comments
+    stats["items"] = len(items)
+    stats["newest_utc"] = max([stats["newest_utc"]] + [item["created_utc"] for item in items])
 
 
 # --- 2. FUNCTION TO FETCH REDDIT DATA (ASYNC) ---
-async def get_reddit_user_data(username, parameters: Dict[str, Any]):
+def create_reddit_client():
+    """
+    Creates an AsyncPRAW client with the configured credentials. Its HTTP session shares
+    the open Reddit connections; closing the client leaves them open for the next request.
+    """
+    return asyncpraw.Reddit(
+        client_id=REDDIT_CLIENT_ID,
+        client_secret=REDDIT_CLIENT_SECRET,
+        user_agent=REDDIT_USER_AGENT,
+        reddit_url=REDDIT_URL,
+        oauth_url=REDDIT_OAUTH_URL,
+        requestor_kwargs={"session": reddit_connections.session()},
+    )
+
+
+async def warm_up_upstreams():
+    """Startup job: resolves and connects to Reddit and the LLM servers ahead of the first request."""
+    results = await asyncio.gather(
+        # Tokens come from reddit_url, listings from oauth_url
+        reddit_connections.warm_up(REDDIT_URL, OUTBOUND_WARMUP_TIMEOUT),
+        reddit_connections.warm_up(REDDIT_OAUTH_URL, OUTBOUND_WARMUP_TIMEOUT),
+        *(asyncio.to_thread(backend.warm_up, OUTBOUND_WARMUP_TIMEOUT)
+          for backend in llm_backends.values() if isinstance(backend, HTTPBackend)),
+    )
+    metrics["outbound_warmups"] += sum(results)
+    metrics["outbound_warmup_failures"] += len(results) - sum(results)
+
+
+async def get_reddit_user_data(username, parameters: Dict[str, Any], deadline: Optional[float] = None,
+                               stats: Optional[Dict[str, Any]] = None, since: Optional[float] = None):
     """
     Fetches recent submissions and comments for a given Reddit username.
-    Parameters can include post_limit and comment_limit.
+    Parameters can include post_limit, comment_limit, include_context
+    (prefix each comment with the title of the post it was made on) and best_effort.
+
+    If `since` (a created_utc watermark) is given, only newer items are fetched and paging
+    stops at the first older one; no new activity returns an empty string. stats["items"]
+    and stats["newest_utc"] report how many items were fetched and the newest one's time.
+
+    If a deadline (time.monotonic() value) is given, fetching may use FETCH_BUDGET_FRACTION
+    of the remaining time. When that budget runs out, best_effort requests continue with
+    whatever was fetched so far (stats["partial"] is set); others fail with 504.
+
+    Missing (404), suspended/forbidden (403) and empty accounts are recorded in the
+    negative cache so repeated lookups can be answered without calling Reddit.
+
+    Windows fetched in full within ACTIVITY_STORE_MAX_AGE are served from the activity
+    store; everything fetched from Reddit is written to it. `since` fetches always go to
+    Reddit: they bring a summary up to date, which a store older than the summary cannot.
     """
     post_limit = parameters.get("post_limit", 10)
     comment_limit = parameters.get("comment_limit", 100)
+    include_context = bool(parameters.get("include_context", False))
+    best_effort = bool(parameters.get("best_effort", False))
+    stats = stats if stats is not None else {}
+    stats["partial"] = False
+    stats["truncated"] = False
+    stats["items"] = 0
+    stats["newest_utc"] = since or 0.0
+    reddit = None
+
+    # Served locally even while Reddit's breaker is open
+    stored = None
+    if since is None:
+        stored = await read_stored_activity(username, post_limit, comment_limit, include_context)
+    if stored is not None:
+        posts, comments = stored
+        record_fetch_stats(stats, posts, comments)
+        text = format_activity(posts, comments, include_context, ACTIVITY_TEXT_MAX_CHARS)
+        account_buffers(sum(map(item_chars, posts + comments)), len(text))
+        return text
+
+    # Fail fast while Reddit is known to be unhealthy
+    reddit_breaker.before_call()
+    started = time.monotonic()
+    healthy = None
     
     try:
         # Initialize AsyncPRAW with your credentials
-        reddit = asyncpraw.Reddit(
-            client_id=REDDIT_CLIENT_ID,
-            client_secret=REDDIT_CLIENT_SECRET,
-            user_agent=REDDIT_USER_AGENT,
-        )
+        reddit = create_reddit_client()
 
         redditor = await reddit.redditor(username)
         
         # Load the redditor to ensure it exists and is accessible
-        await redditor.load()
+        try:
+            await redditor.load()
+        except Exception as e:
+            status = reddit_error_status(e)
+            if status == 404:
+                detail = f"Reddit user u/{username} was not found"
+                await store_negative_cache_entry(username, 404, detail)
+                raise HTTPException(status_code=404, detail=detail)
+            if status == 403:
+                detail = f"Reddit user u/{username} is suspended or not accessible"
+                await store_negative_cache_entry(username, 403, detail)
+                raise HTTPException(status_code=403, detail=detail)
+            raise
 
-        # Use a list to store all the text content
-        content = []
+        # Suspended accounts load successfully but only expose a few attributes
+        if getattr(redditor, "is_suspended", False):
+            detail = f"Reddit user u/{username} is suspended"
+            await store_negative_cache_entry(username, 403, detail)
+            raise HTTPException(status_code=403, detail=detail)
 
-        # Fetch recent submissions (posts)
-        async for submission in redditor.submissions.new(limit=post_limit):
-            # Add post title and selftext (if it exists)
-            content.append(f"Post Title: {submission.title}")
-            if submission.selftext:
-                content.append(f"Post Body: {submission.selftext}")
+        posts = []
+        comments = []
+        fetched_chars = 0
 
-        # Fetch recent comments
-        async for comment in redditor.comments.new(limit=comment_limit):
-            content.append(f"Comment: {comment.body}")
+        def is_new(item):
+            return since is None or item.created_utc > since
 
-        if not content:
-            raise ValueError(f"No recent public activity found for u/{username}")
+        def keep(items, item) -> bool:
+            """Adds a fetched item; False once the activity text budget is full."""
+            nonlocal fetched_chars
+            items.append(item)
+            fetched_chars += item_chars(item)
+            if ACTIVITY_TEXT_MAX_CHARS and fetched_chars >= ACTIVITY_TEXT_MAX_CHARS:
+                # Older items would not make it into the prompt; stop paging
+                stats["truncated"] = True
+                return False
+            return True
 
-        # Close the reddit instance
-        await reddit.close()
+        async def collect():
+            # Fetch recent submissions (posts)
+            async for submission in redditor.submissions.new(limit=post_limit):
+                # Listings are newest first, so everything after this is already summarized
+                if not is_new(submission):
+                    break
+                if not keep(posts, {"fullname": submission.fullname, "kind": "post",
+                                    "created_utc": submission.created_utc, "title": submission.title,
+                                    "body": submission.selftext}):
+                    return
 
-        # Join all collected text into a single string, separated by newlines
-        return "\n---\n".join(content)
+            # Fetch recent comments
+            async for comment in redditor.comments.new(limit=comment_limit):
+                if not is_new(comment):
+                    break
+                if not keep(comments, {"fullname": comment.fullname, "kind": "comment",
+                                       "created_utc": comment.created_utc, "body": comment.body,
+                                       "link_id": comment.link_id}):
+                    break
 
+            # Look up parent post titles in bulk rather than via comment.submission
+            if include_context and comments:
+                link_titles = await hydrate_link_titles(reddit, [comment["link_id"] for comment in comments])
+                for comment in comments:
+                    comment["link_title"] = link_titles.get(comment["link_id"])
+
+        if deadline is None:
+            await collect()
+        else:
+            fetch_budget = max(0.0, (deadline - time.monotonic()) * FETCH_BUDGET_FRACTION)
+            try:
+                await asyncio.wait_for(collect(), timeout=fetch_budget)
+            except asyncio.TimeoutError:
+                if not (best_effort and (posts or comments)):
+                    metrics["deadline_exceeded"] += 1
+                    raise HTTPException(status_code=504, detail=f"Timed out fetching Reddit data for u/{username}")
+                # Summarize whatever made it in before the budget ran out
+                stats["partial"] = True
+                metrics["partial_fetches"] += 1
+
+        if not posts and not comments and since is None:
+            detail = f"No recent public activity found for u/{username}"
+            await store_negative_cache_entry(username, 404, detail)
+            raise HTTPException(status_code=404, detail=detail)
+
+        healthy = True
+        degradation.observe_reddit(time.monotonic() - started, 1 + max(1, math.ceil(len(posts) / 100))
+                                   + max(1, math.ceil(len(comments) / 100)))
+        record_fetch_stats(stats, posts, comments)
+        windows = None
+        if since is None and not stats["partial"] and not stats["truncated"]:
+            # Fewer items than asked for means Reddit has no more to give
+            windows = (post_limit if len(posts) >= post_limit else EXHAUSTED,
+                       comment_limit if len(comments) >= comment_limit else EXHAUSTED)
+        await write_stored_activity(username, posts, comments, windows)
+        text = format_activity(posts, comments, include_context, ACTIVITY_TEXT_MAX_CHARS)
+        account_buffers(fetched_chars, len(text))
+        return text
+
+    except HTTPException:
+        # 404/403 are healthy answers from Reddit. A 504 from our fetch budget is judged by
+        # its duration instead, so a caller's short timeout alone cannot trip the breaker.
+        healthy = True
+        raise
     except Exception as e:
+        healthy = reddit_health(e)
+        if healthy is None:
+            # Not Reddit's doing: leave the breaker alone and surface it as the caller's own error
+            raise
         raise HTTPException(status_code=400, detail=f"Error fetching data from Reddit: {str(e)}")
+    finally:
+        # Close the reddit instance
+        if reddit is not None:
+            limits = getattr(getattr(reddit, "auth", None), "limits", None) or {}
+            degradation.observe_rate_limit(limits.get("remaining"), limits.get("used"))
+            await reddit.close()
+
+        duration = time.monotonic() - started
+        if healthy is None:
+            # Cancelled (deadline or disconnect) before Reddit answered, or failed on our side
+            reddit_breaker.record_ignored()
+        elif healthy:
+            reddit_breaker.record_success(duration)
+        else:
+            reddit_breaker.record_failure(duration)
 
 
 # --- 3. FUNCTION TO SUMMARIZE TEXT WITH LLM ---
-def summarize_with_llm(user_data, username, parameters: Dict[str, Any]):
+# The fixed part of the prompt. It is sent byte-for-byte identical on every request with
+# the same summary_length and output_format, and always before any per-user text, so the
+# provider's prompt (prefix) cache can reuse it.
+SYSTEM_PROMPT = "You are a helpful assistant that analyzes Reddit user histories to create a concise, insightful summary. Be objective and base your analysis strictly on the provided text."
+
+ANALYSIS_TEMPLATE = """You will be given a collection of recent Reddit posts and comments from one user.
+Based *only* on this data, generate a summary that covers:
+1.  **Main Interests:** What are the recurring topics, hobbies, or communities they engage with?
+2.  **Overall Tone:** Do they seem helpful, argumentative, humorous, or technical?
+3.  **Activity Pattern:** What kind of content do they typically post or comment on?
+
+{length}
+
+{output_format}"""
+
+ANALYSIS_MARKDOWN = """Output format: Markdown. Start each of the three parts with its bold heading exactly as
+written above (**Main Interests:**, **Overall Tone:**, **Activity Pattern:**). Do not add
+an introduction or closing remarks."""
+
+
+UPDATE_TEMPLATE = """You will be given an existing summary of one Reddit user and their posts and comments
+made since that summary was written. Update the summary so it reflects all of their activity:
+keep what still holds, adjust what the new activity changes and add anything new. Do not
+describe the new activity separately.
+
+{length}
+
+{output_format}"""
+
+UPDATE_MARKDOWN = """Output format: Markdown, with the same three bold headings as the existing summary
+(**Main Interests:**, **Overall Tone:**, **Activity Pattern:**). Do not add an
+introduction or closing remarks."""
+
+# "output_format": "json" asks for one field per part, so the parts can be returned on
+# their own (the "sections" parameter) from one cached result
+SUMMARY_SECTIONS = {
+    "main_interests": "Main Interests",
+    "overall_tone": "Overall Tone",
+    "activity_pattern": "Activity Pattern",
+}
+
+JSON_FORMAT = """Output format: a JSON object with exactly three string fields, one per part:
+"main_interests", "overall_tone" and "activity_pattern". Each field holds plain text
+without the heading. Do not add other fields."""
+
+# "summary_length" tiers. Completion time grows with every generated token, so a tier sets
+# both the length the prompt asks for and a hard completion token cap.
+SUMMARY_LENGTHS = {
+    "brief": {"max_tokens": 300, "instruction": "Keep each part to one or two sentences."},
+    "standard": {"max_tokens": 1000, "instruction": "Keep the summary to about 3-4 paragraphs."},
+    "detailed": {"max_tokens": 2000,
+                 "instruction": "Write about 6-8 paragraphs, with specific examples from the activity for each part."},
+}
+DEFAULT_SUMMARY_LENGTH = "standard"
+# The prompts ask for no closing remarks; stop generating if the model starts one anyway
+SUMMARY_STOP = ["\n\nIn summary", "\n\nIn conclusion", "\n\n**Conclusion"]
+
+# The instructions for the default, standard-length Markdown summary
+ANALYSIS_INSTRUCTIONS = ANALYSIS_TEMPLATE.format(length=SUMMARY_LENGTHS[DEFAULT_SUMMARY_LENGTH]["instruction"],
+                                                 output_format=ANALYSIS_MARKDOWN)
+UPDATE_INSTRUCTIONS = UPDATE_TEMPLATE.format(length=SUMMARY_LENGTHS[DEFAULT_SUMMARY_LENGTH]["instruction"],
+                                             output_format=UPDATE_MARKDOWN)
+
+
+def build_messages(user_data, username, custom_prompt: Optional[str] = None,
+                   previous_summary: Optional[str] = None, summary_length: str = DEFAULT_SUMMARY_LENGTH,
+                   structured: bool = False):
     """
-    Sends the user's data to an LLM and returns a summary.
-    Parameters can include model, temperature, and custom prompts.
+    Returns the chat messages for a summary request: the cacheable fixed prefix first,
+    then the variable per-user part. With a previous_summary, user_data is only the
+    new activity and the model is asked to update the summary. summary_length picks the
+    length instruction and structured asks for JSON_FORMAT instead of Markdown.
     """
-    model = parameters.get("model", "gpt-4o")
-    temperature = parameters.get("temperature", 0.5)
-    custom_prompt = parameters.get("custom_prompt")
-
-    # This is your "prompt engineering" part. Be specific!
-    system_prompt = "You are a helpful assistant that analyzes Reddit user histories to create a concise, insightful summary. Be objective and base your analysis strictly on the provided text."
+    length = SUMMARY_LENGTHS[summary_length]["instruction"]
+    if previous_summary is not None:
+        instructions = UPDATE_TEMPLATE.format(length=length, output_format=JSON_FORMAT if structured else UPDATE_MARKDOWN)
+        return [
+            {"role": "system", "content": f"{SYSTEM_PROMPT}\n\n{instructions}"},
+            {"role": "user", "content": f"Reddit user: u/{username}\n\n--- EXISTING SUMMARY ---\n{previous_summary}\n"
+                                        f"--- END EXISTING SUMMARY ---\n\n--- NEW ACTIVITY ---\n{user_data}\n--- END NEW ACTIVITY ---"},
+        ]
 
     if custom_prompt:
         # Check if custom prompt has format placeholders
@@ -129,51 +1062,220 @@ def summarize_with_llm(user_data, username, parameters: Dict[str, Any]):
         else:
             # If no placeholders, append the data to the custom prompt
             user_prompt = f"{custom_prompt}\n\nUser: u/{username}\nData: {user_data}"
-    else:
-        user_prompt = f"""
-        Please analyze the following collection of recent Reddit posts and comments from the user u/{username}.
-        Based *only* on this data, generate a summary that covers:
-        1.  **Main Interests:** What are the recurring topics, hobbies, or communities they engage with?
-        2.  **Overall Tone:** Do they seem helpful, argumentative, humorous, or technical?
-        3.  **Activity Pattern:** What kind of content do they typically post or comment on?
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt},
+        ]
 
-        Keep the summary to about 3-4 paragraphs.
+    instructions = ANALYSIS_TEMPLATE.format(length=length, output_format=JSON_FORMAT if structured else ANALYSIS_MARKDOWN)
+    return [
+        {"role": "system", "content": f"{SYSTEM_PROMPT}\n\n{instructions}"},
+        {"role": "user", "content": f"Reddit user: u/{username}\n\n--- USER DATA ---\n{user_data}\n--- END USER DATA ---"},
+    ]
 
-        --- USER DATA ---
-        {user_data}
-        --- END USER DATA ---
-        """
+
+def get_output_options(parameters: Dict[str, Any]) -> Tuple[str, bool, Optional[List[str]]]:
+    """
+    Reads summary_length, output_format and sections, raising 422 if they are malformed.
+    Returns (summary_length, structured, sections or None for all of them).
+    """
+    summary_length = parameters.get("summary_length", DEFAULT_SUMMARY_LENGTH)
+    if summary_length not in SUMMARY_LENGTHS:
+        raise HTTPException(status_code=422,
+                            detail=f"Parameter 'summary_length' must be one of: {', '.join(SUMMARY_LENGTHS)}")
+    output_format = parameters.get("output_format", "markdown")
+    if output_format not in ("markdown", "json"):
+        raise HTTPException(status_code=422, detail="Parameter 'output_format' must be 'markdown' or 'json'")
+    structured = output_format == "json"
+    if structured and parameters.get("custom_prompt"):
+        raise HTTPException(status_code=422, detail="Parameter 'output_format' 'json' cannot be used with 'custom_prompt'")
+
+    sections = parameters.get("sections")
+    if sections is not None:
+        if not structured:
+            raise HTTPException(status_code=422, detail="Parameter 'sections' requires 'output_format' 'json'")
+        if not isinstance(sections, list) or not sections or any(name not in SUMMARY_SECTIONS for name in sections):
+            raise HTTPException(status_code=422,
+                                detail=f"Parameter 'sections' must be a list of: {', '.join(SUMMARY_SECTIONS)}")
+    return summary_length, structured, sections
+
+
+def render_sections(sections: Dict[str, str]) -> str:
+    """Renders structured sections as the Markdown summary, with the usual bold headings."""
+    return "\n\n".join(f"**{heading}:** {sections[name].strip()}"
+                        for name, heading in SUMMARY_SECTIONS.items() if name in sections)
+
+
+def split_sections(summary: str) -> Dict[str, str]:
+    """Splits a Markdown summary back into sections at the bold headings; missing ones are left out."""
+    headings = {f"**{heading}:**": name for name, heading in SUMMARY_SECTIONS.items()}
+    pattern = "|".join(re.escape(heading) for heading in headings)
+    parts = re.split(f"({pattern})", summary)
+    return {headings[parts[i]]: parts[i + 1].strip() for i in range(1, len(parts) - 1, 2)}
+
+
+def parse_structured_summary(content: str) -> Dict[str, str]:
+    """Reads a JSON_FORMAT completion, raising ValueError if it is not the requested object."""
+    try:
+        parsed = json.loads(content)
+    except ValueError:
+        parsed = None
+    if not isinstance(parsed, dict) or any(not isinstance(parsed.get(name), str) for name in SUMMARY_SECTIONS):
+        metrics["llm_invalid_structured_output"] += 1
+        raise ValueError("completion is not the requested JSON object")
+    return {name: parsed[name] for name in SUMMARY_SECTIONS}
+
+
+def extract_usage(result: Dict[str, Any]) -> Dict[str, int]:
+    """Pulls token counts, including prompt tokens served from the provider's cache, from a completion."""
+    usage = result.get("usage") or {}
+    details = usage.get("prompt_tokens_details") or {}
+    return {
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "cached_tokens": details.get("cached_tokens", 0),
+        "completion_tokens": usage.get("completion_tokens", 0),
+    }
+
+
+def get_llm_backend(parameters: Dict[str, Any]):
+    """The backend named by the "backend" parameter (default LLM_BACKEND), raising 422 for unknown names."""
+    name = parameters.get("backend", LLM_BACKEND)
+    backend = llm_backends.get(name) if isinstance(name, str) else None
+    if backend is None:
+        raise HTTPException(status_code=422, detail=f"Parameter 'backend' must be one of: {', '.join(llm_backends)}")
+    return backend
+
+
+def is_canonical_summary(parameters: Dict[str, Any]) -> bool:
+    """
+    Whether an analysis with these parameters produces the summary kept per user (in
+    summary_store and summary_cache): the standard prompt at the default summary_length on
+    the default LLM backend. Custom prompts and other length tiers produce summaries in
+    their own format or length, which updates would not preserve, and other backends (the
+    local one especially) are not what readers of the stored summary expect. JSON output
+    qualifies: it is rendered to the same Markdown sections.
+    """
+    return (not parameters.get("custom_prompt")
+            and parameters.get("summary_length", DEFAULT_SUMMARY_LENGTH) == DEFAULT_SUMMARY_LENGTH
+            and parameters.get("backend", LLM_BACKEND) == LLM_BACKEND)
+
+
+def llm_breaker(name: str) -> Optional[CircuitBreaker]:
+    return openai_breaker if name == "openai" else llm_breakers.get(name)
+
+
+def hedged_chat_completion(backend, data: Dict[str, Any], body: bytes, timeout: float, fallback_model: str):
+    """
+    Sends the completion request (`body` is `data` encoded), hedging with a second one if it
+    is slow to start answering; both end within `timeout`. A hedge to another model is only
+    encoded if it is sent.
+    """
+    def hedge_body():
+        return dump_json(dict(data, model=fallback_model)) if fallback_model else body
+
+    return run_hedged(
+        hedge_executor,
+        hedge_policy,
+        timeout,
+        primary=lambda answered, remaining: backend.complete(body, remaining, answered),
+        hedge=lambda answered, remaining: backend.complete(hedge_body(), remaining, answered),
+        is_success=lambda response: response.status_code == 200,
+        discard=lambda response: response.close(),
+    )
+
+
+def summarize_with_llm(user_data, username, parameters: Dict[str, Any], deadline: Optional[float] = None,
+                       usage: Optional[Dict[str, int]] = None, previous_summary: Optional[str] = None):
+    """
+    Sends the user's data to an LLM and returns a summary.
+    Parameters can include model, temperature, and custom prompts, plus hedge / hedge_model
+    to override LLM_HEDGE_ENABLED / LLM_HEDGE_FALLBACK_MODEL for this request,
+    summary_length / output_format (see SUMMARY_LENGTHS; "json" completions are returned
+    rendered as Markdown) and backend (see llm_backends).
+    If a deadline (time.monotonic() value) is given, the HTTP timeout never runs past it.
+    If a usage dict is given it is filled with the completion's token counts.
+    If previous_summary is given, user_data is new activity to fold into that summary.
+    """
+    timeout = 60
+    if deadline is not None:
+        timeout = min(timeout, deadline - time.monotonic())
+        if timeout <= 0:
+            metrics["deadline_exceeded"] += 1
+            raise HTTPException(status_code=504, detail="Request deadline exceeded before summarization")
+
+    model = parameters.get("model", DEFAULT_MODEL)
+    temperature = parameters.get("temperature", 0.5)
+    custom_prompt = parameters.get("custom_prompt")
+    hedge = bool(parameters.get("hedge", LLM_HEDGE_ENABLED))
+    hedge_model = parameters.get("hedge_model", LLM_HEDGE_FALLBACK_MODEL)
+    summary_length, structured, _ = get_output_options(parameters)
+    backend = get_llm_backend(parameters)
+    breaker = llm_breaker(backend.name)
+
+    # This is your "prompt engineering" part. Be specific!
+    messages = build_messages(user_data, username, custom_prompt, previous_summary, summary_length, structured)
+
+    # Fail fast while the backend is known to be unhealthy
+    if breaker is not None:
+        breaker.before_call()
+    started = time.monotonic()
+    upstream_failed = True
+    token_usage = None
 
     try:
-        # Use direct HTTP requests to avoid package conflicts
-        url = "https://api.openai.com/v1/chat/completions"
-        
-        headers = {
-            "Authorization": f"Bearer {OPENAI_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
         data = {
             "model": model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
+            "messages": messages,
             "temperature": temperature,
-            "max_tokens": 1000
+            "max_tokens": SUMMARY_LENGTHS[summary_length]["max_tokens"]
         }
-        
-        response = requests.post(url, headers=headers, json=data, timeout=60)
+        if structured:
+            data["response_format"] = {"type": "json_object"}
+        elif not custom_prompt:
+            # Custom prompts may well ask for a conclusion
+            data["stop"] = SUMMARY_STOP
+        # Encoded once, straight to bytes; hedges and retries reuse it
+        body = dump_json(data)
+        account_buffers(len(user_data), len(messages[-1]["content"]), len(body))
+
+        if hedge:
+            response = hedged_chat_completion(backend, data, body, timeout, hedge_model)
+        else:
+            response = backend.complete(body, timeout)
+        upstream_failed = is_upstream_failure(response.status_code)
         
         if response.status_code == 200:
+            degradation.observe_llm(time.monotonic() - started)
             result = response.json()
-            summary = result['choices'][0]['message']['content']
+            choice = result['choices'][0]
+            summary = choice['message']['content']
+            if choice.get("finish_reason") == "length":
+                metrics["llm_completions_truncated"] += 1
+            if structured:
+                summary = render_sections(parse_structured_summary(summary))
+
+            token_usage = extract_usage(result)
+            metrics["llm_prompt_tokens"] += token_usage["prompt_tokens"]
+            metrics["llm_cached_prompt_tokens"] += token_usage["cached_tokens"]
+            metrics["llm_completion_tokens"] += token_usage["completion_tokens"]
+            if usage is not None:
+                usage.update(token_usage)
             return summary
         else:
-            raise HTTPException(status_code=500, detail=f"OpenAI API error: {response.status_code} - {response.text}")
+            raise HTTPException(status_code=500, detail=f"LLM backend '{backend.name}' error: "
+                                                        f"{response.status_code} - {response.text}")
 
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error communicating with OpenAI API: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error communicating with LLM backend '{backend.name}': {str(e)}")
+    finally:
+        elapsed = time.monotonic() - started
+        backend.record(elapsed, token_usage is not None, token_usage)
+        if breaker is None:
+            pass
+        elif upstream_failed:
+            breaker.record_failure(elapsed)
+        else:
+            breaker.record_success(elapsed)
 
 
 # --- 4. API ENDPOINTS ---
@@ -182,38 +1284,645 @@ async def root():
     """Health check endpoint."""
     return {"message": "Reddit Stalker API is running", "status": "healthy"}
 
+@app.get("/metrics")
+async def get_metrics():
+    """Returns in-process counters for monitoring."""
+    return {
+        **metrics,
+        "negative_cache_size": len(negative_cache),
+        "link_context_cache_size": len(link_context_cache),
+        **admission.snapshot(),
+        **scheduler.snapshot(),
+        "summary_cache_size": len(summary_cache),
+        "caches": {
+            "backend": type(cache_backend).__name__ if cache_backend is not None else "in-process",
+            "negative": negative_cache.snapshot(),
+            "summary": summary_cache.snapshot(),
+            "result": result_cache.snapshot(),
+        },
+        # COUNT(*) scans the table: off the event loop
+        "summary_store_size": await asyncio.to_thread(len, summary_store),
+        "activity_store_size": await asyncio.to_thread(len, activity_store),
+        "llm_hedging": hedge_policy.snapshot(),
+        "circuit_breakers": {
+            "reddit": reddit_breaker.snapshot(),
+            "openai": openai_breaker.snapshot(),
+            **{f"llm {name}": breaker.snapshot() for name, breaker in llm_breakers.items()},
+        },
+        "llm_backends": {
+            "default": LLM_BACKEND,
+            **{name: backend.snapshot() for name, backend in llm_backends.items()},
+        },
+        "outbound": {
+            "dns": dns_cache.snapshot(),
+            "reddit": reddit_connections.snapshot(),
+        },
+        "callers": caller_metrics.snapshot(),
+        "cluster": cluster.snapshot() if cluster is not None else None,
+        "hot_accounts": {
+            "tracked": len(access_tracker),
+            "reddit_budget": refresh_reddit_budget.snapshot(),
+            "llm_budget": refresh_llm_budget.snapshot(),
+        },
+        "traffic_capture": traffic_recorder.snapshot() if traffic_recorder is not None else None,
+        "event_loop": loop_monitor.snapshot(),
+        "pipeline_buffer_bytes": buffer_percentiles(),
+        "degradation": degradation.snapshot(queued_requests()),
+    }
+
+
+def buffer_percentiles() -> Dict[str, int]:
+    """Peak buffered bytes per /analyze computation, over the most recent ones."""
+    peaks = sorted(pipeline_buffer_peaks)
+    if not peaks:
+        return {}
+    return {
+        "p50": peaks[len(peaks) // 2],
+        "p99": peaks[min(len(peaks) - 1, int(0.99 * len(peaks)))],
+        "max": peaks[-1],
+    }
+
+def get_request_timeout(parameters: Dict[str, Any], raw_request: Optional[Request]) -> float:
+    """Reads the request timeout from X-Request-Timeout or timeout_seconds, capped at REQUEST_TIMEOUT_MAX."""
+    value = parameters.get("timeout_seconds", REQUEST_TIMEOUT_DEFAULT)
+    if raw_request is not None and "x-request-timeout" in raw_request.headers:
+        value = raw_request.headers["x-request-timeout"]
+    try:
+        timeout = float(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=422, detail="Request timeout must be a number of seconds")
+    if timeout <= 0:
+        raise HTTPException(status_code=422, detail="Request timeout must be positive")
+    return min(timeout, REQUEST_TIMEOUT_MAX)
+
+
+async def await_pipeline(pipeline: asyncio.Task, raw_request: Optional[Request], deadline: float):
+    """
+    Waits for the pipeline task, cancelling it (and so freeing its scheduler and admission
+    slots and aborting Reddit paging) if the deadline passes or the client disconnects.
+    """
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                metrics["deadline_exceeded"] += 1
+                raise HTTPException(status_code=504, detail="Request deadline exceeded")
+
+            done, _ = await asyncio.wait({pipeline}, timeout=min(DISCONNECT_POLL_INTERVAL, remaining))
+            if done:
+                return pipeline.result()
+
+            if raw_request is not None and await raw_request.is_disconnected():
+                metrics["client_disconnects"] += 1
+                # Nobody will read this response; 499 is the conventional "client closed request" code
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    finally:
+        if not pipeline.done():
+            pipeline.cancel()
+            try:
+                await pipeline
+            except (asyncio.CancelledError, Exception):
+                pass
+
+
+async def build_summary(username: str, parameters: Dict[str, Any], deadline: float,
+                        fetch_stats: Dict[str, Any], usage: Dict[str, int],
+                        applied_degradation: Optional[Dict[str, Any]] = None) -> Tuple[str, str]:
+    """
+    Fetches and summarizes the account; returns (summary, summary_mode).
+
+    With "mode": "update" and a stored summary for the same model and backend, only activity
+    newer than the stored watermark is fetched and folded into that summary ("incremental"),
+    or the stored summary is returned as is if there is none ("unchanged"). Past
+    SUMMARY_UPDATE_MAX_DRIFT, or without a stored summary, the full history is summarized.
+    Only canonical summaries (is_canonical_summary) are stored or updated, and never ones
+    built with applied_degradation, so a shallower run cannot replace the stored summary.
+    """
+    model = parameters.get("model", DEFAULT_MODEL)
+    backend = get_llm_backend(parameters).name
+    canonical = is_canonical_summary(parameters)
+    persist = canonical and not applied_degradation
+    previous = None
+    if parameters.get("mode", "full") == "update" and canonical:
+        previous = await asyncio.to_thread(summary_store.get, username)
+        if previous is not None and (previous["model"] != model or previous["backend"] != backend):
+            previous = None
+
+    if previous is not None:
+        report_progress("fetching")
+        new_data = await get_reddit_user_data(username, parameters, deadline=deadline, stats=fetch_stats,
+                                              since=previous["watermark"])
+        new_items = fetch_stats["items"]
+        if new_items == 0:
+            metrics["summary_updates_unchanged"] += 1
+            if persist and not fetch_stats["partial"]:
+                await asyncio.to_thread(summary_store.touch, username)
+            return previous["summary"], "unchanged"
+
+        if drift(previous, new_items) <= SUMMARY_UPDATE_MAX_DRIFT:
+            report_progress("summarizing")
+            summary = await asyncio.to_thread(summarize_with_llm, new_data, username, parameters, deadline, usage,
+                                              previous["summary"])
+            if persist and not fetch_stats["partial"]:
+                await asyncio.to_thread(summary_store.record_update, username, summary, fetch_stats["newest_utc"],
+                                        new_items)
+            metrics["summary_updates_incremental"] += 1
+            return summary, "incremental"
+
+        metrics["summary_updates_rebuilt"] += 1
+
+    # Step 1: Get the data from Reddit (now async)
+    report_progress("fetching")
+    reddit_data = await get_reddit_user_data(username, parameters, deadline=deadline, stats=fetch_stats)
+
+    # Step 2: Send it for summarization. The HTTP call is blocking, so it runs in a
+    # worker thread; its timeout is bounded by the deadline.
+    report_progress("summarizing")
+    summary = await asyncio.to_thread(summarize_with_llm, reddit_data, username, parameters, deadline, usage)
+    if persist and not fetch_stats["partial"]:
+        await asyncio.to_thread(summary_store.record_full, username, summary, model, backend,
+                                fetch_stats["newest_utc"], fetch_stats["items"])
+    return summary, "full"
+
+
+async def run_analysis(request: AnalyzeUserRequest, cost: int, deadline: float,
+                       applied_degradation: Optional[Dict[str, Any]] = None) -> AnalyzeUserResponse:
+    """
+    Runs the fetch + summarize pipeline once a fair share of capacity is available. A
+    degraded run (applied_degradation) is neither stored nor cached for later requests.
+    """
+    caller = request.user_id
+    fetch_stats: Dict[str, Any] = {}
+    usage: Dict[str, int] = {}
+    computed = False
+
+    async def compute():
+        nonlocal computed
+        computed = True
+        buffers = {"peak": 0}
+        pipeline_buffers.set(buffers)
+        # Wait for a fair share of pipeline slots, then for global cost capacity
+        async with scheduler.slot(caller, cost):
+            async with admission.admit(cost):
+                summary, summary_mode = await build_summary(request.user_to_search, request.parameters,
+                                                            deadline, fetch_stats, usage, applied_degradation)
+        pipeline_buffer_peaks.append(buffers["peak"])
+        return {"summary": summary, "summary_mode": summary_mode, "partial": fetch_stats["partial"]}
+
+    try:
+        if RESULT_CACHE_TTL > 0:
+            # Identical concurrent requests, in any worker, share one computation
+            result = await result_cache.get_or_compute(result_cache_key(request.user_to_search, request.parameters),
+                                                       RESULT_CACHE_TTL, compute,
+                                                       cacheable=lambda value: not value["partial"]
+                                                       and not applied_degradation)
+        else:
+            result = await compute()
+    except CircuitOpenError as e:
+        # An upstream is down: fall back to the last good summary, if there is one
+        stale_summary = await get_stored_summary(request.user_to_search)
+        if stale_summary is None:
+            raise HTTPException(status_code=503, detail=str(e),
+                                headers={"Retry-After": str(max(1, int(e.retry_after + 0.999)))})
+        metrics["stale_summaries_served"] += 1
+        return AnalyzeUserResponse(
+            success=True,
+            user_id=request.user_id,
+            analyzed_user=request.user_to_search,
+            summary=stale_summary,
+            stale=True,
+            sections=select_sections(stale_summary, request.parameters),
+        )
+
+    if computed and not result["partial"] and not applied_degradation and is_canonical_summary(request.parameters):
+        await store_summary(request.user_to_search, result["summary"])
+
+    # Step 3: Return the successful response
+    return AnalyzeUserResponse(
+        success=True,
+        user_id=request.user_id,
+        analyzed_user=request.user_to_search,
+        summary=result["summary"],
+        partial=result["partial"],
+        usage=usage or None,
+        summary_mode=result["summary_mode"],
+        cached=not computed,
+        sections=select_sections(result["summary"], request.parameters),
+    )
+
+
+def select_sections(summary: str, parameters: Dict[str, Any]) -> Optional[Dict[str, str]]:
+    """The requested sections of a summary for "output_format": "json", else None."""
+    _, structured, selected = get_output_options(parameters)
+    if not structured:
+        return None
+    sections = split_sections(summary)
+    return sections if selected is None else {name: sections[name] for name in selected if name in sections}
+
+
+async def forward_to_owner(request: AnalyzeUserRequest, owner: str, raw_request: Optional[Request],
+                           deadline: float) -> Optional[AnalyzeUserResponse]:
+    """
+    Sends the request to the cluster node that owns its username and relays the answer.
+    Returns None if the owner cannot be reached, so the request is handled locally.
+    """
+    forwarded = asyncio.ensure_future(asyncio.to_thread(cluster.forward, owner, request.model_dump(),
+                                                        deadline - time.monotonic()))
+    try:
+        peer_response = await await_pipeline(forwarded, raw_request, deadline)
+    except (CircuitOpenError, requests.ConnectionError):
+        metrics["cluster_fallbacks"] += 1
+        return None
+    except requests.Timeout:
+        metrics["deadline_exceeded"] += 1
+        raise HTTPException(status_code=504, detail=f"Timed out waiting for cluster node {owner}")
+
+    metrics["cluster_forwarded"] += 1
+    if peer_response.status_code == 200:
+        return AnalyzeUserResponse(**peer_response.json())
+    try:
+        detail = peer_response.json().get("detail", peer_response.text)
+    except ValueError:
+        detail = peer_response.text
+    headers = {"Retry-After": peer_response.headers["Retry-After"]} if "Retry-After" in peer_response.headers else None
+    raise HTTPException(status_code=peer_response.status_code, detail=detail, headers=headers)
+
+
+def parse_fields(fields: Optional[str]) -> Optional[set]:
+    """Parses the comma-separated `fields` selector, raising 422 for unknown field names."""
+    if not fields:
+        return None
+    selected = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = selected - set(AnalyzeUserResponse.model_fields)
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown response fields: {', '.join(sorted(unknown))}")
+    return selected
+
+
+def select_fields(response: AnalyzeUserResponse, selected: Optional[set]):
+    """Returns the response trimmed to the selected fields, serialized directly."""
+    if selected is None:
+        return response
+    return DefaultResponse(response.model_dump(include=selected))
+
+
 @app.post("/analyze", response_model=AnalyzeUserResponse)
-async def analyze_user(request: AnalyzeUserRequest):
+async def analyze_user(request: AnalyzeUserRequest, raw_request: Request = None, fields: Optional[str] = None):
     """
     Analyze a Reddit user based on their public posts and comments.
     
     Args:
         request: Contains user_id (caller), user_to_search (target), and parameters (configuration)
+        raw_request: The underlying HTTP request, used for the X-Request-Timeout header
+            and to notice when the client disconnects
+        fields: Optional comma-separated list of response fields to return (e.g. "summary,usage")
     
     Returns:
         AnalyzeUserResponse with analysis summary or error information
     """
+    # A blocked event loop delays every request in the process; do not add to it
+    if loop_monitor.overloaded():
+        metrics["shed_loop_lag"] += 1
+        raise HTTPException(status_code=503, detail="Server is overloaded, please retry later",
+                            headers={"Retry-After": str(ADMISSION_RETRY_AFTER)})
+
+    selected = parse_fields(fields)
+    deadline = time.monotonic() + get_request_timeout(request.parameters, raw_request)
+
+    if cluster is not None:
+        if raw_request is not None and FORWARDED_HEADER in raw_request.headers:
+            metrics["cluster_received"] += 1
+        else:
+            owner = cluster.owner(request.user_to_search)
+            if owner != cluster.self_url:
+                response = await forward_to_owner(request, owner, raw_request, deadline)
+                if response is not None:
+                    return select_fields(response, selected)
+
+    access_tracker.record(request.user_to_search)
+    return select_fields(await analyze_locally(request, raw_request, deadline), selected)
+
+
+async def analyze_locally(request: AnalyzeUserRequest, raw_request: Optional[Request],
+                          deadline: float) -> AnalyzeUserResponse:
+    """Runs an analysis on this node: negative cache, validation, quota, then the pipeline."""
+    # Answer known missing/suspended/empty accounts without touching Reddit
+    cached_error = await get_negative_cache_entry(request.user_to_search)
+    if cached_error is not None:
+        metrics["negative_cache_hits"] += 1
+        status_code, detail = cached_error
+        raise HTTPException(status_code=status_code, detail=detail)
+    metrics["negative_cache_misses"] += 1
+
+    if request.parameters.get("mode", "full") not in ("full", "update"):
+        raise HTTPException(status_code=422, detail="Parameter 'mode' must be 'full' or 'update'")
+    request = request.model_copy(update={"parameters": normalize_limits(request.parameters)})
+    summary_length, _, _ = get_output_options(request.parameters)
+    get_llm_backend(request.parameters)
+
+    # Under load, run a shallower analysis (within the caller's bounds) rather than time out
+    applied_degradation = None
+    if DEGRADE_ENABLED:
+        parameters, applied_degradation = degradation.plan(request.parameters, degradation.level(queued_requests()),
+                                                           DEFAULT_MODEL)
+        request = request.model_copy(update={"parameters": parameters})
+
+    # Price the request up front; too-large or over-capacity requests fail fast
+    cost = estimate_request_cost(request.parameters, SUMMARY_LENGTHS[summary_length]["max_tokens"])
+    caller = request.user_id
+
     try:
-        # Step 1: Get the data from Reddit (now async)
-        reddit_data = await get_reddit_user_data(request.user_to_search, request.parameters)
-        
-        # Step 2: Send it for summarization
-        llm_summary = summarize_with_llm(reddit_data, request.user_to_search, request.parameters)
-        
-        # Step 3: Return the successful response
-        return AnalyzeUserResponse(
-            success=True,
-            user_id=request.user_id,
-            analyzed_user=request.user_to_search,
-            summary=llm_summary
-        )
-        
+        # Before charging the quota or queueing for a slot, neither of which it would get back
+        admission.check_size(cost["cost"])
+        caller_quotas.take(caller, cost["cost"])
+    except HTTPException:
+        caller_metrics.record_rejected(caller)
+        raise
+
+    started = time.perf_counter()
+    succeeded = False
+    try:
+        pipeline = asyncio.ensure_future(run_analysis(request, cost["cost"], deadline, applied_degradation))
+        response = await await_pipeline(pipeline, raw_request, deadline)
+        response.degradation = applied_degradation
+        succeeded = True
+        return response
+
     except HTTPException:
         # Re-raise HTTPExceptions as they already have proper status codes
         raise
     except Exception as e:
         # Handle any other unexpected errors
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+    finally:
+        caller_metrics.record(caller, time.perf_counter() - started, cost["cost"], succeeded)
+        metrics["analyze_finished"] += 1
+
+
+# --- MULTIPLEXED ANALYSES ---
+async def run_websocket_analysis(body: Dict[str, Any], fields: Optional[str]) -> Dict[str, Any]:
+    """One /ws analysis: the /analyze request body through the /analyze path, as a dict."""
+    try:
+        request = AnalyzeUserRequest(**body)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+    selected = parse_fields(fields)
+    response = await analyze_user(request)
+    return response.model_dump(mode="json", include=selected)
+
+
+@app.websocket("/ws")
+async def analyze_websocket(websocket: WebSocket):
+    """
+    Runs many analyses over one connection, each tagged with a client-chosen id, with
+    progress messages along the way (see multiplex.py for the message format). Closing
+    the connection cancels the analyses still running.
+    """
+    connection = AnalysisConnection(websocket, run_websocket_analysis, max_concurrency=WS_MAX_CONCURRENCY,
+                                    max_pending=WS_MAX_PENDING, send_queue_size=WS_SEND_QUEUE,
+                                    dumps=dump_json, counters=metrics)
+    await connection.serve()
+
+
+# --- CACHEABLE SUMMARIES ---
+# Background refreshes in progress, by lowercased username
+summary_refreshes: Dict[str, asyncio.Task] = {}
+
+
+def datetime_utc(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec="seconds")
+
+
+def summary_etag(stored: Dict[str, Any]) -> str:
+    # Weak: the same summary goes out as identity, gzip or brotli bodies, which differ byte for byte
+    digest = hashlib.sha256(f"{stored['model']}\n{stored['summary']}".encode()).hexdigest()[:32]
+    return f'W/"{digest}"'
+
+
+def is_not_modified(raw_request: Request, etag: str, last_modified: float) -> bool:
+    """Evaluates If-None-Match or, when that is absent, If-Modified-Since (RFC 9110)."""
+    if_none_match = raw_request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # GET uses the weak comparison: W/"x" matches "x"
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag.removeprefix("W/") in tags
+    if_modified_since = raw_request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # HTTP dates have one-second resolution
+        return int(last_modified) <= since.timestamp()
+    return False
+
+
+async def refresh_user_summary(username: str, caller: str, raw_request: Optional[Request]) -> AnalyzeUserResponse:
+    """Brings the stored summary up to date: an incremental update through the local pipeline."""
+    request = AnalyzeUserRequest(user_id=caller, user_to_search=username, parameters={"mode": "update"})
+    deadline = time.monotonic() + get_request_timeout(request.parameters, raw_request)
+    return await analyze_locally(request, raw_request, deadline)
+
+
+async def background_summary_refresh(username: str) -> Optional[AnalyzeUserResponse]:
+    try:
+        response = await refresh_user_summary(username, SUMMARY_REFRESH_CALLER, None)
+    except HTTPException:
+        metrics["summary_background_refresh_failures"] += 1
+        return None
+    metrics["summary_background_refreshes"] += 1
+    return response
+
+
+def schedule_summary_refresh(username: str) -> asyncio.Task:
+    """Starts a background refresh for the username unless one is already running; returns its task."""
+    key = username.lower()
+    if key in summary_refreshes:
+        return summary_refreshes[key]
+    task = asyncio.create_task(background_summary_refresh(username))
+    summary_refreshes[key] = task
+    task.add_done_callback(lambda _: summary_refreshes.pop(key, None))
+    return task
+
+
+# --- HOT ACCOUNT REFRESHER ---
+def queued_requests() -> int:
+    """/analyze requests waiting for a pipeline slot or for admission."""
+    return scheduler.snapshot()["scheduler_queued"] + admission.snapshot()["admission_queue_depth"]
+
+
+def interactive_load_is_low() -> bool:
+    """True while interactive requests leave room: nothing queued and few pipeline slots busy."""
+    state = {**scheduler.snapshot(), **admission.snapshot()}
+    return (state["scheduler_queued"] == 0 and state["admission_queue_depth"] == 0
+            and state["scheduler_active"] < SCHEDULER_MAX_CONCURRENCY * REFRESH_MAX_BUSY_FRACTION)
+
+
+async def refresh_hot_accounts() -> int:
+    """
+    One refresher pass: refreshes the most requested accounts whose stored summary is about
+    to go stale, one at a time, until the budget runs out or interactive traffic picks up.
+    Returns the number of accounts refreshed.
+    """
+    refresh_after = SUMMARY_MAX_AGE * REFRESH_AHEAD_FRACTION
+    refreshed = 0
+    for username in access_tracker.top(REFRESH_TOP_N):
+        stored = await asyncio.to_thread(summary_store.get, username)
+        if stored is None or time.time() - stored["checked_at"] < refresh_after:
+            continue
+        # A refresh fetches once and, if there is new activity, completes once
+        if not refresh_reddit_budget.available() or not refresh_llm_budget.available():
+            metrics["hot_refreshes_over_budget"] += 1
+            break
+        if not interactive_load_is_low():
+            metrics["hot_refreshes_yielded"] += 1
+            break
+
+        response = await schedule_summary_refresh(username)
+        refresh_reddit_budget.spend()
+        if response is not None and not response.cached and response.summary_mode in ("full", "incremental"):
+            refresh_llm_budget.spend()
+        metrics["hot_refreshes"] += 1
+        refreshed += 1
+    return refreshed
+
+
+async def hot_account_refresher():
+    """Background job: a refresher pass every REFRESH_INTERVAL seconds."""
+    while True:
+        await asyncio.sleep(REFRESH_INTERVAL)
+        try:
+            await refresh_hot_accounts()
+        except sqlite3.Error:
+            metrics["summary_background_refresh_failures"] += 1
+
+
+@app.get("/users/{username}/summary", response_model=UserSummaryResponse)
+async def get_user_summary(username: str, raw_request: Request, user_id: str = "anonymous"):
+    """
+    Returns the latest stored summary of a Reddit user, cacheable by browsers and proxies.
+
+    Supports conditional requests (If-None-Match / If-Modified-Since -> 304). A summary
+    older than SUMMARY_MAX_AGE is still returned while a background refresh brings it up
+    to date; one older than SUMMARY_MAX_AGE + SUMMARY_STALE_WHILE_REVALIDATE, or a missing
+    one, is computed first, charged to `user_id`.
+    """
+    access_tracker.record(username)
+    stored = await asyncio.to_thread(summary_store.get, username)
+    if stored is None or time.time() - stored["checked_at"] > SUMMARY_MAX_AGE + SUMMARY_STALE_WHILE_REVALIDATE:
+        await refresh_user_summary(username, user_id, raw_request)
+        stored = await asyncio.to_thread(summary_store.get, username)
+        if stored is None:
+            # The pipeline answered without storing a summary (e.g. a stale fallback)
+            raise HTTPException(status_code=503, detail="Summary is temporarily unavailable",
+                                headers={"Retry-After": str(ADMISSION_RETRY_AFTER)})
+    age = max(0.0, time.time() - stored["checked_at"])
+    if age > SUMMARY_MAX_AGE:
+        schedule_summary_refresh(username)
+
+    etag = summary_etag(stored)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stored["updated_at"], usegmt=True),
+        "Cache-Control": f"public, max-age={SUMMARY_MAX_AGE}, stale-while-revalidate={SUMMARY_STALE_WHILE_REVALIDATE}",
+        "Age": str(int(age)),
+        "Vary": "Accept-Encoding",
+    }
+    if is_not_modified(raw_request, etag, stored["updated_at"]):
+        metrics["summary_not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+
+    body = UserSummaryResponse(
+        username=username,
+        summary=stored["summary"],
+        model=stored["model"],
+        backend=stored["backend"],
+        updated_at=datetime_utc(stored["updated_at"]),
+    )
+    return DefaultResponse(body.model_dump(), headers=headers)
+
+
+# --- DEBUG ENDPOINTS (see profiling.py) ---
+# The profile in progress and whether an allocation trace is running; one of each at a time
+active_profiler: Optional[SamplingProfiler] = None
+memory_trace_running = False
+
+
+def require_debug_token(raw_request: Request):
+    if not DEBUG_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    supplied = raw_request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(supplied.encode(), DEBUG_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid debug token")
+
+
+@app.get("/debug/profile")
+async def debug_profile(raw_request: Request, seconds: float = 10,
+                        request_count: int = Query(0, alias="requests"), interval: float = 0.005,
+                        output_format: str = Query("collapsed", alias="format"), limit: int = 30):
+    """
+    Samples every thread's stack for `seconds`, or until `requests` more /analyze requests
+    have finished on this worker (bounded by DEBUG_MAX_SECONDS). Returns collapsed stacks
+    for a flamegraph, or with format=json the top functions by self and total samples.
+    """
+    global active_profiler
+    require_debug_token(raw_request)
+    if output_format not in ("collapsed", "json"):
+        raise HTTPException(status_code=422, detail="Parameter 'format' must be 'collapsed' or 'json'")
+    if not 0 < seconds <= DEBUG_MAX_SECONDS or request_count < 0 or interval < 0.001:
+        raise HTTPException(status_code=422, detail=f"Profile for 0-{DEBUG_MAX_SECONDS:g} seconds, "
+                                                    "sampling at most every 0.001 seconds")
+    if active_profiler is not None:
+        raise HTTPException(status_code=409, detail="A profile is already running on this worker")
+
+    profiler = active_profiler = SamplingProfiler(interval=interval)
+    profiler.start()
+    try:
+        if request_count:
+            target = metrics["analyze_finished"] + request_count
+            stop_at = time.monotonic() + DEBUG_MAX_SECONDS
+            while metrics["analyze_finished"] < target and time.monotonic() < stop_at:
+                await asyncio.sleep(0.05)
+        else:
+            await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+        active_profiler = None
+
+    if output_format == "json":
+        return profiler.top(limit)
+    return PlainTextResponse(profiler.collapsed(), headers={
+        "X-Profile-Samples": str(profiler.samples),
+        "X-Profile-Seconds": f"{profiler.duration:.3f}",
+    })
+
+
+@app.get("/debug/memory")
+async def debug_memory(raw_request: Request, seconds: float = 5, limit: int = 20, group_by: str = "lineno"):
+    """
+    Top allocating source lines (or files, with group_by=filename) from tracemalloc:
+    what grew over the next `seconds`, or with seconds=0 (when the process runs with
+    PYTHONTRACEMALLOC) everything still allocated since startup.
+    """
+    global memory_trace_running
+    require_debug_token(raw_request)
+    if group_by not in ("lineno", "filename"):
+        raise HTTPException(status_code=422, detail="Parameter 'group_by' must be 'lineno' or 'filename'")
+    if not 0 <= seconds <= DEBUG_MAX_SECONDS:
+        raise HTTPException(status_code=422, detail=f"Trace for 0-{DEBUG_MAX_SECONDS:g} seconds")
+    if seconds == 0 and not tracemalloc.is_tracing():
+        raise HTTPException(status_code=422, detail="tracemalloc is not running; trace for some seconds instead")
+    if memory_trace_running:
+        raise HTTPException(status_code=409, detail="An allocation trace is already running on this worker")
+
+    memory_trace_running = True
+    try:
+        return await trace_allocations(seconds, limit, group_by)
+    finally:
+        memory_trace_running = False
+
 
 # --- 5. SERVER STARTUP ---
 if __name__ == "__main__":
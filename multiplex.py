@@ -0,0 +1,172 @@
+"""
+Many /analyze calls over one WebSocket (the /ws endpoint).
+
+The client sends JSON text messages, each tagged with an id of its choosing:
+
+    {"id": "a1", "request": {"user_id": ..., "user_to_search": ..., "parameters": {...}},
+     "fields": "summary,usage"}
+    {"id": "a1", "cancel": true}
+
+and gets messages tagged with the same id back, in whatever order analyses finish:
+
+    {"id": "a1", "type": "accepted"}
+    {"id": "a1", "type": "progress", "stage": "queued" | "started" | "fetching" | "summarizing"}
+    {"id": "a1", "type": "result", "response": {...}}
+    {"id": "a1", "type": "error", "status_code": 429, "detail": "...", "retry_after": 5}
+
+AnalysisConnection runs at most `max_concurrency` analyses of one connection at a time.
+Backpressure works in both directions:
+
+- Once `max_pending` analyses are accepted but not finished, the connection stops reading,
+  so further requests wait in the client's socket instead of piling up in the server.
+  Cancellations are read in the same order as requests.
+- Outgoing messages go through a queue of `send_queue_size`. Results and errors wait for
+  room, so a client that stops reading stalls its own analyses; "accepted", progress and
+  malformed-message errors are dropped instead.
+
+Closing the connection cancels its analyses.
+"""
+
+import asyncio
+import json
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+
+# The progress callback of the analysis running in the current task, if it has one
+progress_callback: ContextVar[Optional[Callable[[str], None]]] = ContextVar("progress_callback", default=None)
+
+
+def report_progress(stage: str):
+    """Tells the WebSocket client of the current analysis, if any, that it reached `stage`."""
+    callback = progress_callback.get()
+    if callback is not None:
+        callback(stage)
+
+
+class AnalysisConnection:
+    """
+    Serves one WebSocket. `run(request, fields)` performs one analysis and returns the
+    response as a dict, raising HTTPException for errors. `counters` (the app's metrics
+    dict) is incremented under ws_* keys.
+    """
+
+    def __init__(self, websocket: WebSocket, run: Callable[[Dict[str, Any], Optional[str]], Awaitable[Dict[str, Any]]],
+                 max_concurrency: int, max_pending: int, send_queue_size: int,
+                 dumps: Callable[[Any], bytes], counters: Dict[str, int]):
+        self.websocket = websocket
+        self.run = run
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.pending = asyncio.Semaphore(max(max_pending, max_concurrency))
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=send_queue_size)
+        self.dumps = dumps
+        self.counters = counters
+        self.tasks: Dict[Any, asyncio.Task] = {}
+        self.closed = False
+
+    async def serve(self):
+        await self.websocket.accept()
+        self.counters["ws_connections"] += 1
+        sender = asyncio.create_task(self._send_loop())
+        try:
+            while True:
+                # Backpressure: wait for a free pending slot before reading the next message
+                await self.pending.acquire()
+                try:
+                    text = await self.websocket.receive_text()
+                except WebSocketDisconnect:
+                    self.pending.release()
+                    return
+                if not self._dispatch(text):
+                    self.pending.release()
+        finally:
+            self.closed = True
+            tasks = list(self.tasks.values())
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                self.counters["ws_cancelled_on_close"] += len(tasks)
+                await asyncio.gather(*tasks, return_exceptions=True)
+            sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
+
+    def _dispatch(self, text: str) -> bool:
+        """Handles one client message; returns True if it started an analysis."""
+        try:
+            message = json.loads(text)
+        except ValueError:
+            message = None
+        if not isinstance(message, dict) or not isinstance(message.get("id"), (str, int)):
+            self._error(message.get("id") if isinstance(message, dict) else None, 400,
+                        "Messages must be JSON objects with a string or integer id")
+            return False
+
+        request_id = message["id"]
+        if message.get("cancel"):
+            task = self.tasks.get(request_id)
+            if task is not None:
+                task.cancel()
+            return False
+        if request_id in self.tasks:
+            self._error(request_id, 409, f"Request id {request_id!r} is already in progress")
+            return False
+        if not isinstance(message.get("request"), dict):
+            self._error(request_id, 422, "Field 'request' must be an /analyze request body")
+            return False
+
+        self.counters["ws_analyses"] += 1
+        task = asyncio.create_task(self._analyze(request_id, message["request"], message.get("fields")))
+        self.tasks[request_id] = task
+        # A callback rather than a finally clause: it also runs for tasks cancelled before they start
+        task.add_done_callback(lambda _: self._finished(request_id))
+        return True
+
+    async def _analyze(self, request_id, request: Dict[str, Any], fields: Optional[str]):
+        self._notify({"id": request_id, "type": "accepted"})
+        try:
+            if self.slots.locked():
+                self._progress(request_id, "queued")
+            async with self.slots:
+                self._progress(request_id, "started")
+                progress_callback.set(lambda stage: self._progress(request_id, stage))
+                response = await self.run(request, fields)
+        except HTTPException as e:
+            message = {"id": request_id, "type": "error", "status_code": e.status_code, "detail": e.detail}
+            if e.headers and "Retry-After" in e.headers:
+                message["retry_after"] = int(e.headers["Retry-After"])
+            await self.outbox.put(message)
+        except asyncio.CancelledError:
+            if not self.closed:
+                # Cancelled by the client; nobody is listening once the connection closes
+                await self.outbox.put({"id": request_id, "type": "error", "status_code": 499,
+                                       "detail": "Cancelled by client"})
+            raise
+        except Exception as e:
+            await self.outbox.put({"id": request_id, "type": "error", "status_code": 500,
+                                   "detail": f"Unexpected error: {str(e)}"})
+        else:
+            await self.outbox.put({"id": request_id, "type": "result", "response": response})
+
+    def _finished(self, request_id):
+        self.tasks.pop(request_id, None)
+        self.pending.release()
+
+    def _progress(self, request_id, stage: str):
+        self._notify({"id": request_id, "type": "progress", "stage": stage})
+
+    def _notify(self, message: Dict[str, Any]):
+        """Queues an advisory message, dropping it if the client is not keeping up."""
+        try:
+            self.outbox.put_nowait(message)
+        except asyncio.QueueFull:
+            self.counters["ws_progress_dropped"] += 1
+
+    def _error(self, request_id, status_code: int, detail: str):
+        self.counters["ws_rejected"] += 1
+        self._notify({"id": request_id, "type": "error", "status_code": status_code, "detail": detail})
+
+    async def _send_loop(self):
+        while True:
+            message = await self.outbox.get()
+            await self.websocket.send_text(self.dumps(message).decode())
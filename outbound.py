@@ -0,0 +1,245 @@
+"""
+Outbound HTTP for the Reddit and LLM upstreams: connection reuse, DNS caching, warm-up.
+
+- DNSCache: getaddrinfo results kept for `ttl` seconds. install() puts it in front of
+  socket.getaddrinfo, which requests, httpx and aiohttp's default resolver all call, so
+  one cache serves every client in the process. While the resolver fails, the last
+  known addresses are used.
+- HTTPClient: a pooled keep-alive client for the blocking LLM calls. With httpx and h2
+  installed it speaks HTTP/2 to upstreams that offer it, so concurrent completions (and
+  their hedges) share one connection; otherwise it is a requests.Session over HTTP/1.1.
+- RedditConnections: one aiohttp connector per event loop, shared by every request's
+  asyncpraw client through sessions that do not own (and so do not close) it.
+
+Each counts requests and new connections (HTTPClient also TLS handshakes and HTTP/2
+responses), so /metrics shows how often a request paid for a fresh connection.
+"""
+
+import asyncio
+import ipaddress
+import socket
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, Union
+
+import aiohttp
+import requests
+from urllib3 import HTTPConnectionPool, HTTPSConnectionPool
+
+try:
+    import httpx
+    import h2  # noqa: F401 -- httpx only offers HTTP/2 with h2 installed
+except ImportError:  # optional dependency: fall back to HTTP/1.1 keep-alive through requests
+    httpx = None
+
+# What a failed request raises, whichever library sent it
+REQUEST_ERRORS = (requests.RequestException, OSError) + ((httpx.HTTPError,) if httpx is not None else ())
+
+
+def is_ip_literal(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host.strip("[]").split("%")[0])
+    except ValueError:
+        return False
+    return True
+
+
+class DNSCache:
+    def __init__(self, ttl: float, max_entries: int = 1024, resolve=socket.getaddrinfo):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.resolve = resolve
+        self.lock = threading.Lock()
+        # (host, port, family, type, proto, flags) -> (expires_at, addresses)
+        self.entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "failures": 0, "stale_served": 0}
+        self.replaced = None
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        if not isinstance(host, str) or self.ttl <= 0 or is_ip_literal(host):
+            return self.resolve(host, port, family, type, proto, flags)
+
+        key = (host.lower(), port, family, type, proto, flags)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return list(entry[1])
+
+        try:
+            addresses = self.resolve(host, port, family, type, proto, flags)
+        except OSError:
+            with self.lock:
+                self.stats["failures"] += 1
+                if entry is None:
+                    raise
+                self.stats["stale_served"] += 1
+            return list(entry[1])
+
+        with self.lock:
+            self.stats["misses"] += 1
+            self.entries[key] = (now + self.ttl, addresses)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return list(addresses)
+
+    def install(self):
+        """Routes socket.getaddrinfo, for the whole process, through the cache."""
+        if self.replaced is None:
+            self.replaced = socket.getaddrinfo
+            socket.getaddrinfo = self.getaddrinfo
+
+    def uninstall(self):
+        if self.replaced is not None:
+            socket.getaddrinfo = self.replaced
+            self.replaced = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"ttl": self.ttl, "entries": len(self.entries), **self.stats}
+
+
+class HTTPClient:
+    """
+    post() returns once the response headers are in; read() then loads the body (and
+    releases the connection), or iter_lines() streams it. Responses are requests or httpx
+    responses: both have status_code, json(), text, close() and iter_lines().
+    """
+
+    def __init__(self, name: str, max_connections: int = 32, http2: bool = True,
+                 verify: Union[bool, str] = True):
+        self.name = name
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "new_connections": 0, "tls_handshakes": 0, "http2_responses": 0}
+        self.verify = verify
+        self.http2 = http2 and httpx is not None
+        if self.http2:
+            self.client = httpx.Client(http2=True, verify=verify,
+                                       limits=httpx.Limits(max_connections=max_connections,
+                                                           max_keepalive_connections=max_connections))
+        else:
+            self.session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=max_connections)
+            adapter.poolmanager.pool_classes_by_scheme = {"http": self._counting_pool(HTTPConnectionPool, False),
+                                                          "https": self._counting_pool(HTTPSConnectionPool, True)}
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+
+    def _count(self, **counts: int):
+        with self.lock:
+            for key, value in counts.items():
+                self.stats[key] += value
+
+    def _counting_pool(self, base, tls: bool):
+        client = self
+
+        class CountingPool(base):
+            def _new_conn(self):
+                # urllib3 has no TLS session resumption: every new HTTPS connection is a full handshake
+                client._count(new_connections=1, tls_handshakes=int(tls))
+                return super()._new_conn()
+        return CountingPool
+
+    def _trace(self, event_name: str, info: Dict[str, Any]):
+        """httpcore's trace hook, called around every step of a request."""
+        if event_name == "connection.connect_tcp.complete":
+            self._count(new_connections=1)
+        elif event_name == "connection.start_tls.complete":
+            self._count(tls_handshakes=1)
+
+    def post(self, url: str, headers: Dict[str, str], body: bytes, timeout: float):
+        self._count(requests=1)
+        if not self.http2:
+            # verify per request: a session-level setting loses to REQUESTS_CA_BUNDLE
+            return self.session.post(url, headers=headers, data=body, timeout=timeout, stream=True,
+                                     verify=self.verify)
+        request = self.client.build_request("POST", url, headers=headers, content=body, timeout=timeout,
+                                            extensions={"trace": self._trace})
+        response = self.client.send(request, stream=True)
+        if response.http_version == "HTTP/2":
+            self._count(http2_responses=1)
+        return response
+
+    def get(self, url: str, timeout: float):
+        self._count(requests=1)
+        if not self.http2:
+            return self.session.get(url, timeout=timeout, verify=self.verify)
+        return self.client.get(url, timeout=timeout, extensions={"trace": self._trace})
+
+    def read(self, response):
+        if self.http2:
+            response.read()
+        else:
+            response.content
+
+    def warm_up(self, url: str, timeout: float) -> bool:
+        """Opens (and keeps) a connection to the URL's host; any answer will do."""
+        try:
+            self.get(url, timeout).close()
+        except REQUEST_ERRORS:
+            return False
+        return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            stats = dict(self.stats)
+        stats["reused"] = max(0, stats["requests"] - stats["new_connections"])
+        return {"http2": self.http2, **stats}
+
+
+class RedditConnections:
+    """Keep-alive connections to Reddit for asyncpraw, shared by every request on an event loop."""
+
+    def __init__(self, limit: int = 100, keepalive_timeout: float = 30):
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+        self.connectors: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.TCPConnector]" = \
+            weakref.WeakKeyDictionary()
+        self.stats = {"sessions": 0, "requests": 0, "new_connections": 0}
+        self.trace = aiohttp.TraceConfig()
+        self.trace.on_request_start.append(self._on_request_start)
+        self.trace.on_connection_create_end.append(self._on_connection_create_end)
+
+    async def _on_request_start(self, session, context, params):
+        self.stats["requests"] += 1
+
+    async def _on_connection_create_end(self, session, context, params):
+        self.stats["new_connections"] += 1
+
+    def session(self) -> aiohttp.ClientSession:
+        """A session over the running loop's shared connector; closing it leaves the connections open."""
+        loop = asyncio.get_running_loop()
+        connector = self.connectors.get(loop)
+        if connector is None or connector.closed:
+            # Names are resolved (and cached) by DNSCache, through socket.getaddrinfo
+            connector = aiohttp.TCPConnector(limit=self.limit, keepalive_timeout=self.keepalive_timeout,
+                                             use_dns_cache=False)
+            self.connectors[loop] = connector
+        self.stats["sessions"] += 1
+        return aiohttp.ClientSession(connector=connector, connector_owner=False,
+                                     timeout=aiohttp.ClientTimeout(total=None), trace_configs=[self.trace])
+
+    async def warm_up(self, url: str, timeout: float) -> bool:
+        try:
+            async with self.session() as session:
+                async with session.head(url, timeout=aiohttp.ClientTimeout(total=timeout)):
+                    pass
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+            return False
+        return True
+
+    async def close(self):
+        """Closes the running loop's connector."""
+        connector = self.connectors.pop(asyncio.get_running_loop(), None)
+        if connector is not None:
+            await connector.close()
+
+    def snapshot(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats["reused"] = max(0, stats["requests"] - stats["new_connections"])
+        return stats
@@ -0,0 +1,135 @@
+"""
+On-demand profiling of a live worker, behind the /debug endpoints in main.py.
+
+SamplingProfiler is a thread that snapshots every other thread's stack at a fixed
+interval (sys._current_frames), so it sees the event loop and the worker threads
+running completions alike without instrumenting any code. Stacks are aggregated in
+the "collapsed" format (`thread;outer;...;inner count` per line) that flamegraph.pl,
+speedscope and inferno read directly.
+
+trace_allocations() uses tracemalloc to report the lines that allocated the most
+memory, either since tracing started or over a window of a few seconds.
+
+Neither does anything until asked: no profiling hook or allocation tracer is
+installed while no profile is running.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List
+
+
+def frame_label(code) -> str:
+    # ';' separates frames and ' ' separates the count in the collapsed format
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+def collapse(frame, thread_name: str) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.append(thread_name.replace(";", ":").replace(" ", "_"))
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started = 0.0
+        self.duration = 0.0
+        self.thread = None
+        self.stopping = threading.Event()
+
+    def start(self):
+        self.started = time.monotonic()
+        self.thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
+        self.duration = time.monotonic() - self.started
+
+    def _run(self):
+        own = threading.get_ident()
+        names: Dict[int, str] = {}
+        while not self.stopping.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if ident not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                self.stacks[collapse(frame, names.get(ident, str(ident)))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top(self, limit: int = 30) -> Dict[str, Any]:
+        """Functions by samples spent in them (self) and below them (total)."""
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            if frames:
+                own[frames[-1]] += count
+            for label in set(frames):
+                total[label] += count
+        return {
+            "samples": self.samples,
+            "duration_seconds": round(self.duration, 3),
+            "interval_seconds": self.interval,
+            "self": [{"function": label, "samples": count} for label, count in own.most_common(limit)],
+            "total": [{"function": label, "samples": count} for label, count in total.most_common(limit)],
+        }
+
+
+def allocation_report(snapshot, baseline, limit: int, key_type: str) -> List[Dict[str, Any]]:
+    if baseline is None:
+        stats = snapshot.statistics(key_type)
+        return [{"location": str(stat.traceback[0]), "size_bytes": stat.size, "count": stat.count}
+                for stat in stats[:limit]]
+    stats = snapshot.compare_to(baseline, key_type)
+    return [{"location": str(stat.traceback[0]), "size_bytes": stat.size, "size_diff_bytes": stat.size_diff,
+             "count": stat.count, "count_diff": stat.count_diff} for stat in stats[:limit]]
+
+
+async def trace_allocations(seconds: float, limit: int = 20, key_type: str = "lineno") -> Dict[str, Any]:
+    """
+    Top allocators over the next `seconds`: what grew, tracing only for that long unless
+    tracemalloc was already running. With seconds=0 and tracemalloc already running
+    (e.g. PYTHONTRACEMALLOC=1), everything still allocated since tracing started.
+    """
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start()
+    try:
+        baseline = None
+        if seconds > 0:
+            baseline = await asyncio.to_thread(tracemalloc.take_snapshot)
+            await asyncio.sleep(seconds)
+        snapshot = await asyncio.to_thread(tracemalloc.take_snapshot)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+    # Ignore the profiler's own bookkeeping
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    snapshot = snapshot.filter_traces(filters)
+    if baseline is not None:
+        baseline = baseline.filter_traces(filters)
+    top = await asyncio.to_thread(allocation_report, snapshot, baseline, limit, key_type)
+    return {
+        "traced_seconds": seconds if baseline is not None else None,
+        "traced_current_bytes": current,
+        "traced_peak_bytes": peak,
+        "top": top,
+    }
@@ -0,0 +1,109 @@
+"""
+Persisted summaries with a watermark, used to refresh an analysis incrementally.
+
+For every Reddit user we keep the last summary, the created_utc of the newest post or
+comment it covers (the watermark), how many items the last full rebuild was based on
+and how many have been folded in by incremental updates since. An update sends only
+the previous summary plus the items newer than the watermark to the LLM; once the
+incrementally added items outweigh the rebuild's base by too much, the summary is
+rebuilt from the full history instead.
+
+Calls block on SQLite, so the app makes them from worker threads. Like the activity
+store, the database runs in WAL mode with a busy timeout, so several uvicorn worker
+processes can share one file.
+"""
+
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class SummaryStore:
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        self.path = path
+        # Used from several worker threads
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS summaries (
+                    username TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    backend TEXT NOT NULL,
+                    watermark REAL NOT NULL,
+                    base_items INTEGER NOT NULL,
+                    incremental_items INTEGER NOT NULL,
+                    updates INTEGER NOT NULL,
+                    rebuilt_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    checked_at REAL NOT NULL DEFAULT 0
+                )
+                """
+            )
+            columns = {row[1] for row in self.connection.execute("PRAGMA table_info(summaries)")}
+            if "checked_at" not in columns:
+                # Stores created before checked_at existed
+                self.connection.execute("ALTER TABLE summaries ADD COLUMN checked_at REAL NOT NULL DEFAULT 0")
+                self.connection.execute("UPDATE summaries SET checked_at = updated_at")
+            if "backend" not in columns:
+                # Stores created before LLM backends were selectable, when every summary came from OpenAI
+                self.connection.execute("ALTER TABLE summaries ADD COLUMN backend TEXT NOT NULL DEFAULT 'openai'")
+
+    def get(self, username: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT * FROM summaries WHERE username = ?", (username.lower(),)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def record_full(self, username: str, summary: str, model: str, backend: str, watermark: float, items: int):
+        """Stores a summary built, by `model` on the `backend` LLM backend, from the full fetched history."""
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(
+                """
+                INSERT OR REPLACE INTO summaries (username, summary, model, backend, watermark, base_items,
+                                                  incremental_items, updates, rebuilt_at, updated_at, checked_at)
+                VALUES (?, ?, ?, ?, ?, ?, 0, 0, ?, ?, ?)
+                """,
+                (username.lower(), summary, model, backend, watermark, items, now, now, now),
+            )
+
+    def record_update(self, username: str, summary: str, watermark: float, new_items: int):
+        """Stores a summary extended with `new_items` items newer than the old watermark."""
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(
+                """
+                UPDATE summaries
+                SET summary = ?, watermark = ?, incremental_items = incremental_items + ?,
+                    updates = updates + 1, updated_at = ?, checked_at = ?
+                WHERE username = ?
+                """,
+                (summary, watermark, new_items, now, now, username.lower()),
+            )
+
+    def touch(self, username: str):
+        """Records that the summary was found to still be up to date."""
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE summaries SET checked_at = ? WHERE username = ?",
+                                    (time.time(), username.lower()))
+
+    def clear(self):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM summaries")
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+
+
+def drift(previous: Dict[str, Any], new_items: int) -> float:
+    """Share of the summary's items that were folded in incrementally rather than rebuilt."""
+    return (previous["incremental_items"] + new_items) / max(1, previous["base_items"])
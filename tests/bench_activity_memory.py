@@ -0,0 +1,71 @@
+"""
+Benchmark: peak memory (tracemalloc) of one /analyze computation for comment_limit 100,
+1,000 and 10,000, with the default ACTIVITY_TEXT_MAX_CHARS budget and without a cap.
+Comments are 20-600 characters (FakeReddit, built before tracing starts); the completion
+call is replaced by a function that only looks at the encoded body, so the peak is the
+fetch, rendering, prompt and request body path. The accounted peak reported in /metrics
+(pipeline_buffer_bytes) is shown next to it.
+Run with: python tests/bench_activity_memory.py
+"""
+
+import asyncio
+import random
+import tracemalloc
+
+from fakes import FakeReddit, make_account, reset_app_state
+
+import main
+
+LIMITS = (100, 1000, 10000)
+WORDS = "the a driver update fixed it for me but fan curve still ramps way too early when gaming".split()
+
+
+class CannedResponse:
+    status_code = 200
+
+    def json(self):
+        return {"choices": [{"message": {"content": "a summary"}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0}}
+
+
+def fake_completion(body, timeout, answered=None):
+    assert body.startswith(b"{")
+    return CannedResponse()
+
+
+def account(comments):
+    rng = random.Random(comments)
+    result = make_account(10, comments)
+    for item in result["comments"]:
+        item.body = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 120)))
+    return result
+
+
+def measure(comment_limit, max_chars):
+    reset_app_state()
+    main.ACTIVITY_TEXT_MAX_CHARS = max_chars
+    main.admission.max_request_cost = 10 ** 9
+    main.create_reddit_client = FakeReddit({"alice": account(comment_limit)}).client
+    main.llm_backends["openai"].complete = fake_completion
+    request = main.AnalyzeUserRequest(user_id="bench", user_to_search="alice",
+                                      parameters={"post_limit": 10, "comment_limit": comment_limit})
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        asyncio.run(main.analyze_user(request))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - baseline, main.pipeline_buffer_peaks[-1]
+
+
+if __name__ == "__main__":
+    default_budget = main.ACTIVITY_TEXT_MAX_CHARS
+    print(f"{'comment_limit':>13}  {'budget':>9}  {'traced peak':>12}  {'accounted peak':>14}")
+    try:
+        for limit in LIMITS:
+            for max_chars in (default_budget, 0):
+                traced, accounted = measure(limit, max_chars)
+                print(f"{limit:>13}  {max_chars or 'none':>9}  {traced / 1e6:>9.2f} MB  {accounted / 1e6:>11.2f} MB")
+    finally:
+        reset_app_state()
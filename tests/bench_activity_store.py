@@ -0,0 +1,68 @@
+"""
+Benchmark: batched upserts into the activity store up to 1M items, then window reads
+(newest 10 posts + 100 comments of one account) against the full table.
+Run with: python tests/bench_activity_store.py [items]
+"""
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from activity_store import ActivityStore  # noqa: E402
+
+ITEMS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+AUTHORS = 10_000
+BATCH = 1000
+QUERIES = 2000
+
+
+def make_batch(rng, start):
+    batch = []
+    for n in range(start, start + BATCH):
+        kind = "post" if n % 10 == 0 else "comment"
+        batch.append({"fullname": f"t{n}", "kind": kind, "created_utc": 1.6e9 + n,
+                      "title": f"title {n}" if kind == "post" else None, "body": "lorem ipsum " * rng.randint(2, 20),
+                      "link_id": f"t3_{n // 7}" if kind == "comment" else None})
+    return batch
+
+
+def run(path):
+    rng = random.Random(3)
+    store = ActivityStore(path, batch_size=BATCH)
+
+    started = time.perf_counter()
+    for start in range(0, ITEMS, BATCH):
+        # Every batch is one account's fetch, like get_reddit_user_data writes it
+        store.upsert_items(f"user{(start // BATCH) % AUTHORS}", make_batch(rng, start))
+    elapsed = time.perf_counter() - started
+    print(f"insert   {ITEMS} items in {elapsed:6.1f} s  ({ITEMS / elapsed:9.0f} items/s)")
+
+    authors = min(AUTHORS, ITEMS // BATCH)
+    for author in range(authors):
+        store.record_sync(f"user{author}", 10, 100)
+
+    latencies = []
+    for _ in range(QUERIES):
+        author = f"user{rng.randrange(authors)}"
+        started = time.perf_counter()
+        posts, comments = store.read_window(author, 10, 100, max_age=3600)
+        latencies.append(time.perf_counter() - started)
+        assert len(posts) == 10 and len(comments) == 100
+    latencies.sort()
+    print(f"window   p50={statistics.median(latencies) * 1000:5.2f} ms  "
+          f"p99={latencies[int(0.99 * len(latencies))] * 1000:5.2f} ms  (10 posts + 100 comments, {QUERIES} reads)")
+
+    started = time.perf_counter()
+    removed = store.prune(retention_seconds=3600, max_items_per_author=50)
+    store.compact()
+    print(f"prune    removed {removed} items in {time.perf_counter() - started:5.1f} s")
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        run(os.path.join(directory, "activity.db"))
@@ -0,0 +1,94 @@
+"""
+Load test: latency of small /analyze requests while large ones arrive concurrently,
+with and without admission control. Reddit is simulated by the fake client with a
+fixed per-page latency and a shared concurrency cap (like a rate limit).
+Run with: python tests/bench_admission.py
+"""
+
+import asyncio
+import random
+import statistics
+import time
+
+from fakes import FakeReddit, make_account
+
+import main
+from admission import AdmissionController
+from fairness import CallerQuotas, FairScheduler
+from fastapi import HTTPException
+
+PAGE_LATENCY = 0.01
+UPSTREAM_CONCURRENCY = 8
+DURATION = 3.0
+SMALL_RATE = 100  # requests per second
+LARGE_RATE = 60
+
+SMALL = {"post_limit": 5, "comment_limit": 10}
+LARGE = {"post_limit": 50, "comment_limit": 800}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def issue(kind, parameters, results):
+    request = main.AnalyzeUserRequest(user_id=kind, user_to_search="active", parameters=parameters)
+    start = time.perf_counter()
+    try:
+        await main.analyze_user(request)
+        outcome = "ok"
+    except HTTPException as e:
+        outcome = str(e.status_code)
+    results.append((kind, outcome, time.perf_counter() - start))
+
+
+async def generate_load():
+    rng = random.Random(42)
+    results = []
+    tasks = []
+    start = time.perf_counter()
+    next_small = next_large = start
+    while time.perf_counter() - start < DURATION:
+        now = time.perf_counter()
+        if now >= next_small:
+            tasks.append(asyncio.create_task(issue("small", SMALL, results)))
+            next_small += rng.expovariate(SMALL_RATE)
+        if now >= next_large:
+            tasks.append(asyncio.create_task(issue("large", LARGE, results)))
+            next_large += rng.expovariate(LARGE_RATE)
+        await asyncio.sleep(0.001)
+    await asyncio.gather(*tasks)
+    return results
+
+
+def run(label, controller):
+    fake = FakeReddit({"active": make_account(posts=50, comments=800)},
+                      latency=PAGE_LATENCY, max_concurrency=UPSTREAM_CONCURRENCY)
+    main.create_reddit_client = fake.client
+    main.admission = controller
+    results = asyncio.run(generate_load())
+
+    print(f"\n{label}")
+    for kind in ("small", "large"):
+        latencies = [elapsed for k, outcome, elapsed in results if k == kind and outcome == "ok"]
+        shed = [outcome for k, outcome, _ in results if k == kind and outcome != "ok"]
+        total = len([1 for k, _, _ in results if k == kind])
+        if latencies:
+            print(f"  {kind:<5} total={total:<4} ok={len(latencies):<4} shed={len(shed):<4} "
+                  f"p50={statistics.median(latencies) * 1000:7.1f} ms  p99={percentile(latencies, 0.99) * 1000:7.1f} ms")
+        else:
+            print(f"  {kind:<5} total={total:<4} ok=0    shed={len(shed)}")
+
+
+if __name__ == "__main__":
+    main.summarize_with_llm = lambda *args, **kwargs: "summary"
+    # Isolate admission control from per-caller quotas and scheduling
+    main.caller_quotas = CallerQuotas(rate=0, burst=0)
+    main.scheduler = FairScheduler(max_concurrency=10**6, per_caller_concurrency=10**6,
+                                   max_queue_per_caller=10**6, queue_timeout=60, retry_after=5)
+    print(f"Simulated Reddit: {PAGE_LATENCY * 1000:.0f} ms/page, {UPSTREAM_CONCURRENCY} concurrent requests")
+    run("Without admission control", AdmissionController(
+        max_request_cost=10**9, max_inflight_cost=10**9, max_queue=10**6, queue_timeout=60, retry_after=5))
+    run("With admission control", AdmissionController(
+        max_request_cost=100_000, max_inflight_cost=150_000, max_queue=20, queue_timeout=0.5, retry_after=5))
@@ -0,0 +1,38 @@
+"""
+Benchmark: aggregate result-cache hit rate of 4 local instances behind round-robin
+load balancing, with and without cluster routing. Usernames follow a Zipf-like
+popularity distribution.
+Run with: python tests/bench_cluster.py
+"""
+
+import random
+import time
+
+from test_cluster import round_robin_hit_rate, run_nodes
+
+NODES = 4
+REQUESTS = 1000
+USERS = 300
+
+
+def workload():
+    rng = random.Random(11)
+    weights = [1 / (rank + 1) for rank in range(USERS)]
+    return rng.choices([f"user{i}" for i in range(USERS)], weights=weights, k=REQUESTS)
+
+
+def run(label, cluster):
+    usernames = workload()
+    with run_nodes(NODES, cluster=cluster) as urls:
+        started = time.perf_counter()
+        hit_rate, _ = round_robin_hit_rate(urls, usernames)
+        elapsed = time.perf_counter() - started
+    print(f"{label:<12} hit rate={hit_rate:6.1%}  summaries computed={round((1 - hit_rate) * REQUESTS):4d}  "
+          f"mean={elapsed / REQUESTS * 1000:5.1f} ms/request")
+
+
+if __name__ == "__main__":
+    print(f"{REQUESTS} requests for {USERS} users over {NODES} nodes "
+          f"(best possible hit rate {1 - len(set(workload())) / REQUESTS:.1%})\n")
+    run("round-robin", cluster=False)
+    run("cluster", cluster=True)
@@ -0,0 +1,89 @@
+"""
+Benchmark: cost of the /debug profiling support on the /analyze pipeline (FakeReddit,
+stubbed completion, so the run is CPU-bound). Compares an idle worker with the same
+worker right after it served a profile and an allocation trace (no hook, tracer or
+thread may be left behind, so the two must be within noise), and with the sampling
+profiler or tracemalloc active.
+Run with: python tests/bench_debug_endpoints.py
+"""
+
+import asyncio
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+
+from fakes import FakeReddit, make_account, reset_app_state
+
+import main
+from profiling import SamplingProfiler, trace_allocations
+
+REQUESTS = 300
+ROUNDS = 5
+
+
+async def per_request():
+    request = main.AnalyzeUserRequest(user_id="bench", user_to_search="alice",
+                                      parameters={"post_limit": 10, "comment_limit": 100})
+    started = time.perf_counter()
+    for _ in range(REQUESTS):
+        await main.analyze_user(request)
+    return (time.perf_counter() - started) / REQUESTS
+
+
+def hooks():
+    profiler_threads = [thread for thread in threading.enumerate() if thread.name == "sampling-profiler"]
+    return sys.getprofile(), sys.gettrace(), tracemalloc.is_tracing(), profiler_threads
+
+
+async def sampled():
+    profiler = SamplingProfiler(interval=0.005)
+    profiler.start()
+    try:
+        return await per_request()
+    finally:
+        profiler.stop()
+
+
+async def traced():
+    tracemalloc.start()
+    try:
+        return await per_request()
+    finally:
+        tracemalloc.stop()
+
+
+async def profile_briefly():
+    profiler = SamplingProfiler(interval=0.005)
+    profiler.start()
+    await asyncio.sleep(0.1)
+    profiler.stop()
+    await trace_allocations(0.1)
+
+
+async def bench():
+    reset_app_state()
+    main.create_reddit_client = FakeReddit({"alice": make_account(10, 100)}).client
+    main.summarize_with_llm = lambda *args, **kwargs: "a summary"
+    await per_request()  # warm up
+
+    # The pipeline slows down a little as a run goes on, so states are interleaved per
+    # round rather than measured one after another
+    untouched = hooks()
+    rounds = []
+    for _ in range(ROUNDS):
+        before = await per_request()
+        await profile_briefly()
+        assert hooks() == untouched, (hooks(), untouched)
+        rounds.append((before, await per_request(), await sampled(), await traced()))
+    return [statistics.median(column) for column in zip(*rounds)]
+
+
+if __name__ == "__main__":
+    idle, after, sampling, tracing = asyncio.run(bench())
+    print("no profile/trace hook, tracemalloc or profiler thread left after profiling")
+    print(f"idle:                         {idle * 1e6:8.1f} us/request")
+    print(f"after a profile/memory trace: {after * 1e6:8.1f} us/request  ({(after / idle - 1) * 100:+.1f}%)")
+    print(f"sampling profiler running:    {sampling * 1e6:8.1f} us/request  ({(sampling / idle - 1) * 100:+.1f}%)")
+    print(f"tracemalloc tracing:          {tracing * 1e6:8.1f} us/request  ({(tracing / idle - 1) * 100:+.1f}%)")
@@ -0,0 +1,101 @@
+"""
+Load test: /analyze under a ramping arrival rate, with and without adaptive degradation.
+Reddit is the fake client with a per-page latency and a shared concurrency cap (like a
+rate limit); the completion is the local OpenAI stub, slower for longer prompts, for the
+full model and as more completions run at once. Every request has a 10 second deadline.
+Run with: python tests/bench_degradation.py
+"""
+
+import asyncio
+import random
+import statistics
+import threading
+import time
+
+from fastapi import HTTPException
+
+from fakes import FakeReddit, StubOpenAIServer, make_account, reset_app_state
+
+import main
+
+STAGES = (2, 4, 8, 12, 16)  # requests per second
+STAGE_SECONDS = 4.0
+PARAMETERS = {"post_limit": 10, "comment_limit": 300, "timeout_seconds": 10, "degrade": True}
+PAGE_LATENCY = 0.05
+UPSTREAM_CONCURRENCY = 8
+
+
+class LoadedOpenAI(StubOpenAIServer):
+    """Completions take longer per prompt token, for the full model and per concurrent completion."""
+
+    def __init__(self):
+        super().__init__(token_latency=0.0001)
+        self.running = 0
+        self.running_lock = threading.Lock()
+
+    def respond(self, body):
+        with self.running_lock:
+            self.running += 1
+            running = self.running
+        try:
+            time.sleep((0.6 if body["model"] == main.DEFAULT_MODEL else 0.2) * (1 + running / 4))
+            return super().respond(body)
+        finally:
+            with self.running_lock:
+                self.running -= 1
+
+
+async def issue(stage, results):
+    request = main.AnalyzeUserRequest(user_id=f"caller{len(results) % 50}", user_to_search="active",
+                                      parameters=dict(PARAMETERS))
+    started = time.perf_counter()
+    level = 0.0
+    try:
+        response = await main.analyze_user(request)
+        outcome = "ok"
+        level = response.degradation["level"] if response.degradation else 0.0
+    except HTTPException as e:
+        outcome = str(e.status_code)
+    results.append((stage, outcome, time.perf_counter() - started, level))
+
+
+async def ramp():
+    rng = random.Random(7)
+    results = []
+    tasks = []
+    for stage, rate in enumerate(STAGES):
+        stage_end = time.perf_counter() + STAGE_SECONDS
+        while time.perf_counter() < stage_end:
+            tasks.append(asyncio.create_task(issue(stage, results)))
+            await asyncio.sleep(rng.expovariate(rate))
+    await asyncio.gather(*tasks)
+    return results
+
+
+def run(label, enabled, stub):
+    # Completions abandoned at their deadline by the previous run keep the stub busy
+    while stub.running:
+        time.sleep(0.1)
+    reset_app_state()
+    main.OPENAI_BASE_URL = stub.base_url
+    main.DEGRADE_ENABLED = enabled
+    main.create_reddit_client = FakeReddit({"active": make_account(10, 300)}, latency=PAGE_LATENCY,
+                                           max_concurrency=UPSTREAM_CONCURRENCY).client
+    results = asyncio.run(ramp())
+
+    print(f"\n{label}")
+    for stage, rate in enumerate(STAGES):
+        rows = [row for row in results if row[0] == stage]
+        ok = sorted(elapsed for _, outcome, elapsed, _ in rows if outcome == "ok")
+        failed = len(rows) - len(ok)
+        levels = [level for _, outcome, _, level in rows if outcome == "ok"]
+        latency = (f"p50={statistics.median(ok):5.2f} s  p99={ok[min(len(ok) - 1, int(0.99 * len(ok)))]:5.2f} s"
+                   if ok else "no successes")
+        print(f"  {rate:>3} req/s  total={len(rows):<3} ok={len(ok):<3} failed={failed:<3} {latency}  "
+              f"mean level={statistics.mean(levels) if levels else 0:.2f}")
+
+
+if __name__ == "__main__":
+    with LoadedOpenAI() as stub:
+        run("fixed limits and model", False, stub)
+        run("adaptive degradation", True, stub)
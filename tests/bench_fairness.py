@@ -0,0 +1,96 @@
+"""
+Simulation: one heavy caller floods /analyze while many light callers send occasional
+requests. Compares a plain FIFO semaphore with the weighted fair scheduler.
+Run with: python tests/bench_fairness.py
+"""
+
+import asyncio
+import random
+import statistics
+import time
+from contextlib import asynccontextmanager
+
+from fakes import FakeReddit, make_account
+
+import main
+from admission import AdmissionController
+from fairness import CallerMetrics, CallerQuotas, FairScheduler
+
+SLOTS = 8
+PAGE_LATENCY = 0.02
+HEAVY_REQUESTS = 400
+LIGHT_CALLERS = 20
+LIGHT_REQUESTS_EACH = 5
+LIGHT_INTERVAL = 0.1
+
+
+class FifoScheduler:
+    """Baseline: first come, first served over the same number of slots."""
+
+    def __init__(self, slots):
+        self.semaphore = asyncio.Semaphore(slots)
+
+    @asynccontextmanager
+    async def slot(self, caller, cost):
+        async with self.semaphore:
+            yield
+
+    def snapshot(self):
+        return {}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def call(caller):
+    request = main.AnalyzeUserRequest(user_id=caller, user_to_search="active", parameters={})
+    await main.analyze_user(request)
+
+
+async def light_caller(index, rng):
+    await asyncio.sleep(rng.uniform(0, LIGHT_INTERVAL))
+    for _ in range(LIGHT_REQUESTS_EACH):
+        await call(f"light-{index}")
+        await asyncio.sleep(LIGHT_INTERVAL)
+
+
+async def simulate():
+    rng = random.Random(7)
+    start = time.perf_counter()
+    heavy = [asyncio.create_task(call("heavy")) for _ in range(HEAVY_REQUESTS)]
+    await asyncio.gather(*(light_caller(i, rng) for i in range(LIGHT_CALLERS)))
+    light_done = time.perf_counter() - start
+    heavy_done_during_light = sum(task.done() for task in heavy)
+    await asyncio.gather(*heavy)
+    return light_done, heavy_done_during_light, time.perf_counter() - start
+
+
+def run(label, scheduler):
+    main.create_reddit_client = FakeReddit({"active": make_account()}, latency=PAGE_LATENCY).client
+    main.scheduler = scheduler
+    main.caller_metrics = CallerMetrics()
+    light_done, heavy_done, total = asyncio.run(simulate())
+
+    stats = main.caller_metrics.callers
+    light = [latency for caller, s in stats.items() if caller.startswith("light") for latency in s["latencies"]]
+    heavy = list(stats["heavy"]["latencies"])
+    print(f"\n{label}")
+    print(f"  light callers: p50={statistics.median(light) * 1000:7.1f} ms  p99={percentile(light, 0.99) * 1000:7.1f} ms  "
+          f"(all {len(light)} done after {light_done:.2f} s)")
+    print(f"  heavy caller:  p50={statistics.median(heavy) * 1000:7.1f} ms  "
+          f"{heavy_done}/{HEAVY_REQUESTS} done while light callers were active, all done after {total:.2f} s")
+
+
+if __name__ == "__main__":
+    main.summarize_with_llm = lambda *args, **kwargs: "summary"
+    main.caller_quotas = CallerQuotas(rate=0, burst=0)
+    main.admission = AdmissionController(max_request_cost=10**9, max_inflight_cost=10**9,
+                                         max_queue=10**6, queue_timeout=600, retry_after=5)
+    print(f"{SLOTS} pipeline slots, {PAGE_LATENCY * 1000:.0f} ms per Reddit page, "
+          f"1 heavy caller x {HEAVY_REQUESTS}, {LIGHT_CALLERS} light callers x {LIGHT_REQUESTS_EACH}")
+    run("FIFO", FifoScheduler(SLOTS))
+    run("Weighted fair queue", FairScheduler(max_concurrency=SLOTS, per_caller_concurrency=SLOTS // 2,
+                                              max_queue_per_caller=HEAVY_REQUESTS, queue_timeout=600,
+                                              retry_after=5))
@@ -0,0 +1,64 @@
+"""
+Benchmark: completion latency with and without hedging against the local stub server
+with a heavy-tailed latency distribution (most answers ~50 ms, 5% stall for a second).
+Run with: python tests/bench_hedging.py
+"""
+
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fakes import StubOpenAIServer, reset_app_state
+
+import main
+from hedging import HedgePolicy
+
+CALLS = 400
+CONCURRENCY = 8
+TAIL_PROBABILITY = 0.05
+TAIL_LATENCY = 1.0
+
+
+def heavy_tailed_latency():
+    rng = random.Random(1)
+    lock = threading.Lock()
+
+    def latency():
+        with lock:
+            base = 0.05 * rng.lognormvariate(0, 0.3)
+            return base + (TAIL_LATENCY if rng.random() < TAIL_PROBABILITY else 0.0)
+    return latency
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(label, hedge):
+    with StubOpenAIServer(latency=heavy_tailed_latency()) as stub:
+        reset_app_state()
+        main.OPENAI_BASE_URL = stub.base_url
+        main.hedge_policy = HedgePolicy(percentile=0.9, min_delay=0.05, max_delay=2.0,
+                                        min_samples=20, max_extra_ratio=0.1)
+
+        def one_call(_):
+            started = time.perf_counter()
+            main.summarize_with_llm("data", "someone", {"hedge": hedge})
+            return time.perf_counter() - started
+
+        with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+            latencies = list(pool.map(one_call, range(CALLS)))
+        sent = len(stub.requests)
+
+    print(f"{label:<12} p50={statistics.median(latencies) * 1000:6.1f} ms  "
+          f"p95={percentile(latencies, 0.95) * 1000:7.1f} ms  p99={percentile(latencies, 0.99) * 1000:7.1f} ms  "
+          f"requests={sent} (+{(sent - CALLS) / CALLS:.1%} cost)")
+
+
+if __name__ == "__main__":
+    print(f"{CALLS} completions, {CONCURRENCY} concurrent, {TAIL_PROBABILITY:.0%} stall for {TAIL_LATENCY:.0f} s\n")
+    run("no hedging", hedge=False)
+    run("hedging", hedge=True)
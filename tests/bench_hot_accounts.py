@@ -0,0 +1,100 @@
+"""
+Simulation: user-facing cache-miss rate on a Zipf-distributed request trace, with and
+without the hot account refresher.
+
+Runs on virtual time with the real AccessTracker and CallBudget. A summary is fresh for
+SUMMARY_MAX_AGE seconds after it was computed or refreshed; a request that finds none,
+or only an expired one, is a miss and pays the full Reddit + LLM latency. Every
+REFRESH_INTERVAL seconds the refresher refreshes the top-N accounts whose summary is
+older than REFRESH_AHEAD_FRACTION * SUMMARY_MAX_AGE, within an hourly call budget.
+Run with: python tests/bench_hot_accounts.py
+"""
+
+import bisect
+import itertools
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hot_accounts import AccessTracker, CallBudget  # noqa: E402
+
+ACCOUNTS = 20000
+ZIPF_EXPONENT = 1.1
+REQUESTS_PER_SECOND = 5
+DURATION = 6 * 3600
+SUMMARY_MAX_AGE = 300
+REFRESH_INTERVAL = 30
+REFRESH_AHEAD_FRACTION = 0.8
+# Miss rate is also reported for requests to this many most popular accounts
+HEAD = 200
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def zipf_trace(seed):
+    rng = random.Random(seed)
+    weights = [1 / (rank ** ZIPF_EXPONENT) for rank in range(1, ACCOUNTS + 1)]
+    cumulative = list(itertools.accumulate(weights))
+    total = cumulative[-1]
+    now = 0.0
+    while now < DURATION:
+        now += rng.expovariate(REQUESTS_PER_SECOND)
+        rank = bisect.bisect(cumulative, rng.random() * total)
+        yield now, f"user{rank}", rank < HEAD
+
+
+def simulate(top_n, budget_per_hour, seed=1):
+    clock = Clock()
+    tracker = AccessTracker(half_life=3600, clock=clock)
+    budget = CallBudget(budget_per_hour, 3600, clock=clock)
+    fresh_at = {}
+    requests = misses = refreshes = head_requests = head_misses = 0
+    next_pass = REFRESH_INTERVAL
+
+    for now, username, in_head in zipf_trace(seed):
+        while top_n and next_pass <= now:
+            clock.now = next_pass
+            for hot in tracker.top(top_n):
+                if hot not in fresh_at or next_pass - fresh_at[hot] < SUMMARY_MAX_AGE * REFRESH_AHEAD_FRACTION:
+                    continue
+                if not budget.available():
+                    break
+                budget.spend()
+                fresh_at[hot] = next_pass
+                refreshes += 1
+            next_pass += REFRESH_INTERVAL
+
+        clock.now = now
+        tracker.record(username)
+        requests += 1
+        head_requests += in_head
+        if username not in fresh_at or now - fresh_at[username] > SUMMARY_MAX_AGE:
+            misses += 1
+            head_misses += in_head
+            fresh_at[username] = now
+    return {"requests": requests, "misses": misses, "refreshes": refreshes,
+            "head_miss_rate": head_misses / head_requests}
+
+
+def report(label, result):
+    hours = DURATION / 3600
+    print(f"{label:<30} miss rate={result['misses'] / result['requests']:6.1%}  "
+          f"top-{HEAD} miss rate={result['head_miss_rate']:6.1%}  "
+          f"upstream calls/h={(result['misses'] + result['refreshes']) / hours:6.0f}  "
+          f"(refreshes/h={result['refreshes'] / hours:5.0f})")
+
+
+if __name__ == "__main__":
+    print(f"{ACCOUNTS} accounts, Zipf s={ZIPF_EXPONENT}, {REQUESTS_PER_SECOND} req/s for {DURATION // 3600} h, "
+          f"summaries fresh for {SUMMARY_MAX_AGE} s\n")
+    report("no refresher", simulate(top_n=0, budget_per_hour=0))
+    for top_n, budget_per_hour in ((50, 600), (200, 1200), (500, 3600), (1000, 6000)):
+        report(f"top {top_n}, {budget_per_hour} refreshes/h", simulate(top_n, budget_per_hour))
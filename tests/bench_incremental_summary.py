@@ -0,0 +1,77 @@
+"""
+Benchmark: refreshing summaries of accounts analyzed a week ago, by full rebuild versus
+"mode": "update". Each account starts with 10 posts and 100 comments and then gains a
+week of new activity. The stub server charges a fixed time per prompt token.
+Run with: python tests/bench_incremental_summary.py
+"""
+
+import asyncio
+import random
+import statistics
+import time
+
+from fakes import FakeReddit, StubOpenAIServer, add_activity, make_account, reset_app_state
+
+import main
+
+ACCOUNTS = 50
+SECONDS_PER_PROMPT_TOKEN = 0.00002
+WORDS = "the a build game patch server thread league update mod python keyboard rust drivers".split()
+
+
+def wordy(items, rng):
+    """Gives fake items comment-sized bodies instead of a few words."""
+    for item in items:
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(15, 60)))
+        if hasattr(item, "body"):
+            item.body = text
+        else:
+            item.selftext = text
+    return items
+
+
+def build_accounts():
+    rng = random.Random(7)
+    accounts = {}
+    for i in range(ACCOUNTS):
+        account = make_account(10, 100, prefix=f"u{i}")
+        wordy(account["submissions"] + account["comments"], rng)
+        accounts[f"user{i}"] = account
+    return accounts, rng
+
+
+def refresh_all(accounts, mode):
+    latencies, prompt_tokens = [], []
+    for username in accounts:
+        request = main.AnalyzeUserRequest(user_id="bench", user_to_search=username,
+                                          parameters={"comment_limit": 100, "mode": mode})
+        started = time.perf_counter()
+        response = asyncio.run(main.analyze_user(request))
+        latencies.append(time.perf_counter() - started)
+        prompt_tokens.append(response.usage["prompt_tokens"] if response.usage else 0)
+    return latencies, prompt_tokens
+
+
+def run(mode):
+    accounts, rng = build_accounts()
+    with StubOpenAIServer(cache_min_tokens=10**9, token_latency=SECONDS_PER_PROMPT_TOKEN) as stub:
+        reset_app_state()
+        main.OPENAI_BASE_URL = stub.base_url
+        main.create_reddit_client = FakeReddit(accounts).client
+        refresh_all(accounts, "full")
+
+        # A week later: a handful of new posts and comments per account
+        for account in accounts.values():
+            add_activity(account, posts=rng.randint(0, 2), comments=rng.randint(3, 15))
+            wordy(account["submissions"][:2] + account["comments"][:15], rng)
+
+        latencies, prompt_tokens = refresh_all(accounts, mode)
+
+    print(f"{mode:<7} prompt tokens/refresh={statistics.mean(prompt_tokens):7.0f}  "
+          f"mean={statistics.mean(latencies) * 1000:6.1f} ms  max={max(latencies) * 1000:6.1f} ms")
+
+
+if __name__ == "__main__":
+    print(f"{ACCOUNTS} accounts refreshed after a week, {SECONDS_PER_PROMPT_TOKEN * 1e6:.0f} us per prompt token\n")
+    run("full")
+    run("update")
@@ -0,0 +1,42 @@
+"""
+Benchmark: per-comment lazy parent lookups vs. batched /api/info hydration.
+Uses the fake Reddit with a fixed per-request latency, so no network is needed.
+Run with: python tests/bench_link_context.py
+"""
+
+import asyncio
+import time
+
+from fakes import FakeReddit, make_account
+
+import main
+
+LATENCY = 0.02  # seconds per simulated Reddit request
+
+
+async def lazy_lookup(fake, comments):
+    """Baseline: what `comment.submission.title` costs, one request per comment."""
+    titles = {}
+    for comment in comments:
+        async for submission in fake.info(fullnames=[comment.link_id]):
+            titles[submission.fullname] = submission.title
+    return titles
+
+
+def run(label, count, coroutine_factory, fake):
+    main.link_context_cache.clear()
+    fake.calls["info"] = 0
+    start = time.perf_counter()
+    asyncio.run(coroutine_factory())
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} comments={count:<5} info_requests={fake.calls['info']:<5} latency={elapsed * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    print(f"Simulated Reddit latency: {LATENCY * 1000:.0f} ms per request\n")
+    for count in (100, 1000):
+        account = make_account(posts=0, comments=count)
+        fake = FakeReddit({"active": account}, latency=LATENCY)
+        comments = account["comments"]
+        run("lazy", count, lambda: lazy_lookup(fake, comments), fake)
+        run("batched", count, lambda: main.hydrate_link_titles(fake, [c.link_id for c in comments]), fake)
@@ -0,0 +1,71 @@
+"""
+Benchmark: new TCP connections, TLS handshakes and DNS lookups per 1,000 completion
+POSTs to a local TLS stub server, with a fresh requests.post per call (how LLM calls
+were sent before outbound.py) versus the pooled HTTPClient over requests and over httpx.
+Run with: python tests/bench_outbound.py
+"""
+
+import socket
+import tempfile
+import time
+
+import requests
+
+from fakes import TLSStubServer, make_self_signed_certificate
+
+from outbound import DNSCache, HTTPClient, httpx
+
+REQUESTS = 1000
+HEADERS = {"Content-Type": "application/json"}
+BODY = b'{"model": "gpt-4o", "messages": []}'
+
+
+class CountingResolver:
+    def __init__(self):
+        self.resolve = socket.getaddrinfo
+        self.lookups = 0
+
+    def __call__(self, *args):
+        self.lookups += 1
+        return self.resolve(*args)
+
+
+def run(label, certfile, keyfile, post, dns_ttl):
+    resolver = CountingResolver()
+    dns_cache = DNSCache(ttl=dns_ttl, resolve=resolver)
+    dns_cache.install()
+    try:
+        with TLSStubServer(certfile, keyfile) as stub:
+            url = f"{stub.base_url}/v1/chat/completions"
+            started = time.perf_counter()
+            for _ in range(REQUESTS):
+                post(url)
+            elapsed = time.perf_counter() - started
+    finally:
+        dns_cache.uninstall()
+    print(f"{label:<30} connections={stub.connections:5d}  handshakes={stub.handshakes:5d}  "
+          f"dns lookups={resolver.lookups:5d}  mean={elapsed / REQUESTS * 1000:6.2f} ms")
+
+
+def pooled(client):
+    def post(url):
+        response = client.post(url, HEADERS, BODY, timeout=5)
+        client.read(response)
+        assert response.status_code == 200
+    return post
+
+
+if __name__ == "__main__":
+    print(f"{REQUESTS} POSTs to a local TLS server\n")
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = make_self_signed_certificate(directory)
+
+        def per_request(url):
+            assert requests.post(url, headers=HEADERS, data=BODY, timeout=5, verify=certfile).status_code == 200
+
+        run("requests.post per call", certfile, keyfile, per_request, dns_ttl=0)
+        run("HTTPClient (requests)", certfile, keyfile, pooled(HTTPClient("bench", http2=False, verify=certfile)),
+            dns_ttl=60)
+        if httpx is not None:
+            # The stub only speaks HTTP/1.1, so this measures httpx's pooling, not HTTP/2
+            run("HTTPClient (httpx)", certfile, keyfile, pooled(HTTPClient("bench", verify=certfile)), dns_ttl=60)
@@ -0,0 +1,110 @@
+"""
+Benchmark: the whole /analyze pipeline (asyncpraw paging, formatting, the completion
+request) against replayed upstream traffic, with no network access.
+
+Pass a fixture recorded with `python upstream_replay.py record ...` against the real
+Reddit and OpenAI APIs; the usernames analyzed are the ones found in it. Without one,
+a fixture with realistically sized posts and comments is recorded from the local stubs
+first. Each analysis is replayed with recorded timings scaled by 0 (pure client-side
+cost) and by 1 (recorded latency).
+Run with: python tests/bench_pipeline_replay.py [fixture.jsonl.gz] [--profile]
+"""
+
+import asyncio
+import cProfile
+import os
+import pstats
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+from fakes import StubOpenAIServer, StubRedditServer, make_account, reset_app_state
+
+import main
+from upstream_replay import UpstreamProxy, load_fixture
+
+RUNS = 20
+PARAMETERS = {"post_limit": 10, "comment_limit": 100, "include_context": True}
+WORDS = ("honestly the driver update fixed it for me but the fan curve still ramps way too early "
+         "when gaming so I ended up setting a custom profile").split()
+
+
+def realistic_account(rng, prefix):
+    account = make_account(10, 100, prefix=prefix, threads=40)
+    for item in account["submissions"]:
+        item.selftext = " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 300)))
+    for item in account["comments"]:
+        item.body = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 120)))
+    return account
+
+
+def record_from_stubs(fixture, usernames):
+    rng = random.Random(3)
+    accounts = {username: realistic_account(rng, username) for username in usernames}
+    with StubRedditServer(accounts, latency=0.08) as reddit, StubOpenAIServer(latency=1.5) as openai:
+        with UpstreamProxy(fixture, "record", reddit_url=reddit.base_url, oauth_url=reddit.base_url,
+                           openai_url=openai.base_url[:-len("/v1")]) as proxy:
+            point_app_at(proxy)
+            for username in usernames:
+                analyze(username)
+
+
+def point_app_at(proxy):
+    reset_app_state()
+    main.REDDIT_URL = main.REDDIT_OAUTH_URL = proxy.base_url
+    main.OPENAI_BASE_URL = proxy.base_url + "/v1"
+
+
+def analyze(username):
+    request = main.AnalyzeUserRequest(user_id="bench", user_to_search=username, parameters=dict(PARAMETERS))
+    return asyncio.run(main.analyze_user(request))
+
+
+def replay(fixture, usernames, time_scale, runs, profiler=None):
+    samples = []
+    with UpstreamProxy(fixture, "replay", time_scale=time_scale) as proxy:
+        for index in range(runs):
+            point_app_at(proxy)
+            username = usernames[index % len(usernames)]
+            started = time.perf_counter()
+            if profiler is not None:
+                profiler.enable()
+            analyze(username)
+            if profiler is not None:
+                profiler.disable()
+            samples.append(time.perf_counter() - started)
+    assert proxy.stats["misses"] == 0, proxy.stats
+    return samples
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    print(f"{label:<26} mean={statistics.mean(samples) * 1000:8.1f} ms  "
+          f"p50={samples[len(samples) // 2] * 1000:8.1f} ms  max={samples[-1] * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    arguments = [argument for argument in sys.argv[1:] if not argument.startswith("--")]
+    with tempfile.TemporaryDirectory() as directory:
+        if arguments:
+            fixture = arguments[0]
+        else:
+            fixture = os.path.join(directory, "stub_session.jsonl.gz")
+            record_from_stubs(fixture, ["alice", "bob", "carol"])
+
+        exchanges = load_fixture(fixture)
+        usernames = sorted({match.group(1) for exchange in exchanges
+                            for match in [re.match(r"^/user/([^/]+)/about", exchange["path"])] if match})
+        payload = sum(len(exchange["body"]) for exchange in exchanges)
+        print(f"{len(exchanges)} exchanges, {payload / 1024:.0f} KiB of responses, "
+              f"{os.path.getsize(fixture) / 1024:.0f} KiB on disk; users: {', '.join(usernames)}\n")
+
+        profiler = cProfile.Profile() if "--profile" in sys.argv else None
+        report("replay, time scale 0", replay(fixture, usernames, 0, RUNS, profiler))
+        report("replay, time scale 1", replay(fixture, usernames, 1, len(usernames)))
+        if profiler is not None:
+            print()
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
@@ -0,0 +1,49 @@
+"""
+Benchmark: share of prompt tokens served from the provider's prompt cache, and the
+resulting latency, for the old username-first prompt layout versus the stable-prefix
+layout. The stub server charges a fixed time per uncached prompt token.
+Run with: python tests/bench_prompt_cache.py
+"""
+
+import statistics
+import time
+
+from fakes import StubOpenAIServer, reset_app_state
+
+import main
+
+USERS = 200
+# Roughly a short account history
+USER_DATA_CHARS = 1200
+SECONDS_PER_UNCACHED_TOKEN = 0.00005
+# Lower than OpenAI's 1024-token minimum so the fixed prefix on its own is cacheable
+CACHE_MIN_TOKENS = 256
+
+# The layout used before: the username sits in front of the instructions
+LEGACY_PROMPT = (
+    "Please analyze the following collection of recent Reddit posts and comments from the user u/{username}.\n"
+    + main.ANALYSIS_INSTRUCTIONS + "\n\n--- USER DATA ---\n{user_data}\n--- END USER DATA ---"
+)
+
+
+def run(label, parameters):
+    with StubOpenAIServer(cache_min_tokens=CACHE_MIN_TOKENS, token_latency=SECONDS_PER_UNCACHED_TOKEN) as stub:
+        reset_app_state()
+        main.OPENAI_BASE_URL = stub.base_url
+        latencies = []
+        for i in range(USERS):
+            user_data = f"r/sub{i % 17}: post number {i}. " * (USER_DATA_CHARS // 25)
+            started = time.perf_counter()
+            main.summarize_with_llm(user_data, f"user{i}", parameters)
+            latencies.append(time.perf_counter() - started)
+
+    prompt_tokens = main.metrics["llm_prompt_tokens"]
+    cached_tokens = main.metrics["llm_cached_prompt_tokens"]
+    print(f"{label:<14} cached={cached_tokens / prompt_tokens:6.1%} of {prompt_tokens} prompt tokens  "
+          f"mean={statistics.mean(latencies) * 1000:6.1f} ms")
+
+
+if __name__ == "__main__":
+    print(f"{USERS} different users, {SECONDS_PER_UNCACHED_TOKEN * 1e6:.0f} us per uncached prompt token\n")
+    run("username-first", {"custom_prompt": LEGACY_PROMPT})
+    run("stable prefix", {})
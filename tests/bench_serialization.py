@@ -0,0 +1,55 @@
+"""
+Benchmark: rendering /analyze responses with the standard JSONResponse versus
+ORJSONResponse, and bytes on the wire uncompressed, gzipped and (if the brotli
+package is installed) brotli-compressed. "batch" is a list of 50 responses.
+Run with: python tests/bench_serialization.py
+"""
+
+import random
+import timeit
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+import fakes  # noqa: F401 (sets up the import path and credentials)
+
+import compression
+import main
+
+WORDS = ("they mostly post in r/buildapc and r/python asking detailed questions about drivers, "
+         "tend to be helpful and technical, with occasional humour in gaming threads").split()
+
+
+def typical_response(rng):
+    paragraphs = ["**Main Interests:** ", "**Overall Tone:** ", "**Activity Pattern:** "]
+    summary = "\n\n".join(heading + " ".join(rng.choice(WORDS) for _ in range(90)) for heading in paragraphs)
+    return main.AnalyzeUserResponse(
+        success=True, user_id="dashboard", analyzed_user=f"user{rng.randrange(10**6)}", summary=summary,
+        usage={"prompt_tokens": 6800, "cached_tokens": 1024, "completion_tokens": 410}, summary_mode="full",
+    )
+
+
+def measure(label, content):
+    results = {}
+    for name, response_class in (("json", JSONResponse), ("orjson", ORJSONResponse)):
+        runs = 2000 if label == "typical" else 200
+        seconds = timeit.timeit(lambda: response_class(content).body, number=runs) / runs
+        results[name] = seconds
+    body = ORJSONResponse(content).body
+    sizes = [("raw", len(body)), ("gzip", len(compression.compress(body, "gzip")))]
+    if compression.brotli is not None:
+        sizes.append(("br", len(compression.compress(body, "br"))))
+
+    print(f"{label:<8} render json={results['json'] * 1e6:7.1f} us  orjson={results['orjson'] * 1e6:7.1f} us  "
+          f"({results['json'] / results['orjson']:.1f}x)  |  "
+          + "  ".join(f"{name}={size:7d} B" for name, size in sizes))
+
+
+if __name__ == "__main__":
+    rng = random.Random(5)
+    typical = typical_response(rng).model_dump()
+    batch = [typical_response(rng).model_dump() for _ in range(50)]
+    measure("typical", typical)
+    measure("batch", batch)
+    trimmed = main.AnalyzeUserResponse(**typical).model_dump(include={"summary"})
+    print(f"\nfields=summary trims the typical response from {len(ORJSONResponse(typical).body)} "
+          f"to {len(ORJSONResponse(trimmed).body)} bytes before compression")
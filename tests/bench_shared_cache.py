@@ -0,0 +1,72 @@
+"""
+Benchmark: get() latency from 4 worker processes for an L1 hit, a shared-tier hit
+(value written by another worker) and a miss, with the SQLite shared tier and with
+the Redis-protocol backend (against the local stand-in server).
+Run with: python tests/bench_shared_cache.py
+"""
+
+import asyncio
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from fakes import StubRedisServer
+
+from cache import TieredCache, create_backend
+
+WORKERS = 4
+KEYS = 500
+VALUE = {"summary": "x" * 2000, "summary_mode": "full", "partial": False}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def worker(url, index, barrier, results):
+    async def measure():
+        cache = TieredCache("bench", create_backend(url), l1_max_entries=10 * KEYS, l1_ttl=60)
+        for key in range(KEYS):
+            await cache.set(f"w{index}:{key}", VALUE, ttl=300)
+        barrier.wait()
+
+        timings = {"l1 hit": [], "shared hit": [], "miss": []}
+        neighbour = (index + 1) % WORKERS
+        for key in range(KEYS):
+            for kind, name in (("l1 hit", f"w{index}:{key}"), ("shared hit", f"w{neighbour}:{key}"),
+                               ("miss", f"absent:{index}:{key}")):
+                started = time.perf_counter()
+                await cache.get(name)
+                timings[kind].append(time.perf_counter() - started)
+        return timings
+
+    results.put(asyncio.run(measure()))
+
+
+def run(label, url):
+    barrier = multiprocessing.Barrier(WORKERS)
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(url, index, barrier, results)) for index in range(WORKERS)]
+    for process in processes:
+        process.start()
+    merged = {}
+    for _ in processes:
+        for kind, values in results.get().items():
+            merged.setdefault(kind, []).extend(values)
+    for process in processes:
+        process.join()
+
+    for kind, values in merged.items():
+        print(f"{label:<7} {kind:<11} p50={statistics.median(values) * 1e6:7.1f} us  "
+              f"p99={percentile(values, 0.99) * 1e6:7.1f} us")
+
+
+if __name__ == "__main__":
+    print(f"{WORKERS} worker processes, {KEYS} keys each, ~2 KB values\n")
+    with tempfile.TemporaryDirectory() as directory:
+        run("sqlite", f"sqlite:///{os.path.join(directory, 'cache.db')}")
+    with StubRedisServer() as redis:
+        run("redis", f"redis://{redis.host}:{redis.port}/0")
@@ -0,0 +1,54 @@
+"""
+Benchmark: latency of GET /users/{username}/summary answered with 304 Not Modified or
+200 from the summary store, versus POST /analyze computing the summary. Reddit calls
+take 50 ms (FakeReddit latency) and the completion 300 ms (StubOpenAIServer latency).
+Run with: python tests/bench_summary_endpoint.py
+"""
+
+import statistics
+import time
+
+from fastapi.testclient import TestClient
+
+from fakes import FakeReddit, StubOpenAIServer, make_account, reset_app_state
+
+import main
+
+REQUESTS = 200
+COMPUTATIONS = 10
+
+
+def timed(call, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        response = call()
+        samples.append(time.perf_counter() - started)
+        assert response.status_code in (200, 304), response.text
+    samples.sort()
+    return statistics.mean(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def report(label, result):
+    mean, p99 = result
+    print(f"{label:<28} mean={mean * 1000:8.2f} ms  p99={p99 * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    with StubOpenAIServer(latency=0.3) as stub:
+        reset_app_state()
+        main.OPENAI_BASE_URL = stub.base_url
+        main.create_reddit_client = FakeReddit({"alice": make_account(10, 50)}, latency=0.05).client
+        body = {"user_id": "bench", "user_to_search": "alice", "parameters": {}}
+
+        with TestClient(main.app) as client:
+            computed = timed(lambda: client.post("/analyze", json=body), COMPUTATIONS)
+            etag = client.get("/users/alice/summary").headers["etag"]
+            full = timed(lambda: client.get("/users/alice/summary"), REQUESTS)
+            not_modified = timed(lambda: client.get("/users/alice/summary", headers={"If-None-Match": etag}),
+                                 REQUESTS)
+
+    report("POST /analyze (computed)", computed)
+    report("GET summary 200", full)
+    report("GET summary 304", not_modified)
+    print(f"\n304 is {computed[0] / not_modified[0]:.0f}x faster than computing the summary")
@@ -0,0 +1,50 @@
+"""
+Benchmark: end-to-end /analyze latency per summary_length tier, Markdown and JSON output.
+Reddit is the fake client; the completion is the local OpenAI stub, which generates
+tokens at GENERATION_SECONDS each (about 150 tokens/s, gpt-4o's order of magnitude)
+and, if not cut off by max_tokens, writes 60% of the tier's cap (what the tier's length
+instruction would ask for).
+Run with: python tests/bench_summary_length.py
+"""
+
+import asyncio
+import statistics
+import time
+
+from fakes import FakeReddit, StubOpenAIServer, make_account, reset_app_state
+
+import main
+
+REQUESTS = 3
+GENERATION_SECONDS = 1 / 150
+
+
+def natural_length(body):
+    return int(body["max_tokens"] * 0.6)
+
+
+async def per_request(parameters):
+    latencies = []
+    for _ in range(REQUESTS):
+        request = main.AnalyzeUserRequest(user_id="bench", user_to_search="alice",
+                                          parameters={"post_limit": 10, "comment_limit": 100, **parameters})
+        started = time.perf_counter()
+        response = await main.analyze_user(request)
+        latencies.append(time.perf_counter() - started)
+    return statistics.median(latencies), response.usage["completion_tokens"]
+
+
+def bench():
+    with StubOpenAIServer(completion_tokens=natural_length, generation_latency=GENERATION_SECONDS) as stub:
+        reset_app_state()
+        main.OPENAI_BASE_URL = stub.base_url
+        main.create_reddit_client = FakeReddit({"alice": make_account(10, 100)}).client
+        print(f"{'summary_length':>14}  {'format':>8}  {'completion tokens':>17}  {'p50 latency':>11}")
+        for output_format in ("markdown", "json"):
+            for tier in main.SUMMARY_LENGTHS:
+                latency, tokens = asyncio.run(per_request({"summary_length": tier, "output_format": output_format}))
+                print(f"{tier:>14}  {output_format:>8}  {tokens:>17}  {latency:>9.2f} s")
+
+
+if __name__ == "__main__":
+    bench()
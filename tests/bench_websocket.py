@@ -0,0 +1,102 @@
+"""
+Benchmark: 50 analyses from one dashboard, as 50 cross-origin HTTP calls (each with its
+CORS preflight, over a browser's 6 connections per host) versus 50 messages over one
+/ws connection. A real uvicorn server answers; Reddit calls take 20 ms (FakeReddit
+latency) and the completion 100 ms (StubOpenAIServer latency). Both run at most
+SCHEDULER_PER_CALLER_CONCURRENCY analyses of the one caller at a time, so any difference
+is transport overhead: preflights, request parsing and connection slots.
+Run with: python tests/bench_websocket.py
+"""
+
+import asyncio
+import http.client
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import uvicorn
+import websockets
+
+from fakes import FakeReddit, StubOpenAIServer, make_account, reset_app_state
+
+import main
+
+ANALYSES = 50
+BROWSER_CONNECTIONS = 6
+ORIGIN = "http://localhost:3000"
+
+
+def bodies():
+    return [{"user_id": "dashboard", "user_to_search": f"user{i}", "parameters": {"post_limit": 2, "comment_limit": 5}}
+            for i in range(ANALYSES)]
+
+
+def over_http(port):
+    local = threading.local()
+
+    def call(body):
+        if not hasattr(local, "connection"):
+            local.connection = http.client.HTTPConnection("127.0.0.1", port)
+        connection = local.connection
+        # What the browser sends before every cross-origin JSON POST
+        connection.request("OPTIONS", "/analyze", headers={
+            "Origin": ORIGIN, "Access-Control-Request-Method": "POST",
+            "Access-Control-Request-Headers": "content-type"})
+        connection.getresponse().read()
+        connection.request("POST", "/analyze", body=json.dumps(body),
+                           headers={"Origin": ORIGIN, "Content-Type": "application/json"})
+        response = connection.getresponse()
+        response.read()
+        assert response.status == 200, response.status
+
+    with ThreadPoolExecutor(BROWSER_CONNECTIONS) as pool:
+        list(pool.map(call, bodies()))
+
+
+async def over_websocket(port):
+    async with websockets.connect(f"ws://127.0.0.1:{port}/ws", origin=ORIGIN) as websocket:
+        for i, body in enumerate(bodies()):
+            await websocket.send(json.dumps({"id": i, "request": body}))
+        finished = 0
+        while finished < ANALYSES:
+            message = json.loads(await websocket.recv())
+            if message["type"] in ("result", "error"):
+                assert message["type"] == "result", message
+                finished += 1
+
+
+def timed(label, run):
+    started = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<34} {elapsed * 1000:8.1f} ms  ({elapsed / ANALYSES * 1000:6.1f} ms/analysis)")
+    return elapsed
+
+
+if __name__ == "__main__":
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    with StubOpenAIServer(latency=0.1) as stub:
+        reset_app_state()
+        main.OPENAI_BASE_URL = stub.base_url
+        main.create_reddit_client = FakeReddit(
+            {f"user{i}": make_account(2, 5, prefix=f"user{i}") for i in range(ANALYSES)}, latency=0.02).client
+        # One dashboard is one caller; let it use the pipeline like the many HTTP calls can
+        main.WS_MAX_CONCURRENCY = main.SCHEDULER_PER_CALLER_CONCURRENCY
+        server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.01)
+        try:
+            http_time = timed(f"{ANALYSES} HTTP calls + preflights", lambda: over_http(port))
+            ws_time = timed(f"{ANALYSES} analyses over one WebSocket", lambda: asyncio.run(over_websocket(port)))
+        finally:
+            server.should_exit = True
+            thread.join()
+
+    print(f"\nHTTP: {ANALYSES * 2} requests over {BROWSER_CONNECTIONS} connections; "
+          f"WebSocket: 1 upgrade, {ANALYSES} messages ({http_time / ws_time:.2f}x)")
@@ -0,0 +1,24 @@
+"""
+Runs one API instance for the cluster tests and benchmark, against fake Reddit
+accounts user0..user{N-1} and a stub summarizer. Cluster settings come from the
+CLUSTER_* environment variables.
+Run with: python tests/cluster_node.py PORT
+"""
+
+import sys
+
+from fakes import FakeReddit, make_account, reset_app_state
+
+import main
+import uvicorn
+
+ACCOUNTS = 500
+
+if __name__ == "__main__":
+    port = int(sys.argv[1])
+    reset_app_state()
+    main.RESULT_CACHE_TTL = 600
+    main.create_reddit_client = FakeReddit(
+        {f"user{i}": make_account(2, 5, prefix=f"user{i}") for i in range(ACCOUNTS)}).client
+    main.summarize_with_llm = lambda user_data, username, *args, **kwargs: f"summary of u/{username}"
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
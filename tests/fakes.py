@@ -0,0 +1,616 @@
+"""
+In-process fakes for the Reddit client, used by tests that should not hit the network.
+Importing this module also sets placeholder credentials so main.py can be imported.
+"""
+
+import asyncio
+import fnmatch
+import json
+import os
+import re
+import socket
+import socketserver
+import ssl
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+os.environ.setdefault("REDDIT_CLIENT_ID", "test_client_id")
+os.environ.setdefault("REDDIT_CLIENT_SECRET", "test_client_secret")
+os.environ.setdefault("REDDIT_USER_AGENT", "RedditStalker:test (by /u/test)")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ.setdefault("SUMMARY_STORE_PATH", ":memory:")
+os.environ.setdefault("ACTIVITY_STORE_PATH", ":memory:")
+# Tests talk to local stubs only; startup must not connect to the real upstreams
+os.environ.setdefault("OUTBOUND_WARMUP", "false")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+# Tests swap these out for stubs; reset_app_state() puts them back
+REAL_SUMMARIZE_WITH_LLM = main.summarize_with_llm
+REAL_CREATE_REDDIT_CLIENT = main.create_reddit_client
+REAL_OPENAI_BASE_URL = main.OPENAI_BASE_URL
+REAL_REDDIT_URL = main.REDDIT_URL
+REAL_REDDIT_OAUTH_URL = main.REDDIT_OAUTH_URL
+REAL_ACTIVITY_TEXT_MAX_CHARS = main.ACTIVITY_TEXT_MAX_CHARS
+REAL_RESULT_CACHE_TTL = main.RESULT_CACHE_TTL
+REAL_ACTIVITY_STORE_MAX_AGE = main.ACTIVITY_STORE_MAX_AGE
+
+
+class FakeResponse:
+    """Mimics the aiohttp response attached to asyncprawcore exceptions."""
+
+    def __init__(self, status):
+        self.status = status
+
+
+class FakeResponseException(Exception):
+    """Mimics asyncprawcore.exceptions.ResponseException (NotFound, Forbidden, ...)."""
+
+    def __init__(self, status):
+        self.response = FakeResponse(status)
+        super().__init__(f"received {status} HTTP response")
+
+
+class FakeItem:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class FakeListing:
+    def __init__(self, reddit, kind, items):
+        self.reddit = reddit
+        self.kind = kind
+        self.items = items
+
+    async def _iterate(self, limit):
+        self.reddit.calls[f"{self.kind}.new"] += 1
+        # Reddit listings return at most 100 items per page
+        for index, item in enumerate(self.items[:limit]):
+            if index % 100 == 0:
+                await self.reddit.simulate_latency()
+            yield item
+
+    def new(self, limit=100):
+        return self._iterate(limit)
+
+
+class FakeRedditor:
+    def __init__(self, reddit, name, account):
+        self.reddit = reddit
+        self.name = name
+        self.account = account
+        self.submissions = FakeListing(reddit, "submissions", account.get("submissions", []))
+        self.comments = FakeListing(reddit, "comments", account.get("comments", []))
+
+    async def load(self):
+        self.reddit.calls["load"] += 1
+        await self.reddit.simulate_latency()
+        if "status" in self.account:
+            raise FakeResponseException(self.account["status"])
+        if self.account.get("is_suspended"):
+            self.is_suspended = True
+
+
+class FakeReddit:
+    """
+    Stands in for asyncpraw.Reddit. `accounts` maps username -> dict with any of:
+    status (HTTP error raised by load), is_suspended, submissions, comments.
+    Unknown usernames behave like Reddit's 404. `latency` (seconds) is slept once
+    per simulated HTTP request; `max_concurrency` caps simultaneous requests the
+    way a shared rate limit would.
+    """
+
+    def __init__(self, accounts, latency=0.0, max_concurrency=None):
+        self.accounts = accounts
+        self.latency = latency
+        self.max_concurrency = max_concurrency
+        self.semaphore = None
+        # Set to an HTTP status (e.g. 503) to make every request fail like an outage
+        self.failing = None
+        self.calls = {
+            "clients": 0, "load": 0, "submissions.new": 0, "comments.new": 0,
+            "info": 0, "info_fullnames": 0, "close": 0,
+        }
+        # What asyncpraw's Reddit.auth.limits would report after the last response
+        self.rate_limit = {"remaining": None, "reset_timestamp": None, "used": None}
+
+    async def simulate_latency(self):
+        if self.failing:
+            raise FakeResponseException(self.failing)
+        if not self.latency:
+            return
+        if self.max_concurrency is None:
+            await asyncio.sleep(self.latency)
+            return
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self.semaphore:
+            await asyncio.sleep(self.latency)
+
+    @property
+    def auth(self):
+        return FakeItem(limits=dict(self.rate_limit))
+
+    def client(self):
+        """Factory suitable for replacing main.create_reddit_client."""
+        self.calls["clients"] += 1
+        return self
+
+    async def redditor(self, name):
+        return FakeRedditor(self, name, self.accounts.get(name, {"status": 404}))
+
+    def info(self, fullnames=None):
+        """Mimics Reddit.info: one /api/info request per 100 fullnames."""
+        async def generator():
+            names = list(fullnames)
+            for start in range(0, len(names), 100):
+                chunk = names[start:start + 100]
+                self.calls["info"] += 1
+                self.calls["info_fullnames"] += len(chunk)
+                await self.simulate_latency()
+                for name in chunk:
+                    yield FakeItem(fullname=name, title=f"title of {name}")
+        return generator()
+
+    async def close(self):
+        self.calls["close"] += 1
+
+
+# created_utc of the newest item in a fresh fake account
+FAKE_NOW = 1700000000.0
+
+
+def make_account(posts=2, comments=5, prefix="item", threads=None, newest_utc=FAKE_NOW):
+    """
+    Builds a fake active account with the given number of posts and comments, newest
+    first like Reddit's listings. Comments are spread over `threads` distinct parent
+    posts (default: one each).
+    """
+    threads = threads or max(comments, 1)
+    return {
+        "submissions": [
+            FakeItem(fullname=f"t3_{prefix}_{newest_utc:.0f}_{i}", title=f"{prefix} post {i}",
+                     selftext=f"{prefix} body {i}", created_utc=newest_utc - i * 3600)
+            for i in range(posts)
+        ],
+        "comments": [
+            FakeItem(fullname=f"t1_{prefix}_{newest_utc:.0f}_{i}", body=f"{prefix} comment {i}",
+                     link_id=f"t3_{prefix}{i % threads}", created_utc=newest_utc - i * 60)
+            for i in range(comments)
+        ],
+    }
+
+
+def add_activity(account, posts=0, comments=0, prefix="new"):
+    """Prepends posts and comments newer than anything already in the account."""
+    items = account["submissions"] + account["comments"]
+    newest = max((item.created_utc for item in items), default=FAKE_NOW) + 24 * 3600
+    fresh = make_account(posts, comments, prefix=prefix, newest_utc=newest)
+    account["submissions"][:0] = fresh["submissions"]
+    account["comments"][:0] = fresh["comments"]
+    return account
+
+
+class StubOpenAIServer:
+    """
+    A local OpenAI-compatible /chat/completions server running in a background thread.
+    Point main.OPENAI_BASE_URL at `base_url`. Faults can be injected while it runs:
+    `failing` (HTTP status to return instead of a completion) and `latency`
+    (seconds, or a callable returning seconds, slept before answering).
+    Every request body is kept in `requests`.
+
+    Provider prompt caching is simulated the way OpenAI describes it: prompts of at least
+    `cache_min_tokens` tokens (4 chars each) have their prefixes remembered in blocks of
+    `cache_block_tokens`, and a later prompt starting with a remembered prefix reports it
+    as `prompt_tokens_details.cached_tokens`. `token_latency` seconds are added per
+    uncached prompt token.
+
+    Generation is simulated with `completion_tokens` (tokens the model would write, or a
+    callable taking the request body): the answer is cut at the request's max_tokens
+    (finish_reason "length") and `generation_latency` seconds are added per generated
+    token. Requests with a json_object response_format get a JSON object with the
+    summary's sections.
+    """
+
+    def __init__(self, latency=0.0, failing=None, cache_min_tokens=1024, cache_block_tokens=128,
+                 token_latency=0.0, completion_tokens=None, generation_latency=0.0):
+        self.latency = latency
+        self.failing = failing
+        self.cache_min_tokens = cache_min_tokens
+        self.cache_block_tokens = cache_block_tokens
+        self.token_latency = token_latency
+        self.completion_tokens = completion_tokens
+        self.generation_latency = generation_latency
+        self.cached_prefixes = set()
+        self.requests = []
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stub.lock:
+                    stub.requests.append(body)
+                status, payload = stub.respond(body)
+                encoded = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(encoded)))
+                self.end_headers()
+                self.wfile.write(encoded)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def respond(self, body):
+        latency = self.latency() if callable(self.latency) else self.latency
+        if latency:
+            time.sleep(latency)
+        if self.failing:
+            return self.failing, {"error": {"message": "injected failure", "type": "server_error"}}
+
+        prompt = "".join(f"{message['role']}:{message['content']}" for message in body["messages"])
+        prompt_tokens = len(prompt) // 4
+        cached_tokens = self.cache_lookup(prompt, prompt_tokens)
+        if self.token_latency:
+            time.sleep((prompt_tokens - cached_tokens) * self.token_latency)
+
+        finish_reason = "stop"
+        if self.completion_tokens is None:
+            text = f"Stub summary from {body['model']} ({len(prompt)} prompt chars)"
+        else:
+            wanted = self.completion_tokens(body) if callable(self.completion_tokens) else self.completion_tokens
+            generated = min(wanted, body.get("max_tokens", wanted))
+            if generated < wanted:
+                finish_reason = "length"
+            time.sleep(generated * self.generation_latency)
+            text = " ".join(["word"] * generated)
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            content = json.dumps({name: f"{name} of {text}" for name in ("main_interests", "overall_tone",
+                                                                          "activity_pattern")})
+        else:
+            content = text
+        completion_tokens = len(content) // 4 if self.completion_tokens is None else generated
+        return 200, {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": finish_reason}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens,
+                      "prompt_tokens_details": {"cached_tokens": cached_tokens}},
+        }
+
+    def cache_lookup(self, prompt, prompt_tokens):
+        """Returns how many leading prompt tokens were cached, then caches this prompt's prefixes."""
+        if prompt_tokens < self.cache_min_tokens:
+            return 0
+        block_chars = self.cache_block_tokens * 4
+        prefixes = [prompt[:end] for end in range(block_chars, len(prompt) + 1, block_chars)]
+        with self.lock:
+            cached = 0
+            for prefix in prefixes:
+                if prefix not in self.cached_prefixes:
+                    break
+                cached = len(prefix) // 4
+            self.cached_prefixes.update(prefixes)
+        return cached
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StubRedditServer:
+    """
+    A local HTTP server answering like Reddit's API for the same `accounts` dicts FakeReddit
+    takes: the application-only token endpoint, /user/<name>/about, the submitted and
+    comments listings (paged by `limit` and `after`) and /api/info. Point main.REDDIT_URL
+    and main.REDDIT_OAUTH_URL at `base_url` to run the real asyncpraw client against it.
+    `latency` seconds are slept per request; request paths are counted in `calls`.
+    """
+
+    LISTING = re.compile(r"^/user/([^/]+)/(submitted|comments)(?:/new)?/?$")
+
+    def __init__(self, accounts, latency=0.0):
+        self.accounts = accounts
+        self.latency = latency
+        self.calls = {}
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def respond(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                parts = urlsplit(self.path)
+                with stub.lock:
+                    stub.calls[parts.path] = stub.calls.get(parts.path, 0) + 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                status, payload = stub.route(parts.path.rstrip("/") or "/", dict(parse_qsl(parts.query)))
+                encoded = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=UTF-8")
+                self.send_header("Content-Length", str(len(encoded)))
+                self.end_headers()
+                self.wfile.write(encoded)
+
+            do_GET = do_POST = respond
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @staticmethod
+    def thing(item, author):
+        fields = {name: value for name, value in vars(item).items() if name != "fullname"}
+        fields.update(id=item.fullname[3:], name=item.fullname, author=author)
+        return {"kind": item.fullname[:2], "data": fields}
+
+    @staticmethod
+    def listing(children, after=None):
+        return {"kind": "Listing", "data": {"after": after, "before": None, "dist": len(children),
+                                            "children": children}}
+
+    def route(self, path, query):
+        if path == "/api/v1/access_token":
+            return 200, {"access_token": "stub-token", "token_type": "bearer", "expires_in": 86400, "scope": "*"}
+        if path == "/api/info":
+            names = [name for name in query.get("id", "").split(",") if name]
+            return 200, self.listing([{"kind": "t3", "data": {"id": name[3:], "name": name,
+                                                               "title": f"title of {name}"}} for name in names])
+        match = re.match(r"^/user/([^/]+)/about$", path)
+        if match:
+            account = self.accounts.get(match.group(1))
+            if account is None or "status" in account:
+                status = 404 if account is None else account["status"]
+                return status, {"message": "error", "error": status}
+            if account.get("is_suspended"):
+                return 200, {"kind": "t2", "data": {"name": match.group(1), "is_suspended": True}}
+            return 200, {"kind": "t2", "data": {"name": match.group(1), "id": "stub", "created_utc": 0}}
+        match = self.LISTING.match(path)
+        if match:
+            name, kind = match.groups()
+            items = self.accounts.get(name, {}).get("submissions" if kind == "submitted" else "comments", [])
+            start = 0
+            if query.get("after"):
+                start = next((index + 1 for index, item in enumerate(items) if item.fullname == query["after"]),
+                             len(items))
+            page = items[start:start + min(int(query.get("limit", 25)), 100)]
+            after = page[-1].fullname if page and start + len(page) < len(items) else None
+            return 200, self.listing([self.thing(item, name) for item in page], after)
+        return 404, {"message": "Not Found", "error": 404}
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def make_self_signed_certificate(directory):
+    """Writes a certificate for localhost with the openssl CLI; returns (certfile, keyfile)."""
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+                    "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1", "-keyout", keyfile, "-out", certfile],
+                   check=True, capture_output=True)
+    return certfile, keyfile
+
+
+class TLSStubServer:
+    """
+    A local HTTPS server (HTTP/1.1, keep-alive) answering every GET and POST with a small
+    JSON body. Counts accepted TCP `connections`, completed TLS `handshakes` and `requests`.
+    `base_url` uses the name localhost, so clients resolve it like a real upstream.
+    """
+
+    def __init__(self, certfile, keyfile):
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        self.connections = 0
+        self.handshakes = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def respond(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                with stub.lock:
+                    stub.requests += 1
+                encoded = b'{"ok": true}'
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(encoded)))
+                self.end_headers()
+                self.wfile.write(encoded)
+
+            do_GET = do_POST = respond
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+
+            def get_request(self):
+                sock, address = super().get_request()
+                with stub.lock:
+                    stub.connections += 1
+                # Headers and body go out in separate writes; do not let Nagle hold the body back
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                return context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False), address
+
+            def finish_request(self, request, client_address):
+                # In the connection's thread, so a slow handshake does not hold up accept()
+                request.do_handshake()
+                with stub.lock:
+                    stub.handshakes += 1
+                super().finish_request(request, client_address)
+
+        self.server = Server(("127.0.0.1", 0), Handler)
+        self.base_url = f"https://localhost:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StubRedisServer:
+    """
+    A local stand-in for Redis speaking enough of the protocol for cache.RedisBackend:
+    GET, SET (PX, NX), DEL, SCAN (MATCH), SELECT and PING. Point a RedisBackend at
+    `host` / `port`. Every command name is counted in `commands`.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.commands = {}
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    args = []
+                    for _ in range(int(line[1:-2])):
+                        length = int(self.rfile.readline()[1:-2])
+                        args.append(self.rfile.read(length + 2)[:-2])
+                    self.wfile.write(stub.execute(args))
+
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.host, self.port = self.server.server_address
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def _live(self, key):
+        entry = self.data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self.data[key]
+            return None
+        return entry
+
+    def execute(self, args):
+        command = args[0].upper().decode()
+        with self.lock:
+            self.commands[command] = self.commands.get(command, 0) + 1
+            if command in ("PING", "SELECT"):
+                return b"+OK\r\n"
+            if command == "GET":
+                entry = self._live(args[1])
+                return b"$-1\r\n" if entry is None else b"$%d\r\n%s\r\n" % (len(entry[0]), entry[0])
+            if command == "SET":
+                options = [arg.upper() for arg in args[3:]]
+                expires_at = None
+                if b"PX" in options:
+                    expires_at = time.time() + int(args[3 + options.index(b"PX") + 1]) / 1000
+                if b"NX" in options and self._live(args[1]) is not None:
+                    return b"$-1\r\n"
+                self.data[args[1]] = (args[2], expires_at)
+                return b"+OK\r\n"
+            if command == "DEL":
+                removed = sum(self.data.pop(key, None) is not None for key in args[1:])
+                return b":%d\r\n" % removed
+            if command == "SCAN":
+                pattern = args[args.index(b"MATCH") + 1].decode() if b"MATCH" in args else "*"
+                keys = [key for key in list(self.data) if self._live(key) and fnmatch.fnmatchcase(key.decode(), pattern)]
+                reply = b"*2\r\n$1\r\n0\r\n*%d\r\n" % len(keys)
+                return reply + b"".join(b"$%d\r\n%s\r\n" % (len(key), key) for key in keys)
+        return b"-ERR unknown command\r\n"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def reset_app_state(production: bool = False):
+    """
+    Clears caches, counters, stubs and breaker state that earlier tests may have left in main.
+    By default the result cache, the activity store's read path and caller quotas are off,
+    so repeated requests each run the pipeline; `production` keeps the configured defaults.
+    """
+    from circuit_breaker import CircuitBreaker
+    from fairness import CallerQuotas
+    from hot_accounts import AccessTracker, CallBudget
+    from degradation import DegradationController
+    from loop_monitor import LoopLagMonitor
+
+    main.summarize_with_llm = REAL_SUMMARIZE_WITH_LLM
+    main.create_reddit_client = REAL_CREATE_REDDIT_CLIENT
+    main.OPENAI_BASE_URL = REAL_OPENAI_BASE_URL
+    main.REDDIT_URL = REAL_REDDIT_URL
+    main.REDDIT_OAUTH_URL = REAL_REDDIT_OAUTH_URL
+    main.DEBUG_TOKEN = ""
+    main.ACTIVITY_TEXT_MAX_CHARS = REAL_ACTIVITY_TEXT_MAX_CHARS
+    main.pipeline_buffer_peaks.clear()
+    main.degradation = DegradationController(queue_depth=main.DEGRADE_QUEUE_DEPTH,
+                                             reddit_page_target=main.DEGRADE_REDDIT_PAGE_SECONDS,
+                                             llm_target=main.DEGRADE_LLM_SECONDS,
+                                             rate_headroom=main.DEGRADE_RATE_HEADROOM,
+                                             min_fraction=main.DEGRADE_MIN_FRACTION,
+                                             model_level=main.DEGRADE_MODEL_LEVEL,
+                                             fallback_model=main.DEGRADE_FALLBACK_MODEL)
+    main.negative_cache.clear()
+    main.link_context_cache.clear()
+    main.summary_cache.clear()
+    main.result_cache.clear()
+    # Most tests repeat identical requests and expect each one to run the pipeline
+    main.RESULT_CACHE_TTL = REAL_RESULT_CACHE_TTL if production else 0
+    main.summary_store.clear()
+    main.activity_store.clear()
+    # Most tests count Reddit calls; test_activity_store turns the read path back on
+    main.ACTIVITY_STORE_MAX_AGE = REAL_ACTIVITY_STORE_MAX_AGE if production else 0
+    for key in main.metrics:
+        main.metrics[key] = 0
+    main.reddit_breaker = CircuitBreaker("reddit")
+    main.openai_breaker = CircuitBreaker("openai")
+    main.llm_backends = main.create_llm_backends()
+    main.caller_quotas = (CallerQuotas(rate=main.CALLER_QUOTA_RATE, burst=main.CALLER_QUOTA_BURST) if production
+                          else CallerQuotas(rate=0, burst=0))
+    main.access_tracker = AccessTracker(half_life=main.ACCESS_TRACKER_HALF_LIFE)
+    main.refresh_reddit_budget = CallBudget(main.REFRESH_REDDIT_BUDGET, main.REFRESH_BUDGET_WINDOW)
+    main.refresh_llm_budget = CallBudget(main.REFRESH_LLM_BUDGET, main.REFRESH_BUDGET_WINDOW)
+    main.loop_monitor = LoopLagMonitor(interval=main.LOOP_LAG_INTERVAL,
+                                       slow_callback_threshold=main.LOOP_SLOW_CALLBACK_THRESHOLD)
+    return main
@@ -0,0 +1,72 @@
+"""
+Tests for the activity text budget, the single encoding of the completion request body
+and per-request buffer accounting.
+Run with: python tests/test_activity_budget.py
+"""
+
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from fakes import FakeReddit, StubOpenAIServer, make_account, reset_app_state
+
+import main
+
+
+def test_paging_stops_once_the_budget_is_full():
+    reset_app_state()
+    main.ACTIVITY_STORE_MAX_AGE = 600
+    main.ACTIVITY_TEXT_MAX_CHARS = 2000
+    fake = FakeReddit({"active": make_account(posts=2, comments=1000)})
+    main.create_reddit_client = fake.client
+
+    stats = {}
+    data = asyncio.run(main.get_reddit_user_data("active", {"comment_limit": 1000}, stats=stats))
+    assert stats["truncated"] and stats["items"] < 60
+    assert len(data) <= 2000
+    # Newest first: the posts and the latest comments make it in
+    assert data.startswith("Post Title: item post 0") and "Comment: item comment 0\n" in data
+    assert "item comment 100\n" not in data
+
+    # A truncated fetch is not a complete window, so it is not served from the store
+    asyncio.run(main.get_reddit_user_data("active", {"comment_limit": 1000}))
+    assert fake.calls["comments.new"] == 2
+
+
+def test_format_activity_caps_the_text():
+    posts = [{"title": "a title", "body": "x" * 50}]
+    comments = [{"body": f"comment {index}"} for index in range(20)]
+    full = main.format_activity(posts, comments, False)
+    assert main.format_activity(posts, comments, False, max_chars=len(full)) == full
+
+    capped = main.format_activity(posts, comments, False, max_chars=200)
+    assert len(capped) <= 200 and full.startswith(capped)
+    # Everything that fits, and no more
+    assert capped.endswith("Comment: comment 4") and len(capped + "\n---\nComment: comment 5") > 200
+    # A single item larger than the budget is cut rather than dropped
+    assert main.format_activity([{"title": "t" * 500, "body": ""}], [], False, max_chars=100) == \
+        ("Post Title: " + "t" * 500)[:100]
+
+
+def test_body_is_encoded_once_and_buffers_are_accounted():
+    with StubOpenAIServer() as stub:
+        reset_app_state()
+        main.OPENAI_BASE_URL = stub.base_url
+        main.create_reddit_client = FakeReddit({"alice": make_account(5, 300)}).client
+        body = {"user_id": "caller", "user_to_search": "alice",
+                "parameters": {"post_limit": 5, "comment_limit": 300, "custom_prompt": "Über {username}: {user_data}"}}
+        client = TestClient(main.app)
+        assert client.post("/analyze", json=body).status_code == 200
+        buffers = client.get("/metrics").json()["pipeline_buffer_bytes"]
+
+    prompt = stub.requests[0]["messages"][1]["content"]
+    assert prompt.startswith("Über alice: Post Title: item post 0")
+    # Text, prompt and body are held at once while the request is sent
+    assert 3 * len(prompt) <= buffers["max"] < 4 * len(prompt)
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"PASS {name}")
@@ -0,0 +1,178 @@
+"""
+Tests for the SQLite activity store and the read path in get_reddit_user_data.
+Run with: python tests/test_activity_store.py
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+
+from fakes import FakeReddit, make_account, reset_app_state
+
+import main
+from activity_store import EXHAUSTED, ActivityStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def items(kind, count, newest=1000.0, prefix="x"):
+    return [{"fullname": f"{kind}_{prefix}_{i}", "kind": kind, "created_utc": newest - i, "body": f"{prefix} {i}"}
+            for i in range(count)]
+
+
+def test_window_is_served_newest_first():
+    store = ActivityStore(":memory:")
+    store.upsert_items("Alice", items("post", 5) + items("comment", 50))
+    assert store.read_window("alice", 5, 50, max_age=60) is None
+    store.record_sync("alice", 5, 50)
+
+    posts, comments = store.read_window("ALICE", 3, 20, max_age=60)
+    assert [post["created_utc"] for post in posts] == [1000.0, 999.0, 998.0]
+    assert len(comments) == 20 and comments[0]["body"] == "x 0"
+    # Larger than what was fetched, or too old
+    assert store.read_window("alice", 6, 20, max_age=60) is None
+    assert store.read_window("alice", 3, 20, max_age=-1) is None
+    # Only items newer than the watermark
+    posts, comments = store.read_window("alice", 5, 50, max_age=60, since=997.5)
+    assert len(posts) == 3 and len(comments) == 3
+
+
+def test_exhausted_window_serves_any_limit():
+    store = ActivityStore(":memory:")
+    store.upsert_items("bob", items("comment", 3))
+    store.record_sync("bob", EXHAUSTED, EXHAUSTED)
+    posts, comments = store.read_window("bob", 10, 1000, max_age=60)
+    assert posts == [] and len(comments) == 3
+
+
+def test_upsert_keeps_known_link_titles():
+    store = ActivityStore(":memory:")
+    store.upsert_items("bob", [{"fullname": "t1_a", "kind": "comment", "created_utc": 1.0, "body": "old",
+                                "link_id": "t3_p", "link_title": "Parent"}])
+    store.upsert_items("bob", [{"fullname": "t1_a", "kind": "comment", "created_utc": 1.0, "body": "edited",
+                                "link_id": "t3_p"}])
+    store.record_sync("bob", 0, 1)
+    _, comments = store.read_window("bob", 0, 1, max_age=60)
+    assert comments[0]["body"] == "edited" and comments[0]["link_title"] == "Parent"
+    assert len(store) == 1
+
+
+def test_prune_applies_retention_and_per_author_cap():
+    store = ActivityStore(":memory:")
+    store.upsert_items("alice", items("comment", 30))
+    store.upsert_items("bob", items("comment", 5, prefix="b"))
+    store.record_sync("alice", 0, EXHAUSTED)
+
+    assert store.prune(retention_seconds=3600, max_items_per_author=10) == 20
+    assert len(store) == 15
+    # alice's window shrank with her items
+    assert store.read_window("alice", 0, 11, max_age=60) is None
+    _, comments = store.read_window("alice", 0, 10, max_age=60)
+    assert comments[-1]["body"] == "x 9"
+
+    assert store.prune(retention_seconds=-1, max_items_per_author=10) == 15
+    assert len(store) == 0
+    store.compact()
+
+
+def test_prune_deletes_in_bounded_batches():
+    store = ActivityStore(":memory:", batch_size=4)
+    store.upsert_items("alice", items("comment", 30))
+    store.upsert_items("alice", items("post", 6, prefix="p"))
+    store.upsert_items("bob", items("comment", 5, prefix="b"))
+    store.record_sync("alice", 6, 30)
+    statements = []
+    store.connection.set_trace_callback(statements.append)
+
+    assert store.prune(retention_seconds=3600, max_items_per_author=5) == 26
+    assert len(store) == 15
+    _, comments = store.read_window("alice", 0, 5, max_age=60)
+    assert [comment["body"] for comment in comments] == [f"x {i}" for i in range(5)]
+    # Retention, authors, 25 of alice's comments four at a time, her 6th post, windows
+    assert statements.count("BEGIN IMMEDIATE") == 1 + 1 + 7 + 1 + 1
+    assert all("ROW_NUMBER" not in statement for statement in statements)
+
+
+def test_concurrent_writers_in_separate_processes():
+    script = (
+        "import sys; sys.path.insert(0, sys.argv[1]); from activity_store import ActivityStore; "
+        "store = ActivityStore(sys.argv[2], batch_size=50); "
+        "[store.upsert_items(sys.argv[3], [{'fullname': f'{sys.argv[3]}_{i}_{j}', 'kind': 'comment', "
+        "'created_utc': float(j)} for j in range(50)]) for i in range(20)]"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "activity.db")
+        ActivityStore(path)
+        workers = [subprocess.Popen([sys.executable, "-c", script, ROOT, path, f"w{n}"]) for n in range(4)]
+        assert all(worker.wait(timeout=60) == 0 for worker in workers)
+        assert len(ActivityStore(path)) == 4 * 20 * 50
+
+
+def setup_reddit(accounts):
+    reset_app_state()
+    main.ACTIVITY_STORE_MAX_AGE = 600
+    fake = FakeReddit(accounts)
+    main.create_reddit_client = fake.client
+    return fake
+
+
+def fetch(username, **parameters):
+    return asyncio.run(main.get_reddit_user_data(username, parameters))
+
+
+def test_repeat_fetch_is_served_from_the_store():
+    fake = setup_reddit({"alice": make_account(5, 40)})
+    try:
+        first = fetch("alice", post_limit=5, comment_limit=40)
+        assert fetch("alice", post_limit=5, comment_limit=40) == first
+        assert fetch("alice", post_limit=2, comment_limit=10).count("Comment:") == 10
+        assert fake.calls["load"] == 1
+        # A bigger window than was fetched goes back to Reddit
+        fetch("alice", post_limit=5, comment_limit=41)
+        assert fake.calls["load"] == 2
+        assert main.metrics["activity_store_hits"] == 2
+    finally:
+        reset_app_state()
+
+
+def test_context_is_served_once_titles_are_stored():
+    fake = setup_reddit({"alice": make_account(1, 10, threads=3)})
+    try:
+        fetch("alice", comment_limit=10)
+        with_context = fetch("alice", comment_limit=10, include_context=True)
+        assert fake.calls["load"] == 2
+        assert fetch("alice", comment_limit=10, include_context=True) == with_context
+        assert fake.calls["load"] == 2 and fake.calls["info"] == 1
+    finally:
+        reset_app_state()
+
+
+def test_store_answers_while_reddit_breaker_is_open():
+    fake = setup_reddit({"alice": make_account(2, 5)})
+    try:
+        fetch("alice")
+        main.reddit_breaker._open()
+        fake.failing = 503
+        assert "item comment 4" in fetch("alice")
+    finally:
+        reset_app_state()
+
+
+if __name__ == "__main__":
+    tests = [
+        test_window_is_served_newest_first,
+        test_exhausted_window_serves_any_limit,
+        test_upsert_keeps_known_link_titles,
+        test_prune_applies_retention_and_per_author_cap,
+        test_prune_deletes_in_bounded_batches,
+        test_concurrent_writers_in_separate_processes,
+        test_repeat_fetch_is_served_from_the_store,
+        test_context_is_served_once_titles_are_stored,
+        test_store_answers_while_reddit_breaker_is_open,
+    ]
+    for test in tests:
+        test()
+        print(f"{test.__name__} passed")
+    print(f"All {len(tests)} activity store tests passed!")
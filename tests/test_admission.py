@@ -0,0 +1,192 @@
+"""
+Tests for cost estimation and admission control on /analyze.
+Run with: python tests/test_admission.py
+"""
+
+import asyncio
+
+from fakes import FakeReddit, make_account, reset_app_state
+
+import main
+from admission import AdmissionController, estimate_request_cost
+from fastapi import HTTPException
+
+
+def make_controller(**overrides):
+    settings = dict(max_request_cost=10_000, max_inflight_cost=10_000, max_queue=2,
+                    queue_timeout=0.2, retry_after=7)
+    settings.update(overrides)
+    return AdmissionController(**settings)
+
+
+def test_estimate_scales_with_limits():
+    small = estimate_request_cost({"post_limit": 5, "comment_limit": 10})
+    large = estimate_request_cost({"post_limit": 100, "comment_limit": 1000})
+    assert small["pages"] == 3
+    assert large["pages"] == 12
+    assert large["items"] == 1100
+    assert large["cost"] > 10 * small["cost"]
+    with_context = estimate_request_cost({"comment_limit": 1000, "include_context": True})
+    assert with_context["pages"] > estimate_request_cost({"comment_limit": 1000})["pages"]
+
+
+def test_malformed_limits_are_rejected():
+    for parameters in ({"comment_limit": "lots"}, {"post_limit": -1}, {"post_limit": 5.5}):
+        try:
+            estimate_request_cost(parameters)
+        except HTTPException as e:
+            assert e.status_code == 422
+        else:
+            raise AssertionError(f"{parameters} should be rejected")
+
+
+def test_numeric_strings_reach_reddit_as_ints():
+    reset_app_state()
+    fake = FakeReddit({"active": make_account(3, 5)})
+    main.create_reddit_client = fake.client
+    prompts = []
+    main.summarize_with_llm = lambda user_data, username, *args, **kwargs: prompts.append(user_data) or "summary"
+
+    request = main.AnalyzeUserRequest(user_id="caller", user_to_search="active",
+                                      parameters={"post_limit": "2", "comment_limit": 5.0})
+    assert asyncio.run(main.analyze_user(request)).success
+    assert prompts[0].count("Post Title:") == 2
+    try:
+        asyncio.run(main.analyze_user(main.AnalyzeUserRequest(user_id="caller", user_to_search="active",
+                                                              parameters={"post_limit": 2.5})))
+        assert False, "expected a 422"
+    except HTTPException as e:
+        assert e.status_code == 422
+
+
+def test_request_over_ceiling_is_rejected():
+    controller = make_controller(max_request_cost=100)
+
+    async def scenario():
+        await controller.acquire(101)
+
+    try:
+        asyncio.run(scenario())
+    except HTTPException as e:
+        assert e.status_code == 422
+    else:
+        raise AssertionError("request over the per-request ceiling should be rejected")
+    assert controller.stats["rejected_too_large"] == 1
+
+
+def test_full_queue_sheds_with_429():
+    controller = make_controller(max_queue=1)
+
+    async def scenario():
+        await controller.acquire(8_000)
+        queued = asyncio.create_task(controller.acquire(8_000))
+        await asyncio.sleep(0)
+        try:
+            await controller.acquire(8_000)
+        finally:
+            controller.release(8_000)
+            await queued
+
+    try:
+        asyncio.run(scenario())
+    except HTTPException as e:
+        assert e.status_code == 429
+        assert e.headers["Retry-After"] == "7"
+    else:
+        raise AssertionError("third request should be shed")
+    assert controller.stats["shed_queue_full"] == 1
+
+
+def test_queue_timeout_sheds_with_503():
+    controller = make_controller(queue_timeout=0.05)
+
+    async def scenario():
+        await controller.acquire(8_000)
+        await controller.acquire(8_000)
+
+    try:
+        asyncio.run(scenario())
+    except HTTPException as e:
+        assert e.status_code == 503
+        assert "Retry-After" in e.headers
+    else:
+        raise AssertionError("queued request should time out")
+    assert controller.stats["shed_timeout"] == 1
+    assert not controller.waiters
+
+
+def test_small_requests_bypass_queued_large_ones():
+    controller = make_controller()
+    order = []
+
+    async def worker(name, cost, hold):
+        async with controller.admit(cost):
+            order.append(name)
+            await asyncio.sleep(hold)
+
+    async def scenario():
+        first = asyncio.create_task(worker("large-1", 8_000, 0.05))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(worker("large-2", 8_000, 0))
+        await asyncio.sleep(0)
+        third = asyncio.create_task(worker("small", 1_000, 0))
+        await asyncio.gather(first, second, third)
+
+    asyncio.run(scenario())
+    assert order == ["large-1", "small", "large-2"]
+    assert controller.inflight_cost == 0
+
+
+def test_analyze_releases_capacity_on_errors():
+    reset_app_state()
+    fake = FakeReddit({"active": make_account()})
+    main.create_reddit_client = fake.client
+    main.summarize_with_llm = lambda user_data, username, *args, **kwargs: f"summary of {username}"
+
+    request = main.AnalyzeUserRequest(user_id="caller", user_to_search="active", parameters={})
+    assert asyncio.run(main.analyze_user(request)).success
+    missing = main.AnalyzeUserRequest(user_id="caller", user_to_search="ghost", parameters={})
+    try:
+        asyncio.run(main.analyze_user(missing))
+    except HTTPException:
+        pass
+    assert main.admission.inflight_cost == 0
+    assert main.admission.inflight_requests == 0
+
+
+def test_oversized_request_is_rejected_before_quota_and_queue():
+    reset_app_state()
+    main.caller_quotas = main.CallerQuotas(rate=1, burst=1_000_000)
+    main.create_reddit_client = FakeReddit({"active": make_account()}).client
+    request = main.AnalyzeUserRequest(user_id="caller", user_to_search="active",
+                                      parameters={"post_limit": 100, "comment_limit": 100})
+    main.admission.max_request_cost = estimate_request_cost(request.parameters)["cost"] - 1
+    rejected = main.admission.stats["rejected_too_large"]
+    try:
+        asyncio.run(main.analyze_user(request))
+        assert False, "expected a 422"
+    except HTTPException as e:
+        assert e.status_code == 422
+    finally:
+        main.admission.max_request_cost = main.ADMISSION_MAX_REQUEST_COST
+    # Nothing was charged to the caller
+    assert len(main.caller_quotas.buckets) == 0
+    assert main.admission.stats["rejected_too_large"] == rejected + 1
+
+
+if __name__ == "__main__":
+    tests = [
+        test_estimate_scales_with_limits,
+        test_malformed_limits_are_rejected,
+        test_numeric_strings_reach_reddit_as_ints,
+        test_request_over_ceiling_is_rejected,
+        test_full_queue_sheds_with_429,
+        test_queue_timeout_sheds_with_503,
+        test_small_requests_bypass_queued_large_ones,
+        test_analyze_releases_capacity_on_errors,
+        test_oversized_request_is_rejected_before_quota_and_queue,
+    ]
+    for test in tests:
+        test()
+        print(f"{test.__name__} passed")
+    print(f"All {len(tests)} admission tests passed!")
@@ -112,12 +112,12 @@ def test_analyze_invalid_user():
         print(f"Status Code: {response.status_code}")
         print(f"Response: {response.json()}")
         
-        # Should return 400 error for invalid user
-        if response.status_code == 400:
+        # Should return 404 error for invalid user
+        if response.status_code == 404:
             print("✅ Invalid user test passed (correctly returned error)!\n")
             return True
         else:
-            print("❌ Invalid user test failed (should have returned 400)!\n")
+            print("❌ Invalid user test failed (should have returned 404)!\n")
             return False
             
     except Exception as e:
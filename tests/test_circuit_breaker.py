@@ -0,0 +1,190 @@
+"""
+Tests for the Reddit and OpenAI circuit breakers. OpenAI is a local stub server and
+Reddit a fake client; both are flipped between healthy and failing mid-test.
+Run with: python tests/test_circuit_breaker.py
+"""
+
+import asyncio
+import time
+
+from fakes import FakeReddit, StubOpenAIServer, make_account, reset_app_state
+
+import main
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from fastapi import HTTPException
+
+
+def make_breaker(name="test", **overrides):
+    settings = dict(failure_rate_threshold=0.5, slow_call_duration=0.2, slow_call_rate_threshold=0.8,
+                    window_size=10, min_calls=4, open_duration=0.2)
+    settings.update(overrides)
+    return CircuitBreaker(name, **settings)
+
+
+def setup_pipeline(stub):
+    reset_app_state()
+    fake = FakeReddit({"active": make_account(), "other": make_account()})
+    main.create_reddit_client = fake.client
+    main.OPENAI_BASE_URL = stub.base_url
+    main.reddit_breaker = make_breaker("reddit")
+    main.openai_breaker = make_breaker("openai")
+    return fake
+
+
+def analyze(username):
+    request = main.AnalyzeUserRequest(user_id="breaker_caller", user_to_search=username, parameters={})
+    return asyncio.run(main.analyze_user(request))
+
+
+def expect_status(username, status_code):
+    try:
+        analyze(username)
+    except HTTPException as e:
+        assert e.status_code == status_code, (e.status_code, e.detail)
+        return e
+    raise AssertionError(f"expected {status_code}")
+
+
+def test_breaker_opens_on_error_rate_and_recovers():
+    breaker = make_breaker()
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_success(0.01)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == OPEN
+    try:
+        breaker.before_call()
+    except CircuitOpenError as e:
+        assert 0 < e.retry_after <= 0.2
+    else:
+        raise AssertionError("open breaker should reject calls")
+
+    time.sleep(0.25)
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    # Only one probe at a time
+    try:
+        breaker.before_call()
+    except CircuitOpenError:
+        pass
+    else:
+        raise AssertionError("second probe should be rejected")
+    breaker.record_success(0.01)
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_reopens():
+    breaker = make_breaker(min_calls=1)
+    breaker.before_call()
+    breaker.record_failure()
+    time.sleep(0.25)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.snapshot()["opened"] == 2
+
+
+def test_slow_calls_open_breaker():
+    breaker = make_breaker()
+    for _ in range(4):
+        breaker.before_call()
+        breaker.record_success(0.5)
+    assert breaker.state == OPEN
+
+
+def test_openai_outage_serves_stale_summary():
+    with StubOpenAIServer() as stub:
+        setup_pipeline(stub)
+        fresh = analyze("active")
+        assert not fresh.stale
+
+        stub.failing = 500
+        # One success and three failures in a window of min_calls=4
+        for _ in range(3):
+            expect_status("active", 500)
+        assert main.openai_breaker.state == OPEN
+
+        calls_before = len(stub.requests)
+        started = time.monotonic()
+        stale = analyze("active")
+        assert stale.stale and stale.summary == fresh.summary
+        assert time.monotonic() - started < 0.1
+        assert len(stub.requests) == calls_before
+
+        # No summary to fall back on: fail fast with Retry-After
+        error = expect_status("other", 503)
+        assert "Retry-After" in error.headers
+
+        stub.failing = None
+        time.sleep(0.25)
+        assert not analyze("active").stale
+        assert main.openai_breaker.state == CLOSED
+
+
+def test_slow_openai_trips_latency_threshold():
+    with StubOpenAIServer(latency=0.25) as stub:
+        setup_pipeline(stub)
+        for _ in range(4):
+            analyze("active")
+        assert main.openai_breaker.state == OPEN
+        assert analyze("active").stale
+
+
+def test_reddit_outage_opens_breaker_but_404s_do_not():
+    with StubOpenAIServer() as stub:
+        fake = setup_pipeline(stub)
+        for _ in range(4):
+            main.negative_cache.clear()
+            expect_status("ghost", 404)
+        assert main.reddit_breaker.state == CLOSED
+
+        analyze("active")
+        fake.failing = 503
+        # Five failures against five healthy answers in a window of 10
+        for _ in range(5):
+            expect_status("other", 400)
+        assert main.reddit_breaker.state == OPEN
+
+        loads_before = fake.calls["load"]
+        assert analyze("active").stale
+        expect_status("other", 503)
+        assert fake.calls["load"] == loads_before
+
+        snapshot = asyncio.run(main.get_metrics())["circuit_breakers"]
+        assert snapshot["reddit"]["state"] == OPEN
+        assert snapshot["openai"]["state"] == CLOSED
+
+
+def test_local_errors_do_not_open_the_reddit_breaker():
+    with StubOpenAIServer() as stub:
+        fake = setup_pipeline(stub)
+        # A listing our own code cannot slice fails with a TypeError, which says nothing about Reddit
+        fake.accounts["broken"] = {"submissions": None}
+        for _ in range(6):
+            expect_status("broken", 500)
+        assert main.reddit_breaker.state == CLOSED
+        assert main.reddit_breaker.snapshot()["window_calls"] == 0
+
+        fake.failing = 429
+        for _ in range(4):
+            expect_status("other", 400)
+        assert main.reddit_breaker.state == OPEN
+        assert main.reddit_health(asyncio.TimeoutError()) is False
+
+
+if __name__ == "__main__":
+    tests = [
+        test_breaker_opens_on_error_rate_and_recovers,
+        test_failed_probe_reopens,
+        test_slow_calls_open_breaker,
+        test_openai_outage_serves_stale_summary,
+        test_slow_openai_trips_latency_threshold,
+        test_reddit_outage_opens_breaker_but_404s_do_not,
+        test_local_errors_do_not_open_the_reddit_breaker,
+    ]
+    for test in tests:
+        test()
+        print(f"{test.__name__} passed")
+    print(f"All {len(tests)} circuit breaker tests passed!")
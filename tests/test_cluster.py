@@ -0,0 +1,126 @@
+"""
+Tests for cluster mode: the consistent-hash ring, and several local instances on
+different ports forwarding /analyze to the owner of each username.
+Run with: python tests/test_cluster.py
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from cluster import HashRing  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def run_nodes(count, cluster=True, extra_nodes=()):
+    """Starts `count` instances; with cluster=True they share one ring (plus extra_nodes)."""
+    ports = [free_port() for _ in range(count)]
+    urls = [f"http://127.0.0.1:{port}" for port in ports]
+    processes = []
+    for port, url in zip(ports, urls):
+        env = dict(os.environ)
+        if cluster:
+            env.update(CLUSTER_NODES=",".join(urls + list(extra_nodes)), CLUSTER_SELF=url)
+        processes.append(subprocess.Popen([sys.executable, os.path.join(HERE, "cluster_node.py"), str(port)],
+                                          env=env))
+    try:
+        for url in urls:
+            for _ in range(300):
+                try:
+                    requests.get(url, timeout=1)
+                    break
+                except requests.ConnectionError:
+                    time.sleep(0.05)
+        yield urls
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=10)
+
+
+def analyze(url, username):
+    response = requests.post(f"{url}/analyze", json={"user_id": "tester", "user_to_search": username, "parameters": {}},
+                             timeout=10)
+    response.raise_for_status()
+    return response.json()
+
+
+def round_robin_hit_rate(urls, usernames):
+    results = [analyze(urls[index % len(urls)], username) for index, username in enumerate(usernames)]
+    return sum(result["cached"] for result in results) / len(results), results
+
+
+def test_ring_spreads_keys_evenly():
+    nodes = [f"http://node{i}" for i in range(4)]
+    ring = HashRing(nodes)
+    counts = Counter(ring.owner(f"user{i}") for i in range(20000))
+    assert set(counts) == set(nodes)
+    assert max(counts.values()) < 1.3 * 20000 / 4
+
+
+def test_adding_a_node_moves_few_keys():
+    before = HashRing([f"http://node{i}" for i in range(4)])
+    after = HashRing([f"http://node{i}" for i in range(5)])
+    moved = sum(before.owner(f"user{i}") != after.owner(f"user{i}") for i in range(20000))
+    # Ideally 1/5 of the keys move, all of them to the new node
+    assert moved < 0.3 * 20000
+    assert all(after.owner(f"user{i}") == "http://node4"
+               for i in range(2000) if before.owner(f"user{i}") != after.owner(f"user{i}"))
+
+
+# Each of 40 users requested 6 times, spread round-robin over the nodes
+WORKLOAD = [f"user{i}" for _ in range(6) for i in range(40)]
+
+
+def test_cluster_routing_beats_round_robin_hit_rate():
+    with run_nodes(3, cluster=False) as urls:
+        plain_rate, _ = round_robin_hit_rate(urls, WORKLOAD)
+    with run_nodes(3) as urls:
+        cluster_rate, results = round_robin_hit_rate(urls, WORKLOAD)
+        forwarded = sum(requests.get(f"{url}/metrics").json()["cluster_forwarded"] for url in urls)
+
+    # With routing every user is summarized exactly once
+    assert cluster_rate == 1 - 40 / len(WORKLOAD)
+    assert plain_rate < cluster_rate
+    assert forwarded > 0
+    assert all(result["summary"] == f"summary of u/{result['analyzed_user']}" for result in results)
+
+
+def test_unreachable_owner_falls_back_to_local():
+    dead = f"http://127.0.0.1:{free_port()}"
+    with run_nodes(2, extra_nodes=[dead]) as urls:
+        ring = HashRing(urls + [dead])
+        orphans = [f"user{i}" for i in range(100) if ring.owner(f"user{i}") == dead][:5]
+        assert orphans
+        for username in orphans:
+            assert analyze(urls[0], username)["summary"] == f"summary of u/{username}"
+        stats = requests.get(f"{urls[0]}/metrics").json()
+        assert stats["cluster_fallbacks"] == len(orphans)
+
+
+if __name__ == "__main__":
+    tests = [
+        test_ring_spreads_keys_evenly,
+        test_adding_a_node_moves_few_keys,
+        test_cluster_routing_beats_round_robin_hit_rate,
+        test_unreachable_owner_falls_back_to_local,
+    ]
+    for test in tests:
+        test()
+        print(f"{test.__name__} passed")
+    print(f"All {len(tests)} cluster tests passed!")
@@ -0,0 +1,106 @@
+"""
+Tests for response compression, the orjson response class and the `fields` selector.
+Run with: python tests/test_compression.py
+"""
+
+import gzip
+
+from fastapi.testclient import TestClient
+
+from fakes import FakeReddit, make_account, reset_app_state
+
+import compression
+import main
+
+BODY = {"user_id": "tester", "user_to_search": "active", "parameters": {}}
+
+
+def setup(summary_length):
+    reset_app_state()
+    main.create_reddit_client = FakeReddit({"active": make_account(2, 5)}).client
+    main.summarize_with_llm = lambda *args, **kwargs: "Main Interests: " + "x" * summary_length
+    return TestClient(main.app)
+
+
+def test_choose_encoding_follows_q_values():
+    assert compression.choose_encoding("gzip") == "gzip"
+    assert compression.choose_encoding("gzip;q=0, identity") is None
+    assert compression.choose_encoding("") is None
+    assert compression.choose_encoding("*") == compression.supported_encodings()[0]
+    assert compression.choose_encoding("br;q=0.5, gzip;q=0.8") == "gzip"
+    expected = "br" if compression.brotli is not None else "gzip"
+    assert compression.choose_encoding("gzip, deflate, br") == expected
+
+
+def test_large_response_is_gzipped():
+    client = setup(5000)
+    response = client.post("/analyze", json=BODY, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert int(response.headers["content-length"]) < 1000
+    assert response.json()["summary"].endswith("x" * 5000)
+
+
+def test_small_or_unaccepted_responses_are_not_compressed():
+    client = setup(10)
+    response = client.post("/analyze", json=BODY, headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert "Accept-Encoding" in response.headers["vary"]
+
+    client = setup(5000)
+    response = client.post("/analyze", json=BODY, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+
+
+def test_summary_validators_match_across_encodings():
+    client = setup(5000)
+    compressed = client.get("/users/active/summary", headers={"Accept-Encoding": "gzip"})
+    identity = client.get("/users/active/summary", headers={"Accept-Encoding": "identity"})
+    assert compressed.headers["content-encoding"] == "gzip" and "content-encoding" not in identity.headers
+    # One representation in two encodings: a weak validator, and caches keyed on Accept-Encoding
+    assert compressed.headers["etag"] == identity.headers["etag"] and compressed.headers["etag"].startswith("W/")
+    assert compressed.headers["vary"] == identity.headers["vary"] == "Accept-Encoding"
+    revalidated = client.get("/users/active/summary", headers={"Accept-Encoding": "identity",
+                                                               "If-None-Match": compressed.headers["etag"]})
+    assert revalidated.status_code == 304
+
+
+def test_compress_round_trips():
+    body = b'{"summary": "' + b"abc" * 1000 + b'"}'
+    assert gzip.decompress(compression.compress(body, "gzip")) == body
+    if compression.brotli is not None:
+        assert compression.brotli.decompress(compression.compress(body, "br")) == body
+
+
+def test_fields_selector_trims_the_response():
+    client = setup(100)
+    response = client.post("/analyze?fields=summary,analyzed_user", json=BODY)
+    assert response.status_code == 200
+    assert set(response.json()) == {"summary", "analyzed_user"}
+
+    response = client.post("/analyze?fields=summary,password", json=BODY)
+    assert response.status_code == 422
+    assert "password" in response.json()["detail"]
+
+
+def test_default_response_class_is_orjson():
+    route = next(route for route in main.app.routes if getattr(route, "path", None) == "/analyze")
+    assert route.response_class is main.DefaultResponse is main.ORJSONResponse
+    client = setup(100)
+    assert client.get("/").json()["status"] == "healthy"
+
+
+if __name__ == "__main__":
+    tests = [
+        test_choose_encoding_follows_q_values,
+        test_large_response_is_gzipped,
+        test_small_or_unaccepted_responses_are_not_compressed,
+        test_compress_round_trips,
+        test_fields_selector_trims_the_response,
+        test_default_response_class_is_orjson,
+    ]
+    for test in tests:
+        test()
+        print(f"{test.__name__} passed")
+    print(f"All {len(tests)} compression tests passed!")
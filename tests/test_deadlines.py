@@ -0,0 +1,156 @@
+"""
+Tests for request deadlines, best-effort partial fetches and cancellation when the
+client disconnects. Reddit is a fake with slow pages; one test runs a real uvicorn
+server and drops the connection mid-request.
+Run with: python tests/test_deadlines.py
+"""
+
+import asyncio
+import json
+import socket
+import threading
+import time
+
+from fakes import REAL_SUMMARIZE_WITH_LLM, FakeReddit, make_account, reset_app_state
+
+import main
+import uvicorn
+from fastapi import HTTPException
+
+PAGE_LATENCY = 0.2
+
+class DisconnectingRequest:
+    """Stands in for starlette's Request: reports a disconnect after `after` seconds."""
+
+    def __init__(self, after, headers=None):
+        self.disconnect_at = time.monotonic() + after
+        self.headers = headers or {}
+
+    async def is_disconnected(self):
+        return time.monotonic() >= self.disconnect_at
+
+
+def setup_slow_reddit():
+    reset_app_state()
+    # 8 pages of comments at PAGE_LATENCY each: about 1.6 seconds for a full fetch
+    fake = FakeReddit({"active": make_account(posts=0, comments=800)}, latency=PAGE_LATENCY)
+    main.create_reddit_client = fake.client
+    main.summarize_with_llm = lambda user_data, username, *args, **kwargs: f"summary of {user_data.count('Comment')} comments"
+    return fake
+
+
+def analyze(parameters, raw_request=None):
+    request = main.AnalyzeUserRequest(user_id="deadline_caller", user_to_search="active", parameters=parameters)
+    return asyncio.run(main.analyze_user(request, raw_request))
+
+
+def assert_slots_released():
+    assert main.scheduler.active == 0
+    assert main.admission.inflight_requests == 0
+
+
+def test_fetch_budget_exceeded_returns_504():
+    fake = setup_slow_reddit()
+    started = time.monotonic()
+    try:
+        analyze({"comment_limit": 800, "timeout_seconds": 0.6})
+    except HTTPException as e:
+        assert e.status_code == 504
+    else:
+        raise AssertionError("slow fetch should exceed the deadline")
+    assert time.monotonic() - started < 1.0
+    assert fake.calls["close"] == 1
+    assert_slots_released()
+
+
+def test_best_effort_summarizes_partial_fetch():
+    setup_slow_reddit()
+    response = analyze({"comment_limit": 800, "timeout_seconds": 1.0, "best_effort": True})
+    assert response.success and response.partial
+    fetched = int(response.summary.split()[2])
+    assert 0 < fetched < 800
+
+
+def test_header_overrides_parameter():
+    setup_slow_reddit()
+    raw_request = DisconnectingRequest(after=60, headers={"x-request-timeout": "0.4"})
+    started = time.monotonic()
+    try:
+        analyze({"comment_limit": 800, "timeout_seconds": 30}, raw_request)
+    except HTTPException as e:
+        assert e.status_code == 504
+    else:
+        raise AssertionError("header timeout should apply")
+    assert time.monotonic() - started < 1.0
+
+
+def test_disconnect_cancels_reddit_paging():
+    fake = setup_slow_reddit()
+    main.metrics["client_disconnects"] = 0
+    started = time.monotonic()
+    try:
+        analyze({"comment_limit": 800}, DisconnectingRequest(after=0.3))
+    except HTTPException as e:
+        assert e.status_code == 499
+    else:
+        raise AssertionError("disconnect should cancel the request")
+    assert time.monotonic() - started < 1.0
+    assert main.metrics["client_disconnects"] == 1
+    assert fake.calls["close"] == 1
+    assert_slots_released()
+
+
+def test_llm_call_respects_deadline():
+    try:
+        REAL_SUMMARIZE_WITH_LLM("data", "someone", {}, deadline=time.monotonic() - 1)
+    except HTTPException as e:
+        assert e.status_code == 504
+    else:
+        raise AssertionError("expired deadline should fail before calling OpenAI")
+
+
+def test_http_client_disconnect_frees_slot():
+    fake = setup_slow_reddit()
+    main.metrics["client_disconnects"] = 0
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    try:
+        body = json.dumps({"user_id": "browser", "user_to_search": "active", "parameters": {"comment_limit": 800}})
+        client = socket.create_connection(("127.0.0.1", port))
+        client.sendall((f"POST /analyze HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                        f"Content-Length: {len(body)}\r\n\r\n{body}").encode())
+        time.sleep(0.3)
+        client.close()
+
+        for _ in range(100):
+            if main.metrics["client_disconnects"] == 1:
+                break
+            time.sleep(0.02)
+        assert main.metrics["client_disconnects"] == 1
+        assert main.scheduler.active == 0
+        assert fake.calls["comments.new"] == 1 and fake.calls["close"] == 1
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+if __name__ == "__main__":
+    tests = [
+        test_fetch_budget_exceeded_returns_504,
+        test_best_effort_summarizes_partial_fetch,
+        test_header_overrides_parameter,
+        test_disconnect_cancels_reddit_paging,
+        test_llm_call_respects_deadline,
+        test_http_client_disconnect_frees_slot,
+    ]
+    for test in tests:
+        test()
+        print(f"{test.__name__} passed")
+    print(f"All {len(tests)} deadline tests passed!")
@@ -0,0 +1,122 @@
+"""
+Tests for the /debug/profile and /debug/memory endpoints.
+Run with: python tests/test_debug_endpoints.py
+"""
+
+import threading
+import time
+import tracemalloc
+
+from fastapi.testclient import TestClient
+
+from fakes import FakeReddit, make_account, reset_app_state
+
+import main
+
+AUTH = {"Authorization": "Bearer let-me-in"}
+BODY = {"user_id": "caller", "user_to_search": "alice", "parameters": {"post_limit": 2, "comment_limit": 5}}
+
+
+def setup():
+    reset_app_state()
+    main.DEBUG_TOKEN = "let-me-in"
+    main.create_reddit_client = FakeReddit({"alice": make_account(2, 5)}).client
+
+
+def slow_summary(*args, **kwargs):
+    started = time.perf_counter()
+    while time.perf_counter() - started < 0.1:
+        pass
+    return "a summary"
+
+
+def test_debug_endpoints_are_hidden_without_a_token():
+    setup()
+    client = TestClient(main.app)
+    assert client.get("/debug/profile?seconds=0.1", headers={"Authorization": "Bearer guess"}).status_code == 403
+    assert client.get("/debug/memory?seconds=0.1").status_code == 403
+    main.DEBUG_TOKEN = ""
+    assert client.get("/debug/profile?seconds=0.1", headers=AUTH).status_code == 404
+    assert client.get("/debug/memory?seconds=0.1", headers=AUTH).status_code == 404
+
+
+def test_profile_for_a_number_of_seconds():
+    setup()
+    stop = threading.Event()
+
+    def busy_worker():
+        while not stop.is_set():
+            sum(range(1000))
+
+    worker = threading.Thread(target=busy_worker, name="busy worker")
+    worker.start()
+    try:
+        client = TestClient(main.app)
+        response = client.get("/debug/profile?seconds=0.3", headers=AUTH)
+        top = client.get("/debug/profile?seconds=0.3&format=json", headers=AUTH).json()
+    finally:
+        stop.set()
+        worker.join()
+
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/plain")
+    assert int(response.headers["X-Profile-Samples"]) > 10
+    lines = response.text.splitlines()
+    busy = [line for line in lines if line.startswith("busy_worker;")]
+    assert busy and "busy_worker (test_debug_endpoints.py:" in busy[0]
+    # Collapsed format: frames joined by ';' then the sample count
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) > 0 and ";" in stack
+    assert any(entry["function"].startswith("busy_worker ") for entry in top["total"])
+    assert top["samples"] > 10 and 0.3 <= top["duration_seconds"] < 1
+
+
+def test_profile_the_next_analyze_requests():
+    setup()
+    main.summarize_with_llm = slow_summary
+    with TestClient(main.app) as client:
+        result = {}
+        profile = threading.Thread(target=lambda: result.update(
+            response=client.get("/debug/profile?requests=2", headers=AUTH)))
+        profile.start()
+        time.sleep(0.2)
+        assert client.get("/debug/profile?seconds=1", headers=AUTH).status_code == 409
+        for _ in range(2):
+            assert client.post("/analyze", json=BODY).status_code == 200
+        profile.join(timeout=10)
+
+    response = result["response"]
+    assert response.status_code == 200
+    assert float(response.headers["X-Profile-Seconds"]) < 5
+    # The completion runs in a worker thread and shows up there
+    assert any("slow_summary (test_debug_endpoints.py:" in line for line in response.text.splitlines())
+    assert main.active_profiler is None
+
+
+def test_memory_reports_what_grew():
+    setup()
+    kept = []
+
+    def allocate():
+        for _ in range(200):
+            kept.append(bytearray(10000))
+            time.sleep(0.001)
+
+    client = TestClient(main.app)
+    worker = threading.Thread(target=allocate)
+    worker.start()
+    report = client.get("/debug/memory?seconds=0.5&limit=5", headers=AUTH).json()
+    worker.join()
+
+    top = report["top"][0]
+    assert "test_debug_endpoints.py" in top["location"]
+    assert top["size_diff_bytes"] >= 100 * 10000
+    # Tracing stops again once the report is made
+    assert not tracemalloc.is_tracing()
+    assert client.get("/debug/memory?seconds=0", headers=AUTH).status_code == 422
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"PASS {name}")
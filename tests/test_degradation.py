@@ -0,0 +1,138 @@
+"""
+Tests for adaptive degradation of fetch limits and the model under load.
+Run with: python tests/test_degradation.py
+"""
+
+from fastapi.testclient import TestClient
+
+from fakes import FakeReddit, StubOpenAIServer, make_account, reset_app_state
+
+import main
+from degradation import DegradationController
+
+
+def test_no_load_changes_nothing():
+    controller = DegradationController()
+    parameters = {"post_limit": 10, "comment_limit": 100, "degrade": True}
+    assert controller.level(queued=0) == 0
+    assert controller.plan(parameters, 0.0, "gpt-4o") == (parameters, None)
+
+
+def test_only_requests_that_opt_in_are_degraded():
+    controller = DegradationController()
+    for parameters in ({"comment_limit": 100}, {"comment_limit": 100, "degrade": False}):
+        assert controller.plan(parameters, 1.0, "gpt-4o") == (parameters, None)
+    assert controller.plan({"comment_limit": 100, "degrade": True}, 1.0, "gpt-4o")[1] is not None
+
+
+def test_limits_and_model_scale_with_the_level():
+    controller = DegradationController(min_fraction=0.25, model_level=0.5, fallback_model="fast")
+    mild, applied = controller.plan({"post_limit": 10, "comment_limit": 100, "degrade": True}, 0.2, "gpt-4o")
+    assert mild == {"post_limit": 9, "comment_limit": 85, "degrade": True}
+    assert applied == {"level": 0.2, "post_limit": {"requested": 10, "applied": 9},
+                       "comment_limit": {"requested": 100, "applied": 85}}
+
+    full, applied = controller.plan({"post_limit": 10, "comment_limit": 100, "degrade": True}, 1.0, "gpt-4o")
+    assert full == {"post_limit": 3, "comment_limit": 25, "model": "fast", "degrade": True}
+    assert applied["model"] == {"requested": "gpt-4o", "applied": "fast"}
+
+
+def test_caller_bounds_are_respected():
+    controller = DegradationController(fallback_model="fast")
+    parameters = {"comment_limit": 100, "min_comment_limit": 80, "min_post_limit": 10, "degraded_model": "medium",
+                  "degrade": True}
+    effective, applied = controller.plan(parameters, 1.0, "gpt-4o")
+    assert effective["comment_limit"] == 80 and "post_limit" not in applied
+    assert effective["model"] == "medium"
+
+    assert controller.plan({"comment_limit": 100, "degrade": False}, 1.0, "gpt-4o")[1] is None
+    effective, applied = controller.plan({"comment_limit": 100, "degraded_model": "", "degrade": True}, 1.0, "gpt-4o")
+    assert "model" not in applied and effective["comment_limit"] == 25
+
+
+def test_degraded_and_partial_results_are_not_shared():
+    plain = main.result_cache_key("alice", {"comment_limit": 100})
+    assert main.result_cache_key("alice", {"comment_limit": 100, "degrade": True}) != plain
+    assert main.result_cache_key("alice", {"comment_limit": 100, "best_effort": True}) != plain
+    assert main.result_cache_key("alice", {"comment_limit": 100, "sections": ["overall_tone"]}) == plain
+
+
+def test_signals():
+    controller = DegradationController(queue_depth=20, reddit_page_target=1.0, llm_target=20, rate_headroom=0.2)
+    assert controller.signals(queued=10)["queue"] == 0.5
+
+    controller.observe_llm(30)
+    assert controller.signals(0)["llm_latency"] == 0.5
+    controller.observe_llm(10)  # smoothed, not replaced
+    assert 0 < controller.signals(0)["llm_latency"] < 0.5
+
+    controller.observe_reddit(seconds=6, pages=3)
+    assert controller.signals(0)["reddit_latency"] == 1.0
+
+    controller.observe_rate_limit(remaining=60, used=540)
+    assert abs(controller.signals(0)["rate_limit"] - 0.5) < 1e-9
+    assert controller.level(0) == 1.0
+
+
+def test_analyze_reports_the_applied_degradation():
+    with StubOpenAIServer() as stub:
+        reset_app_state()
+        main.OPENAI_BASE_URL = stub.base_url
+        fake = FakeReddit({"alice": make_account(10, 100)})
+        main.create_reddit_client = fake.client
+        client = TestClient(main.app)
+        body = {"user_id": "caller", "user_to_search": "alice",
+                "parameters": {"post_limit": 10, "comment_limit": 100, "degrade": True}}
+
+        normal = client.post("/analyze", json=body).json()
+        assert normal["degradation"] is None
+        assert stub.requests[-1]["model"] == main.DEFAULT_MODEL
+
+        # Reddit reports that 3% of the rate-limit window is left
+        fake.rate_limit = {"remaining": 18.0, "reset_timestamp": None, "used": 582}
+        client.post("/analyze", json=body)
+        degraded = client.post("/analyze", json=body).json()
+        degraded_request = stub.requests[-1]
+        # Without "degrade": true the request runs as asked, however loaded the server
+        body["parameters"]["degrade"] = False
+        full = client.post("/analyze", json=body).json()
+
+    applied = degraded["degradation"]
+    assert applied["level"] == 0.85
+    assert applied["comment_limit"]["applied"] < 50 and applied["model"]["applied"] == main.DEGRADE_FALLBACK_MODEL
+    prompt = degraded_request["messages"][1]["content"]
+    assert prompt.count("Comment: ") == applied["comment_limit"]["applied"]
+    assert degraded_request["model"] == main.DEGRADE_FALLBACK_MODEL
+    assert main.degradation.stats["degraded"] >= 1
+    assert full["degradation"] is None and stub.requests[-1]["model"] == main.DEFAULT_MODEL
+
+
+def test_degraded_runs_do_not_replace_the_stored_summary():
+    with StubOpenAIServer() as stub:
+        reset_app_state()
+        main.OPENAI_BASE_URL = stub.base_url
+        fake = FakeReddit({"alice": make_account(10, 100)})
+        main.create_reddit_client = fake.client
+        client = TestClient(main.app)
+        body = {"user_id": "caller", "user_to_search": "alice",
+                "parameters": {"post_limit": 10, "comment_limit": 100, "degrade": True}}
+
+        # The first request reports the low rate limit; only the ones after it are degraded
+        fake.rate_limit = {"remaining": 18.0, "reset_timestamp": None, "used": 582}
+        client.post("/analyze", json=body)
+        stored = main.summary_store.get("alice")
+        for mode in ("full", "update"):
+            body["parameters"]["mode"] = mode
+            degraded = client.post("/analyze", json=body).json()
+            assert degraded["degradation"] is not None and not degraded["cached"]
+
+    assert main.summary_store.get("alice") == stored
+    assert client.get("/users/alice/summary").json()["summary"] == stored["summary"]
+    assert main.metrics["summary_updates_incremental"] == 0
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"PASS {name}")
@@ -0,0 +1,79 @@
+"""
+End-to-end test of /analyze, /ws and /users/{username}/summary with the production
+defaults that the other tests turn off: the result cache, the activity store's read path
+and caller quotas, alongside coalescing, summary tiers, hedging and opt-in degradation.
+Run with: python tests/test_end_to_end.py
+"""
+
+from fastapi.testclient import TestClient
+
+from fakes import FakeReddit, StubOpenAIServer, make_account, reset_app_state
+
+import main
+
+
+def body(user, **parameters):
+    limits = {"post_limit": 2, "comment_limit": 10} if user != "alice" else {"post_limit": 3, "comment_limit": 20}
+    return {"user_id": "dashboard", "user_to_search": user, "parameters": {**limits, **parameters}}
+
+
+def test_pipeline_with_production_defaults():
+    accounts = {"alice": make_account(3, 20), "bob": make_account(2, 10), "carol": make_account(2, 10),
+                "dave": make_account(2, 10)}
+    with StubOpenAIServer(latency=0.2) as stub:
+        reset_app_state(production=True)
+        assert main.RESULT_CACHE_TTL > 0 and main.ACTIVITY_STORE_MAX_AGE > 0
+        main.OPENAI_BASE_URL = stub.base_url
+        fake = FakeReddit(accounts)
+        main.create_reddit_client = fake.client
+        primaries = main.hedge_policy.snapshot()["primaries"]
+
+        with TestClient(main.app) as client:
+            first = client.post("/analyze", json=body("alice")).json()
+            assert first["summary_mode"] == "full" and not first["cached"]
+
+            # The same request again is answered from the result cache
+            again = client.post("/analyze", json=body("alice")).json()
+            assert again["cached"] and again["summary"] == first["summary"]
+            assert len(stub.requests) == 1 and fake.calls["submissions.new"] == 1
+
+            # Another tier is a new completion over the stored activity, and is not stored
+            brief = client.post("/analyze", json=body("alice", summary_length="brief")).json()
+            assert not brief["cached"] and len(stub.requests) == 2
+            assert fake.calls["submissions.new"] == 1 and main.metrics["activity_store_hits"] == 1
+            assert stub.requests[-1]["max_tokens"] == main.SUMMARY_LENGTHS["brief"]["max_tokens"]
+            assert client.get("/users/alice/summary").json()["summary"] == first["summary"]
+
+            # Identical analyses in flight at once share one computation
+            with client.websocket_connect("/ws") as websocket:
+                for request_id in range(2):
+                    websocket.send_json({"id": request_id, "request": body("bob")})
+                results = {}
+                while len(results) < 2:
+                    message = websocket.receive_json()
+                    if message["type"] in ("result", "error"):
+                        results[message["id"]] = message
+            assert all(message["type"] == "result" for message in results.values())
+            assert sorted(message["response"]["cached"] for message in results.values()) == [False, True]
+            assert len(stub.requests) == 3
+
+            # A hedged request with the production policy is answered by its primary
+            assert client.post("/analyze", json=body("carol", hedge=True)).json()["success"]
+            assert main.hedge_policy.snapshot()["primaries"] == primaries + 1
+
+            # Reddit reports its rate limit running low: only requests that opt in are degraded
+            fake.rate_limit = {"remaining": 18.0, "reset_timestamp": None, "used": 582}
+            client.post("/analyze", json=body("dave"))
+            degraded = client.post("/analyze", json=body("bob", degrade=True)).json()
+            assert degraded["degradation"]["model"]["applied"] == main.DEGRADE_FALLBACK_MODEL
+            assert stub.requests[-1]["model"] == main.DEGRADE_FALLBACK_MODEL
+            plain = client.post("/analyze", json=body("bob")).json()
+            assert plain["degradation"] is None and plain["cached"]
+            assert plain["summary"] == results[0]["response"]["summary"]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"PASS {name}")
@@ -0,0 +1,159 @@
+"""
+Tests for per-caller quotas, weighted fair scheduling and per-caller metrics.
+Run with: python tests/test_fairness.py
+"""
+
+import asyncio
+
+from fakes import FakeReddit, make_account, reset_app_state
+
+import main
+from fairness import CallerMetrics, CallerQuotas, FairScheduler
+from fastapi import HTTPException
+
+
+def make_scheduler(**overrides):
+    settings = dict(max_concurrency=1, per_caller_concurrency=1, max_queue_per_caller=10,
+                    queue_timeout=1.0, retry_after=3)
+    settings.update(overrides)
+    return FairScheduler(**settings)
+
+
+def test_quota_rejects_with_retry_after():
+    quotas = CallerQuotas(rate=10, burst=100)
+    quotas.take("alice", 60)
+    try:
+        quotas.take("alice", 60)
+    except HTTPException as e:
+        assert e.status_code == 429
+        assert int(e.headers["Retry-After"]) >= 1
+    else:
+        raise AssertionError("second request should exceed the quota")
+    # Other callers have their own bucket
+    quotas.take("bob", 60)
+
+
+def test_quota_allows_requests_larger_than_burst_when_full():
+    quotas = CallerQuotas(rate=10, burst=100)
+    quotas.take("alice", 1000)
+
+
+def test_light_caller_overtakes_heavy_backlog():
+    scheduler = make_scheduler()
+    order = []
+
+    async def job(caller, name):
+        async with scheduler.slot(caller, 1):
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        tasks = [asyncio.create_task(job("heavy", f"heavy-{i}")) for i in range(5)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(job("light", "light-0")))
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert order.index("light-0") <= 2, order
+
+
+def test_weights_share_slots_proportionally():
+    scheduler = make_scheduler(weights={"gold": 3})
+    order = []
+
+    async def job(caller):
+        async with scheduler.slot(caller, 1):
+            order.append(caller)
+            await asyncio.sleep(0.001)
+
+    async def scenario():
+        tasks = [asyncio.create_task(job(caller)) for caller in ["gold"] * 9 + ["basic"] * 9]
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    first_eight = order[:8]
+    assert first_eight.count("gold") >= 5, order
+
+
+def test_per_caller_concurrency_cap():
+    scheduler = make_scheduler(max_concurrency=4, per_caller_concurrency=2)
+    peak = {"heavy": 0}
+    running = {"heavy": 0}
+
+    async def job():
+        async with scheduler.slot("heavy", 1):
+            running["heavy"] += 1
+            peak["heavy"] = max(peak["heavy"], running["heavy"])
+            await asyncio.sleep(0.01)
+            running["heavy"] -= 1
+
+    async def scenario():
+        await asyncio.gather(*(job() for _ in range(6)))
+
+    asyncio.run(scenario())
+    assert peak["heavy"] == 2
+    assert scheduler.active == 0 and not scheduler.queues and not scheduler.last_tags
+
+
+def test_full_caller_queue_is_rejected():
+    scheduler = make_scheduler(max_queue_per_caller=1)
+
+    async def scenario():
+        await scheduler.acquire("heavy", 1)
+        queued = asyncio.create_task(scheduler.acquire("heavy", 1))
+        await asyncio.sleep(0)
+        try:
+            await scheduler.acquire("heavy", 1)
+        finally:
+            scheduler.release("heavy")
+            await queued
+            scheduler.release("heavy")
+
+    try:
+        asyncio.run(scenario())
+    except HTTPException as e:
+        assert e.status_code == 429
+    else:
+        raise AssertionError("third request should be rejected")
+
+
+def test_caller_metrics_snapshot():
+    caller_metrics = CallerMetrics(max_callers=2)
+    caller_metrics.record("a", 0.1, 100, True)
+    caller_metrics.record("a", 0.3, 100, False)
+    caller_metrics.record_rejected("b")
+    caller_metrics.record("c", 0.2, 10, True)
+    snapshot = caller_metrics.snapshot()
+    assert set(snapshot) == {"b", "c"}
+    assert snapshot["c"]["latency_p50_ms"] == 200.0
+
+
+def test_analyze_records_per_caller_usage():
+    reset_app_state()
+    fake = FakeReddit({"active": make_account()})
+    main.create_reddit_client = fake.client
+    main.summarize_with_llm = lambda *args, **kwargs: "summary"
+    main.caller_metrics = CallerMetrics()
+
+    request = main.AnalyzeUserRequest(user_id="dashboard", user_to_search="active", parameters={})
+    asyncio.run(main.analyze_user(request))
+    stats = main.caller_metrics.snapshot()["dashboard"]
+    assert stats["succeeded"] == 1
+    assert stats["cost_used"] > 0
+
+
+if __name__ == "__main__":
+    tests = [
+        test_quota_rejects_with_retry_after,
+        test_quota_allows_requests_larger_than_burst_when_full,
+        test_light_caller_overtakes_heavy_backlog,
+        test_weights_share_slots_proportionally,
+        test_per_caller_concurrency_cap,
+        test_full_caller_queue_is_rejected,
+        test_caller_metrics_snapshot,
+        test_analyze_records_per_caller_usage,
+    ]
+    for test in tests:
+        test()
+        print(f"{test.__name__} passed")
+    print(f"All {len(tests)} fairness tests passed!")
@@ -0,0 +1,139 @@
+"""
+Tests for hedged OpenAI completions against the local stub server.
+Run with: python tests/test_hedging.py
+"""
+
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fakes import StubOpenAIServer, reset_app_state
+
+import main
+from hedging import HedgePolicy, run_hedged
+
+
+def scripted_latency(*values):
+    """Latency callable for the stub: returns the given values in order, then zeros."""
+    sequence = itertools.chain(values, itertools.repeat(0.0))
+    lock = threading.Lock()
+
+    def next_latency():
+        with lock:
+            return next(sequence)
+    return next_latency
+
+
+def setup_stub(stub, **policy):
+    reset_app_state()
+    main.OPENAI_BASE_URL = stub.base_url
+    settings = dict(percentile=0.9, min_delay=0.05, max_delay=0.1, min_samples=1000, max_extra_ratio=1.0)
+    settings.update(policy)
+    main.hedge_policy = HedgePolicy(**settings)
+
+
+def test_delay_follows_latency_percentile():
+    policy = HedgePolicy(percentile=0.9, min_delay=0.01, max_delay=5, min_samples=10)
+    assert policy.delay() == 5
+    for i in range(100):
+        policy.record_latency(i / 100)
+    assert abs(policy.delay() - 0.9) < 0.02
+    policy.record_latency(100)
+    assert policy.delay() <= 5
+
+
+def test_slow_primary_is_hedged_with_fallback_model():
+    with StubOpenAIServer(latency=scripted_latency(1.0)) as stub:
+        setup_stub(stub)
+        started = time.monotonic()
+        summary = main.summarize_with_llm("data", "someone", {"hedge": True, "hedge_model": "gpt-4o-mini"})
+        assert time.monotonic() - started < 0.5
+        assert "gpt-4o-mini" in summary
+        assert [request["model"] for request in stub.requests] == ["gpt-4o", "gpt-4o-mini"]
+        assert main.hedge_policy.snapshot()["hedge_wins"] == 1
+
+
+def test_fast_primary_is_not_hedged():
+    with StubOpenAIServer() as stub:
+        setup_stub(stub)
+        main.summarize_with_llm("data", "someone", {"hedge": True})
+        assert len(stub.requests) == 1
+        assert main.hedge_policy.snapshot()["hedges"] == 0
+
+
+def test_hedges_are_capped_by_ratio():
+    with StubOpenAIServer(latency=0.2) as stub:
+        setup_stub(stub, max_extra_ratio=0.25)
+        for _ in range(8):
+            main.summarize_with_llm("data", "someone", {"hedge": True})
+        assert main.hedge_policy.snapshot()["hedges"] == 2
+        assert len(stub.requests) == 10
+
+
+def test_failed_hedge_falls_back_to_primary():
+    with StubOpenAIServer(latency=scripted_latency(0.3)) as stub:
+        setup_stub(stub)
+        original_respond = stub.respond
+
+        def respond(body):
+            if len(stub.requests) == 2:
+                return 500, {"error": {"message": "hedge failed"}}
+            return original_respond(body)
+        stub.respond = respond
+
+        summary = main.summarize_with_llm("data", "someone", {"hedge": True})
+        assert summary.startswith("Stub summary")
+        assert main.hedge_policy.snapshot()["hedge_wins"] == 0
+
+
+def test_hedge_gets_the_remaining_time_and_primary_latency_is_kept():
+    policy = HedgePolicy(min_delay=0.05, max_delay=0.05, max_extra_ratio=1.0)
+    timeouts = {}
+
+    def attempt(name, seconds):
+        def call(answered, timeout):
+            timeouts[name] = timeout
+            time.sleep(seconds)
+            answered.set()
+            return name
+        return call
+
+    with ThreadPoolExecutor(4) as executor:
+        result = run_hedged(executor, policy, 1.0, primary=attempt("primary", 0.3), hedge=attempt("hedge", 0.0),
+                            is_success=lambda result: True, discard=lambda result: None)
+        assert result == "hedge"
+        assert timeouts["primary"] == 1.0 and 0.9 < timeouts["hedge"] < 0.95
+        # The slow primary's latency still counts once it answers
+        time.sleep(0.4)
+        assert len(policy.latencies) == 1 and policy.latencies[0] >= 0.3
+
+        # No time would be left for a hedge: the primary runs alone
+        timeouts.clear()
+        result = run_hedged(executor, policy, 0.05, primary=attempt("primary", 0.1), hedge=attempt("hedge", 0.0),
+                            is_success=lambda result: True, discard=lambda result: None)
+        assert result == "primary" and "hedge" not in timeouts
+    assert policy.snapshot()["hedges"] == 1 and policy.snapshot()["hedge_wins"] == 1
+
+
+def test_hedging_is_off_by_default():
+    with StubOpenAIServer(latency=scripted_latency(0.3)) as stub:
+        setup_stub(stub)
+        main.summarize_with_llm("data", "someone", {})
+        assert len(stub.requests) == 1
+
+
+if __name__ == "__main__":
+    tests = [
+        test_delay_follows_latency_percentile,
+        test_slow_primary_is_hedged_with_fallback_model,
+        test_fast_primary_is_not_hedged,
+        test_hedges_are_capped_by_ratio,
+        test_failed_hedge_falls_back_to_primary,
+        test_hedge_gets_the_remaining_time_and_primary_latency_is_kept,
+        test_hedging_is_off_by_default,
+    ]
+    for test in tests:
+        test()
+        print(f"{test.__name__} passed")
+    print(f"All {len(tests)} hedging tests passed!")
@@ -0,0 +1,161 @@
+"""
+Tests for access tracking, refresh budgets and the hot account refresher pass.
+Run with: python tests/test_hot_accounts.py
+"""
+
+import asyncio
+
+from fakes import REAL_ACTIVITY_STORE_MAX_AGE, FakeReddit, add_activity, make_account, reset_app_state
+
+import main
+from hot_accounts import AccessTracker, CallBudget
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_tracker_ranks_by_decayed_frequency():
+    clock = Clock()
+    tracker = AccessTracker(half_life=100, clock=clock)
+    for _ in range(8):
+        tracker.record("old_favourite")
+    clock.now = 500  # five half-lives: 8 accesses now weigh 0.25
+    for _ in range(2):
+        tracker.record("Newcomer")
+    tracker.record("once")
+    assert tracker.top(2) == ["newcomer", "once"]
+    assert tracker.top(10) == ["newcomer", "once", "old_favourite"]
+
+
+def test_tracker_stays_bounded():
+    tracker = AccessTracker(max_entries=100)
+    for _ in range(3):
+        tracker.record("hot")
+    for index in range(1000):
+        tracker.record(f"user{index}")
+    assert len(tracker) <= 110
+    assert tracker.top(1) == ["hot"]
+
+
+def test_budget_is_a_sliding_window():
+    clock = Clock()
+    budget = CallBudget(limit=3, window=60, clock=clock)
+    budget.spend(2)
+    clock.now = 30
+    budget.spend()
+    assert budget.available() == 0
+    clock.now = 61
+    assert budget.available() == 2
+    clock.now = 91
+    assert budget.available() == 3
+
+
+def setup(accounts):
+    reset_app_state()
+    fake = FakeReddit(accounts)
+    main.create_reddit_client = fake.client
+    calls = []
+
+    def summarize(user_data, username, parameters, deadline=None, usage=None, previous_summary=None):
+        calls.append(username)
+        return f"Summary of u/{username}"
+
+    main.summarize_with_llm = summarize
+    return fake, calls
+
+
+def analyze(username, times=1):
+    request = main.AnalyzeUserRequest(user_id="caller", user_to_search=username, parameters={})
+    for _ in range(times):
+        asyncio.run(main.analyze_user(request))
+
+
+def age_all(seconds):
+    with main.summary_store.connection:
+        main.summary_store.connection.execute("UPDATE summaries SET checked_at = checked_at - ?", (seconds,))
+
+
+def test_pass_refreshes_hot_accounts_about_to_go_stale():
+    accounts = {name: make_account(2, 5, prefix=name) for name in ("hot", "warm", "cold")}
+    fake, calls = setup(accounts)
+    analyze("hot", 5)
+    analyze("warm", 3)
+    analyze("cold", 1)
+    age_all(main.SUMMARY_MAX_AGE * main.REFRESH_AHEAD_FRACTION + 1)
+    add_activity(accounts["hot"], comments=1)
+    calls.clear()
+
+    original_top_n = main.REFRESH_TOP_N
+    main.REFRESH_TOP_N = 2
+    try:
+        assert asyncio.run(main.refresh_hot_accounts()) == 2
+    finally:
+        main.REFRESH_TOP_N = original_top_n
+
+    # Only "hot" had new activity, so only it needed a completion
+    assert calls == ["hot"]
+    assert main.metrics["hot_refreshes"] == 2
+    assert main.metrics["summary_updates_incremental"] == 1 and main.metrics["summary_updates_unchanged"] == 1
+    assert main.refresh_reddit_budget.available() == main.REFRESH_REDDIT_BUDGET - 2
+    assert main.refresh_llm_budget.available() == main.REFRESH_LLM_BUDGET - 1
+    stored = {name: main.summary_store.get(name)["checked_at"] for name in accounts}
+    assert stored["cold"] < stored["warm"] and stored["cold"] < stored["hot"]
+
+
+def test_refreshes_fetch_from_reddit_not_the_activity_store():
+    accounts = {"hot": make_account(2, 5)}
+    fake, calls = setup(accounts)
+    main.ACTIVITY_STORE_MAX_AGE = REAL_ACTIVITY_STORE_MAX_AGE
+    analyze("hot")
+    # The summary is due for a refresh while the stored activity is still within ACTIVITY_STORE_MAX_AGE
+    age_all(main.SUMMARY_MAX_AGE)
+    add_activity(accounts["hot"], comments=1)
+    calls.clear()
+
+    assert asyncio.run(main.refresh_hot_accounts()) == 1
+    assert calls == ["hot"] and main.metrics["summary_updates_incremental"] == 1
+    assert fake.calls["comments.new"] == 2 and main.metrics["activity_store_hits"] == 0
+
+
+def test_fresh_summaries_are_left_alone():
+    fake, calls = setup({"hot": make_account(2, 5)})
+    analyze("hot", 3)
+    calls.clear()
+    assert asyncio.run(main.refresh_hot_accounts()) == 0
+    assert fake.calls["load"] == 3 and not calls
+
+
+def test_pass_stops_when_the_budget_is_spent():
+    accounts = {f"user{index}": make_account(2, 5, prefix=f"u{index}") for index in range(4)}
+    setup(accounts)
+    for name in accounts:
+        analyze(name)
+    age_all(main.SUMMARY_MAX_AGE)
+    main.refresh_reddit_budget = CallBudget(2, 3600)
+    assert asyncio.run(main.refresh_hot_accounts()) == 2
+    assert main.metrics["hot_refreshes_over_budget"] == 1
+
+
+def test_pass_yields_to_interactive_traffic():
+    setup({"hot": make_account(2, 5)})
+    analyze("hot")
+    age_all(main.SUMMARY_MAX_AGE)
+    main.scheduler.active = main.SCHEDULER_MAX_CONCURRENCY
+    try:
+        assert asyncio.run(main.refresh_hot_accounts()) == 0
+    finally:
+        main.scheduler.active = 0
+    assert main.metrics["hot_refreshes_yielded"] == 1
+    assert asyncio.run(main.refresh_hot_accounts()) == 1
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"PASS {name}")
@@ -0,0 +1,130 @@
+"""
+Tests for incremental summary updates ("mode": "update") against the fake Reddit
+client and the local OpenAI stub server.
+Run with: python tests/test_incremental_summary.py
+"""
+
+import asyncio
+import os
+import tempfile
+
+from fastapi import HTTPException
+
+from fakes import FakeReddit, StubOpenAIServer, add_activity, make_account, reset_app_state
+
+import main
+from summary_store import SummaryStore
+
+
+def setup(stub, accounts):
+    reset_app_state()
+    main.OPENAI_BASE_URL = stub.base_url
+    fake = FakeReddit(accounts)
+    main.create_reddit_client = fake.client
+    return fake
+
+
+def analyze(username, **parameters):
+    request = main.AnalyzeUserRequest(user_id="caller", user_to_search=username, parameters=parameters)
+    return asyncio.run(main.analyze_user(request))
+
+
+def test_update_without_stored_summary_is_full():
+    with StubOpenAIServer() as stub:
+        setup(stub, {"alice": make_account(5, 20)})
+        response = analyze("alice", mode="update")
+        assert response.summary_mode == "full"
+        stored = main.summary_store.get("alice")
+        assert stored["base_items"] == 25 and stored["summary"] == response.summary
+
+
+def test_update_without_new_activity_skips_the_llm():
+    with StubOpenAIServer() as stub:
+        fake = setup(stub, {"alice": make_account(5, 20)})
+        first = analyze("alice")
+        second = analyze("alice", mode="update")
+        assert second.summary_mode == "unchanged"
+        assert second.summary == first.summary
+        assert len(stub.requests) == 1
+        assert main.metrics["summary_updates_unchanged"] == 1
+        assert fake.calls["load"] == 2
+
+
+def test_update_sends_previous_summary_and_only_new_items():
+    account = make_account(5, 40, prefix="old")
+    with StubOpenAIServer() as stub:
+        setup(stub, {"alice": account})
+        full = analyze("alice")
+        add_activity(account, posts=1, comments=3)
+        update = analyze("alice", mode="update")
+
+        assert update.summary_mode == "incremental"
+        prompt = stub.requests[-1]["messages"][1]["content"]
+        assert full.summary in prompt
+        assert "new comment 2" in prompt and "new post 0" in prompt
+        assert "old comment" not in prompt
+        assert stub.requests[-1]["messages"][0]["content"].endswith(main.UPDATE_INSTRUCTIONS)
+        assert update.usage["prompt_tokens"] < full.usage["prompt_tokens"]
+
+        stored = main.summary_store.get("alice")
+        assert stored["incremental_items"] == 4 and stored["updates"] == 1
+        assert stored["summary"] == update.summary
+
+
+def test_drift_past_threshold_rebuilds():
+    account = make_account(2, 8)
+    with StubOpenAIServer() as stub:
+        setup(stub, {"alice": account})
+        analyze("alice")
+        add_activity(account, comments=6)
+        response = analyze("alice", mode="update")
+        assert response.summary_mode == "full"
+        assert main.metrics["summary_updates_rebuilt"] == 1
+        stored = main.summary_store.get("alice")
+        assert stored["incremental_items"] == 0 and stored["base_items"] == 16
+
+
+def test_model_change_rebuilds():
+    account = make_account(5, 40)
+    with StubOpenAIServer() as stub:
+        setup(stub, {"alice": account})
+        analyze("alice")
+        add_activity(account, comments=1)
+        response = analyze("alice", mode="update", model="gpt-4o-mini")
+        assert response.summary_mode == "full"
+
+
+def test_unknown_mode_is_rejected():
+    reset_app_state()
+    try:
+        analyze("alice", mode="sometimes")
+        assert False, "expected 422"
+    except HTTPException as e:
+        assert e.status_code == 422
+
+
+def test_store_file_is_shared_in_wal_mode():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "summaries.db")
+        writer, reader = SummaryStore(path), SummaryStore(path)
+        assert writer.connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        writer.record_full("Alice", "a summary", "gpt-4o", "openai", 100.0, 7)
+        assert reader.get("alice")["summary"] == "a summary"
+        writer.connection.close()
+        reader.connection.close()
+
+
+if __name__ == "__main__":
+    tests = [
+        test_update_without_stored_summary_is_full,
+        test_update_without_new_activity_skips_the_llm,
+        test_update_sends_previous_summary_and_only_new_items,
+        test_drift_past_threshold_rebuilds,
+        test_model_change_rebuilds,
+        test_unknown_mode_is_rejected,
+        test_store_file_is_shared_in_wal_mode,
+    ]
+    for test in tests:
+        test()
+        print(f"{test.__name__} passed")
+    print(f"All {len(tests)} incremental summary tests passed!")
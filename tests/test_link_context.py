@@ -0,0 +1,64 @@
+"""
+Tests for include_context: parent post titles are hydrated in bulk via /api/info.
+Run with: python tests/test_link_context.py
+"""
+
+import asyncio
+
+from fakes import FakeReddit, make_account, reset_app_state
+
+import main
+
+
+def setup_fake_reddit(comments, threads=None):
+    reset_app_state()
+    fake = FakeReddit({"active": make_account(posts=0, comments=comments, threads=threads)})
+    main.create_reddit_client = fake.client
+    return fake
+
+
+def fetch(parameters):
+    return asyncio.run(main.get_reddit_user_data("active", parameters))
+
+
+def test_context_is_off_by_default():
+    fake = setup_fake_reddit(comments=10)
+    data = fetch({"comment_limit": 10})
+    assert "on post" not in data
+    assert fake.calls["info"] == 0
+
+
+def test_titles_are_fetched_in_batches_of_100():
+    fake = setup_fake_reddit(comments=250)
+    data = fetch({"comment_limit": 250, "include_context": True})
+    assert fake.calls["info"] == 3
+    assert fake.calls["info_fullnames"] == 250
+    assert 'Comment (on post "title of t3_item0"): item comment 0' in data
+
+
+def test_duplicate_parents_are_requested_once():
+    fake = setup_fake_reddit(comments=100, threads=7)
+    fetch({"comment_limit": 100, "include_context": True})
+    assert fake.calls["info"] == 1
+    assert fake.calls["info_fullnames"] == 7
+
+
+def test_titles_are_cached_across_requests():
+    fake = setup_fake_reddit(comments=50)
+    first = fetch({"comment_limit": 50, "include_context": True})
+    second = fetch({"comment_limit": 50, "include_context": True})
+    assert first == second
+    assert fake.calls["info"] == 1
+
+
+if __name__ == "__main__":
+    tests = [
+        test_context_is_off_by_default,
+        test_titles_are_fetched_in_batches_of_100,
+        test_duplicate_parents_are_requested_once,
+        test_titles_are_cached_across_requests,
+    ]
+    for test in tests:
+        test()
+        print(f"{test.__name__} passed")
+    print(f"All {len(tests)} link context tests passed!")
@@ -0,0 +1,121 @@
+"""
+Tests for the chat completion backends: the local offline backend, OpenAI-compatible
+servers by base URL and the per-request "backend" parameter.
+Run with: python tests/test_llm_backends.py
+"""
+
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from fakes import FakeReddit, StubOpenAIServer, make_account, reset_app_state
+
+import main
+from llm_backends import HTTPBackend, LocalBackend, parse_backends
+
+
+def setup_stub(stub=None):
+    reset_app_state()
+    if stub is not None:
+        main.OPENAI_BASE_URL = stub.base_url
+    main.create_reddit_client = FakeReddit({"alice": make_account(2, 5)}).client
+
+
+def analyze(**parameters):
+    request = main.AnalyzeUserRequest(user_id="caller", user_to_search="alice",
+                                      parameters={"post_limit": 2, "comment_limit": 5, **parameters})
+    return asyncio.run(main.analyze_user(request))
+
+
+def request_body(**fields):
+    return json.dumps({"model": "m", "messages": [{"role": "system", "content": "Summarize"},
+                                                  {"role": "user", "content": "Post Title: Rust? Rust borrow"}],
+                       **fields}).encode()
+
+
+def test_local_backend_is_deterministic_and_honours_max_tokens():
+    backend = LocalBackend()
+    first = backend.complete(request_body(), timeout=5).json()
+    assert first == backend.complete(request_body(), timeout=5).json()
+    assert "rust" in first["choices"][0]["message"]["content"]
+    assert first["usage"]["completion_tokens"] > 0
+
+    truncated = backend.complete(request_body(max_tokens=2), timeout=5).json()["choices"][0]
+    assert truncated["finish_reason"] == "length" and len(truncated["message"]["content"]) == 8
+    sections = json.loads(backend.complete(request_body(response_format={"type": "json_object"}),
+                                           timeout=5).json()["choices"][0]["message"]["content"])
+    assert set(sections) == {"main_interests", "overall_tone", "activity_pattern"}
+    assert backend.complete(b"[]", timeout=5).status_code == 400
+
+
+def test_local_backend_streams_the_same_answer():
+    backend = LocalBackend()
+    answer = backend.complete(request_body(), timeout=5).json()
+    chunks = list(backend.stream(request_body(stream=True), timeout=5))
+    text = "".join(chunk["choices"][0]["delta"].get("content", "") for chunk in chunks if chunk["choices"])
+    assert text == answer["choices"][0]["message"]["content"]
+    assert chunks[-1]["usage"] == answer["usage"]
+
+    async def collect():
+        return [chunk async for chunk in backend.astream(request_body(stream=True), timeout=5)]
+    assert asyncio.run(collect()) == chunks
+    assert asyncio.run(backend.acomplete(request_body(), timeout=5)).json() == answer
+
+
+def test_http_backend_follows_a_changing_base_url():
+    with StubOpenAIServer() as stub:
+        base_url = {"value": "http://127.0.0.1:1/v1"}
+        backend = HTTPBackend("stub", lambda: base_url["value"])
+        base_url["value"] = stub.base_url + "/"
+        response = backend.complete(request_body(), timeout=5)
+        assert response.status_code == 200 and stub.requests[-1]["model"] == "m"
+
+
+def test_backend_parameter_selects_and_reports_backend():
+    setup_stub()
+    response = analyze(backend="local")
+    assert "Frequent topics" in response.summary or "No recurring topics" in response.summary
+    snapshot = main.llm_backends["local"].snapshot()
+    assert snapshot["calls"] == 1 and snapshot["failures"] == 0 and snapshot["completion_tokens"] > 0
+    assert asyncio.run(main.get_metrics())["llm_backends"]["local"]["calls"] == 1
+
+    with StubOpenAIServer() as stub:
+        setup_stub(stub)
+        analyze()
+        assert len(stub.requests) == 1
+    with pytest.raises(HTTPException) as e:
+        analyze(backend="nope")
+    assert e.value.status_code == 422
+
+
+def test_other_backends_do_not_replace_the_stored_summary():
+    with StubOpenAIServer() as stub:
+        setup_stub(stub)
+        stored = analyze().summary
+        assert main.summary_store.get("alice")["backend"] == "openai"
+
+        local = analyze(backend="local", mode="update")
+        assert local.summary_mode == "full" and local.summary != stored
+        assert main.summary_store.get("alice")["summary"] == stored
+        assert asyncio.run(main.get_stored_summary("alice")) == stored
+
+        # Update mode only extends a summary written by the same backend
+        with main.summary_store.connection:
+            main.summary_store.connection.execute("UPDATE summaries SET backend = 'vllm'")
+        assert analyze(mode="update").summary_mode == "full"
+        assert main.summary_store.get("alice")["backend"] == "openai"
+
+
+def test_parse_backends():
+    assert parse_backends(" a=http://x/v1, b=http://y/v1 ,") == {"a": "http://x/v1", "b": "http://y/v1"}
+    with pytest.raises(ValueError):
+        parse_backends("http://x/v1")
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"PASS {name}")
@@ -0,0 +1,114 @@
+"""
+Tests for the event-loop lag monitor: detecting a blocking call, reporting where it
+blocked and shedding /analyze while the loop is lagging.
+Run with: python tests/test_loop_monitor.py
+"""
+
+import asyncio
+import logging
+import time
+
+from fastapi.testclient import TestClient
+
+from fakes import FakeReddit, make_account, reset_app_state
+
+import main
+from loop_monitor import LagHistogram, LoopLagMonitor
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def blocking_call(seconds):
+    # Stands in for sync work (a slow query, a blocking HTTP call) run on the loop
+    time.sleep(seconds)
+
+
+def test_blocking_call_is_detected_and_reported():
+    handler = ListHandler()
+    logging.getLogger("loop_monitor").addHandler(handler)
+
+    async def scenario():
+        monitor = LoopLagMonitor(interval=0.02, slow_callback_threshold=0.05)
+        monitor.start()
+        await asyncio.sleep(0.2)
+        blocking_call(0.3)
+        await asyncio.sleep(0.1)
+        monitor.stop()
+        return monitor
+
+    try:
+        monitor = asyncio.run(scenario())
+    finally:
+        logging.getLogger("loop_monitor").removeHandler(handler)
+
+    lag = monitor.histogram.snapshot()
+    assert lag["count"] == monitor.stats["samples"] > 5
+    assert lag["max_ms"] >= 250
+    # Everything else was well under the stall
+    assert lag["buckets_ms"]["100"] == lag["count"] - 1
+
+    assert monitor.stats["slow_callbacks"] == 1
+    report = monitor.slow_callbacks[0]
+    assert report["blocked_for_ms"] >= 50 and report["lag_ms"] >= 250
+    assert any("blocking_call" in line for line in report["stack"])
+    assert len(handler.messages) == 1 and "blocking_call" in handler.messages[0]
+
+
+def test_histogram_is_cumulative():
+    histogram = LagHistogram(bounds=(1, 10, 100))
+    for value in (0.5, 1, 5, 50, 5000):
+        histogram.observe(value)
+    snapshot = histogram.snapshot()
+    assert snapshot["buckets_ms"] == {"1": 2, "10": 3, "100": 4, "+Inf": 5}
+    assert snapshot["count"] == 5 and snapshot["max_ms"] == 5000
+
+
+def test_analyze_is_shed_while_the_loop_lags():
+    reset_app_state()
+    main.create_reddit_client = FakeReddit({"alice": make_account(2, 5)}).client
+    main.summarize_with_llm = lambda *args, **kwargs: "a summary"
+    main.loop_monitor = LoopLagMonitor(interval=0.02, slow_callback_threshold=0.05,
+                                       shed_threshold=0.1, shed_window=0.5)
+    real_lookup = main.get_negative_cache_entry
+
+    async def slow_lookup(username):
+        if username == "slowpoke":
+            blocking_call(0.3)
+        return await real_lookup(username)
+
+    main.get_negative_cache_entry = slow_lookup
+    body = {"user_id": "caller", "user_to_search": "alice", "parameters": {"post_limit": 2, "comment_limit": 5}}
+    try:
+        with TestClient(main.app) as client:
+            assert client.post("/analyze", json=body).status_code == 200
+            client.post("/analyze", json={**body, "user_to_search": "slowpoke"})
+
+            shed = client.post("/analyze", json=body)
+            assert shed.status_code == 503 and shed.headers["Retry-After"]
+            # Only new analyses are turned away
+            assert client.get("/").status_code == 200
+
+            time.sleep(0.6)
+            assert client.post("/analyze", json=body).status_code == 200
+            event_loop = client.get("/metrics").json()["event_loop"]
+    finally:
+        main.get_negative_cache_entry = real_lookup
+
+    assert main.metrics["shed_loop_lag"] == 1
+    assert event_loop["slow_callbacks"] == 1 and not event_loop["overloaded"]
+    assert event_loop["lag"]["max_ms"] >= 250
+    assert any("slow_lookup" in line for line in event_loop["recent_slow_callbacks"][0]["stack"])
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"PASS {name}")
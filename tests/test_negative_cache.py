@@ -0,0 +1,109 @@
+"""
+Tests for the negative cache of missing, suspended and empty Reddit accounts.
+Uses a fake Reddit client, so no credentials or network access are needed.
+Run with: python tests/test_negative_cache.py
+"""
+
+import asyncio
+
+from fakes import FakeReddit, make_account, reset_app_state
+
+import main
+from fastapi import HTTPException
+
+
+def setup_fake_reddit():
+    """Installs a fake Reddit with one missing, one suspended, one empty and one active account."""
+    reset_app_state()
+    fake = FakeReddit({
+        "ghost": {"status": 404},
+        "banned": {"status": 403},
+        "suspended": {"is_suspended": True},
+        "quiet": {},
+        "active": make_account(),
+    })
+    main.create_reddit_client = fake.client
+    main.summarize_with_llm = lambda user_data, username, *args, **kwargs: f"summary of {username}"
+    return fake
+
+
+def analyze(username):
+    request = main.AnalyzeUserRequest(user_id="test_caller", user_to_search=username, parameters={})
+    return asyncio.run(main.analyze_user(request))
+
+
+def expect_error(username, status_code):
+    try:
+        analyze(username)
+    except HTTPException as e:
+        assert e.status_code == status_code, f"expected {status_code}, got {e.status_code}"
+        return e.detail
+    raise AssertionError(f"u/{username} should have failed with {status_code}")
+
+
+def test_missing_user_is_cached():
+    fake = setup_fake_reddit()
+    first = expect_error("ghost", 404)
+    second = expect_error("ghost", 404)
+    assert first == second
+    assert fake.calls["clients"] == 1
+    assert fake.calls["load"] == 1
+    assert main.metrics["negative_cache_hits"] == 1
+
+
+def test_forbidden_and_suspended_users_are_cached():
+    fake = setup_fake_reddit()
+    expect_error("banned", 403)
+    expect_error("suspended", 403)
+    expect_error("banned", 403)
+    expect_error("Suspended", 403)
+    assert fake.calls["load"] == 2
+    assert main.metrics["negative_cache_hits"] == 2
+
+
+def test_empty_account_is_cached():
+    fake = setup_fake_reddit()
+    expect_error("quiet", 404)
+    expect_error("quiet", 404)
+    assert fake.calls["comments.new"] == 1
+    assert main.metrics["negative_cache_stores"] == 1
+
+
+def test_active_user_is_not_cached():
+    fake = setup_fake_reddit()
+    assert analyze("active").success
+    assert analyze("active").success
+    assert fake.calls["load"] == 2
+    assert main.metrics["negative_cache_hits"] == 0
+    assert not main.negative_cache
+
+
+def test_expired_entry_calls_reddit_again():
+    fake = setup_fake_reddit()
+    expect_error("ghost", 404)
+    expires_at, entry = main.negative_cache.l1["ghost"]
+    main.negative_cache.l1["ghost"] = (0, entry)
+    expect_error("ghost", 404)
+    assert fake.calls["load"] == 2
+
+
+def test_client_is_closed_on_error():
+    fake = setup_fake_reddit()
+    expect_error("ghost", 404)
+    expect_error("banned", 403)
+    assert fake.calls["close"] == fake.calls["clients"] == 2
+
+
+if __name__ == "__main__":
+    tests = [
+        test_missing_user_is_cached,
+        test_forbidden_and_suspended_users_are_cached,
+        test_empty_account_is_cached,
+        test_active_user_is_not_cached,
+        test_expired_entry_calls_reddit_again,
+        test_client_is_closed_on_error,
+    ]
+    for test in tests:
+        test()
+        print(f"{test.__name__} passed")
+    print(f"All {len(tests)} negative cache tests passed!")
@@ -0,0 +1,153 @@
+"""
+Tests for the outbound HTTP layer: the DNS cache, connection reuse for LLM calls over
+TLS and for Reddit calls through the real asyncpraw client, and startup warm-up.
+Run with: python tests/test_outbound.py
+"""
+
+import asyncio
+import shutil
+import socket
+import tempfile
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from fakes import (StubOpenAIServer, StubRedditServer, TLSStubServer, make_account, make_self_signed_certificate,
+                   reset_app_state)
+
+import main
+from outbound import DNSCache, HTTPClient
+
+ADDRESSES = [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("10.0.0.1", 443))]
+
+requires_openssl = pytest.mark.skipif(shutil.which("openssl") is None, reason="needs the openssl CLI")
+
+
+class FakeResolver:
+    def __init__(self):
+        self.lookups = 0
+        self.failing = False
+
+    def __call__(self, host, port, family=0, type=0, proto=0, flags=0):
+        self.lookups += 1
+        if self.failing:
+            raise socket.gaierror("resolver down")
+        return list(ADDRESSES)
+
+
+def test_dns_cache_expires_and_serves_stale_on_failure():
+    resolver = FakeResolver()
+    cache = DNSCache(ttl=0.05, resolve=resolver)
+    for _ in range(10):
+        assert cache.getaddrinfo("API.openai.com", 443) == ADDRESSES
+    assert resolver.lookups == 1
+    # IP literals never reach the resolver cache
+    cache.getaddrinfo("127.0.0.1", 443)
+    assert resolver.lookups == 2 and cache.snapshot()["entries"] == 1
+
+    time.sleep(0.06)
+    resolver.failing = True
+    assert cache.getaddrinfo("api.openai.com", 443) == ADDRESSES
+    with pytest.raises(socket.gaierror):
+        cache.getaddrinfo("oauth.reddit.com", 443)
+    assert cache.snapshot()["stale_served"] == 1 and cache.snapshot()["failures"] == 2
+
+
+def test_dns_cache_install_routes_getaddrinfo():
+    original = socket.getaddrinfo
+    resolver = FakeResolver()
+    cache = DNSCache(ttl=60, resolve=resolver)
+    cache.install()
+    try:
+        assert socket.getaddrinfo("example.invalid", 443) == ADDRESSES
+        assert socket.getaddrinfo("example.invalid", 443) == ADDRESSES
+    finally:
+        cache.uninstall()
+    assert socket.getaddrinfo is original and resolver.lookups == 1
+
+
+def test_app_installs_the_dns_cache_only_while_running():
+    reset_app_state()
+    original = socket.getaddrinfo
+    assert main.dns_cache.replaced is None
+    with TestClient(main.app):
+        assert socket.getaddrinfo == main.dns_cache.getaddrinfo
+    assert socket.getaddrinfo is original
+
+
+@requires_openssl
+@pytest.mark.parametrize("http2", [False, True])
+def test_llm_client_reuses_one_tls_connection(http2):
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = make_self_signed_certificate(directory)
+        with TLSStubServer(certfile, keyfile) as stub:
+            client = HTTPClient("test", http2=http2, verify=certfile)
+            for _ in range(200):
+                response = client.post(f"{stub.base_url}/v1/chat/completions", {"Content-Type": "application/json"},
+                                       b"{}", timeout=5)
+                client.read(response)
+                assert response.json() == {"ok": True}
+            assert (stub.requests, stub.connections, stub.handshakes) == (200, 1, 1)
+
+    snapshot = client.snapshot()
+    assert snapshot["requests"] == 200 and snapshot["new_connections"] == 1 and snapshot["tls_handshakes"] == 1
+    assert snapshot["reused"] == 199
+
+
+def test_completions_share_connections():
+    with StubOpenAIServer() as stub:
+        reset_app_state()
+        main.OPENAI_BASE_URL = stub.base_url
+        backend = main.llm_backends["openai"]
+        for _ in range(20):
+            assert backend.complete(b'{"model": "m", "messages": []}', timeout=5).status_code == 200
+    assert backend.snapshot()["connections"]["new_connections"] == 1
+
+
+def test_reddit_requests_share_connections():
+    reset_app_state()
+    accounts = {f"user{i}": make_account(2, 5) for i in range(5)}
+    with StubRedditServer(accounts) as reddit:
+        main.REDDIT_URL = main.REDDIT_OAUTH_URL = reddit.base_url
+        main.summarize_with_llm = lambda *args, **kwargs: "a summary"
+        before = main.reddit_connections.snapshot()
+
+        async def analyze_all():
+            for username in accounts:
+                await main.analyze_user(main.AnalyzeUserRequest(user_id="caller", user_to_search=username,
+                                                                parameters={"post_limit": 2, "comment_limit": 5}))
+            await main.reddit_connections.close()
+        asyncio.run(analyze_all())
+
+    after = main.reddit_connections.snapshot()
+    requests = after["requests"] - before["requests"]
+    # token + about + two listings per user
+    assert requests == 4 * len(accounts)
+    # asyncprawcore asks for "Connection: close" on token requests; everything else reuses one connection
+    assert after["new_connections"] - before["new_connections"] == len(accounts) + 1
+
+
+def test_warm_up_connects_before_the_first_request():
+    with StubOpenAIServer() as stub, StubRedditServer({}) as reddit:
+        reset_app_state()
+        main.OPENAI_BASE_URL = stub.base_url
+        main.REDDIT_URL = main.REDDIT_OAUTH_URL = reddit.base_url
+
+        async def warm_up():
+            await main.warm_up_upstreams()
+            await main.reddit_connections.close()
+        asyncio.run(warm_up())
+
+    assert main.metrics["outbound_warmups"] == 3 and main.metrics["outbound_warmup_failures"] == 0
+    assert main.llm_backends["openai"].snapshot()["connections"]["new_connections"] == 1
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and name != "test_llm_client_reuses_one_tls_connection":
+            test()
+            print(f"PASS {name}")
+    for http2 in (False, True):
+        test_llm_client_reuses_one_tls_connection(http2)
+        print(f"PASS test_llm_client_reuses_one_tls_connection[http2={http2}]")
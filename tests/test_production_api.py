@@ -92,12 +92,12 @@ def test_production_analyze_invalid_user():
         print(f"Status Code: {response.status_code}")
         print(f"Response: {response.json()}")
         
-        # Should return 400 error for invalid user
-        if response.status_code == 400:
+        # Should return 404 error for invalid user
+        if response.status_code == 404:
             print("✅ Production invalid user test passed (correctly returned error)!")
             return True
         else:
-            print("❌ Production invalid user test failed (should have returned 400)!")
+            print("❌ Production invalid user test failed (should have returned 404)!")
             return False
             
     except Exception as e:
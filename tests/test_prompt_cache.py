@@ -0,0 +1,88 @@
+"""
+Tests for the stable-prefix prompt layout and cached-token reporting, against the
+local stub server's simulated prompt caching.
+Run with: python tests/test_prompt_cache.py
+"""
+
+import asyncio
+
+from fakes import FakeReddit, StubOpenAIServer, make_account, reset_app_state
+
+import main
+
+# Prompts this short are never cached by the provider; the stub is told to cache them
+CACHE_SETTINGS = dict(cache_min_tokens=64, cache_block_tokens=16)
+
+
+def setup_stub(stub):
+    reset_app_state()
+    main.OPENAI_BASE_URL = stub.base_url
+
+
+def test_fixed_prefix_comes_before_user_data():
+    first = main.build_messages("first data", "alice")
+    second = main.build_messages("second data", "bob")
+    assert first[0] == second[0]
+    assert "alice" not in first[0]["content"] and "first data" not in first[0]["content"]
+    assert "**Activity Pattern:**" in first[0]["content"]
+    assert first[1]["content"].startswith("Reddit user: u/alice")
+    assert "first data" in first[1]["content"]
+
+
+def test_custom_prompt_is_unchanged():
+    messages = main.build_messages("data", "alice", "Describe {username}: {user_data}")
+    assert messages[0]["content"] == main.SYSTEM_PROMPT
+    assert messages[1]["content"] == "Describe alice: data"
+
+
+def test_repeat_requests_report_cached_prefix():
+    with StubOpenAIServer(**CACHE_SETTINGS) as stub:
+        setup_stub(stub)
+        first, second = {}, {}
+        main.summarize_with_llm("posts from alice", "alice", {}, usage=first)
+        main.summarize_with_llm("comments from bob", "bob", {}, usage=second)
+
+        assert first["cached_tokens"] == 0
+        prefix_tokens = len(f"system:{main.SYSTEM_PROMPT}\n\n{main.ANALYSIS_INSTRUCTIONS}") // 4
+        assert second["cached_tokens"] >= prefix_tokens - CACHE_SETTINGS["cache_block_tokens"]
+        assert second["cached_tokens"] < second["prompt_tokens"]
+        assert main.metrics["llm_cached_prompt_tokens"] == second["cached_tokens"]
+        assert main.metrics["llm_prompt_tokens"] == first["prompt_tokens"] + second["prompt_tokens"]
+
+
+def test_username_first_layout_defeats_the_cache():
+    legacy = "Please analyze the posts and comments from the user u/{username}.\n" + main.ANALYSIS_INSTRUCTIONS + "\n{user_data}"
+    with StubOpenAIServer(**CACHE_SETTINGS) as stub:
+        setup_stub(stub)
+        usage = {}
+        main.summarize_with_llm("posts from alice", "alice", {"custom_prompt": legacy})
+        main.summarize_with_llm("comments from bob", "bob", {"custom_prompt": legacy}, usage=usage)
+        # Only the system prompt and the text before the username are shared
+        shared = f"system:{main.SYSTEM_PROMPT}user:" + legacy.split("{username}")[0] + "u/"
+        assert usage["cached_tokens"] <= len(shared) // 4
+        assert usage["cached_tokens"] < len(main.ANALYSIS_INSTRUCTIONS) // 4
+
+
+def test_usage_is_returned_by_analyze():
+    fake = FakeReddit({"alice": make_account(2, 5), "bob": make_account(2, 5)})
+    with StubOpenAIServer(**CACHE_SETTINGS) as stub:
+        setup_stub(stub)
+        main.create_reddit_client = fake.client
+        asyncio.run(main.analyze_user(main.AnalyzeUserRequest(user_id="caller", user_to_search="alice", parameters={})))
+        response = asyncio.run(main.analyze_user(main.AnalyzeUserRequest(user_id="caller", user_to_search="bob", parameters={})))
+        assert response.usage["cached_tokens"] > 0
+        assert response.usage["prompt_tokens"] > response.usage["cached_tokens"]
+
+
+if __name__ == "__main__":
+    tests = [
+        test_fixed_prefix_comes_before_user_data,
+        test_custom_prompt_is_unchanged,
+        test_repeat_requests_report_cached_prefix,
+        test_username_first_layout_defeats_the_cache,
+        test_usage_is_returned_by_analyze,
+    ]
+    for test in tests:
+        test()
+        print(f"{test.__name__} passed")
+    print(f"All {len(tests)} prompt cache tests passed!")
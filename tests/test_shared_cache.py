@@ -0,0 +1,189 @@
+"""
+Tests for the two-tier cache (cache.py) with SQLite and Redis-protocol shared tiers,
+and for result sharing between identical /analyze requests.
+Run with: python tests/test_shared_cache.py
+"""
+
+import asyncio
+import os
+import socket
+import tempfile
+import time
+
+from fakes import FakeReddit, StubOpenAIServer, StubRedisServer, make_account, reset_app_state
+
+import main
+from cache import MISSING, RedisBackend, SQLiteBackend, TieredCache, create_backend, decode, encode
+
+
+def check_backend(backend):
+    backend.set("a:1", b"one")
+    backend.set("a:2", b"two", ttl=0.05)
+    backend.set("b:1", b"other")
+    assert backend.get("a:1") == b"one" and backend.get("a:2") == b"two"
+    assert backend.add("a:lock", b"1", ttl=0.05)
+    assert not backend.add("a:lock", b"1", ttl=0.05)
+    time.sleep(0.08)
+    assert backend.get("a:2") is None
+    assert backend.add("a:lock", b"1", ttl=10)
+    backend.delete("a:lock")
+    assert backend.get("a:lock") is None
+    backend.clear("a:")
+    assert backend.get("a:1") is None and backend.get("b:1") == b"other"
+
+
+def test_serialization_is_versioned_json():
+    assert decode(encode({"x": (1, "two")})) == {"x": [1, "two"]}
+    assert decode(b"0:{}") is MISSING and decode(None) is MISSING
+
+
+def test_sqlite_backend():
+    with tempfile.TemporaryDirectory() as directory:
+        check_backend(SQLiteBackend(os.path.join(directory, "cache.db")))
+
+
+def test_sqlite_backend_purges_expired_entries():
+    with tempfile.TemporaryDirectory() as directory:
+        backend = SQLiteBackend(os.path.join(directory, "cache.db"))
+        for i in range(25):
+            backend.set(f"old:{i}", b"x", ttl=0.01)
+        backend.set("fresh", b"x", ttl=60)
+        backend.set("forever", b"x")
+        time.sleep(0.02)
+        assert backend.purge_expired(batch_size=10) == 25
+        count = backend.connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        assert count == 2 and backend.get("fresh") == b"x"
+
+
+def test_redis_backend_closes_broken_connections():
+    with StubRedisServer() as redis:
+        backend = RedisBackend(redis.host, redis.port)
+        assert backend.get("missing") is None
+        sock, _ = backend.local.connection
+        # The server goes away: the next call fails, closes the socket and the one after reconnects
+        sock.shutdown(socket.SHUT_RDWR)
+        try:
+            backend.get("missing")
+            assert False, "expected the call to fail"
+        except OSError:
+            pass
+        assert sock.fileno() == -1 and backend.local.connection is None
+        assert backend.get("missing") is None
+
+
+def test_redis_backend_against_stand_in():
+    with StubRedisServer() as redis:
+        check_backend(RedisBackend(redis.host, redis.port))
+        assert create_backend(f"redis://{redis.host}:{redis.port}/0").get("missing") is None
+
+
+def test_workers_share_the_second_tier():
+    with StubRedisServer() as redis:
+        worker_a = TieredCache("t", RedisBackend(redis.host, redis.port), l1_ttl=0.05)
+        worker_b = TieredCache("t", RedisBackend(redis.host, redis.port), l1_ttl=0.05)
+
+        async def scenario():
+            await worker_a.set("key", ("v", 1), ttl=60)
+            assert await worker_a.get("key") == ["v", 1]
+            assert await worker_b.get("key") == ["v", 1]
+            assert worker_a.stats["l1_hits"] == 1 and worker_b.stats["shared_hits"] == 1
+            # b's copy expires from its L1 and it picks up a's update
+            await worker_a.set("key", "new", ttl=60)
+            await asyncio.sleep(0.08)
+            assert await worker_b.get("key") == "new"
+        asyncio.run(scenario())
+
+
+def test_concurrent_misses_compute_once_per_process():
+    cache = TieredCache("t")
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def scenario():
+        return await asyncio.gather(*[cache.get_or_compute("key", 60, compute) for _ in range(10)])
+    assert asyncio.run(scenario()) == ["value"] * 10
+    assert len(calls) == 1 and cache.stats["coalesced"] == 9
+
+
+def test_concurrent_misses_compute_once_across_workers():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cache.db")
+        workers = [TieredCache("t", SQLiteBackend(path), poll_interval=0.01) for _ in range(4)]
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return "value"
+
+        async def scenario():
+            return await asyncio.gather(*[worker.get_or_compute("key", 60, compute) for worker in workers])
+        assert asyncio.run(scenario()) == ["value"] * 4
+        assert len(calls) == 1
+
+
+def test_failed_computation_is_not_cached():
+    cache = TieredCache("t")
+
+    async def fail():
+        raise ValueError("boom")
+
+    async def scenario():
+        for _ in range(2):
+            try:
+                await cache.get_or_compute("key", 60, fail)
+                assert False, "expected ValueError"
+            except ValueError:
+                pass
+    asyncio.run(scenario())
+    assert cache.stats["computations"] == 2 and len(cache) == 0
+
+
+def analyze_many(count):
+    async def scenario():
+        requests = [main.AnalyzeUserRequest(user_id=f"caller{i}", user_to_search="active", parameters={})
+                    for i in range(count)]
+        return await asyncio.gather(*[main.analyze_user(request) for request in requests])
+    return asyncio.run(scenario())
+
+
+def test_identical_requests_share_one_result():
+    fake = FakeReddit({"active": make_account(2, 5)}, latency=0.05)
+    with StubOpenAIServer() as stub:
+        reset_app_state()
+        main.OPENAI_BASE_URL = stub.base_url
+        main.create_reddit_client = fake.client
+        main.RESULT_CACHE_TTL = 60
+        try:
+            responses = analyze_many(5)
+            assert len(stub.requests) == 1 and fake.calls["load"] == 1
+            assert [response.cached for response in responses].count(False) == 1
+            assert len({response.summary for response in responses}) == 1
+
+            again = analyze_many(1)[0]
+            assert again.cached and len(stub.requests) == 1
+        finally:
+            reset_app_state()
+
+
+if __name__ == "__main__":
+    tests = [
+        test_serialization_is_versioned_json,
+        test_sqlite_backend,
+        test_sqlite_backend_purges_expired_entries,
+        test_redis_backend_closes_broken_connections,
+        test_redis_backend_against_stand_in,
+        test_workers_share_the_second_tier,
+        test_concurrent_misses_compute_once_per_process,
+        test_concurrent_misses_compute_once_across_workers,
+        test_failed_computation_is_not_cached,
+        test_identical_requests_share_one_result,
+    ]
+    for test in tests:
+        test()
+        print(f"{test.__name__} passed")
+    print(f"All {len(tests)} shared cache tests passed!")
@@ -0,0 +1,198 @@
+"""
+Tests for GET /users/{username}/summary: validators, conditional requests and
+stale-while-revalidate refreshes.
+Run with: python tests/test_summary_endpoint.py
+"""
+
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+from email.utils import formatdate
+
+from fastapi.testclient import TestClient
+
+from fakes import FakeReddit, add_activity, make_account, reset_app_state
+
+import main
+from summary_store import SummaryStore
+
+
+def setup(accounts):
+    reset_app_state()
+    fake = FakeReddit(accounts)
+    main.create_reddit_client = fake.client
+    calls = []
+
+    def summarize(user_data, username, parameters, deadline=None, usage=None, previous_summary=None):
+        calls.append(previous_summary)
+        return f"Summary #{len(calls)} of u/{username}"
+
+    main.summarize_with_llm = summarize
+    return fake, calls
+
+
+def age_summary(username, seconds):
+    with main.summary_store.connection:
+        main.summary_store.connection.execute(
+            "UPDATE summaries SET checked_at = checked_at - ? WHERE username = ?", (seconds, username))
+
+
+def test_first_request_computes_and_sets_validators():
+    fake, calls = setup({"alice": make_account(3, 10)})
+    with TestClient(main.app) as client:
+        response = client.get("/users/alice/summary")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["summary"] == "Summary #1 of u/alice" and body["model"] == "gpt-4o"
+    assert response.headers["etag"].startswith('W/"')
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["last-modified"].endswith("GMT")
+    cache_control = response.headers["cache-control"]
+    assert f"max-age={main.SUMMARY_MAX_AGE}" in cache_control
+    assert f"stale-while-revalidate={main.SUMMARY_STALE_WHILE_REVALIDATE}" in cache_control
+    assert len(calls) == 1
+
+
+def test_fresh_summary_is_served_without_the_pipeline():
+    fake, calls = setup({"alice": make_account(3, 10)})
+    with TestClient(main.app) as client:
+        first = client.get("/users/alice/summary")
+        second = client.get("/users/alice/summary")
+    assert second.status_code == 200
+    assert second.headers["etag"] == first.headers["etag"]
+    assert fake.calls["load"] == 1 and len(calls) == 1
+
+
+def test_if_none_match_returns_304():
+    setup({"alice": make_account(3, 10)})
+    with TestClient(main.app) as client:
+        etag = client.get("/users/alice/summary").headers["etag"]
+        response = client.get("/users/alice/summary", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+        assert "cache-control" in response.headers
+        strong = etag.removeprefix("W/")
+        assert client.get("/users/alice/summary", headers={"If-None-Match": strong}).status_code == 304
+        assert client.get("/users/alice/summary", headers={"If-None-Match": f'"other", {etag}'}).status_code == 304
+        assert client.get("/users/alice/summary", headers={"If-None-Match": '"other"'}).status_code == 200
+    assert main.metrics["summary_not_modified"] == 3
+
+
+def test_if_modified_since():
+    setup({"alice": make_account(3, 10)})
+    with TestClient(main.app) as client:
+        last_modified = client.get("/users/alice/summary").headers["last-modified"]
+        assert client.get("/users/alice/summary", headers={"If-Modified-Since": last_modified}).status_code == 304
+        earlier = formatdate(time.time() - 3600, usegmt=True)
+        assert client.get("/users/alice/summary", headers={"If-Modified-Since": earlier}).status_code == 200
+        assert client.get("/users/alice/summary", headers={"If-Modified-Since": "garbage"}).status_code == 200
+        # If-None-Match takes precedence
+        response = client.get("/users/alice/summary",
+                              headers={"If-None-Match": '"other"', "If-Modified-Since": last_modified})
+        assert response.status_code == 200
+
+
+def test_stale_summary_is_served_and_refreshed_in_background():
+    account = make_account(3, 10, prefix="old")
+    fake, calls = setup({"alice": account})
+    with TestClient(main.app) as client:
+        first = client.get("/users/alice/summary")
+        age_summary("alice", main.SUMMARY_MAX_AGE + 1)
+        add_activity(account, comments=2)
+
+        stale = client.get("/users/alice/summary", headers={"If-None-Match": first.headers["etag"]})
+        # Served from the store right away, still matching the client's copy
+        assert stale.status_code == 304
+        assert int(stale.headers["age"]) > main.SUMMARY_MAX_AGE
+
+        deadline = time.monotonic() + 5
+        while main.metrics["summary_background_refreshes"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert main.metrics["summary_background_refreshes"] == 1
+
+        refreshed = client.get("/users/alice/summary", headers={"If-None-Match": first.headers["etag"]})
+    assert refreshed.status_code == 200
+    assert refreshed.headers["etag"] != first.headers["etag"]
+    assert refreshed.json()["summary"] == "Summary #2 of u/alice"
+    # The refresh was an incremental update of the stored summary
+    assert calls[-1] == "Summary #1 of u/alice"
+    assert main.metrics["summary_updates_incremental"] == 1
+
+
+def test_unchanged_refresh_keeps_validators_but_renews_freshness():
+    fake, calls = setup({"alice": make_account(3, 10)})
+    with TestClient(main.app) as client:
+        first = client.get("/users/alice/summary")
+        age_summary("alice", main.SUMMARY_MAX_AGE + 1)
+        client.get("/users/alice/summary")
+        deadline = time.monotonic() + 5
+        while main.metrics["summary_background_refreshes"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        after = client.get("/users/alice/summary")
+    assert main.metrics["summary_updates_unchanged"] == 1
+    assert after.headers["etag"] == first.headers["etag"]
+    assert after.headers["last-modified"] == first.headers["last-modified"]
+    assert int(after.headers["age"]) < main.SUMMARY_MAX_AGE
+    assert len(calls) == 1
+
+
+def test_concurrent_stale_requests_start_one_refresh():
+    fake, calls = setup({"alice": make_account(3, 10)})
+
+    async def scenario():
+        for _ in range(5):
+            main.schedule_summary_refresh("alice")
+        assert len(main.summary_refreshes) == 1
+        await asyncio.gather(*main.summary_refreshes.values())
+
+    asyncio.run(scenario())
+    assert main.metrics["summary_background_refreshes"] == 1
+    assert not main.summary_refreshes
+    assert len(calls) == 1
+
+
+def test_expired_summary_is_refreshed_before_answering():
+    account = make_account(3, 10, prefix="old")
+    fake, calls = setup({"alice": account})
+    with TestClient(main.app) as client:
+        client.get("/users/alice/summary")
+        age_summary("alice", main.SUMMARY_MAX_AGE + main.SUMMARY_STALE_WHILE_REVALIDATE + 1)
+        add_activity(account, posts=1)
+        response = client.get("/users/alice/summary")
+    assert response.json()["summary"] == "Summary #2 of u/alice"
+    assert int(response.headers["age"]) < main.SUMMARY_MAX_AGE
+    assert main.metrics["summary_background_refreshes"] == 0
+
+
+def test_unknown_user_is_404():
+    setup({})
+    with TestClient(main.app) as client:
+        response = client.get("/users/ghost/summary")
+    assert response.status_code == 404
+
+
+def test_store_without_checked_at_is_migrated():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "summaries.db")
+        connection = sqlite3.connect(path)
+        connection.execute("CREATE TABLE summaries (username TEXT PRIMARY KEY, summary TEXT NOT NULL, "
+                           "model TEXT NOT NULL, watermark REAL NOT NULL, base_items INTEGER NOT NULL, "
+                           "incremental_items INTEGER NOT NULL, updates INTEGER NOT NULL, "
+                           "rebuilt_at REAL NOT NULL, updated_at REAL NOT NULL)")
+        connection.execute("INSERT INTO summaries VALUES ('alice', 's', 'gpt-4o', 1, 1, 0, 0, 5, 7)")
+        connection.commit()
+        connection.close()
+
+        store = SummaryStore(path)
+        assert store.get("alice")["checked_at"] == 7
+        store.connection.close()
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"PASS {name}")
@@ -0,0 +1,109 @@
+"""
+Tests for summary_length tiers and the structured ("output_format": "json") summary.
+Run with: python tests/test_summary_length.py
+"""
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from fakes import FakeReddit, StubOpenAIServer, make_account, reset_app_state
+
+import main
+
+
+def setup_stub(stub):
+    reset_app_state()
+    main.OPENAI_BASE_URL = stub.base_url
+    main.create_reddit_client = FakeReddit({"alice": make_account(2, 5)}).client
+
+
+def analyze(**parameters):
+    request = main.AnalyzeUserRequest(user_id="caller", user_to_search="alice",
+                                      parameters={"post_limit": 2, "comment_limit": 5, **parameters})
+    return asyncio.run(main.analyze_user(request))
+
+
+def test_length_tiers_set_token_cap_and_instructions():
+    with StubOpenAIServer(completion_tokens=500) as stub:
+        setup_stub(stub)
+        for tier in ("brief", "standard", "detailed"):
+            analyze(summary_length=tier)
+            body = stub.requests[-1]
+            assert body["max_tokens"] == main.SUMMARY_LENGTHS[tier]["max_tokens"]
+            assert main.SUMMARY_LENGTHS[tier]["instruction"] in body["messages"][0]["content"]
+            assert body["stop"] == main.SUMMARY_STOP
+        # The default is the standard prompt, unchanged
+        default = analyze()
+        assert stub.requests[-1]["messages"][0]["content"].endswith(main.ANALYSIS_INSTRUCTIONS)
+        # Only the brief answer hit its cap
+        assert main.metrics["llm_completions_truncated"] == 1
+
+        # The stored summary is the standard one; other tiers neither replace nor update it
+        standard = main.summary_store.get("alice")
+        assert standard["summary"] == default.summary
+        assert analyze(summary_length="brief", mode="update").summary_mode == "full"
+        assert main.summary_store.get("alice") == standard
+        assert asyncio.run(main.get_stored_summary("alice")) == default.summary
+
+    brief = main.estimate_request_cost({}, main.SUMMARY_LENGTHS["brief"]["max_tokens"])
+    assert brief["cost"] < main.estimate_request_cost({})["cost"]
+    with pytest.raises(HTTPException) as e:
+        analyze(summary_length="epic")
+    assert e.value.status_code == 422
+
+
+def test_json_output_returns_sections():
+    with StubOpenAIServer() as stub:
+        setup_stub(stub)
+        response = analyze(output_format="json", summary_length="brief")
+        body = stub.requests[-1]
+        assert body["response_format"] == {"type": "json_object"} and "stop" not in body
+        assert main.JSON_FORMAT in body["messages"][0]["content"]
+
+    assert set(response.sections) == set(main.SUMMARY_SECTIONS)
+    assert response.sections["overall_tone"].startswith("overall_tone of Stub summary")
+    # The summary is the same sections as Markdown, so stored summaries keep one format
+    assert response.summary.startswith("**Main Interests:** main_interests of")
+    assert main.split_sections(response.summary) == response.sections
+    # Only the standard length is stored
+    assert main.summary_store.get("alice") is None
+    with StubOpenAIServer() as stub:
+        main.OPENAI_BASE_URL = stub.base_url
+        response = analyze(output_format="json")
+    assert main.summary_store.get("alice")["summary"] == response.summary
+
+
+def test_sections_are_served_from_one_cached_result():
+    with StubOpenAIServer() as stub:
+        setup_stub(stub)
+        main.RESULT_CACHE_TTL = 60
+        tone = analyze(output_format="json", sections=["overall_tone"])
+        interests = analyze(output_format="json", sections=["main_interests", "activity_pattern"])
+        assert len(stub.requests) == 1
+
+    assert list(tone.sections) == ["overall_tone"]
+    assert interests.cached and list(interests.sections) == ["main_interests", "activity_pattern"]
+    for parameters in ({"sections": ["overall_tone"]}, {"output_format": "json", "sections": ["age"]},
+                       {"output_format": "json", "custom_prompt": "Describe {username}"}, {"output_format": "xml"}):
+        with pytest.raises(HTTPException) as e:
+            analyze(**parameters)
+        assert e.value.status_code == 422
+
+
+def test_malformed_json_completion_fails():
+    with StubOpenAIServer() as stub:
+        setup_stub(stub)
+        stub.respond = lambda body: StubOpenAIServer.respond(stub, {**body, "response_format": None})
+        with pytest.raises(HTTPException) as e:
+            analyze(output_format="json")
+    assert e.value.status_code == 500 and "JSON object" in e.value.detail
+    assert main.metrics["llm_invalid_structured_output"] == 1
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"PASS {name}")
@@ -0,0 +1,127 @@
+"""
+Tests for capturing /analyze traffic and replaying the trace against a local instance.
+Run with: python tests/test_traffic_capture.py
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+
+from fastapi.testclient import TestClient
+
+from fakes import FakeReddit, make_account, reset_app_state
+
+import main
+from test_cluster import run_nodes
+from traffic_capture import TrafficCaptureMiddleware, TrafficRecorder, build_request, load_trace, replay, worker_path
+
+
+def capture(path, requests_to_send, **recorder_options):
+    reset_app_state()
+    main.create_reddit_client = FakeReddit({"SecretAlice": make_account(2, 5)}).client
+    main.summarize_with_llm = lambda *args, **kwargs: "a summary"
+    recorder = TrafficRecorder(path, salt="test-salt", **recorder_options)
+    client = TestClient(TrafficCaptureMiddleware(main.app, recorder))
+    for body, headers, params in requests_to_send:
+        client.post("/analyze", json=body, headers=headers, params=params)
+    client.get("/")
+    recorder.close()
+    return recorder
+
+
+def test_captures_sanitized_request_shapes():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "traffic.jsonl")
+        prompt = "Tell me everything about this person's private life"
+        recorder = capture(path, [
+            ({"user_id": "dashboard-42", "user_to_search": "SecretAlice",
+              "parameters": {"post_limit": 2, "custom_prompt": prompt, "api_key": "sk-leak"}},
+             {"X-Request-Timeout": "30"}, {"fields": "summary,usage"}),
+            ({"user_id": "dashboard-42", "user_to_search": "secretalice", "parameters": {}}, {}, {}),
+            ({"user_id": "other", "user_to_search": "ghost", "parameters": {}}, {}, {}),
+        ])
+        assert recorder.path == os.path.join(directory, f"traffic.{os.getpid()}.jsonl")
+        with open(recorder.path) as file:
+            raw = file.read()
+        for secret in ("SecretAlice", "secretalice", "dashboard-42", prompt, "sk-leak", "api_key"):
+            assert secret not in raw
+
+        records = [json.loads(line) for line in raw.splitlines()]
+        assert len(records) == 3 and recorder.stats == {"captured": 3, "dropped": 0, "written": 3}
+        first, second, third = records
+        assert first["parameters"] == {"post_limit": 2, "custom_prompt_chars": len(prompt)}
+        assert first["timeout_header"] == "30" and first["fields"] == "summary,usage"
+        assert first["status"] == 200 and first["duration_ms"] > 0 and first["response_bytes"] > 0
+        # Hashes are case-insensitive and stable, so repeats stay visible
+        assert first["target"] == second["target"] != third["target"]
+        assert first["caller"] == second["caller"] != third["caller"]
+        assert third["status"] == 404 and not third["forwarded"]
+
+
+def test_trace_rotates_and_loads_in_order():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "traffic.jsonl")
+        body = {"user_id": "caller", "user_to_search": "SecretAlice", "parameters": {}}
+        written = capture(path, [(body, {}, {})] * 12, max_bytes=800, backup_count=20).path
+        assert os.path.exists(written + ".1") and os.path.exists(written + ".2")
+        # Another worker's file is merged in by the capture path
+        with open(worker_path(path, pid=1), "w") as file:
+            file.write(json.dumps({"ts": 0.0, "forwarded": False}) + "\n")
+        records = load_trace([path])
+        assert len(records) == 13 and records[0]["ts"] == 0.0
+        assert [record["ts"] for record in records] == sorted(record["ts"] for record in records)
+        assert len(load_trace([written])) == 12
+
+
+def test_records_are_dropped_rather_than_blocking():
+    with tempfile.TemporaryDirectory() as directory:
+        recorder = TrafficRecorder(os.path.join(directory, "traffic.jsonl"), queue_size=1)
+        # With the writer stopped nothing drains the queue
+        recorder.close()
+        scope = {"headers": [], "path": "/analyze"}
+        recorder.record(scope, b"{}", 0.0, 0.1, 200, 10)
+        recorder.record(scope, b"{}", 0.0, 0.1, 200, 10)
+        assert recorder.stats["captured"] == 1 and recorder.stats["dropped"] == 1
+
+
+def test_build_request_restores_the_shape():
+    record = {"caller": "c1", "target": "t1", "path": "/analyze", "timeout_header": "15", "fields": "summary",
+              "parameters": {"comment_limit": 50, "custom_prompt_chars": 12}}
+    body, headers, params = build_request(record, "user3")
+    assert body == {"user_id": "replay-c1", "user_to_search": "user3",
+                    "parameters": {"comment_limit": 50, "custom_prompt": "x" * 12}}
+    assert headers == {"X-Request-Timeout": "15"} and params == {"fields": "summary"}
+
+
+def test_replay_against_a_local_instance():
+    records = [
+        {"ts": 1000.0 + index * 0.1, "path": "/analyze", "caller": f"c{index % 2}", "target": f"t{index % 3}",
+         "parameters": {}, "timeout_header": None, "fields": None, "forwarded": False, "status": 200,
+         "duration_ms": 500.0, "response_bytes": 300}
+        for index in range(10)
+    ]
+    # A forwarded copy of a request is not replayed twice
+    records.append({**records[0], "forwarded": True})
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "traffic.jsonl")
+        with open(path, "w") as file:
+            file.writelines(json.dumps(record) + "\n" for record in records)
+        trace = load_trace([path])
+    assert len(trace) == 10
+
+    with run_nodes(1, cluster=False) as (url,):
+        report = asyncio.run(replay(trace, url, speed=2, username_template="user{index}"))
+    assert report["requests"] == 10
+    assert report["statuses"] == {200: 10}
+    # 0.9 s of recorded traffic at twice the speed
+    assert 0.4 <= report["elapsed_seconds"] < 2
+    assert set(report["latency_ms"]) == {"p50", "p90", "p99", "max"}
+    assert report["recorded_latency_ms"]["p50"] == 500.0
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"PASS {name}")
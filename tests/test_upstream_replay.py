@@ -0,0 +1,121 @@
+"""
+Tests for recording upstream traffic through upstream_replay.py and replaying it, with
+the real asyncpraw client and HTTP calls against the local Reddit and OpenAI stubs.
+Run with: python tests/test_upstream_replay.py
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import tempfile
+import time
+
+import requests
+
+from fakes import StubOpenAIServer, StubRedditServer, make_account, reset_app_state
+
+import main
+from upstream_replay import Replayer, UpstreamProxy, load_fixture, request_key
+
+PARAMETERS = {"post_limit": 5, "comment_limit": 150, "include_context": True}
+
+
+def point_app_at(proxy):
+    reset_app_state()
+    main.REDDIT_URL = main.REDDIT_OAUTH_URL = proxy.base_url
+    main.OPENAI_BASE_URL = proxy.base_url + "/v1"
+
+
+def analyze(username):
+    request = main.AnalyzeUserRequest(user_id="caller", user_to_search=username, parameters=dict(PARAMETERS))
+    return asyncio.run(main.analyze_user(request))
+
+
+def record(fixture, accounts, reddit_latency=0.0):
+    with StubRedditServer(accounts, latency=reddit_latency) as reddit, StubOpenAIServer() as openai:
+        openai_url = openai.base_url[:-len("/v1")]
+        with UpstreamProxy(fixture, "record", reddit_url=reddit.base_url, oauth_url=reddit.base_url,
+                           openai_url=openai_url) as proxy:
+            point_app_at(proxy)
+            summaries = [analyze(username).summary for username in accounts]
+        return summaries, proxy.stats, reddit.calls
+
+
+def test_record_then_replay_offline():
+    with tempfile.TemporaryDirectory() as directory:
+        fixture = os.path.join(directory, "session.jsonl.gz")
+        summaries, stats, reddit_calls = record(fixture, {"alice": make_account(3, 150), "bob": make_account(2, 4)})
+        # token + about + listings (two comment pages for alice) + /api/info + completion, per user
+        assert stats["recorded"] == sum(reddit_calls.values()) + 2
+        assert reddit_calls["/user/alice/comments"] == 2
+
+        with UpstreamProxy(fixture, "replay", time_scale=0) as proxy:
+            point_app_at(proxy)
+            replayed = [analyze(username).summary for username in ("alice", "bob")]
+        assert replayed == summaries
+        assert proxy.stats["misses"] == 0 and proxy.stats["replayed"] == stats["recorded"]
+
+
+def test_fixture_holds_no_credentials():
+    with tempfile.TemporaryDirectory() as directory:
+        fixture = os.path.join(directory, "session.jsonl.gz")
+        record(fixture, {"alice": make_account(2, 5)})
+        with gzip.open(fixture, "rt") as file:
+            raw = file.read()
+        assert "stub-token" not in raw and main.OPENAI_API_KEY not in raw
+        assert main.REDDIT_CLIENT_SECRET not in raw
+        token = next(exchange for exchange in load_fixture(fixture) if exchange["path"] == "/api/v1/access_token")
+        assert json.loads(token["body"])["access_token"] == "replayed-token"
+        assert set(token) == {"key", "method", "path", "status", "headers", "body", "elapsed"}
+
+
+def test_replay_scales_recorded_timings():
+    with tempfile.TemporaryDirectory() as directory:
+        fixture = os.path.join(directory, "session.jsonl.gz")
+        record(fixture, {"alice": make_account(2, 5)}, reddit_latency=0.1)
+        recorded = sum(exchange["elapsed"] for exchange in load_fixture(fixture))
+        assert recorded >= 0.5
+
+        timings = {}
+        for scale in (0, 1):
+            with UpstreamProxy(fixture, "replay", time_scale=scale) as proxy:
+                point_app_at(proxy)
+                started = time.perf_counter()
+                analyze("alice")
+                timings[scale] = time.perf_counter() - started
+        assert timings[1] >= recorded * 0.9
+        assert timings[0] < recorded / 2
+
+
+def test_replayer_serves_repeats_in_order_and_falls_back_by_path():
+    exchanges = [
+        {"key": request_key("GET", "/user/a/about", "raw_json=1", b""), "method": "GET", "path": "/user/a/about",
+         "status": 200, "headers": {}, "body": "first", "elapsed": 0},
+        {"key": request_key("GET", "/user/a/about", "raw_json=1", b""), "method": "GET", "path": "/user/a/about",
+         "status": 200, "headers": {}, "body": "second", "elapsed": 0},
+    ]
+    replayer = Replayer(exchanges)
+    bodies = [replayer.lookup("GET", "/user/a/about", "raw_json=1", b"")["body"] for _ in range(3)]
+    assert bodies == ["first", "second", "second"]
+    # Query order does not matter; an unseen query falls back to the path
+    assert replayer.lookup("GET", "/user/a/about", "other=2", b"")["body"] == "first"
+    assert replayer.lookup("GET", "/user/b/about", "", b"") is None
+
+
+def test_unrecorded_request_is_a_502():
+    with tempfile.TemporaryDirectory() as directory:
+        fixture = os.path.join(directory, "empty.jsonl.gz")
+        with gzip.open(fixture, "wt"):
+            pass
+        with UpstreamProxy(fixture, "replay", time_scale=0) as proxy:
+            response = requests.get(proxy.base_url + "/user/nobody/about", timeout=5)
+        assert response.status_code == 502
+        assert proxy.stats["misses"] == 1
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"PASS {name}")
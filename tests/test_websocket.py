@@ -0,0 +1,143 @@
+"""
+Tests for multiplexed analyses over the /ws WebSocket.
+Run with: python tests/test_websocket.py
+"""
+
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from fakes import FakeReddit, make_account, reset_app_state
+
+import main
+
+USERS = [f"user{i}" for i in range(6)]
+
+
+def setup():
+    reset_app_state()
+    main.create_reddit_client = FakeReddit({user: make_account(2, 5) for user in USERS}).client
+
+
+def analysis(request_id, user, **parameters):
+    return {"id": request_id, "request": {"user_id": "dashboard", "user_to_search": user,
+                                          "parameters": {"post_limit": 2, "comment_limit": 5, **parameters}}}
+
+
+def receive_until_done(websocket, ids):
+    """Reads messages until every id has a result or an error; returns them by id."""
+    messages = {request_id: [] for request_id in ids}
+    done = set()
+    while done != set(ids):
+        message = websocket.receive_json()
+        messages[message["id"]].append(message)
+        if message["type"] in ("result", "error"):
+            done.add(message["id"])
+    return messages
+
+
+def test_results_are_tagged_by_id_with_progress():
+    setup()
+    main.summarize_with_llm = lambda user_data, username, *args, **kwargs: f"summary of u/{username}"
+    with TestClient(main.app) as client, client.websocket_connect("/ws") as websocket:
+        for i, user in enumerate(USERS):
+            message = analysis(f"a{i}", user)
+            if i == 0:
+                message["fields"] = "summary,analyzed_user"
+            websocket.send_json(message)
+        messages = receive_until_done(websocket, [f"a{i}" for i in range(len(USERS))])
+
+    for i, user in enumerate(USERS):
+        received = messages[f"a{i}"]
+        assert [m["type"] for m in received][0] == "accepted"
+        stages = [m["stage"] for m in received if m["type"] == "progress"]
+        assert stages[-2:] == ["fetching", "summarizing"]
+        assert received[-1]["type"] == "result"
+        assert received[-1]["response"]["summary"] == f"summary of u/{user}"
+    assert set(messages["a0"][-1]["response"]) == {"summary", "analyzed_user"}
+    assert main.metrics["ws_connections"] == 1 and main.metrics["ws_analyses"] == len(USERS)
+
+
+def test_per_connection_concurrency_limit():
+    setup()
+    main.WS_MAX_CONCURRENCY = 2
+    lock = threading.Lock()
+    running = {"now": 0, "max": 0}
+
+    def slow_summary(user_data, username, *args, **kwargs):
+        with lock:
+            running["now"] += 1
+            running["max"] = max(running["max"], running["now"])
+        time.sleep(0.05)
+        with lock:
+            running["now"] -= 1
+        return "a summary"
+
+    main.summarize_with_llm = slow_summary
+    try:
+        with TestClient(main.app) as client, client.websocket_connect("/ws") as websocket:
+            for i, user in enumerate(USERS):
+                websocket.send_json(analysis(i, user))
+            messages = receive_until_done(websocket, list(range(len(USERS))))
+    finally:
+        main.WS_MAX_CONCURRENCY = 8
+    assert running["max"] == 2
+    assert all(received[-1]["type"] == "result" for received in messages.values())
+    assert any({"type": "progress", "stage": "queued", "id": i} in received for i, received in messages.items())
+
+
+def test_errors_are_reported_per_request():
+    setup()
+    main.summarize_with_llm = lambda *args, **kwargs: "a summary"
+    with TestClient(main.app) as client, client.websocket_connect("/ws") as websocket:
+        websocket.send_text("not json")
+        assert websocket.receive_json() == {"id": None, "type": "error", "status_code": 400,
+                                            "detail": "Messages must be JSON objects with a string or integer id"}
+        websocket.send_json({"id": "bad", "request": {"user_id": "dashboard"}})
+        websocket.send_json(analysis("mode", USERS[0], mode="sideways"))
+        websocket.send_json(analysis("fields", USERS[0]) | {"fields": "summary,secret"})
+        websocket.send_json(analysis("missing", "nobody"))
+        messages = receive_until_done(websocket, ["bad", "mode", "fields", "missing"])
+
+    assert {request_id: received[-1]["status_code"] for request_id, received in messages.items()} == \
+        {"bad": 422, "mode": 422, "fields": 422, "missing": 404}
+
+
+def test_cancel_and_close_stop_analyses():
+    setup()
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocked_summary(*args, **kwargs):
+        started.set()
+        release.wait(5)
+        return "a summary"
+
+    main.summarize_with_llm = blocked_summary
+    try:
+        with TestClient(main.app) as client:
+            with client.websocket_connect("/ws") as websocket:
+                websocket.send_json(analysis("slow", USERS[0]))
+                assert started.wait(5)
+                websocket.send_json({"id": "slow", "cancel": True})
+                messages = receive_until_done(websocket, ["slow"])
+                assert messages["slow"][-1]["status_code"] == 499
+
+                started.clear()
+                websocket.send_json(analysis("abandoned", USERS[1]))
+                assert started.wait(5)
+            # Leaving the block closed the connection with the analysis still running
+            deadline = time.monotonic() + 5
+            while main.metrics["ws_cancelled_on_close"] == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+    finally:
+        release.set()
+    assert main.metrics["ws_cancelled_on_close"] == 1
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"PASS {name}")
@@ -0,0 +1,308 @@
+"""
+Capture the production /analyze request mix and replay it against a test instance.
+
+TrafficCaptureMiddleware (enabled with TRAFFIC_CAPTURE_PATH) records one JSON line per
+request: when it arrived, its shape and how it went. Callers and target usernames are
+stored as keyed hashes, only known scalar parameters are kept and a custom prompt is
+reduced to its length. The request path only queues the raw request (dropping it, and
+counting the drop, if the bounded queue is full); a background thread builds the record
+and appends it to a size-rotated file. Each process writes its own file, with its pid
+before the extension (traffic.jsonl -> traffic.1234.jsonl), since uvicorn workers
+cannot share one rotating file.
+
+Running this module replays such a trace (every worker's files, merged by arrival time),
+keeping the original arrival times scaled by --speed (0 sends as fast as --concurrency
+allows), and reports throughput, latency percentiles and status codes next to the
+recorded ones:
+
+    python traffic_capture.py traffic.jsonl --url http://127.0.0.1:8000 --speed 4
+
+Each distinct target hash is replayed as one username, built from --username-template
+with {target} (the hash) or {index} (order of first appearance), so the instance's
+caches see the same repeat structure as production.
+"""
+
+import argparse
+import asyncio
+import glob
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from collections import Counter
+from logging.handlers import RotatingFileHandler
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl
+
+import aiohttp
+
+from cluster import FORWARDED_HEADER
+
+# Parameters whose (scalar) values are captured; anything else is dropped
+CAPTURED_PARAMETERS = ("post_limit", "comment_limit", "include_context", "best_effort", "model", "temperature",
+                       "mode", "timeout_seconds", "hedge", "hedge_model", "degrade", "min_post_limit",
+                       "min_comment_limit", "degraded_model", "summary_length", "output_format")
+MAX_CAPTURED_BODY = 64 * 1024
+
+
+def worker_path(path: str, pid: Optional[int] = None) -> str:
+    """The file one process writes for a capture path: traffic.jsonl -> traffic.<pid>.jsonl."""
+    root, extension = os.path.splitext(path)
+    return f"{root}.{pid or os.getpid()}{extension}"
+
+
+class TrafficRecorder:
+    """
+    Turns captured requests into records and writes them to a rotating JSONL file of
+    this process's own (worker_path). The request path only enqueues the raw request;
+    decoding, hashing and writing happen in a background thread.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024, backup_count: int = 5,
+                 salt: str = "", queue_size: int = 10000):
+        # Without a configured salt hashes are only stable for this process
+        self.salt = (salt or secrets.token_hex(16)).encode()
+        self.queue = queue.Queue(queue_size)
+        self.path = worker_path(path)
+        self.handler = RotatingFileHandler(self.path, maxBytes=max_bytes, backupCount=backup_count,
+                                           encoding="utf-8")
+        self.handler.setFormatter(logging.Formatter("%(message)s"))
+        self.stats = {"captured": 0, "dropped": 0, "written": 0}
+        self.thread = threading.Thread(target=self._write_loop, name="traffic-capture", daemon=True)
+        self.thread.start()
+
+    def hash(self, value: str) -> str:
+        return hmac.new(self.salt, value.lower().encode(), hashlib.sha256).hexdigest()[:16]
+
+    def record(self, scope, body: bytes, arrived: float, duration: float, status: int, response_bytes: int):
+        """Queues a finished request; dropped (and counted) if the writer has fallen behind."""
+        try:
+            self.queue.put_nowait((scope, body, arrived, duration, status, response_bytes))
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return
+        self.stats["captured"] += 1
+
+    def _write_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            line = json.dumps(self.entry(*item), separators=(",", ":"))
+            self.handler.handle(logging.makeLogRecord({"msg": line}))
+            self.stats["written"] += 1
+
+    def entry(self, scope, body: bytes, arrived: float, duration: float, status: int,
+              response_bytes: int) -> Dict[str, Any]:
+        try:
+            request = json.loads(body)
+        except ValueError:
+            request = {}
+        if not isinstance(request, dict):
+            request = {}
+        headers = dict(scope["headers"])
+        query = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+        return {
+            "ts": round(arrived, 3),
+            "path": scope["path"],
+            "caller": self.hash(str(request.get("user_id", ""))),
+            "target": self.hash(str(request.get("user_to_search", ""))),
+            "parameters": sanitize_parameters(request.get("parameters")),
+            "timeout_header": headers.get(b"x-request-timeout", b"").decode("latin-1") or None,
+            "fields": query.get("fields"),
+            # Also captured by the node it was forwarded to; replays skip these
+            "forwarded": FORWARDED_HEADER.lower().encode() in headers,
+            "status": status,
+            "duration_ms": round(duration * 1000, 2),
+            "response_bytes": response_bytes,
+        }
+
+    def close(self):
+        """Writes everything queued so far and stops the writer thread."""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.handler.close()
+
+    def snapshot(self) -> Dict[str, int]:
+        return {**self.stats, "queued": self.queue.qsize()}
+
+
+def sanitize_parameters(parameters: Any) -> Dict[str, Any]:
+    if not isinstance(parameters, dict):
+        return {}
+    sanitized = {name: parameters[name] for name in CAPTURED_PARAMETERS
+                 if isinstance(parameters.get(name), (bool, int, float, str))}
+    if parameters.get("custom_prompt"):
+        sanitized["custom_prompt_chars"] = len(str(parameters["custom_prompt"]))
+    return sanitized
+
+
+class TrafficCaptureMiddleware:
+    def __init__(self, app, recorder: TrafficRecorder, paths=("/analyze",)):
+        self.app = app
+        self.recorder = recorder
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        arrived = time.time()
+        started = time.perf_counter()
+        body = bytearray()
+        status = None
+        response_bytes = 0
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request" and len(body) < MAX_CAPTURED_BODY:
+                body.extend(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message):
+            nonlocal status, response_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            self.recorder.record(scope, bytes(body), arrived, time.perf_counter() - started,
+                                 status or 500, response_bytes)
+
+
+# --- REPLAY ---
+def trace_files(path: str) -> List[str]:
+    """
+    The trace file and its rotated backups (path.1, path.2, ...), oldest first. A capture
+    path (traffic.jsonl) stands for the files of every worker that wrote to it.
+    """
+    if not os.path.exists(path):
+        root, extension = os.path.splitext(path)
+        workers = [name for name in sorted(glob.glob(f"{glob.escape(root)}.*{glob.escape(extension)}"))
+                   if name[len(root) + 1:len(name) - len(extension)].isdigit()]
+        if workers:
+            return [name for worker in workers for name in trace_files(worker)]
+    backups = []
+    index = 1
+    while os.path.exists(f"{path}.{index}"):
+        backups.append(f"{path}.{index}")
+        index += 1
+    return list(reversed(backups)) + ([path] if os.path.exists(path) else [])
+
+
+def load_trace(paths: List[str]) -> List[Dict[str, Any]]:
+    records = []
+    for path in paths:
+        for name in trace_files(path):
+            with open(name, encoding="utf-8") as file:
+                records.extend(json.loads(line) for line in file if line.strip())
+    return sorted((record for record in records if not record.get("forwarded")), key=lambda record: record["ts"])
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def at(fraction):
+        return round(values[min(len(values) - 1, int(len(values) * fraction))], 2)
+
+    return {"p50": at(0.5), "p90": at(0.9), "p99": at(0.99), "max": round(values[-1], 2)}
+
+
+def build_request(record: Dict[str, Any], username: str):
+    parameters = dict(record["parameters"])
+    prompt_chars = parameters.pop("custom_prompt_chars", 0)
+    if prompt_chars:
+        parameters["custom_prompt"] = "x" * prompt_chars
+    body = {"user_id": f"replay-{record['caller']}", "user_to_search": username, "parameters": parameters}
+    headers = {"X-Request-Timeout": record["timeout_header"]} if record.get("timeout_header") else {}
+    params = {"fields": record["fields"]} if record.get("fields") else {}
+    return body, headers, params
+
+
+async def replay(records: List[Dict[str, Any]], url: str, speed: float = 1.0, concurrency: int = 100,
+                 username_template: str = "replay_{target}", timeout: float = 300.0) -> Dict[str, Any]:
+    """Reissues the trace against `url` and returns a report of what happened."""
+    targets: Dict[str, int] = {}
+    results = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def issue(session, record, due):
+        index = targets.setdefault(record["target"], len(targets))
+        body, headers, params = build_request(record, username_template.format(target=record["target"],
+                                                                               index=index))
+        async with semaphore:
+            started = time.monotonic()
+            lag = started - due
+            try:
+                async with session.post(f"{url}{record['path']}", json=body, headers=headers,
+                                        params=params) as response:
+                    await response.read()
+                    status = response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                status = 0
+            results.append((status, (time.monotonic() - started) * 1000, lag * 1000))
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        start = time.monotonic()
+        first = records[0]["ts"] if records else 0.0
+        tasks = []
+        for record in records:
+            due = start + (record["ts"] - first) / speed if speed > 0 else time.monotonic()
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(issue(session, record, due)))
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - start
+
+    recorded_span = (records[-1]["ts"] - first) if records else 0.0
+    return {
+        "requests": len(results),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "recorded_rps": round(len(records) / recorded_span, 2) if recorded_span else None,
+        "statuses": dict(Counter(status for status, _, _ in results)),
+        "recorded_statuses": dict(Counter(record["status"] for record in records)),
+        "latency_ms": percentiles([latency for _, latency, _ in results]),
+        "recorded_latency_ms": percentiles([record["duration_ms"] for record in records]),
+        # How late requests went out compared to the schedule; large values mean the
+        # replay client (or --concurrency) was the bottleneck
+        "issue_lag_ms": percentiles([lag for _, _, lag in results]),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Replay a captured /analyze trace against an instance.")
+    parser.add_argument("trace", nargs="+", help="trace file(s); rotated backups are picked up automatically")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--speed", type=float, default=1.0, help="time compression (2 = twice as fast, 0 = no waits)")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--username-template", default="replay_{target}")
+    parser.add_argument("--limit", type=int, default=0, help="replay only the first N requests")
+    args = parser.parse_args(argv)
+
+    records = load_trace(args.trace)
+    if args.limit:
+        records = records[:args.limit]
+    report = asyncio.run(replay(records, args.url.rstrip("/"), args.speed, args.concurrency,
+                                args.username_template))
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Record and replay upstream HTTP traffic: Reddit OAuth and listings, OpenAI chat completions.
+
+Put a recorder in front of the real upstreams and point the app at it:
+
+    python upstream_replay.py record fixtures/session.jsonl.gz --port 8900
+    REDDIT_URL=http://127.0.0.1:8900 REDDIT_OAUTH_URL=http://127.0.0.1:8900 \\
+        OPENAI_BASE_URL=http://127.0.0.1:8900/v1 python main.py
+
+then serve the same exchanges later without any network access, at the recorded speed
+or scaled (0 answers immediately):
+
+    python upstream_replay.py replay fixtures/session.jsonl.gz --port 8900 --time-scale 1
+
+Requests are routed by path: Reddit's token endpoints to reddit_url, /v1/... to
+openai_url and everything else to oauth_url. A replayed request is matched on method,
+path, query and a hash of its body; repeats of one request get successive recordings
+(the last one repeats), and a request that was never recorded falls back to the first
+recording of the same method and path.
+
+Fixtures are gzip-compressed JSON lines, appended as exchanges complete. Credentials
+are never written: request headers and bodies are not stored (only the body's hash),
+and access tokens in token responses are replaced.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+
+TOKEN_PATHS = ("/api/v1/access_token", "/api/v1/revoke_token")
+OPENAI_PREFIX = "/v1/"
+# Response headers worth replaying; the rest are hop-by-hop or describe the original encoding
+KEPT_HEADERS = ("content-type", "x-ratelimit-remaining", "x-ratelimit-used", "x-ratelimit-reset", "retry-after")
+# Request headers not forwarded upstream
+DROPPED_HEADERS = ("host", "content-length", "accept-encoding", "connection")
+
+
+def request_key(method: str, path: str, query: str, body: bytes) -> str:
+    query = urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+    digest = hashlib.sha256(body).hexdigest()[:16] if body else "-"
+    return f"{method} {path}?{query} {digest}"
+
+
+def redact(path: str, body: bytes) -> bytes:
+    """Replaces the access token in a token endpoint response."""
+    if path not in TOKEN_PATHS:
+        return body
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return body
+    if isinstance(payload, dict) and "access_token" in payload:
+        payload["access_token"] = "replayed-token"
+        return json.dumps(payload).encode()
+    return body
+
+
+def load_fixture(path: str) -> List[Dict[str, Any]]:
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+class Replayer:
+    """Looks up recorded exchanges for replayed requests."""
+
+    def __init__(self, exchanges: List[Dict[str, Any]]):
+        self.by_key = defaultdict(list)
+        self.by_path = defaultdict(list)
+        for exchange in exchanges:
+            self.by_key[exchange["key"]].append(exchange)
+            self.by_path[(exchange["method"], exchange["path"])].append(exchange)
+        self.served = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def lookup(self, method: str, path: str, query: str, body: bytes) -> Optional[Dict[str, Any]]:
+        key = request_key(method, path, query, body)
+        with self.lock:
+            recorded = self.by_key.get(key)
+            if recorded:
+                index = min(self.served[key], len(recorded) - 1)
+                self.served[key] += 1
+                return recorded[index]
+        fallback = self.by_path.get((method, path))
+        return fallback[0] if fallback else None
+
+
+class UpstreamProxy:
+    """
+    A local HTTP server in "record" mode (forwarding to the real upstreams and appending
+    every exchange to `fixture_path`) or "replay" mode (answering from the fixture).
+    Usable as a context manager; `base_url` is where to point the app.
+    """
+
+    def __init__(self, fixture_path: str, mode: str, host: str = "127.0.0.1", port: int = 0,
+                 time_scale: float = 1.0, reddit_url: str = "https://www.reddit.com",
+                 oauth_url: str = "https://oauth.reddit.com", openai_url: str = "https://api.openai.com",
+                 timeout: float = 120.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"mode must be 'record' or 'replay', not {mode!r}")
+        self.fixture_path = fixture_path
+        self.mode = mode
+        self.time_scale = time_scale
+        self.upstreams = {"reddit": reddit_url.rstrip("/"), "oauth": oauth_url.rstrip("/"),
+                          "openai": openai_url.rstrip("/")}
+        self.timeout = timeout
+        self.stats = {"recorded": 0, "replayed": 0, "misses": 0, "upstream_errors": 0}
+        self.lock = threading.Lock()
+        self.session = requests.Session() if mode == "record" else None
+        self.replayer = Replayer(load_fixture(fixture_path)) if mode == "replay" else None
+
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def handle_any(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                status, headers, payload = proxy.handle(self.command, self.path, dict(self.headers), body)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = handle_any
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def upstream_for(self, path: str) -> str:
+        if path in TOKEN_PATHS:
+            return self.upstreams["reddit"]
+        if path.startswith(OPENAI_PREFIX):
+            return self.upstreams["openai"]
+        return self.upstreams["oauth"]
+
+    def handle(self, method: str, target: str, headers: Dict[str, str], body: bytes):
+        parts = urlsplit(target)
+        if self.mode == "replay":
+            return self.replay(method, parts.path, parts.query, body)
+        return self.record(method, parts.path, parts.query, target, headers, body)
+
+    def replay(self, method: str, path: str, query: str, body: bytes):
+        exchange = self.replayer.lookup(method, path, query, body)
+        if exchange is None:
+            with self.lock:
+                self.stats["misses"] += 1
+            payload = json.dumps({"error": f"No recorded exchange for {method} {path}"}).encode()
+            return 502, {"Content-Type": "application/json"}, payload
+        if self.time_scale > 0:
+            time.sleep(exchange["elapsed"] * self.time_scale)
+        with self.lock:
+            self.stats["replayed"] += 1
+        return exchange["status"], exchange["headers"], exchange["body"].encode("utf-8")
+
+    def record(self, method: str, path: str, query: str, target: str, headers: Dict[str, str], body: bytes):
+        forwarded = {name: value for name, value in headers.items() if name.lower() not in DROPPED_HEADERS}
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.upstream_for(path) + target, headers=forwarded,
+                                            data=body or None, timeout=self.timeout)
+        except requests.RequestException as e:
+            with self.lock:
+                self.stats["upstream_errors"] += 1
+            return 502, {"Content-Type": "application/json"}, json.dumps({"error": str(e)}).encode()
+        elapsed = time.perf_counter() - started
+
+        kept = {name: value for name, value in response.headers.items() if name.lower() in KEPT_HEADERS}
+        payload = redact(path, response.content)
+        exchange = {
+            "key": request_key(method, path, query, body),
+            "method": method,
+            "path": path,
+            "status": response.status_code,
+            "headers": kept,
+            "body": payload.decode("utf-8", errors="replace"),
+            "elapsed": round(elapsed, 4),
+        }
+        line = json.dumps(exchange, separators=(",", ":")) + "\n"
+        with self.lock:
+            # Each append is its own gzip member; readers see one continuous stream
+            with gzip.open(self.fixture_path, "at", encoding="utf-8") as file:
+                file.write(line)
+            self.stats["recorded"] += 1
+        return response.status_code, kept, payload
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record or replay the app's upstream HTTP traffic.")
+    parser.add_argument("mode", choices=("record", "replay"))
+    parser.add_argument("fixture", help="gzip JSON-lines fixture file (appended to when recording)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--time-scale", type=float, default=1.0,
+                        help="replay: multiply recorded response times by this (0 = no delay)")
+    parser.add_argument("--reddit-url", default="https://www.reddit.com")
+    parser.add_argument("--oauth-url", default="https://oauth.reddit.com")
+    parser.add_argument("--openai-url", default="https://api.openai.com")
+    args = parser.parse_args()
+
+    proxy = UpstreamProxy(args.fixture, args.mode, args.host, args.port, args.time_scale,
+                          args.reddit_url, args.oauth_url, args.openai_url)
+    print(f"{args.mode.capitalize()}ing upstream traffic on {proxy.base_url} ({args.fixture})")
+    print(f"  REDDIT_URL={proxy.base_url} REDDIT_OAUTH_URL={proxy.base_url} OPENAI_BASE_URL={proxy.base_url}/v1")
+    try:
+        proxy.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        proxy.server.server_close()
+        print(json.dumps(proxy.stats))
+
+
+if __name__ == "__main__":
+    main()